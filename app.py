@@ -1,76 +1,298 @@
 """
 BotInterface - Flask Backend Application
 Serves the chat interface and handles bot API communication
+
+Use `create_app(config)` to build an application. The module-level `app`
+attribute is created on first access for `python app.py`, `flask --app app`
+and existing tests; production servers should go through serve.py.
 """
 
 import os
+from typing import Any, Dict, Optional
+
 from flask import Flask, jsonify
 from dotenv import load_dotenv
 
-from database.db import init_db, close_db
+from database.cli import db_cli
+from database.db import (
+    init_db, close_db, start_write_behind, stop_write_behind,
+    start_rollup_refresher, stop_rollup_refresher,
+)
+from database.pool import close_pools
+from service.compression import init_compression
+from service.evaluation import eval_cli, init_evaluation
+from service.gemini_service import get_gemini_service
+from service.admission import init_admission
+from service.idempotency import init_idempotency
+from service.principal_cache import init_principals
+from service.auth_service import init_tokens
+from service.profiler import init_profiler
+from service.session_store import init_sessions, start_session_sweeper, stop_session_sweeper
+from service.token_denylist import start_denylist_sync, stop_denylist_sync
+from service.usage import init_usage, start_usage_flusher, stop_usage_flusher
 from route.page_routes import page_bp
 from route.chat_routes import chat_bp
 from route.ai_routes import ai_bp
 from route.auth_routes import auth_bp
+from route.admin_routes import admin_bp
+from route.ws_routes import init_websocket
 
 load_dotenv()
 
-app = Flask(__name__, 
-            static_folder='stactic',
-            static_url_path='/static',
-            template_folder='templates')
 
-# Secret key for session management
-app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
+def _env_bool(name: str, default: str) -> bool:
+    return os.environ.get(name, default).lower() == "true"
 
-# Init SQLite database
-app.config["DB_PATH"] = os.environ.get(
-    "SQLITE_DB_PATH",
-    os.path.join(os.getcwd(), "database", "botinterface.db"),
-)
 
-# Preinscription URL (Université de Douala)
-app.config["PREINSCRIPTION_URL"] = os.environ.get(
-    "PREINSCRIPTION_URL",
-    "http://www.systhag-online.cm:8080/SYSTHAG-ONLINE/faces/etudiants/preInscription.xhtml",
-)
-init_db(app)
-app.teardown_appcontext(close_db)
+def config_from_env() -> Dict[str, Any]:
+    """Application settings read from the environment (.env supported)."""
+    return {
+        # Secret key for session management
+        "SECRET_KEY": os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production'),
+        # Flask session storage: "sqlite" keeps the data server-side behind an opaque cookie id
+        # (per-worker LRU cache, expiry slid at most every TOUCH interval, expired rows swept
+        # in batches), "cookie" is Flask's signed cookie
+        "SESSION_BACKEND": os.environ.get("SESSION_BACKEND", "sqlite"),
+        "SESSION_CACHE_SIZE": int(os.environ.get("SESSION_CACHE_SIZE", "10000")),
+        "SESSION_CACHE_TTL_S": float(os.environ.get("SESSION_CACHE_TTL_S", "5")),
+        "SESSION_TOUCH_INTERVAL_S": float(os.environ.get("SESSION_TOUCH_INTERVAL_S", "300")),
+        "SESSION_SWEEP_INTERVAL_S": float(os.environ.get("SESSION_SWEEP_INTERVAL_S", "600")),
+        "SESSION_SWEEP_BATCH": int(os.environ.get("SESSION_SWEEP_BATCH", "500")),
+        # Per-worker cache of logged-in users for login_required/admin_required; changes made
+        # in another worker are picked up from the user_invalidation generation every SYNC interval
+        "PRINCIPAL_CACHE_SIZE": int(os.environ.get("PRINCIPAL_CACHE_SIZE", "10000")),
+        "PRINCIPAL_CACHE_TTL_S": float(os.environ.get("PRINCIPAL_CACHE_TTL_S", "60")),
+        "PRINCIPAL_SYNC_INTERVAL_MS": int(os.environ.get("PRINCIPAL_SYNC_INTERVAL_MS", "1000")),
+        # Signed API tokens (POST /api/auth/token): "kid:secret,..." keys, the first signs and all
+        # verify (derived from SECRET_KEY when empty); access / refresh lifetimes. Revocations are
+        # read from SQLite into a per-worker bloom filter by a background thread every SYNC
+        # interval (0 disables the thread)
+        "JWT_SIGNING_KEYS": os.environ.get("JWT_SIGNING_KEYS", ""),
+        "JWT_ACCESS_TTL_S": float(os.environ.get("JWT_ACCESS_TTL_S", "900")),
+        "JWT_REFRESH_TTL_S": float(os.environ.get("JWT_REFRESH_TTL_S", str(30 * 86400))),
+        "JWT_DENYLIST_SYNC_MS": int(os.environ.get("JWT_DENYLIST_SYNC_MS", "1000")),
+        "JWT_DENYLIST_CAPACITY": int(os.environ.get("JWT_DENYLIST_CAPACITY", "100000")),
+        "JWT_DENYLIST_ERROR_RATE": float(os.environ.get("JWT_DENYLIST_ERROR_RATE", "0.001")),
+        "JWT_DENYLIST_REBUILD_S": float(os.environ.get("JWT_DENYLIST_REBUILD_S", "3600")),
+        # Bearer token for admin endpoints used by scripts (disabled when empty)
+        "ADMIN_API_TOKEN": os.environ.get('ADMIN_API_TOKEN', ''),
+        # SQLite database
+        "DB_PATH": os.environ.get(
+            "SQLITE_DB_PATH",
+            os.path.join(os.getcwd(), "database", "botinterface.db"),
+        ),
+        # Preinscription URL (Université de Douala)
+        "PREINSCRIPTION_URL": os.environ.get(
+            "PREINSCRIPTION_URL",
+            "http://www.systhag-online.cm:8080/SYSTHAG-ONLINE/faces/etudiants/preInscription.xhtml",
+        ),
+        # Read-only connection pool size per worker (writes go through one serialized writer)
+        "DB_READ_POOL_SIZE": int(os.environ.get("DB_READ_POOL_SIZE", "4")),
+        # Spread sessions and messages over N SQLite files by session uuid (0 = everything in DB_PATH);
+        # change it with `flask db rebalance --shards N` while workers are stopped
+        "DB_SHARDS": int(os.environ.get("DB_SHARDS", "0")),
+        # Optional group-commit write-behind for message inserts
+        "DB_WRITE_BEHIND": _env_bool("DB_WRITE_BEHIND", "False"),
+        "DB_WRITE_DURABILITY": os.environ.get("DB_WRITE_DURABILITY", "commit"),
+        "DB_FLUSH_INTERVAL_MS": int(os.environ.get("DB_FLUSH_INTERVAL_MS", "20")),
+        "DB_FLUSH_MAX_ROWS": int(os.environ.get("DB_FLUSH_MAX_ROWS", "256")),
+        "DB_WRITE_SYNCHRONOUS": os.environ.get("DB_WRITE_SYNCHRONOUS", "NORMAL"),
+        "DB_WRITE_TIMEOUT_S": float(os.environ.get("DB_WRITE_TIMEOUT_S", "30")),
+        # Per-statement SQL timing (/api/admin/queries) and slow-query log threshold
+        "DB_INSTRUMENT": _env_bool("DB_INSTRUMENT", "True"),
+        "DB_SLOW_QUERY_MS": float(os.environ.get("DB_SLOW_QUERY_MS", "100")),
+        # Stored compression of long message bodies (zlib, zstd with the zstandard package, or off);
+        # new rows use the newest dictionary trained by `flask db recompress --train`
+        "MESSAGE_COMPRESSION": os.environ.get("MESSAGE_COMPRESSION", "zlib"),
+        "MESSAGE_COMPRESS_MIN_BYTES": int(os.environ.get("MESSAGE_COMPRESS_MIN_BYTES", "512")),
+        "MESSAGE_COMPRESS_LEVEL": int(os.environ.get("MESSAGE_COMPRESS_LEVEL", "0")),
+        "MESSAGE_COMPRESS_DICTIONARY": _env_bool("MESSAGE_COMPRESS_DICTIONARY", "True"),
+        # Analytics rollups refresh period for /api/admin/stats (0 = only via `flask db rollup`)
+        "STATS_REFRESH_INTERVAL_S": float(os.environ.get("STATS_REFRESH_INTERVAL_S", "60")),
+        "STATS_SETTLE_SECONDS": int(os.environ.get("STATS_SETTLE_SECONDS", "5")),
+        # Time budget of one /api/chat request (clients may ask for less or more, up to the max)
+        "CHAT_DEADLINE_MS": int(os.environ.get("CHAT_DEADLINE_MS", "30000")),
+        "CHAT_DEADLINE_MAX_MS": int(os.environ.get("CHAT_DEADLINE_MAX_MS", "60000")),
+        # Admission control of chat generations per worker (0 = disabled): concurrency,
+        # per-class shares of it, queue bound and per-class queue-time limits
+        "ADMISSION_CAPACITY": int(os.environ.get("ADMISSION_CAPACITY", "8")),
+        "ADMISSION_SHARES": os.environ.get("ADMISSION_SHARES", "admin:1.0,student:0.8,guest:0.5"),
+        "ADMISSION_MAX_QUEUE": int(os.environ.get("ADMISSION_MAX_QUEUE", "32")),
+        "ADMISSION_MAX_WAIT_MS": os.environ.get("ADMISSION_MAX_WAIT_MS", "admin:10000,student:5000,guest:2000"),
+        # Chat WebSocket /ws/chat (needs flask-sock), off by default: under the gthread workers
+        # of serve.py each open socket holds one server thread, so at most MAX_CONNECTIONS
+        # sockets per worker (default WEB_THREADS // 4) and extra tabs stay on HTTP.
+        # Keepalive ping, in-flight messages per connection, max frame size
+        "WS_ENABLED": _env_bool("WS_ENABLED", "False"),
+        "WS_MAX_CONNECTIONS": int(os.environ.get(
+            "WS_MAX_CONNECTIONS", str(max(1, int(os.environ.get("WEB_THREADS", "4")) // 4)))),
+        "WS_PING_INTERVAL_S": float(os.environ.get("WS_PING_INTERVAL_S", "25")),
+        "WS_MAX_PENDING": int(os.environ.get("WS_MAX_PENDING", "4")),
+        "WS_MAX_MESSAGE_BYTES": int(os.environ.get("WS_MAX_MESSAGE_BYTES", "65536")),
+        # Origins allowed to open /ws/chat besides the app's own host ("https://a.example,...");
+        # browsers send the cookie on cross-site WebSockets without any CORS check
+        "WS_ALLOWED_ORIGINS": os.environ.get("WS_ALLOWED_ORIGINS", ""),
+        # Gemini token metering: in-memory counters per user/session/day flushed to token_usage
+        # every FLUSH interval; daily token quota per class (0 = unlimited), 429 once used up
+        "USAGE_DAILY_QUOTAS": os.environ.get("USAGE_DAILY_QUOTAS", "admin:0,student:200000,guest:20000"),
+        "USAGE_FLUSH_INTERVAL_S": float(os.environ.get("USAGE_FLUSH_INTERVAL_S", "5")),
+        # Golden sets available to POST /api/admin/eval (file names inside this directory)
+        "EVAL_DIR": os.environ.get("EVAL_DIR", os.path.join(os.getcwd(), "eval")),
+        # Idempotency-Key replay window for /api/chat and how long a retry waits for the original
+        "IDEMPOTENCY_TTL_S": float(os.environ.get("IDEMPOTENCY_TTL_S", "86400")),
+        "IDEMPOTENCY_WAIT_S": float(os.environ.get("IDEMPOTENCY_WAIT_S", "90")),
+        # Sampling profiler of /api/ requests: keeps requests slower than the threshold (and a
+        # random sample) as collapsed stacks in a ring buffer of PROFILE_MAX_FILES captures
+        "PROFILE_ENABLED": _env_bool("PROFILE_ENABLED", "False"),
+        "PROFILE_DIR": os.environ.get("PROFILE_DIR", os.path.join(os.getcwd(), "profiles")),
+        "PROFILE_INTERVAL_MS": float(os.environ.get("PROFILE_INTERVAL_MS", "10")),
+        "PROFILE_THRESHOLD_MS": float(os.environ.get("PROFILE_THRESHOLD_MS", "2000")),
+        "PROFILE_SAMPLE_RATE": float(os.environ.get("PROFILE_SAMPLE_RATE", "0")),
+        "PROFILE_MAX_FILES": int(os.environ.get("PROFILE_MAX_FILES", "50")),
+        "PROFILE_MAX_PER_MIN": int(os.environ.get("PROFILE_MAX_PER_MIN", "30")),
+        # Response compression (gzip / brotli negotiated via Accept-Encoding)
+        "COMPRESS_ENABLED": _env_bool("COMPRESS_ENABLED", "True"),
+        "COMPRESS_MIN_SIZE": int(os.environ.get("COMPRESS_MIN_SIZE", "500")),
+        "COMPRESS_GZIP_LEVEL": int(os.environ.get("COMPRESS_GZIP_LEVEL", "6")),
+        "COMPRESS_BROTLI_LEVEL": int(os.environ.get("COMPRESS_BROTLI_LEVEL", "4")),
+        "COMPRESS_STREAMS": _env_bool("COMPRESS_STREAMS", "True"),
+    }
 
-# Register blueprints
-app.register_blueprint(page_bp)
-app.register_blueprint(chat_bp)
-app.register_blueprint(ai_bp)
-app.register_blueprint(auth_bp)
 
+def create_app(config: Optional[Dict[str, Any]] = None) -> Flask:
+    """Build a fully configured Flask application.
 
-@app.context_processor
-def inject_globals():
-    """Inject global variables into all templates."""
-    return {
-        "PREINSCRIPTION_URL": app.config.get("PREINSCRIPTION_URL"),
-    }
+    `config` overrides values read from the environment, e.g.
+    create_app({"DB_PATH": tmp_path, "TESTING": True}).
+
+    No background threads are started here, so the result can be built
+    in a preforking master: call init_worker(app) in each process that
+    serves requests (serve.py's post_fork hook, the dev server below).
+    """
+    app = Flask(__name__,
+                static_folder='stactic',
+                static_url_path='/static',
+                template_folder='templates')
+    app.config.update(config_from_env())
+    if config:
+        app.config.update(config)
+
+    init_db(app)
+    app.teardown_appcontext(close_db)
+    init_sessions(app)
+    init_principals(app)
+    init_tokens(app)
+    init_compression(app)
+    init_idempotency(app)
+    init_admission(app)
+    init_usage(app)
+    init_evaluation(app)
+    init_profiler(app)
+
+    # Register blueprints
+    app.register_blueprint(page_bp)
+    app.register_blueprint(chat_bp)
+    app.register_blueprint(ai_bp)
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(admin_bp)
+    init_websocket(app)
+    app.cli.add_command(db_cli)
+    app.cli.add_command(eval_cli)
 
+    @app.context_processor
+    def inject_globals():
+        """Inject global variables into all templates."""
+        return {
+            "PREINSCRIPTION_URL": app.config.get("PREINSCRIPTION_URL"),
+            # The chat page only opens a WebSocket when the route is served
+            "WS_CHAT": app.extensions.get("websocket") is not None,
+        }
 
-@app.errorhandler(404)
-def not_found(error):
-    """Handle 404 errors"""
-    return jsonify({'error': 'Route non trouvée'}), 404
+    @app.errorhandler(404)
+    def not_found(error):
+        """Handle 404 errors"""
+        return jsonify({'error': 'Route non trouvée'}), 404
 
+    @app.errorhandler(500)
+    def internal_error(error):
+        """Handle 500 errors"""
+        print(f'[ERROR] Internal error: {error}')
+        return jsonify({'error': 'Erreur serveur interne'}), 500
 
-@app.errorhandler(500)
-def internal_error(error):
-    """Handle 500 errors"""
-    print(f'[ERROR] Internal error: {error}')
-    return jsonify({'error': 'Erreur serveur interne'}), 500
+    preload(app)
+    return app
+
+
+def preload(app: Flask) -> None:
+    """Build immutable, fork-safe state once, before workers are forked.
+
+    Everything here is shared copy-on-write by preforked workers: compiled
+    Jinja templates and the Gemini service with its prompt template. No
+    sockets, threads or SQLite connections are created here.
+    """
+    for name in app.jinja_env.list_templates():
+        if name.endswith(".html"):
+            app.jinja_env.get_template(name)
+    get_gemini_service()
+
+
+def init_worker(app: Flask, warm: bool = False) -> None:
+    """Per-process initialisation (call again in every forked worker).
+
+    Idempotent within a process. Connection pools are keyed by pid and are
+    opened lazily; the background threads (write-behind, rollups, session
+    sweeper, usage flush, token denylist sync) and the Gemini client must not be inherited across
+    fork, so they are (re)created here. With warm=True the read pool, the
+    Gemini client and its HTTP connections are opened before the first request.
+    """
+    pid = os.getpid()
+    if app.extensions.get("worker_pid") == pid:
+        return
+    forked = "worker_pid" in app.extensions
+    app.extensions["worker_pid"] = pid
+    start_write_behind(app)
+    start_rollup_refresher(app)
+    start_session_sweeper(app)
+    start_usage_flusher(app)
+    start_denylist_sync(app)
+    svc = get_gemini_service()
+    if forked:
+        svc.reset_client()
+    if warm:
+        with app.app_context():
+            from database.db import session_exists
+            session_exists("warm-up")
+        svc.warm_up()
+
+
+def shutdown_worker(app: Flask) -> None:
+    """Flush pending writes and close this process' connections."""
+    stop_write_behind(app)
+    stop_rollup_refresher(app)
+    stop_session_sweeper(app)
+    stop_usage_flusher(app)
+    stop_denylist_sync(app)
+    close_pools()
+
+
+def __getattr__(name):
+    # Lazily build the default application so importing this module has no
+    # side effects (`from app import app` still works).
+    if name == "app":
+        application = create_app()
+        globals()["app"] = application
+        return application
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 if __name__ == '__main__':
-    # Development server
+    # Development server (see serve.py for production)
     debug_mode = os.environ.get('FLASK_DEBUG', 'True').lower() == 'true'
     port = int(os.environ.get('PORT', '5000'))
-    
-    app.run(
+
+    application = create_app()
+    init_worker(application)
+    application.run(
         host='0.0.0.0',
         port=port,
         debug=debug_mode
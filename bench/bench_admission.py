@@ -0,0 +1,98 @@
+"""Benchmark: chat generations under overload, plain FIFO vs priority admission.
+Run: python bench/bench_admission.py [--requests 600] [--capacity 4] [--overload 1.5]
+
+Requests arrive open-loop at --overload times what --capacity slots can
+serve (each generation sleeps ~--service-ms). The mix is 10 % admin, 40 %
+student and 50 % guest. "fifo" lets every request wait for a slot in
+arrival order. "admission" uses the default shares and queue-time limits.
+A request counts as good when it completes within --client-timeout-ms.
+After that point the client has already given up.
+"""
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from service.admission import CLASSES, AdmissionController, AdmissionRejected
+
+MIX = (("admin", 0.1), ("student", 0.4), ("guest", 0.5))
+
+
+def _pick(rng):
+    roll = rng.random()
+    for cls, weight in MIX:
+        if roll < weight:
+            return cls
+        roll -= weight
+    return MIX[-1][0]
+
+
+def run(label, controller, args, priorities=True):
+    rng = random.Random(7)
+    results = {cls: {"latencies": [], "shed": 0} for cls in CLASSES}
+    lock = threading.Lock()
+    interval = args.service_ms / 1000.0 / args.capacity / args.overload
+
+    def request(cls, service_s):
+        start = time.perf_counter()
+        try:
+            slot = cls if priorities else "student"
+            started = controller.acquire(slot)
+        except AdmissionRejected:
+            with lock:
+                results[cls]["shed"] += 1
+            return
+        time.sleep(service_s)
+        controller.release(slot, started)
+        with lock:
+            results[cls]["latencies"].append((time.perf_counter() - start) * 1000)
+
+    threads = []
+    next_at = time.perf_counter()
+    for _ in range(args.requests):
+        service_s = max(0.001, rng.gauss(args.service_ms, args.service_ms * 0.2)) / 1000.0
+        thread = threading.Thread(target=request, args=(_pick(rng), service_s))
+        thread.start()
+        threads.append(thread)
+        next_at += rng.expovariate(1.0 / interval)
+        time.sleep(max(0.0, next_at - time.perf_counter()))
+    for thread in threads:
+        thread.join()
+
+    for cls in CLASSES:
+        latencies = sorted(results[cls]["latencies"])
+        good = sum(1 for ms in latencies if ms <= args.client_timeout_ms)
+        total = len(latencies) + results[cls]["shed"]
+        pct = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+        print(f"{label:>9} {cls:>8} {total:>6} {results[cls]['shed']:>6} {good:>6} "
+              f"{pct(0.5):9.0f} {pct(0.95):9.0f} {latencies[-1] if latencies else 0.0:9.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=600)
+    parser.add_argument("--capacity", type=int, default=4)
+    parser.add_argument("--service-ms", type=float, default=100.0)
+    parser.add_argument("--overload", type=float, default=1.5, help="arrival rate / service rate")
+    parser.add_argument("--client-timeout-ms", type=float, default=3000.0)
+    args = parser.parse_args()
+    print(f"{'mode':>9} {'class':>8} {'sent':>6} {'shed':>6} {'good':>6} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    # Every request in one class, no queue bound or time limit: plain FIFO
+    fifo = AdmissionController(capacity=args.capacity, max_queue=args.requests,
+                               shares={"student": 1.0},
+                               max_wait_ms={"student": 3600 * 1000})
+    run("fifo", fifo, args, priorities=False)
+    run("admission", AdmissionController(capacity=args.capacity), args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Benchmark: CPU cost vs bytes saved when compressing /api/history payloads.
+Run: python bench/bench_compression.py [--messages 40]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import zlib
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from service.compression import brotli
+
+QUESTIONS = [
+    "Bonjour, comment faire ma préinscription à l'Université de Douala ?",
+    "Quels sont les documents requis pour la préinscription en licence 1 ?",
+    "Est-ce que je peux payer les frais de préinscription par mobile money ?",
+    "Quelle est la date limite pour la préinscription cette année ?",
+    "J'ai oublié mon mot de passe SYSTHAG, que dois-je faire ?",
+]
+
+REPLY_SENTENCES = [
+    "Pour effectuer votre préinscription, rendez-vous sur le portail officiel SYSTHAG.",
+    "Créez d'abord votre compte avec une adresse email valide, puis connectez-vous.",
+    "Remplissez le formulaire en indiquant votre filière, votre diplôme et vos informations personnelles.",
+    "Téléversez les pièces requises : acte de naissance, relevé de notes du baccalauréat et photo d'identité.",
+    "Vérifiez attentivement toutes les informations avant de valider définitivement votre dossier.",
+    "Le paiement des frais se fait uniquement via les canaux officiels indiqués sur le portail.",
+    "Conservez le reçu de paiement, il vous sera demandé lors de l'inscription administrative.",
+    "En cas de difficulté, contactez le service de la scolarité de votre faculté.",
+]
+
+
+def build_history_payload(n_messages: int, seed: int = 7) -> bytes:
+    """Build a JSON body shaped like GET /api/history."""
+    rng = random.Random(seed)
+    messages = []
+    for i in range(n_messages):
+        if i % 2 == 0:
+            content = rng.choice(QUESTIONS)
+            role = "user"
+        else:
+            content = " ".join(rng.sample(REPLY_SENTENCES, k=rng.randint(3, 7)))
+            role = "assistant"
+        messages.append({
+            "role": role,
+            "content": content,
+            "timestamp": f"2025-09-{1 + i % 28:02d} 10:{i % 60:02d}:00",
+            "error": None,
+        })
+    body = {"messages": messages, "session_id": "6f1c3c52-0b7e-4c1e-9a43-2a0f3f0f8d11"}
+    # Flask's jsonify escapes non-ASCII by default, mirror that here.
+    return json.dumps(body).encode("utf-8")
+
+
+def _time_it(fn, data: bytes, repeat: int):
+    best = float("inf")
+    out = b""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn(data)
+        best = min(best, time.perf_counter() - start)
+    return best, len(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, nargs="+", default=[10, 40, 200])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    codecs = []
+    for level in (1, 6, 9):
+        def _gzip(data, level=level):
+            c = zlib.compressobj(level, zlib.DEFLATED, 31)
+            return c.compress(data) + c.flush()
+        codecs.append((f"gzip-{level}", _gzip))
+    if brotli is not None:
+        for quality in (1, 4, 6, 11):
+            codecs.append((f"br-{quality}", lambda data, q=quality: brotli.compress(data, quality=q)))
+    else:
+        print("[WARN] brotli not installed, only gzip is measured")
+
+    print(f"{'messages':>8} {'codec':>8} {'raw B':>9} {'out B':>9} {'saved':>7} {'cpu µs':>9} {'MB/s':>8}")
+    for n in args.messages:
+        data = build_history_payload(n)
+        for name, fn in codecs:
+            seconds, size = _time_it(fn, data, args.repeat)
+            saved = 1 - size / len(data)
+            mbps = len(data) / seconds / 1e6 if seconds else float("inf")
+            print(f"{n:>8} {name:>8} {len(data):>9} {size:>9} {saved:>6.1%} {seconds * 1e6:>9.1f} {mbps:>8.1f}")
+    # On a 3G link (~400 kbit/s effective) every KB saved is ~20 ms of transfer,
+    # compared against a few hundred µs of CPU at the default levels.
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Benchmark: streaming NDJSON export / import rate and peak memory.
+Run: python bench/bench_export.py [--messages 1000000] [--per-session 20] [--gzip]
+
+Peak RSS is reported after seeding, after export and after import so a
+growing export (e.g. --messages 10000000) shows whether memory stays flat.
+"""
+
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from database.export import export_to_file, import_ndjson, open_ndjson
+from database.migrations import migrate
+from database.pool import connect
+
+REPLY = "Pour votre préinscription, rendez-vous sur le portail SYSTHAG et suivez les étapes. " * 4
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def seed(path, messages, per_session):
+    conn = connect(path)
+    migrate(conn)
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("BEGIN")
+    sessions = (messages + per_session - 1) // per_session
+    conn.executemany("INSERT INTO session (uuid) VALUES (?)", ((f"bench-{s}",) for s in range(sessions)))
+    conn.executemany(
+        "INSERT INTO message (session_id, role, content) VALUES (?, ?, ?)",
+        ((i // per_session + 1, "user" if i % 2 == 0 else "assistant", REPLY) for i in range(messages)),
+    )
+    conn.execute("COMMIT")
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--per-session", type=int, default=20)
+    parser.add_argument("--gzip", action="store_true", help="gzip the export")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    src = os.path.join(tmp, "src.db")
+    out = os.path.join(tmp, "export.ndjson" + (".gz" if args.gzip else ""))
+
+    start = time.perf_counter()
+    seed(src, args.messages, args.per_session)
+    print(f"seeded {args.messages} messages in {time.perf_counter() - start:.1f}s, peak RSS {_peak_rss_mb():.0f} MB")
+
+    conn = connect(src, read_only=True)
+    start = time.perf_counter()
+    with open(out, "wb") as fh:
+        lines = export_to_file(conn, fh, compress=args.gzip)
+    elapsed = time.perf_counter() - start
+    conn.close()
+    size_mb = os.path.getsize(out) / 1e6
+    print(f"export: {lines} lines, {size_mb:.1f} MB in {elapsed:.1f}s "
+          f"({lines / elapsed:,.0f} lines/s), peak RSS {_peak_rss_mb():.0f} MB")
+
+    dst = os.path.join(tmp, "dst.db")
+    conn = connect(dst)
+    migrate(conn)
+    start = time.perf_counter()
+    with open(out, "rb") as fh:
+        stats = import_ndjson(conn, open_ndjson(fh))
+    elapsed = time.perf_counter() - start
+    conn.close()
+    print(f"import: {stats['messages']} messages in {elapsed:.1f}s "
+          f"({stats['messages'] / elapsed:,.0f} rows/s), peak RSS {_peak_rss_mb():.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Benchmark: tail latency of GeminiService with and without hedged requests.
+Run: python bench/bench_hedging.py [--requests 400] [--threads 8] [--slow-rate 0.05]
+
+The fake upstream answers in ~N(median, 20%) but a fraction of calls
+(--slow-rate) takes 10-30x longer, like an occasional stuck generation.
+"""
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from service.gemini_service import GeminiService
+from service.hedging import HedgePolicy
+
+
+class HeavyTailClient:
+    def __init__(self, median_ms, slow_rate, seed):
+        rng = random.Random(seed)
+        lock = threading.Lock()
+
+        class models:
+            @staticmethod
+            def generate_content(model, contents):
+                with lock:
+                    latency = max(1.0, rng.gauss(median_ms, median_ms * 0.2))
+                    if rng.random() < slow_rate:
+                        latency *= rng.uniform(10, 30)
+                time.sleep(latency / 1000.0)
+                return SimpleNamespace(text="ok")
+
+        self.models = models
+
+
+def run(hedge, args):
+    svc = GeminiService()
+    svc.client = HeavyTailClient(args.median_ms, args.slow_rate, seed=42)
+    svc.hedging = HedgePolicy(enabled=hedge, max_rate=args.max_rate, min_samples=20)
+    latencies = []
+    lock = threading.Lock()
+    per_thread = args.requests // args.threads
+
+    def worker():
+        for _ in range(per_thread):
+            start = time.perf_counter()
+            svc.generate_reply("Comment faire ma préinscription ?", [])
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+    stats = svc.hedging.stats()
+    label = "hedged" if hedge else "plain"
+    print(f"{label:>7} {pct(0.5):8.1f} {pct(0.9):8.1f} {pct(0.99):8.1f} {latencies[-1]:8.1f} "
+          f"{stats['hedge_rate']:>10.3f} {stats['hedge_wins']:>6}")
+    svc._pool().shutdown(wait=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--median-ms", type=float, default=20.0)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--max-rate", type=float, default=0.1, help="hedge budget (fraction of requests)")
+    args = parser.parse_args()
+    print(f"{'mode':>7} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} {'hedge rate':>10} {'wins':>6}")
+    run(False, args)
+    run(True, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+/**
+ * Benchmark: rendering a long chat history, one node per message vs the
+ * windowed MessageList from stactic/js/index.js.
+ * Run: node bench/bench_message_list.js [--messages 5000] [--viewport 800]
+ *
+ * Runs without a browser on a minimal fake DOM. Layout is modelled the way
+ * browsers do it: a geometry read (offsetHeight, scrollHeight, offsetTop)
+ * after a DOM mutation lays out every attached node again. The report shows
+ * wall time, layout passes, nodes laid out and nodes left in the document.
+ */
+
+'use strict';
+
+const path = require('path');
+
+function arg(name, fallback) {
+    const i = process.argv.indexOf(`--${name}`);
+    return i > 0 ? Number(process.argv[i + 1]) : fallback;
+}
+
+const MESSAGES = arg('messages', 5000);
+const VIEWPORT = arg('viewport', 800);
+const LINE_CHARS = 60;
+const LINE_HEIGHT = 24;
+
+// ---- fake DOM ----
+
+const layout = { dirty: true, passes: 0, visited: 0, root: null };
+
+function invalidate() {
+    layout.dirty = true;
+}
+
+function flushLayout() {
+    if (!layout.dirty) {
+        return;
+    }
+    layout.passes++;
+    const walk = (node) => {
+        layout.visited++;
+        let height = 0;
+        if (node.isText) {
+            height = Math.max(1, Math.ceil(node._text.length / LINE_CHARS)) * LINE_HEIGHT + 40;
+        } else if (node.style.height) {
+            height = parseFloat(node.style.height) || 0;
+        }
+        for (const child of node.children) {
+            height += walk(child);
+        }
+        node._height = height;
+        return height;
+    };
+    walk(layout.root);
+    layout.dirty = false;
+}
+
+class FakeClassList {
+    constructor(el) { this.el = el; this.set = new Set(); }
+    add(c) { this.set.add(c); invalidate(); }
+    remove(c) { this.set.delete(c); invalidate(); }
+    contains(c) { return this.set.has(c); }
+    toggle(c, force) {
+        const on = force === undefined ? !this.set.has(c) : force;
+        if (on) { this.set.add(c); } else { this.set.delete(c); }
+        invalidate();
+        return on;
+    }
+}
+
+class FakeElement {
+    constructor(tag) {
+        this.tagName = tag;
+        this.children = [];
+        this.parentNode = null;
+        this.classList = new FakeClassList(this);
+        this.style = {};
+        this.listeners = {};
+        this.isText = false;
+        this._text = '';
+        this._height = 0;
+        this.scrollTop = 0;
+        this.clientHeight = 0;
+    }
+    set className(value) { this.classList.set = new Set(value.split(' ')); this.isText = value === 'message-text'; invalidate(); }
+    get className() { return [...this.classList.set].join(' '); }
+    set textContent(value) { this._text = String(value); invalidate(); }
+    get textContent() { return this._text; }
+    set innerHTML(value) { this._text = String(value); invalidate(); }
+    get nextSibling() {
+        if (!this.parentNode) { return null; }
+        const siblings = this.parentNode.children;
+        return siblings[siblings.indexOf(this) + 1] || null;
+    }
+    get firstChild() { return this.children[0] || null; }
+    appendChild(child) { return this.insertBefore(child, null); }
+    insertBefore(child, ref) {
+        if (child.parentNode) { child.parentNode.removeChild(child); }
+        const index = ref ? this.children.indexOf(ref) : this.children.length;
+        this.children.splice(index, 0, child);
+        child.parentNode = this;
+        invalidate();
+        return child;
+    }
+    removeChild(child) {
+        this.children.splice(this.children.indexOf(child), 1);
+        child.parentNode = null;
+        invalidate();
+        return child;
+    }
+    addEventListener(type, fn) { (this.listeners[type] = this.listeners[type] || []).push(fn); }
+    get offsetHeight() { flushLayout(); return this._height; }
+    get scrollHeight() { flushLayout(); return this._height; }
+    get offsetTop() { flushLayout(); return 0; }
+}
+
+function countNodes(node) {
+    return 1 + node.children.reduce((sum, child) => sum + countNodes(child), 0);
+}
+
+function installFakeDom() {
+    const scroller = new FakeElement('main');
+    scroller.className = 'main-content';
+    scroller.clientHeight = VIEWPORT;
+    const wrapper = new FakeElement('div');
+    scroller.appendChild(wrapper);
+    layout.root = scroller;
+
+    let frames = [];
+    global.document = {
+        createElement: (tag) => new FakeElement(tag),
+        addEventListener: () => {},
+        getElementById: () => null,
+        querySelector: () => null,
+    };
+    global.window = { addEventListener: () => {} };
+    global.requestAnimationFrame = (fn) => { frames.push(fn); return frames.length; };
+    global.cancelAnimationFrame = () => { frames = []; };
+    global.runFrames = () => {
+        let count = 0;
+        while (frames.length) {
+            const pending = frames;
+            frames = [];
+            pending.forEach((fn) => fn());
+            count++;
+        }
+        return count;
+    };
+    return { scroller, wrapper };
+}
+
+function history(count) {
+    const messages = [];
+    for (let i = 0; i < count; i++) {
+        const role = i % 2 === 0 ? 'user' : 'assistant';
+        const content = role === 'user'
+            ? `Question ${i} : comment se déroule la préinscription ?`
+            : `Réponse ${i} : rendez-vous sur le portail SYSTHAG. `.repeat(1 + (i % 5));
+        messages.push({ role, content, timestamp: new Date() });
+    }
+    return messages;
+}
+
+function resetCounters() {
+    layout.passes = 0;
+    layout.visited = 0;
+    layout.dirty = true;
+}
+
+function report(label, ms, scroller) {
+    console.log(
+        `${label.padEnd(24)} ${ms.toFixed(1).padStart(9)} ms  ` +
+        `${String(layout.passes).padStart(6)} layouts  ` +
+        `${String(layout.visited).padStart(12)} nodes laid out  ` +
+        `${String(countNodes(scroller)).padStart(7)} DOM nodes`
+    );
+}
+
+function main() {
+    const { MessageList, createMessageElement } = (() => {
+        installFakeDom();
+        return require(path.join(__dirname, '..', 'stactic', 'js', 'index.js'));
+    })();
+    const messages = history(MESSAGES);
+    console.log(`${MESSAGES} messages, ${VIEWPORT}px viewport`);
+
+    // Previous behaviour: one element per message, each followed by a
+    // scrollToBottom() whose read was deferred with setTimeout
+    {
+        const { scroller, wrapper } = installFakeDom();
+        resetCounters();
+        const start = process.hrtime.bigint();
+        const timers = [];
+        for (const message of messages) {
+            wrapper.appendChild(createMessageElement(message));
+            timers.push(() => { scroller.scrollTop = scroller.scrollHeight; });
+        }
+        timers.forEach((fn) => fn());
+        report('one node per message', Number(process.hrtime.bigint() - start) / 1e6, scroller);
+    }
+
+    // Windowed list: whole history appended in one frame
+    {
+        const { scroller, wrapper } = installFakeDom();
+        const list = new MessageList(wrapper, scroller);
+        resetCounters();
+        const start = process.hrtime.bigint();
+        list.appendMany(messages);
+        const frames = global.runFrames();
+        report(`windowed (${frames} frames)`, Number(process.hrtime.bigint() - start) / 1e6, scroller);
+
+        // Scroll from the bottom to the top one viewport at a time
+        list.stickToBottom = false;
+        resetCounters();
+        const steps = Math.ceil(scroller.scrollHeight / VIEWPORT);
+        const scrollStart = process.hrtime.bigint();
+        for (let top = scroller.scrollHeight; top > 0; top -= VIEWPORT) {
+            scroller.scrollTop = top;
+            list.schedule();
+            global.runFrames();
+        }
+        const perStep = Number(process.hrtime.bigint() - scrollStart) / 1e6 / steps;
+        report(`scroll step (avg of ${steps})`, perStep, scroller);
+        const pooled = Object.values(list.pool).reduce((sum, pool) => sum + pool.length, 0);
+        console.log(`recycled nodes in pool: ${pooled}`);
+    }
+}
+
+main();
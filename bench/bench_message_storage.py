@@ -0,0 +1,140 @@
+"""Benchmark: stored size vs read latency of compressed message bodies.
+Run: python bench/bench_message_storage.py [--sessions 300] [--per-session 20]
+
+Builds one database per setting (plain, zlib, zlib + dictionary, and zstd
+when the zstandard package is installed) from the same synthetic corpus:
+short user questions, Gemini-like replies of 1-6 KB of French prose, and
+a few pasted documents. The dictionary is trained on the first 20% of the
+messages. For each setting it reports:
+
+  size      database file after VACUUM
+  encode    compression cost per message on the write path
+  history   reading + decoding the 20 messages of one session (get_messages)
+  scan      GROUP BY role over the whole table; never decodes
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from database.content_codec import MessageCodec, configure_content, zstandard
+from database.migrations import migrate
+
+SENTENCES = [
+    "Pour votre préinscription à l'Université de Douala, connectez-vous au portail SYSTHAG.",
+    "Munissez-vous de votre relevé de notes du baccalauréat et d'une pièce d'identité.",
+    "Les frais de dossier sont payables en ligne ou auprès de la banque partenaire.",
+    "La Faculté des Sciences propose des licences en informatique, mathématiques et physique.",
+    "Les inscriptions administratives se font au service de la scolarité du campus principal.",
+    "Le calendrier académique est publié chaque année sur le site officiel de l'université.",
+    "Pour plus d'informations, contactez le service d'orientation ou consultez la FAQ.",
+    "Les candidats titulaires d'un diplôme étranger doivent fournir une équivalence.",
+    "Les cours reprennent généralement en octobre après la publication des listes.",
+    "Vous pouvez suivre l'état de votre dossier depuis votre espace étudiant.",
+    "L'École Nationale Supérieure Polytechnique recrute sur concours après le baccalauréat.",
+    "Les bourses d'excellence sont attribuées selon les résultats du premier semestre.",
+]
+QUESTIONS = ["Comment faire ma préinscription ?", "Quels sont les frais ?", "Où est le campus ?",
+             "Quelles filières en informatique ?", "Date limite des inscriptions ?"]
+WORDS = ("étudiant université campus licence master dossier inscription semestre filière "
+         "examen concours bourse calendrier faculté département scolarité").split()
+
+
+def corpus(sessions, per_session, seed=5):
+    rng = random.Random(seed)
+    messages = []
+    for s in range(sessions):
+        for i in range(per_session):
+            if i % 2 == 0:
+                if rng.random() < 0.03:
+                    # Pasted document: long, mostly unique prose
+                    text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1500, 3000)))
+                else:
+                    text = rng.choice(QUESTIONS)
+                messages.append((s + 1, "user", text))
+            else:
+                parts = [f"Bonjour, voici la réponse à votre question n°{rng.randint(1, 9999)}."]
+                while sum(len(p) for p in parts) < rng.randint(1000, 6000):
+                    parts.append(rng.choice(SENTENCES))
+                    if rng.random() < 0.3:
+                        parts.append(" ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 20))) + ".")
+                messages.append((s + 1, "assistant", "\n".join(parts)))
+    return messages
+
+
+def build(path, messages, sessions, algorithm, dictionary):
+    conn = sqlite3.connect(path, isolation_level=None)
+    migrate(conn)
+    conn.executemany("INSERT INTO session (uuid) VALUES (?)", ((f"s{i}",) for i in range(sessions)))
+    configure_content(algorithm or "off", min_bytes=512, use_dictionary=dictionary)
+    codec = MessageCodec(path)
+    if algorithm and dictionary:
+        conn.execute("BEGIN IMMEDIATE")
+        codec.train(conn, [text for _, _, text in messages[:len(messages) // 5]])
+        conn.execute("COMMIT")
+    start = time.perf_counter()
+    rows = []
+    for session_id, role, text in messages:
+        codec_id, value = codec.encode(text)
+        rows.append((session_id, role, value, codec_id))
+    encode_us = (time.perf_counter() - start) / len(messages) * 1e6
+    conn.execute("BEGIN")
+    conn.executemany("INSERT INTO message (session_id, role, content, codec) VALUES (?, ?, ?, ?)", rows)
+    conn.execute("COMMIT")
+    conn.execute("VACUUM")
+    return conn, codec, encode_us
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=300)
+    parser.add_argument("--per-session", type=int, default=20)
+    args = parser.parse_args()
+
+    messages = corpus(args.sessions, args.per_session)
+    raw = sum(len(text.encode("utf-8")) for _, _, text in messages)
+    print(f"{len(messages)} messages, {raw / 1e6:.1f} MB of text\n")
+    settings = [("plain", None, False), ("zlib", "zlib", False), ("zlib + dictionary", "zlib", True)]
+    if zstandard is not None:
+        settings += [("zstd", "zstd", False), ("zstd + dictionary", "zstd", True)]
+
+    print(f"{'setting':<20} {'size MB':>8} {'encode us/msg':>14} {'history ms':>11} {'scan ms':>8}")
+    directory = tempfile.mkdtemp()
+    for label, algorithm, dictionary in settings:
+        path = os.path.join(directory, label.replace(" ", "_").replace("+", "") + ".db")
+        conn, codec, encode_us = build(path, messages, args.sessions, algorithm, dictionary)
+        sample = random.Random(1).sample(range(1, args.sessions + 1), 50)
+
+        def history():
+            for session_id in sample:
+                rows = conn.execute("SELECT role, content, created_ms, error, codec FROM message "
+                                    "WHERE session_id = ? ORDER BY id", (session_id,)).fetchall()
+                [codec.decode(r[4], r[1]) for r in rows]
+
+        history_ms = timed(history, 5) / len(sample) * 1000
+        scan_ms = timed(lambda: conn.execute("SELECT role, COUNT(*) FROM message GROUP BY role").fetchall(), 5) * 1000
+        conn.close()
+        print(f"{label:<20} {os.path.getsize(path) / 1e6:8.2f} {encode_us:14.1f} {history_ms:11.3f} {scan_ms:8.2f}")
+    configure_content()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Benchmark: overhead of the sampling profiler on request handling.
+Run: python bench/bench_profiler.py [--threads 8] [--seconds 3] [--interval-ms 10]
+
+Each worker thread serves fake requests in a loop. A request is some CPU
+work (JSON round-trip of a /api/history-sized payload) plus a short sleep
+standing in for SQLite and Gemini I/O. The modes are:
+
+  off        no profiler
+  enabled    sampling every request, threshold never reached (steady state)
+  capturing  sampling and writing a capture for every request (worst case;
+             writes are still capped by the per-minute limit)
+
+The report is throughput and CPU time per request relative to "off".
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from service.profiler import SamplingProfiler
+
+PAYLOAD = {"messages": [{"role": "assistant", "content": "Rendez-vous sur le portail SYSTHAG. " * 8,
+                         "timestamp": "2025-09-01 10:00:00"} for _ in range(40)]}
+
+
+def handle_request(io_s):
+    body = json.dumps(PAYLOAD)
+    json.loads(body)
+    time.sleep(io_s)
+
+
+def run(label, profiler, args, baseline=None):
+    stop = time.monotonic() + args.seconds
+    counts = [0] * args.threads
+
+    def worker(index):
+        while time.monotonic() < stop:
+            capture = profiler.begin() if profiler else None
+            handle_request(args.io_ms / 1000.0)
+            if profiler:
+                profiler.end(capture, "GET", "/api/history", 200)
+            counts[index] += 1
+
+    cpu_start = time.process_time()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    cpu = time.process_time() - cpu_start
+    total = sum(counts)
+    rate = total / args.seconds
+    cpu_us = cpu / total * 1e6
+    overhead = f"{(cpu_us / baseline - 1) * 100:+7.1f}%" if baseline else f"{'-':>8}"
+    captured = profiler.counters["captured"] if profiler else 0
+    print(f"{label:>10} {rate:10.0f} {cpu_us:12.1f} {overhead} {captured:>9}")
+    return cpu_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--io-ms", type=float, default=5.0)
+    parser.add_argument("--interval-ms", type=float, default=10.0)
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp()
+    print(f"{'mode':>10} {'req/s':>10} {'cpu us/req':>12} {'cpu':>8} {'captures':>9}")
+    try:
+        baseline = run("off", None, args)
+        run("enabled", SamplingProfiler(directory, enabled=True, interval_ms=args.interval_ms,
+                                        threshold_ms=60000), args, baseline)
+        run("capturing", SamplingProfiler(directory, enabled=True, interval_ms=args.interval_ms,
+                                          threshold_ms=0), args, baseline)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
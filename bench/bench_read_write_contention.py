@@ -0,0 +1,116 @@
+"""Stress test: read latency while writers saturate the SQLite write lock.
+Run: python bench/bench_read_write_contention.py [--writers 4] [--seconds 5]
+
+Phase 1 measures get_messages / session_exists / get_user_by_id latency with
+no write traffic; phase 2 repeats it while writer processes insert messages
+as fast as the single-writer lock allows. With the read-only pool, read
+latency should stay flat and no reader should see `database is locked`.
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from flask import Flask
+
+from database.db import (
+    init_db, create_session, add_message, get_messages, session_exists, create_user, get_user_by_id,
+)
+
+TEXT = "Les pièces requises sont l'acte de naissance et le relevé du baccalauréat. " * 4
+
+
+def _make_app(db_path):
+    app = Flask(__name__)
+    app.config["DB_PATH"] = db_path
+    init_db(app)
+    return app
+
+
+def _writer_proc(db_path, stop_at, counter):
+    app = _make_app(db_path)
+    written = 0
+    with app.app_context():
+        sid = create_session()
+        while time.time() < stop_at:
+            add_message(sid, "assistant", TEXT)
+            written += 1
+    with counter.get_lock():
+        counter.value += written
+
+
+def _read_phase(app, sid, user_id, seconds, readers):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + seconds
+
+    def reader():
+        local = []
+        with app.app_context():
+            while time.perf_counter() < stop_at:
+                start = time.perf_counter()
+                try:
+                    session_exists(sid)
+                    get_messages(sid, limit=50)
+                    get_user_by_id(user_id)
+                except Exception as e:
+                    errors.append(e)
+                local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    latencies.sort()
+    pick = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    return len(latencies), pick(0.5), pick(0.99), len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=4, help="writer processes")
+    parser.add_argument("--readers", type=int, default=4, help="reader threads")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "contention.db")
+    app = _make_app(db_path)
+    with app.app_context():
+        sid = create_session()
+        for i in range(200):
+            add_message(sid, "user" if i % 2 == 0 else "assistant", TEXT)
+        user_id = create_user("bench@example.com", "Bench", "x")
+
+    print(f"{'phase':>16} {'reads':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} {'writes/s':>9}")
+    n, p50, p99, errs = _read_phase(app, sid, user_id, args.seconds, args.readers)
+    print(f"{'idle':>16} {n:>8} {p50:>8.3f} {p99:>8.3f} {errs:>7} {0:>9}")
+
+    counter = multiprocessing.Value("i", 0)
+    stop_at = time.time() + args.seconds + 0.5
+    procs = [multiprocessing.Process(target=_writer_proc, args=(db_path, stop_at, counter))
+             for _ in range(args.writers)]
+    for p in procs:
+        p.start()
+    time.sleep(0.25)
+    n, p50, p99, errs = _read_phase(app, sid, user_id, args.seconds, args.readers)
+    for p in procs:
+        p.join()
+    rate = counter.value / (args.seconds + 0.25)
+    print(f"{'writes saturated':>16} {n:>8} {p50:>8.3f} {p99:>8.3f} {errs:>7} {rate:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
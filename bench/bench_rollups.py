@@ -0,0 +1,108 @@
+"""Benchmark: ad-hoc GROUP BY dashboard vs incrementally maintained rollups.
+Run: python bench/bench_rollups.py [--messages 500000] [--days 60]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from database.migrations import migrate
+from database.pool import connect
+from database.rollups import read_dashboard, refresh_batch
+
+QUESTIONS = ["Comment faire ma préinscription ?", "Quels sont les frais ?", "Où est le campus ?",
+             "Quelles filières en informatique ?", "Date limite des inscriptions ?"]
+
+ADHOC_SQL = [
+    "SELECT created_ms / 86400000, role, COUNT(*), COUNT(error) FROM message "
+    "WHERE created_ms >= ? GROUP BY 1, 2",
+    "SELECT created_ms / 86400000, COUNT(DISTINCT session_id) FROM message "
+    "WHERE created_ms >= ? GROUP BY 1",
+    "SELECT lower(content), COUNT(*) AS n FROM message WHERE role = 'user' AND created_ms >= ? "
+    "GROUP BY 1 ORDER BY n DESC LIMIT 10",
+]
+
+
+def seed(path, messages, days):
+    conn = connect(path)
+    migrate(conn)
+    conn.execute("PRAGMA synchronous = OFF")
+    now_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
+    rng = random.Random(7)
+    conn.execute("BEGIN")
+    sessions = messages // 10
+    conn.executemany("INSERT INTO session (uuid) VALUES (?)", ((f"bench-{s}",) for s in range(sessions)))
+
+    def rows():
+        for i in range(messages):
+            ts = now_ms - int((messages - i) / messages * days * 86400) * 1000
+            role = "user" if i % 2 == 0 else "assistant"
+            content = rng.choice(QUESTIONS) if role == "user" else "Réponse du bot."
+            error = "timeout" if rng.random() < 0.01 else None
+            yield (rng.randint(1, sessions), role, content, ts, error)
+    conn.executemany("INSERT INTO message (session_id, role, content, created_ms, error) VALUES (?, ?, ?, ?, ?)",
+                     rows())
+    conn.execute("COMMIT")
+    return conn
+
+
+def _timed(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=500_000)
+    parser.add_argument("--days", type=int, default=60)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    conn = seed(path, args.messages, args.days)
+
+    start = time.perf_counter()
+    folded = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        n = refresh_batch(conn, batch_size=5000, settle_seconds=0)
+        conn.execute("COMMIT")
+        folded += n
+        if n < 5000:
+            break
+    print(f"initial fold: {folded} messages in {time.perf_counter() - start:.1f}s")
+
+    since = int((datetime.now(timezone.utc) - timedelta(days=14)).timestamp() * 1000)
+    adhoc = _timed(lambda: [conn.execute(sql, (since,)).fetchall() for sql in ADHOC_SQL])
+    rollup = _timed(lambda: read_dashboard(conn, days=14))
+
+    conn.execute("BEGIN")
+    conn.executemany("INSERT INTO message (session_id, role, content) VALUES (1, 'user', ?)",
+                     ((q,) for q in QUESTIONS * 200))
+    conn.execute("COMMIT")
+    start = time.perf_counter()
+    conn.execute("BEGIN IMMEDIATE")
+    n = refresh_batch(conn, batch_size=5000, settle_seconds=0)
+    conn.execute("COMMIT")
+    incremental = (time.perf_counter() - start) * 1000
+
+    print(f"dashboard (14 days) ad-hoc GROUP BY: {adhoc:8.1f} ms")
+    print(f"dashboard (14 days) from rollups:    {rollup:8.1f} ms")
+    print(f"incremental refresh of {n} new rows: {incremental:8.1f} ms")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
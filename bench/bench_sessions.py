@@ -0,0 +1,88 @@
+"""Benchmark: Flask signed-cookie sessions vs the server-side SQLite store.
+Run: python bench/bench_sessions.py [--requests 3000] [--fields 8]
+
+Logs a client in, adds --fields extra session keys (profile data, UI
+state), then times requests through the Flask test client:
+
+  read      a route that only reads the session (the common case)
+  write     a route that changes one key on every request
+  cold      read with the worker cache emptied before every request
+
+It prints requests/s and the Cookie header the browser sends back on
+every request. The SQLite store only writes dirty sessions, so reads cost
+a cache lookup; the cookie backend verifies the signature on every request
+and re-signs the whole dict on every write.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from flask import jsonify, session
+
+from app import create_app
+
+
+def make_app(backend, fields):
+    path = os.path.join(tempfile.mkdtemp(), "sessions.db")
+    app = create_app({"DB_PATH": path, "TESTING": True, "SESSION_BACKEND": backend,
+                      "STATS_REFRESH_INTERVAL_S": 0, "SESSION_SWEEP_INTERVAL_S": 0})
+
+    @app.route('/_fill')
+    def fill():
+        for i in range(fields):
+            session[f'pref_{i}'] = f'valeur de préférence numéro {i}'
+        return jsonify({})
+
+    @app.route('/_read')
+    def read():
+        return jsonify({'user': session.get('user_email')})
+
+    @app.route('/_write')
+    def write():
+        session['counter'] = session.get('counter', 0) + 1
+        return jsonify({})
+
+    return app
+
+
+def rate(client, url, requests, before=None):
+    start = time.perf_counter()
+    for _ in range(requests):
+        if before:
+            before()
+        client.get(url)
+    return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--fields", type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"{'backend':<8} {'cookie B':>9} {'read req/s':>11} {'write req/s':>12} {'cold req/s':>11}")
+    for backend in ("cookie", "sqlite"):
+        app = make_app(backend, args.fields)
+        client = app.test_client()
+        client.post('/api/auth/login', json={'email': 'etudiant@univ.cm', 'password': 'Secret123'})
+        client.get('/_fill')
+        cookie = client.get_cookie('session')
+        cookie_bytes = len(f"{cookie.key}={cookie.value}")
+
+        read = rate(client, '/_read', args.requests)
+        write = rate(client, '/_write', args.requests)
+        store = app.extensions.get("session_store")
+        cold = rate(client, '/_read', args.requests, before=store._cache.clear) if store else read
+        print(f"{backend:<8} {cookie_bytes:9d} {read:11.0f} {write:12.0f} {cold:11.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Benchmark: message insert throughput against the number of shard files.
+Run: python bench/bench_shards.py [--writers 8] [--seconds 5] [--shards 0,1,2,4,8]
+
+Writer processes (one per gunicorn worker in production) insert messages
+through add_message for a fixed time, each cycling over its own chat
+sessions. With DB_SHARDS=0 every insert queues on the single SQLite write
+lock of DB_PATH; with N shards the sessions, and so the writers, are spread
+over N files that commit independently. Expect near-linear scaling until
+the disk's fsync rate or the CPU count is reached; on a single core the
+writers are CPU-bound and extra files only add overhead.
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from flask import Flask
+
+from database.db import add_message, create_session, init_db
+
+TEXT = "Les pièces requises sont l'acte de naissance et le relevé du baccalauréat. " * 4
+
+
+def _make_app(db_path, shards):
+    app = Flask(__name__)
+    # Lock waits would flood the slow-query log with DB_SHARDS=0
+    app.config.update(DB_PATH=db_path, DB_SHARDS=shards, DB_INSTRUMENT=False)
+    init_db(app)
+    return app
+
+
+def _writer_proc(db_path, shards, sessions, start_at, stop_at, counter):
+    app = _make_app(db_path, shards)
+    written = 0
+    with app.app_context():
+        sids = [create_session() for _ in range(sessions)]
+        while time.time() < start_at:
+            time.sleep(0.001)
+        while time.time() < stop_at:
+            add_message(sids[written % len(sids)], "assistant", TEXT)
+            written += 1
+    with counter.get_lock():
+        counter.value += written
+
+
+def run(shards, writers, seconds, sessions):
+    db_path = os.path.join(tempfile.mkdtemp(), "shards.db")
+    _make_app(db_path, shards)  # apply migrations once, before the timed phase
+    counter = multiprocessing.Value("i", 0)
+    start_at = time.time() + 1.0
+    stop_at = start_at + seconds
+    procs = [multiprocessing.Process(target=_writer_proc,
+                                     args=(db_path, shards, sessions, start_at, stop_at, counter))
+             for _ in range(writers)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    return counter.value / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=8, help="writer processes")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--sessions", type=int, default=16, help="chat sessions per writer")
+    parser.add_argument("--shards", default="0,1,2,4,8", help="comma-separated shard counts")
+    args = parser.parse_args()
+
+    print(f"{'shards':>7} {'writes/s':>10} {'speedup':>8}")
+    baseline = None
+    for shards in (int(n) for n in args.shards.split(",")):
+        rate = run(shards, args.writers, args.seconds, args.sessions)
+        baseline = baseline or rate
+        print(f"{shards:>7} {rate:>10.0f} {rate / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
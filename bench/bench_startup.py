@@ -0,0 +1,79 @@
+"""Benchmark: cold start of the Flask app and cost of init_db().
+Run: python bench/bench_startup.py [--runs 10]
+
+Measures (1) wall time of `import app` in a fresh interpreter, which is
+what every preforked or autoscaled worker pays, and (2) init_db() against
+a fresh database vs. one already at the latest user_version.
+"""
+
+import argparse
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from database.migrations import migrate
+
+
+def _import_app_time(db_path: str) -> float:
+    code = (
+        "import time; t = time.perf_counter(); import app; "
+        "print(time.perf_counter() - t)"
+    )
+    env = dict(os.environ, SQLITE_DB_PATH=db_path)
+    out = subprocess.run([sys.executable, "-c", code], cwd=PROJECT_ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def _genai_import_time() -> float:
+    code = "import time; t = time.perf_counter(); from google import genai; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if out.returncode != 0:
+        return float("nan")
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def _migrate_time(db_path: str) -> float:
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    start = time.perf_counter()
+    migrate(conn)
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    warm_db = os.path.join(tmp, "warm.db")
+    _migrate_time(warm_db)
+
+    fresh = [_migrate_time(os.path.join(tmp, f"fresh{i}.db")) for i in range(args.runs)]
+    warm = [_migrate_time(warm_db) for _ in range(args.runs)]
+    imports = [_import_app_time(warm_db) for _ in range(args.runs)]
+    genai = _genai_import_time()
+
+    ms = lambda xs: statistics.median(xs) * 1000
+    print(f"init_db, fresh database     : {ms(fresh):8.2f} ms (median of {args.runs})")
+    print(f"init_db, already migrated   : {ms(warm):8.2f} ms")
+    print(f"import app (cold process)   : {ms(imports):8.2f} ms")
+    if genai == genai:
+        print(f"google.genai import (avoided): {genai * 1000:8.2f} ms")
+    else:
+        print("google.genai import         :      n/a (package not installed)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Benchmark: TEXT CURRENT_TIMESTAMP columns (schema v3) vs INTEGER epoch-ms (v4).
+Run: python bench/bench_timestamps.py [--messages 300000] [--days 60]
+
+Seeds a version 3 database and times three range queries: recent login
+failures for one email, idle sessions, and the message volume of one day
+by role. It then runs migration 4 (batched backfill and swap) and times
+the same queries again. Sizes are measured after VACUUM. The per-table
+sizes come from dbstat when SQLite is built with it.
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from database.migrations import migrate
+from database.timestamps import ms_to_text, now_ms
+
+EMAILS = 500
+
+QUERIES_V3 = {
+    "login failures (1 email, 1 h)":
+        "SELECT COUNT(*) FROM login_attempt WHERE email = ? AND attempted_at >= ? AND success = 0",
+    "idle sessions (> 30 days)":
+        "SELECT uuid FROM session WHERE status = 'active' AND last_activity_at < ? "
+        "ORDER BY last_activity_at LIMIT 1000",
+    "messages of 1 day by role":
+        "SELECT role, COUNT(*) FROM message WHERE created_at >= ? AND created_at < ? GROUP BY role",
+}
+QUERIES_V4 = {
+    "login failures (1 email, 1 h)":
+        "SELECT COUNT(*) FROM login_attempt WHERE email = ? AND attempted_ms >= ? AND success = 0",
+    "idle sessions (> 30 days)":
+        "SELECT uuid FROM session WHERE status = 'active' AND last_activity_ms < ? "
+        "ORDER BY last_activity_ms LIMIT 1000",
+    "messages of 1 day by role":
+        "SELECT role, COUNT(*) FROM message WHERE created_ms >= ? AND created_ms < ? GROUP BY role",
+}
+
+
+def seed(conn, messages, days):
+    migrate(conn, target=3)
+    conn.execute("PRAGMA synchronous = OFF")
+    rng = random.Random(7)
+    now = now_ms()
+    span = days * 86400 * 1000
+    text = lambda ms: ms_to_text(ms)
+    sessions = max(messages // 10, 1)
+    conn.execute("BEGIN")
+    conn.executemany(
+        "INSERT INTO session (uuid, started_at, last_activity_at) VALUES (?, ?, ?)",
+        ((f"bench-{s:08d}", text(now - span + s * span // sessions),
+          text(now - span + s * span // sessions + rng.randint(0, 3600) * 1000)) for s in range(sessions)))
+    conn.executemany(
+        "INSERT INTO message (session_id, role, content, created_at, error) VALUES (?, ?, ?, ?, ?)",
+        ((rng.randint(1, sessions), "user" if i % 2 == 0 else "assistant",
+          "Comment faire ma préinscription ?", text(now - span + i * span // messages), None)
+         for i in range(messages)))
+    attempts = messages // 5
+    conn.executemany(
+        "INSERT INTO login_attempt (email, ip_address, success, attempted_at) VALUES (?, ?, ?, ?)",
+        ((f"etudiant{rng.randrange(EMAILS)}@univ.cm", "10.0.0.1", int(rng.random() < 0.8),
+          text(now - span + i * span // attempts)) for i in range(attempts)))
+    conn.execute("COMMIT")
+    return now
+
+
+def sizes(conn, path):
+    conn.execute("VACUUM")
+    per_table = {}
+    try:
+        for name, tbl, size in conn.execute(
+                "SELECT d.name, COALESCE(m.tbl_name, d.name), SUM(d.pgsize) FROM dbstat d "
+                "LEFT JOIN sqlite_master m ON m.name = d.name GROUP BY d.name"):
+            per_table[tbl] = per_table.get(tbl, 0) + size
+    except sqlite3.OperationalError:
+        pass
+    return os.path.getsize(path), per_table
+
+
+def timed(conn, sql, params, repeat=20):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def run_queries(conn, queries, now, as_text):
+    value = ms_to_text if as_text else (lambda ms: ms)
+    day = 86400 * 1000
+    params = {
+        "login failures (1 email, 1 h)": ("etudiant7@univ.cm", value(now - 3600 * 1000)),
+        "idle sessions (> 30 days)": (value(now - 30 * day),),
+        "messages of 1 day by role": (value(now - 8 * day), value(now - 7 * day)),
+    }
+    return {label: timed(conn, sql, params[label]) for label, sql in queries.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=300_000)
+    parser.add_argument("--days", type=int, default=60)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    conn = sqlite3.connect(path, isolation_level=None)
+    now = seed(conn, args.messages, args.days)
+    size_v3, tables_v3 = sizes(conn, path)
+    times_v3 = run_queries(conn, QUERIES_V3, now, as_text=True)
+
+    start = time.perf_counter()
+    migrate(conn)
+    migration_s = time.perf_counter() - start
+    size_v4, tables_v4 = sizes(conn, path)
+    times_v4 = run_queries(conn, QUERIES_V4, now, as_text=False)
+    conn.close()
+
+    print(f"\n{args.messages} messages, migration 4 took {migration_s:.1f}s\n")
+    print(f"{'range query':<32} {'TEXT ms':>9} {'INTEGER ms':>11} {'speedup':>8}")
+    for label in QUERIES_V3:
+        print(f"{label:<32} {times_v3[label]:9.3f} {times_v4[label]:11.3f} "
+              f"{times_v3[label] / max(times_v4[label], 1e-6):7.1f}x")
+    print(f"\n{'size (after VACUUM)':<32} {'TEXT MB':>9} {'INTEGER MB':>11}")
+    print(f"{'database file':<32} {size_v3 / 1e6:9.2f} {size_v4 / 1e6:11.2f}")
+    for table in ("message", "session", "login_attempt"):
+        if table in tables_v3 and table in tables_v4:
+            print(f"{'  ' + table + ' (+ indexes)':<32} {tables_v3[table] / 1e6:9.2f} {tables_v4[table] / 1e6:11.2f}")
+
+
+if __name__ == "__main__":
+    main()
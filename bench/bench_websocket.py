@@ -0,0 +1,138 @@
+"""Benchmark: chat messages over POST /api/chat vs the /ws/chat WebSocket.
+Run: python bench/bench_websocket.py [--messages 500] [--window 4]
+
+Starts the app on a local threaded server with an instant fake Gemini
+client. Per-message latency is then almost entirely transport and request
+handling overhead: connection setup, cookie and session parsing, headers,
+JSON envelope, and the two message inserts. The modes are:
+
+  rest       one POST per message on a keep-alive requests.Session
+  ws         one frame per message, waiting for each reply
+  ws-window  up to --window frames in flight on the same socket
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import requests
+import simple_websocket
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from app import create_app
+from service import gemini_service as svc_module
+from service.gemini_service import GeminiService
+
+
+class InstantClient:
+    class models:
+        @staticmethod
+        def generate_content(model, contents):
+            return SimpleNamespace(text="Rendez-vous sur le portail SYSTHAG pour la préinscription.")
+
+
+def _report(label, count, elapsed, latencies):
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+    print(f"{label:>10} {count / elapsed:10.0f} {statistics.mean(latencies):9.2f} "
+          f"{pct(0.5):9.2f} {pct(0.99):9.2f}")
+
+
+def bench_rest(base, args):
+    http = requests.Session()
+    session_id = http.post(f"{base}/api/chat", json={"message": "Bonjour"}).json()["session_id"]
+    latencies = []
+    start = time.perf_counter()
+    for i in range(args.messages):
+        sent = time.perf_counter()
+        resp = http.post(f"{base}/api/chat", json={"message": f"Question {i}", "session_id": session_id})
+        assert resp.status_code == 200, resp.status_code
+        latencies.append((time.perf_counter() - sent) * 1000)
+    _report("rest", args.messages, time.perf_counter() - start, latencies)
+    return session_id
+
+
+def bench_ws(base, session_id, args, window):
+    # /ws/chat checks Origin against Host, which simple_websocket sends without the port
+    ws = simple_websocket.Client.connect(base.replace("http", "ws") + "/ws/chat",
+                                         headers={"Origin": "http://127.0.0.1"})
+    # Browsers disable Nagle on WebSockets too
+    ws.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    assert json.loads(ws.receive(timeout=5))["type"] == "ready"
+    sent_at = {}
+    latencies = []
+    lock = threading.Lock()
+    slots = threading.Semaphore(window)
+    done = threading.Event()
+
+    def reader():
+        while len(latencies) < args.messages:
+            frame = json.loads(ws.receive(timeout=10))
+            if frame["type"] == "reply":
+                with lock:
+                    latencies.append((time.perf_counter() - sent_at.pop(frame["id"])) * 1000)
+                slots.release()
+            elif frame["type"] == "error":
+                raise AssertionError(frame)
+        done.set()
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    start = time.perf_counter()
+    for i in range(args.messages):
+        slots.acquire()
+        frame_id = f"m{i}"
+        with lock:
+            sent_at[frame_id] = time.perf_counter()
+        ws.send(json.dumps({"type": "chat", "id": frame_id, "message": f"Question {i}",
+                            "session_id": session_id}))
+    done.wait(60)
+    elapsed = time.perf_counter() - start
+    ws.close()
+    _report("ws" if window == 1 else "ws-window", args.messages, elapsed, latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--window", type=int, default=4, help="frames in flight for ws-window")
+    args = parser.parse_args()
+
+    svc = GeminiService()
+    svc.client = InstantClient()
+    svc_module._gemini_service = svc
+    app = create_app({
+        "DB_PATH": os.path.join(tempfile.mkdtemp(), "bench_ws.db"),
+        "WS_ENABLED": True,
+        "WS_MAX_PENDING": max(4, args.window),
+        # Every message is a guest's: keep the daily token quota out of the way
+        "USAGE_DAILY_QUOTAS": "admin:0,student:0,guest:0",
+    })
+    # HTTP/1.1 so the REST client can reuse its connection; no access log
+    WSGIRequestHandler.protocol_version = "HTTP/1.1"
+    WSGIRequestHandler.log_request = lambda *a, **k: None
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    print(f"{'mode':>10} {'msgs/s':>10} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    session_id = bench_rest(base, args)
+    bench_ws(base, session_id, args, 1)
+    bench_ws(base, session_id, args, args.window)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Benchmark: per-call commit vs group-commit write-behind under concurrent chat load.
+Run: python bench/bench_write_behind.py [--threads 16] [--messages 200]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from flask import Flask
+
+from database.db import init_db, close_db, create_session, add_message, start_write_behind
+
+REPLY = "Pour votre préinscription, rendez-vous sur le portail SYSTHAG et suivez les étapes. " * 8
+
+
+def _make_app(mode, synchronous):
+    app = Flask(__name__)
+    app.config["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+    app.config["DB_WRITE_BEHIND"] = mode != "sync"
+    app.config["DB_WRITE_DURABILITY"] = "commit" if mode == "sync" else mode
+    app.config["DB_WRITE_SYNCHRONOUS"] = synchronous
+    init_db(app)
+    start_write_behind(app)
+    app.teardown_appcontext(close_db)
+    return app
+
+
+def run(mode, threads, per_thread, synchronous):
+    app = _make_app(mode, synchronous)
+    latencies = []
+    lock = threading.Lock()
+
+    def worker():
+        with app.app_context():
+            sid = create_session()
+            local = []
+            for i in range(per_thread):
+                start = time.perf_counter()
+                add_message(sid, "user" if i % 2 == 0 else "assistant", REPLY)
+                local.append(time.perf_counter() - start)
+            close_db()
+        with lock:
+            latencies.extend(local)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    writer = app.extensions.get("db_write_behind")
+    if writer is not None:
+        writer.stop()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    total = threads * per_thread
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    batches = writer.stats()["batches"] if writer else total
+    print(f"{mode:>7} {total:>7} {elapsed:>8.2f} {total / elapsed:>10.0f} {p50:>8.2f} {p99:>8.2f} {batches:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--messages", type=int, default=200, help="messages per thread")
+    parser.add_argument("--synchronous", default="FULL", help="PRAGMA synchronous for the write-behind writer")
+    args = parser.parse_args()
+    print(f"{'mode':>7} {'rows':>7} {'secs':>8} {'rows/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'commits':>8}")
+    for mode in ("sync", "commit", "async"):
+        run(mode, args.threads, args.messages, args.synchronous)
+
+
+if __name__ == "__main__":
+    main()
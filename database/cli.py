@@ -0,0 +1,144 @@
+"""Flask CLI commands for database maintenance.
+
+    flask --app app db export --out conversations.ndjson.gz --gzip --since 2025-09-01
+    flask --app app db import conversations.ndjson.gz
+    flask --app app db rollup
+    flask --app app db recompress --train
+    flask --app app db rebalance --shards 4
+"""
+
+import os
+import sys
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from database.content_codec import codec_for, recompress_batch, training_samples
+from database.db import DEFAULT_DB_PATH, chat_db_paths, refresh_stats
+from database.export import export_to_file, import_ndjson, open_ndjson
+from database.pool import connect
+from database.shards import rebalance
+
+db_cli = AppGroup("db", help="Database maintenance commands.")
+
+
+def _db_path() -> str:
+    return current_app.config.get("DB_PATH", DEFAULT_DB_PATH)
+
+
+@db_cli.command("export")
+@click.option("--out", "out_path", default="-", help="Output file ('-' for stdout).")
+@click.option("--gzip", "compress", is_flag=True, help="Gzip-compress the output.")
+@click.option("--since", default=None, help="Only messages created at or after this UTC date/time.")
+@click.option("--until", default=None, help="Only messages created before this UTC date/time.")
+@click.option("--user-id", type=int, default=None, help="Only sessions of this user.")
+def export_command(out_path, compress, since, until, user_id):
+    """Stream sessions and messages as NDJSON (constant memory)."""
+    conns = [connect(path, read_only=True) for path in chat_db_paths()]
+    try:
+        if out_path == "-":
+            lines = export_to_file(conns, sys.stdout.buffer, compress=compress,
+                                   since=since, until=until, user_id=user_id)
+        else:
+            with open(out_path, "wb") as out:
+                lines = export_to_file(conns, out, compress=compress,
+                                       since=since, until=until, user_id=user_id)
+    finally:
+        for conn in conns:
+            conn.close()
+    click.echo(f"Exported {lines} lines", err=True)
+
+
+@db_cli.command("import")
+@click.argument("src", default="-")
+@click.option("--batch-size", type=int, default=5000, show_default=True, help="Rows per executemany.")
+@click.option("--transaction-rows", type=int, default=100000, show_default=True, help="Rows per transaction.")
+def import_command(src, batch_size, transaction_rows):
+    """Load an NDJSON export (plain or gzip) into the database.
+
+    With DB_SHARDS set, each session is loaded straight into its shard.
+    """
+    conns = [connect(path) for path in chat_db_paths()]
+    try:
+        if src == "-":
+            stats = import_ndjson(conns, open_ndjson(sys.stdin.buffer), batch_size, transaction_rows)
+        else:
+            with open(src, "rb") as fh:
+                stats = import_ndjson(conns, open_ndjson(fh), batch_size, transaction_rows)
+    finally:
+        for conn in conns:
+            conn.close()
+    click.echo(f"Imported {stats}", err=True)
+
+
+@db_cli.command("rollup")
+@click.option("--settle-seconds", type=int, default=None,
+              help="Leave messages younger than this for the next run (default: STATS_SETTLE_SECONDS).")
+def rollup_command(settle_seconds):
+    """Fold new messages into the analytics rollups (for cron)."""
+    click.echo(f"Folded {refresh_stats(settle_seconds)} messages into the rollups", err=True)
+
+
+@db_cli.command("recompress")
+@click.option("--train", is_flag=True, help="Train a dictionary on recent messages first.")
+@click.option("--samples", type=int, default=5000, show_default=True, help="Messages to train on.")
+@click.option("--dict-size", type=int, default=32768, show_default=True, help="Dictionary size in bytes.")
+@click.option("--batch-size", type=int, default=2000, show_default=True, help="Rows per transaction.")
+@click.option("--start-id", type=int, default=0, help="Resume after this message id (ids are per shard file).")
+@click.option("--force", is_flag=True, help="Re-encode rows already using the current codec.")
+def recompress_command(train, samples, dict_size, batch_size, start_id, force):
+    """Rewrite stored messages with the current MESSAGE_COMPRESSION settings."""
+    for path in chat_db_paths():
+        _recompress(path, train, samples, dict_size, batch_size, start_id, force)
+
+
+def _recompress(path, train, samples, dict_size, batch_size, start_id, force):
+    """Recompress one file (dictionaries are trained per file)."""
+    conn = connect(path)
+    try:
+        if train:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                codec_id = codec_for(conn).train(conn, training_samples(conn, samples), dict_size)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            click.echo(f"Trained dictionary: codec {codec_id}" if codec_id else
+                       "No repeated text to build a dictionary from", err=True)
+        totals = {"scanned": 0, "rewritten": 0, "bytes_before": 0, "bytes_after": 0}
+        last_id = start_id
+        while True:
+            # One short transaction per batch so the chat keeps writing
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                stats = recompress_batch(conn, last_id, batch_size, force)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            if not stats["last_id"]:
+                break
+            last_id = stats["last_id"]
+            for key in totals:
+                totals[key] += stats[key]
+    finally:
+        conn.close()
+    click.echo(f"Recompressed {os.path.basename(path)} up to message {last_id}: {totals}", err=True)
+
+
+@db_cli.command("rebalance")
+@click.option("--shards", type=int, required=True, help="New shard count (0 = move everything back to DB_PATH).")
+@click.option("--batch-size", type=int, default=500, show_default=True, help="Sessions read per batch.")
+def rebalance_command(shards, batch_size):
+    """Move sessions to the shard file their uuid maps to (run with workers stopped).
+
+    Restart the workers with DB_SHARDS set to the same count afterwards.
+    """
+    def progress(path, totals):
+        click.echo(f"  {path}: scanned {totals['scanned']}, moved {totals['sessions']} sessions", err=True)
+
+    result = rebalance(_db_path(), shards, batch_size=batch_size, progress=progress)
+    click.echo(f"Moved {result['sessions']} sessions ({result['messages']} messages) "
+               f"out of {result['scanned']}; sessions per file: {result['distribution']}", err=True)
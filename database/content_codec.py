@@ -0,0 +1,328 @@
+"""Transparent compression of message.content.
+
+Bodies of at least MESSAGE_COMPRESS_MIN_BYTES (UTF-8) are stored as a
+compressed BLOB in message.content. message.codec says how to read a row:
+
+  0       plain TEXT (short message, or compression did not save enough)
+  n > 0   row n of content_codec: the algorithm ('zlib' or 'zstd') plus an
+          optional preset dictionary trained on our own messages
+
+Rows 1 (zlib) and 2 (zstd) have no dictionary. `flask db recompress --train`
+adds one row per trained dictionary. Rows are never updated or deleted, so
+every stored message stays readable whatever the current settings.
+
+Decompression is lazy: it runs in Python, only for the rows whose text is
+returned (get_messages, export, user questions in the rollup fold). Queries
+that count or list messages without selecting content never pay for it.
+
+zstd needs the optional `zstandard` package. Without it new rows use zlib,
+and rows already written with zstd cannot be read.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import zstandard  # type: ignore
+except Exception:
+    zstandard = None  # type: ignore
+
+PLAIN = 0
+ZLIB = 1
+ZSTD = 2
+ALGORITHMS = ("zlib", "zstd")
+DEFAULT_LEVELS = {"zlib": 6, "zstd": 3}
+ZLIB_DICT_MAX = 32768      # deflate window: bytes further back are unreachable
+MIN_SAVING = 0.1           # keep plain text unless compression saves 10%
+REFRESH_S = 60.0           # how often workers look for a newer dictionary
+
+_SEGMENT = re.compile(r"(?<=[.!?:;\n])\s+")
+
+
+class _Settings:
+    __slots__ = ("algorithm", "min_bytes", "level", "use_dictionary")
+
+    def __init__(self):
+        self.algorithm: Optional[str] = "zlib"
+        self.min_bytes = 512
+        self.level = 0
+        self.use_dictionary = True
+
+
+_settings = _Settings()
+
+
+def configure_content(algorithm: Optional[str] = "zlib", min_bytes: int = 512, level: int = 0,
+                      use_dictionary: bool = True) -> None:
+    """Process-wide write settings (read settings come from content_codec rows)."""
+    algorithm = (algorithm or "").lower() or None
+    if algorithm in ("off", "none", "0", "false"):
+        algorithm = None
+    if algorithm == "zstd" and zstandard is None:
+        print("[WARN] MESSAGE_COMPRESSION=zstd but zstandard is not installed, using zlib")
+        algorithm = "zlib"
+    if algorithm is not None and algorithm not in ALGORITHMS:
+        raise ValueError(f"Unknown message compression: {algorithm}")
+    _settings.algorithm = algorithm
+    _settings.min_bytes = max(int(min_bytes), 1)
+    _settings.level = int(level)
+    _settings.use_dictionary = bool(use_dictionary)
+    with _codecs_lock:
+        for codec in _codecs.values():
+            codec._active_at = 0.0
+
+
+class _Codec:
+    """One content_codec row, with primed (de)compressors."""
+
+    def __init__(self, codec_id: int, algorithm: str, dictionary: Optional[bytes]):
+        self.id = codec_id
+        self.algorithm = algorithm
+        self.dictionary = dictionary or None
+        self._comp: Dict[int, Any] = {}
+        self._decomp: Any = None
+        self._local = threading.local()
+
+    def compress(self, data: bytes, level: int = 0) -> bytes:
+        level = level or DEFAULT_LEVELS[self.algorithm]
+        if self.algorithm == "zstd":
+            return self._zstd_compressor(level).compress(data)
+        template = self._comp.get(level)
+        if template is None:
+            # Priming with the dictionary costs about as much as compressing
+            # 32 KB; copy() of a primed object does not pay it again.
+            if self.dictionary:
+                template = zlib.compressobj(level, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY,
+                                            self.dictionary)
+            else:
+                template = zlib.compressobj(level, zlib.DEFLATED, -15)
+            self._comp[level] = template
+        comp = template.copy()
+        return comp.compress(data) + comp.flush()
+
+    def decompress(self, blob: bytes) -> bytes:
+        if self.algorithm == "zstd":
+            return self._zstd_decompressor().decompress(blob)
+        if self._decomp is None:
+            self._decomp = (zlib.decompressobj(-15, zdict=self.dictionary) if self.dictionary
+                            else zlib.decompressobj(-15))
+        decomp = self._decomp.copy()
+        return decomp.decompress(blob) + decomp.flush()
+
+    # zstandard (de)compressors are not thread-safe: one per thread
+
+    def _zstd_kwargs(self) -> Dict[str, Any]:
+        if zstandard is None:
+            raise RuntimeError("zstandard is not installed: cannot use zstd message content")
+        return {"dict_data": zstandard.ZstdCompressionDict(self.dictionary)} if self.dictionary else {}
+
+    def _zstd_compressor(self, level: int):
+        comps = self._local.__dict__.setdefault("comp", {})
+        if level not in comps:
+            comps[level] = zstandard.ZstdCompressor(level=level, **self._zstd_kwargs())
+        return comps[level]
+
+    def _zstd_decompressor(self):
+        if not hasattr(self._local, "decomp"):
+            self._local.decomp = zstandard.ZstdDecompressor(**self._zstd_kwargs())
+        return self._local.decomp
+
+
+class MessageCodec:
+    """Encoder / decoder of message.content for one database file."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._codecs: Dict[int, _Codec] = {}
+        self._active: Optional[_Codec] = None
+        self._active_at = 0.0
+        self._lock = threading.Lock()
+
+    # ---- codec rows ----
+
+    def _load(self, conn: Optional[sqlite3.Connection] = None):
+        own = conn is None
+        if own:
+            uri = "file:" + os.path.abspath(self.db_path) + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True)
+        try:
+            rows = conn.execute("SELECT id, algorithm, dictionary FROM content_codec ORDER BY id").fetchall()
+        finally:
+            if own:
+                conn.close()
+        with self._lock:
+            for codec_id, algorithm, dictionary in rows:
+                if codec_id not in self._codecs:
+                    self._codecs[codec_id] = _Codec(codec_id, algorithm, dictionary)
+
+    def codec(self, codec_id: int, conn: Optional[sqlite3.Connection] = None) -> _Codec:
+        codec = self._codecs.get(codec_id)
+        if codec is None:
+            # Written by another worker with a dictionary trained since we loaded
+            self._load(conn)
+            codec = self._codecs.get(codec_id)
+            if codec is None:
+                raise ValueError(f"Unknown message codec {codec_id}")
+        return codec
+
+    def active(self) -> Optional[_Codec]:
+        """Codec for new rows: the newest dictionary of the configured algorithm."""
+        algorithm = _settings.algorithm
+        if algorithm is None:
+            return None
+        now = time.monotonic()
+        if self._active is None or now - self._active_at >= REFRESH_S or self._active.algorithm != algorithm:
+            self._load()
+            candidates = [c for c in self._codecs.values() if c.algorithm == algorithm
+                          and (_settings.use_dictionary or not c.dictionary)]
+            self._active = max(candidates, key=lambda c: c.id) if candidates else None
+            self._active_at = now
+        return self._active
+
+    # ---- content ----
+
+    def encode(self, text: str) -> Tuple[int, Any]:
+        """(codec, value to store) for a message body."""
+        # A character is at most 4 UTF-8 bytes: skip short bodies before encoding
+        if _settings.algorithm is None or len(text) * 4 < _settings.min_bytes:
+            return PLAIN, text
+        data = text.encode("utf-8")
+        if len(data) < _settings.min_bytes:
+            return PLAIN, text
+        codec = self.active()
+        if codec is None:
+            return PLAIN, text
+        blob = codec.compress(data, _settings.level)
+        if len(blob) > len(data) * (1 - MIN_SAVING):
+            return PLAIN, text
+        return codec.id, blob
+
+    def decode(self, codec_id: Optional[int], value: Any, conn: Optional[sqlite3.Connection] = None) -> str:
+        if not codec_id:
+            return value
+        return self.codec(codec_id, conn).decompress(value).decode("utf-8")
+
+    # ---- dictionaries ----
+
+    def train(self, conn: sqlite3.Connection, samples: List[str], size: int = ZLIB_DICT_MAX) -> Optional[int]:
+        """Store a dictionary trained on samples as a new content_codec row.
+
+        Runs on the caller's (write) connection and transaction. Returns the
+        new codec id, or None when the samples have nothing in common.
+        """
+        algorithm = _settings.algorithm or "zlib"
+        if algorithm == "zstd":
+            try:
+                dictionary = zstandard.train_dictionary(size, [s.encode("utf-8") for s in samples]).as_bytes()
+            except zstandard.ZstdError as e:
+                print(f"[WARN] zstd dictionary training failed: {e}")
+                return None
+        else:
+            dictionary = train_zlib_dictionary(samples, min(size, ZLIB_DICT_MAX))
+        if not dictionary:
+            return None
+        cur = conn.execute("INSERT INTO content_codec (algorithm, dictionary, created_ms) VALUES (?, ?, ?)",
+                           (algorithm, dictionary, int(time.time() * 1000)))
+        codec = _Codec(cur.lastrowid, algorithm, dictionary)
+        with self._lock:
+            self._codecs[codec.id] = codec
+        self._active, self._active_at = codec, time.monotonic()
+        return codec.id
+
+
+def train_zlib_dictionary(samples: Iterable[str], size: int = ZLIB_DICT_MAX) -> bytes:
+    """Preset dictionary made of the sentences that repeat across samples.
+
+    Sentences are ranked by the bytes they would save, (count - 1) * length.
+    Deflate codes near matches shorter than far ones, so the best ones are
+    placed at the end of the dictionary.
+    """
+    counts: Counter = Counter()
+    for text in samples:
+        for segment in set(_SEGMENT.split(text)):
+            if len(segment) >= 16:
+                counts[segment] += 1
+    ranked = sorted(((n - 1) * len(s.encode("utf-8")), s) for s, n in counts.items() if n > 1)
+    picked: List[bytes] = []
+    total = 0
+    for _, segment in reversed(ranked):
+        data = segment.encode("utf-8") + b" "
+        if total + len(data) > size:
+            continue
+        picked.append(data)
+        total += len(data)
+    return b"".join(reversed(picked))
+
+
+_codecs: Dict[str, MessageCodec] = {}
+_codecs_lock = threading.Lock()
+
+
+def content_codec(db_path: str) -> MessageCodec:
+    """The MessageCodec of a database file (shared by all its connections)."""
+    key = os.path.abspath(db_path)
+    codec = _codecs.get(key)
+    if codec is None:
+        with _codecs_lock:
+            codec = _codecs.setdefault(key, MessageCodec(key))
+    return codec
+
+
+def codec_for(conn: sqlite3.Connection) -> MessageCodec:
+    """MessageCodec of the main database of an open connection."""
+    path = getattr(conn, "_codec_path", None)
+    if path is None:
+        path = next(row[2] for row in conn.execute("PRAGMA database_list") if row[1] == "main")
+        try:
+            conn._codec_path = path  # type: ignore[attr-defined]
+        except AttributeError:
+            pass  # plain sqlite3.Connection: look it up again next time
+    return content_codec(path)
+
+
+def recompress_batch(conn: sqlite3.Connection, after_id: int, batch_rows: int = 2000,
+                     force: bool = False) -> Dict[str, int]:
+    """Re-encode up to batch_rows messages with id > after_id under the current settings.
+
+    Rows already stored with the active codec are skipped unless `force`.
+    Returns counters plus "last_id" (0 when there was nothing left).
+    """
+    codec = codec_for(conn)
+    active = codec.active()
+    stats = {"last_id": 0, "scanned": 0, "rewritten": 0, "bytes_before": 0, "bytes_after": 0}
+    rows = conn.execute("SELECT id, codec, content FROM message WHERE id > ? ORDER BY id LIMIT ?",
+                        (after_id, batch_rows)).fetchall()
+    size = lambda v: len(v) if isinstance(v, bytes) else len(v.encode("utf-8"))
+    updates = []
+    for msg_id, codec_id, content in rows:
+        stats["last_id"] = msg_id
+        stats["scanned"] += 1
+        if not force and active is not None and codec_id == active.id:
+            continue
+        text = codec.decode(codec_id, content, conn)
+        new_id, value = codec.encode(text)
+        if new_id == (codec_id or PLAIN) and not force:
+            continue
+        stats["bytes_before"] += size(content)
+        stats["bytes_after"] += size(value)
+        updates.append((new_id, value, msg_id))
+    if updates:
+        conn.executemany("UPDATE message SET codec = ?, content = ? WHERE id = ?", updates)
+        stats["rewritten"] = len(updates)
+    return stats
+
+
+def training_samples(conn: sqlite3.Connection, limit: int = 5000, min_bytes: int = 0) -> List[str]:
+    """Recent message bodies (decoded) to train a dictionary on."""
+    codec = codec_for(conn)
+    rows = conn.execute("SELECT codec, content FROM message WHERE length(content) >= ? "
+                        "ORDER BY id DESC LIMIT ?", (min_bytes, limit)).fetchall()
+    return [codec.decode(codec_id, content, conn) for codec_id, content in rows]
@@ -3,106 +3,52 @@
 Provides connection management and CRUD operations for users, sessions and messages
 based on the ER diagram (USER, SESSION, MESSAGE).
 
-Tables (created lazily on first import / init_db call):
-  user(id,email,display_name,created_at)
-  session(id,uuid,user_id,status,started_at,last_activity_at)
-  message(id,session_id,role,content,created_at,error)
+Tables (created by the versioned migrations in database/migrations.py on init_db):
+  user(id,email,display_name,created_ms,updated_ms)
+  session(id,uuid,user_id,status,started_ms,last_activity_ms)
+  message(id,session_id,role,content,created_ms,error,codec)
 
 Notes:
   * We keep "uuid" as external public identifier for sessions instead of numeric id.
-  * Timestamps stored as ISO strings (UTC) via CURRENT_TIMESTAMP for simplicity.
+  * Timestamps are stored as INTEGER epoch milliseconds (UTC, `*_ms` columns)
+    and returned as "YYYY-MM-DD HH:MM:SS" text (see database/timestamps.py).
+  * Long message bodies are stored compressed; the helpers below encode and
+    decode them transparently (see database/content_codec.py).
+  * With DB_SHARDS=N, session and message rows live in N shard files chosen
+    by the session uuid; the helpers route each call to the right file
+    (see database/shards.py). Every other table stays in DB_PATH.
   * For now user management is minimal; user_id can be NULL in session.
 """
 
 from __future__ import annotations
 
+import heapq
 import os
 import sqlite3
 import uuid
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from flask import g, current_app
 
+from database.content_codec import configure_content, content_codec
+from database.instrument import QUERY_STATS
+from database.migrations import SCHEMA_SQL, migrate  # noqa: F401 - SCHEMA_SQL re-exported
+from database.pool import ConnectionPools, get_pools, retry_busy
+from database.rollups import RollupRefresher, merge_dashboards, read_dashboard
+from database.shards import shard_index, shard_paths
+from database.timestamps import ms_to_text, now_ms, text_to_ms
+from database.write_behind import WriteBehindWriter
+
 DEFAULT_DB_PATH = os.environ.get(
     "SQLITE_DB_PATH",
     os.path.join(os.getcwd(), "database", "botinterface.db"),
 )
 
-SCHEMA_SQL = """
-PRAGMA journal_mode=WAL;
-
--- User table with authentication fields
-CREATE TABLE IF NOT EXISTS user (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    email TEXT UNIQUE NOT NULL,
-    display_name TEXT NOT NULL,
-    password_hash TEXT NOT NULL,
-    role TEXT DEFAULT 'student' CHECK(role IN ('student', 'admin', 'guest')),
-    is_verified INTEGER DEFAULT 0,
-    verification_token TEXT,
-    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
-);
-
-CREATE INDEX IF NOT EXISTS idx_user_email ON user(email);
-CREATE INDEX IF NOT EXISTS idx_user_verification_token ON user(verification_token);
-
--- Session table linked to users
-CREATE TABLE IF NOT EXISTS session (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    uuid TEXT UNIQUE NOT NULL,
-    user_id INTEGER,
-    status TEXT DEFAULT 'active',
-    started_at TEXT DEFAULT CURRENT_TIMESTAMP,
-    last_activity_at TEXT DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY(user_id) REFERENCES user(id) ON DELETE CASCADE
-);
-
-CREATE INDEX IF NOT EXISTS idx_session_uuid ON session(uuid);
-CREATE INDEX IF NOT EXISTS idx_session_user_id ON session(user_id);
-
--- Message table
-CREATE TABLE IF NOT EXISTS message (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    session_id INTEGER NOT NULL,
-    role TEXT NOT NULL,
-    content TEXT NOT NULL,
-    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-    error TEXT,
-    FOREIGN KEY(session_id) REFERENCES session(id) ON DELETE CASCADE
-);
-
-CREATE INDEX IF NOT EXISTS idx_message_session_id ON message(session_id);
-
--- Password reset table
-CREATE TABLE IF NOT EXISTS password_reset (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER NOT NULL,
-    token TEXT UNIQUE NOT NULL,
-    expires_at TEXT NOT NULL,
-    used INTEGER DEFAULT 0,
-    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY(user_id) REFERENCES user(id) ON DELETE CASCADE
-);
-
-CREATE INDEX IF NOT EXISTS idx_password_reset_token ON password_reset(token);
-CREATE INDEX IF NOT EXISTS idx_password_reset_user_id ON password_reset(user_id);
-
--- Login attempt table for security
-CREATE TABLE IF NOT EXISTS login_attempt (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    email TEXT NOT NULL,
-    ip_address TEXT,
-    success INTEGER DEFAULT 0,
-    attempted_at TEXT DEFAULT CURRENT_TIMESTAMP
-);
-
-CREATE INDEX IF NOT EXISTS idx_login_attempt_email ON login_attempt(email);
-CREATE INDEX IF NOT EXISTS idx_login_attempt_attempted_at ON login_attempt(attempted_at);
-"""
-
-
 def get_db() -> sqlite3.Connection:
-    """Return a request-scoped SQLite connection (Flask 'g')."""
+    """Return a request-scoped SQLite connection (Flask 'g').
+
+    Kept for ad-hoc scripts; the CRUD helpers below go through
+    `_pools()` (read-only pool + serialized writer) instead.
+    """
     if "_db_conn" not in g:
         db_path = current_app.config.get("DB_PATH", DEFAULT_DB_PATH)
         # Ensure parent directory exists
@@ -124,61 +70,131 @@ def init_db(app=None):
     """Initialize database schema (idempotent)."""
     # Need an app context to use current_app
     if app:
+        QUERY_STATS.configure(enabled=bool(app.config.get("DB_INSTRUMENT", True)),
+                              slow_ms=float(app.config.get("DB_SLOW_QUERY_MS", 100)))
+        configure_content(algorithm=app.config.get("MESSAGE_COMPRESSION", "zlib"),
+                          min_bytes=int(app.config.get("MESSAGE_COMPRESS_MIN_BYTES", 512)),
+                          level=int(app.config.get("MESSAGE_COMPRESS_LEVEL", 0)),
+                          use_dictionary=bool(app.config.get("MESSAGE_COMPRESS_DICTIONARY", True)))
         with app.app_context():
             _create_schema()
+            for path in chat_db_paths(app):
+                if path != app.config.get("DB_PATH", DEFAULT_DB_PATH):
+                    _create_schema(path)
             app.logger.info("SQLite database initialized at %s", current_app.config.get("DB_PATH", DEFAULT_DB_PATH))
     else:
         _create_schema()
 
 
-def _create_schema():
-    conn = sqlite3.connect(current_app.config.get("DB_PATH", DEFAULT_DB_PATH))
-    try:
-        _migrate_existing_user_table(conn)
-        conn.executescript(SCHEMA_SQL)
-        conn.commit()
-    finally:
-        conn.close()
+def start_write_behind(app):
+    """Start (or restart after fork) the write-behind thread(s) if enabled.
 
+    One writer per file holding messages: the primary database, or each
+    shard ("db_write_behind_shards", keyed by path) when DB_SHARDS is set.
+    """
+    if not app.config.get("DB_WRITE_BEHIND"):
+        return
+    db_path = app.config.get("DB_PATH", DEFAULT_DB_PATH)
+    for path in chat_db_paths(app):
+        if path == db_path:
+            writer = app.extensions.get("db_write_behind")
+        else:
+            writer = app.extensions.setdefault("db_write_behind_shards", {}).get(path)
+        if writer is None:
+            writer = WriteBehindWriter(
+                get_pools(path).writer,
+                flush_interval_ms=int(app.config.get("DB_FLUSH_INTERVAL_MS", 20)),
+                max_batch=int(app.config.get("DB_FLUSH_MAX_ROWS", 256)),
+                durability=app.config.get("DB_WRITE_DURABILITY", "commit"),
+                synchronous=app.config.get("DB_WRITE_SYNCHRONOUS", "NORMAL"),
+                result_timeout_s=float(app.config.get("DB_WRITE_TIMEOUT_S", 30)),
+            )
+            if path == db_path:
+                app.extensions["db_write_behind"] = writer
+            else:
+                app.extensions["db_write_behind_shards"][path] = writer
+        else:
+            # After fork the inherited writer points at the parent's connection
+            writer.writer = get_pools(path).writer
+        writer.start()
+
+
+def stop_write_behind(app):
+    """Flush queued messages and stop the write-behind thread(s)."""
+    writers = [app.extensions.get("db_write_behind")]
+    writers += list(app.extensions.get("db_write_behind_shards", {}).values())
+    for writer in writers:
+        if writer is not None:
+            writer.stop()
+
+
+def start_rollup_refresher(app):
+    """Start (or restart after fork) the periodic analytics rollup refresh."""
+    interval = float(app.config.get("STATS_REFRESH_INTERVAL_S", 0) or 0)
+    if interval <= 0:
+        return
+    refresher = app.extensions.get("db_rollups")
+    if refresher is None:
+        refresher = app.extensions["db_rollups"] = RollupRefresher(
+            [get_pools(path).writer for path in chat_db_paths(app)],
+            interval_s=interval,
+            settle_seconds=int(app.config.get("STATS_SETTLE_SECONDS", 5)),
+        )
+    else:
+        refresher.writers = [get_pools(path).writer for path in chat_db_paths(app)]
+    refresher.start()
 
-def _migrate_existing_user_table(conn: sqlite3.Connection) -> None:
-    """Upgrade pre-auth 'user' table to include new authentication columns if missing.
 
-    Earlier versions of the schema created a minimal `user` table without
-    password_hash / role / is_verified / verification_token / updated_at.
-    Because we now create indexes referencing `verification_token`, startup
-    would fail with `sqlite3.OperationalError: no such column: verification_token`.
+def stop_rollup_refresher(app):
+    refresher = app.extensions.get("db_rollups")
+    if refresher is not None:
+        refresher.stop()
 
-    This function inspects the existing table (if any) and issues ALTER TABLE
-    statements to add the missing columns with safe defaults so constraints
-    won't break. Columns added:
-      - password_hash TEXT NOT NULL DEFAULT ''
-      - role TEXT DEFAULT 'student'
-      - is_verified INTEGER DEFAULT 0
-      - verification_token TEXT (nullable)
-      - updated_at TEXT DEFAULT CURRENT_TIMESTAMP
 
-    NOTE: Existing users will have an empty password_hash and must be updated
-    on next login/registration flow. If you prefer a clean slate you can delete
-    the database file instead of relying on this migration logic.
-    """
-    cur = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='user'")
-    if not cur.fetchone():
-        return  # Table does not exist yet; fresh create will handle it.
-
-    cur = conn.execute("PRAGMA table_info(user)")
-    existing_cols = {row[1] for row in cur.fetchall()}
-    required_defs = {
-        "password_hash": "ALTER TABLE user ADD COLUMN password_hash TEXT DEFAULT '' NOT NULL",
-        "role": "ALTER TABLE user ADD COLUMN role TEXT DEFAULT 'student'",
-        "is_verified": "ALTER TABLE user ADD COLUMN is_verified INTEGER DEFAULT 0",
-        "verification_token": "ALTER TABLE user ADD COLUMN verification_token TEXT",
-        "updated_at": "ALTER TABLE user ADD COLUMN updated_at TEXT DEFAULT CURRENT_TIMESTAMP",
-    }
-    for col, ddl in required_defs.items():
-        if col not in existing_cols:
-            conn.execute(ddl)
-    conn.commit()
+def _pools() -> ConnectionPools:
+    """Reader pool / serialized writer for the configured database."""
+    return get_pools(
+        current_app.config.get("DB_PATH", DEFAULT_DB_PATH),
+        int(current_app.config.get("DB_READ_POOL_SIZE", 4)),
+    )
+
+
+def chat_db_paths(app=None) -> List[str]:
+    """Files holding session / message rows (DB_PATH unless DB_SHARDS is set)."""
+    config = (app or current_app).config
+    return shard_paths(config.get("DB_PATH", DEFAULT_DB_PATH), int(config.get("DB_SHARDS", 0) or 0))
+
+
+def _chat_path(session_uuid: str) -> str:
+    paths = chat_db_paths()
+    return paths[shard_index(session_uuid, len(paths))]
+
+
+def _chat_pools(session_uuid: str) -> ConnectionPools:
+    """Reader pool / writer of the file holding this session."""
+    return get_pools(_chat_path(session_uuid), int(current_app.config.get("DB_READ_POOL_SIZE", 4)))
+
+
+def _codec(db_path: Optional[str] = None):
+    return content_codec(db_path or current_app.config.get("DB_PATH", DEFAULT_DB_PATH))
+
+
+def _write_behind(db_path: Optional[str] = None) -> Optional[WriteBehindWriter]:
+    """Return the group-commit writer of db_path when write-behind mode is enabled."""
+    if db_path is None or db_path == current_app.config.get("DB_PATH", DEFAULT_DB_PATH):
+        return current_app.extensions.get("db_write_behind")
+    return current_app.extensions.get("db_write_behind_shards", {}).get(db_path)
+
+
+def _create_schema(db_path: Optional[str] = None):
+    """Apply pending schema migrations (no-op when user_version is current)."""
+    db_path = db_path or current_app.config.get("DB_PATH", DEFAULT_DB_PATH)
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        migrate(conn)
+    finally:
+        conn.close()
 
 
 # ---- Session operations ----
@@ -186,81 +202,98 @@ def _migrate_existing_user_table(conn: sqlite3.Connection) -> None:
 def create_session(user_id: Optional[int] = None) -> str:
     """Create a new session and return its public UUID."""
     session_uuid = str(uuid.uuid4())
-    db = get_db()
-    db.execute(
-        "INSERT INTO session (uuid, user_id) VALUES (?, ?)",
-        (session_uuid, user_id)
-    )
-    db.commit()
+    ts = now_ms()
+    _chat_pools(session_uuid).writer.run(lambda db: db.execute(
+        "INSERT INTO session (uuid, user_id, started_ms, last_activity_ms) VALUES (?, ?, ?, ?)",
+        (session_uuid, user_id, ts, ts)
+    ))
     return session_uuid
 
 
 def touch_session(session_uuid: str):
-    """Update last_activity_at timestamp for a session."""
-    db = get_db()
-    db.execute(
-        "UPDATE session SET last_activity_at = CURRENT_TIMESTAMP WHERE uuid = ?",
-        (session_uuid,)
-    )
-    db.commit()
+    """Update last_activity_ms timestamp for a session."""
+    _chat_pools(session_uuid).writer.run(lambda db: db.execute(
+        "UPDATE session SET last_activity_ms = ? WHERE uuid = ?",
+        (now_ms(), session_uuid)
+    ))
 
 
 def session_exists(session_uuid: str) -> bool:
-    db = get_db()
-    cur = db.execute("SELECT 1 FROM session WHERE uuid = ?", (session_uuid,))
-    return cur.fetchone() is not None
+    rows = _chat_pools(session_uuid).reader.execute("SELECT 1 FROM session WHERE uuid = ?", (session_uuid,))
+    return bool(rows)
+
+
+def get_idle_sessions(idle_before_ms: int, status: str = 'active', limit: int = 1000) -> List[str]:
+    """UUIDs of sessions with no activity since idle_before_ms (covering index scan)."""
+    size = int(current_app.config.get("DB_READ_POOL_SIZE", 4))
+    per_file = [
+        get_pools(path, size).reader.execute(
+            "SELECT last_activity_ms, uuid FROM session WHERE status = ? AND last_activity_ms < ? "
+            "ORDER BY last_activity_ms LIMIT ?",
+            (status, idle_before_ms, limit)
+        )
+        for path in chat_db_paths()
+    ]
+    return [r[1] for r in heapq.merge(*per_file, key=lambda r: r[0])][:limit]
 
 
 # ---- Message operations ----
 
 def add_message(session_uuid: str, role: str, content: str, error: Optional[str] = None) -> Dict[str, Any]:
     """Insert a message record and return stored message dict."""
-    db = get_db()
-    cur = db.execute("SELECT id FROM session WHERE uuid = ?", (session_uuid,))
-    row = cur.fetchone()
-    if not row:
+    path = _chat_path(session_uuid)
+    pools = _chat_pools(session_uuid)
+    rows = pools.reader.execute("SELECT id FROM session WHERE uuid = ?", (session_uuid,))
+    if not rows:
         raise ValueError("Session not found when adding message")
-    session_id = row[0]
-    db.execute(
-        "INSERT INTO message (session_id, role, content, error) VALUES (?, ?, ?, ?)",
-        (session_id, role, content, error)
-    )
-    db.commit()
-    # Fetch inserted message for timestamp
-    m_cur = db.execute(
-        "SELECT id, role, content, created_at, error FROM message WHERE rowid = last_insert_rowid()"
-    )
-    m_row = m_cur.fetchone()
+    session_id = rows[0][0]
+    writer = _write_behind(path)
+    if writer is not None:
+        return writer.add_message(session_id, role, content, error)
+
+    created_ms = now_ms()
+    # Compress outside the writer lock
+    codec, stored = _codec(path).encode(content)
+    cur = pools.writer.run(lambda db: db.execute(
+        "INSERT INTO message (session_id, role, content, created_ms, error, codec) VALUES (?, ?, ?, ?, ?, ?)",
+        (session_id, role, stored, created_ms, error, codec)
+    ))
+    # The timestamp is taken here, so no read-back of the inserted row
     return {
-        "id": m_row[0],
-        "role": m_row[1],
-        "content": m_row[2],
-        "timestamp": m_row[3],
-        "error": m_row[4],
+        "id": cur.lastrowid,
+        "role": role,
+        "content": content,
+        "timestamp": ms_to_text(created_ms),
+        "error": error,
     }
 
 
 def get_messages(session_uuid: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
-    db = get_db()
-    cur = db.execute("SELECT id FROM session WHERE uuid = ?", (session_uuid,))
-    session_row = cur.fetchone()
-    if not session_row:
+    path = _chat_path(session_uuid)
+    reader = _chat_pools(session_uuid).reader
+    session_rows = reader.execute("SELECT id FROM session WHERE uuid = ?", (session_uuid,))
+    if not session_rows:
         return []
-    session_id = session_row[0]
-    sql = "SELECT role, content, created_at, error FROM message WHERE session_id = ? ORDER BY id ASC"
+    session_id = session_rows[0][0]
+    writer = _write_behind(path)
+    if writer is not None:
+        writer.wait_for_session(session_id)
+    # Not ORDER BY id: async write-behind ids come from per-worker blocks
+    sql = ("SELECT role, content, created_ms, error, codec FROM message WHERE session_id = ? "
+           "ORDER BY created_ms ASC, id ASC")
     params: List[Any] = [session_id]
     if limit is not None:
         sql += " LIMIT ?"
         params.append(limit)
-    m_cur = db.execute(sql, params)
+    decode = _codec(path).decode
     return [
         {
             "role": r[0],
-            "content": r[1],
-            "timestamp": r[2],
+            "content": decode(r[4], r[1]),
+            "timestamp": ms_to_text(r[2]),
             "error": r[3],
         }
-        for r in m_cur.fetchall()
+        for r in reader.execute(sql, params)
     ]
 
 
@@ -272,22 +305,29 @@ def get_recent_context(session_uuid: str, max_messages: int = 10) -> List[Dict[s
 
 __all__ = [
     "init_db",
+    "start_write_behind",
+    "stop_write_behind",
     "get_db",
     "close_db",
     "create_session",
     "touch_session",
     "session_exists",
+    "get_idle_sessions",
     "add_message",
     "get_messages",
     "get_recent_context",
+    "chat_db_paths",
     "create_user",
     "get_user_by_email",
     "get_user_by_id",
     "update_user_verification",
+    "update_user_role",
+    "update_user_password",
     "create_password_reset",
     "get_password_reset",
     "mark_reset_used",
     "log_login_attempt",
+    "count_recent_login_failures",
 ]
 
 
@@ -296,27 +336,25 @@ __all__ = [
 def create_user(email: str, display_name: str, password_hash: str, 
                 role: str = 'student', verification_token: Optional[str] = None) -> int:
     """Create a new user and return user ID"""
-    db = get_db()
-    cur = db.execute(
-        """INSERT INTO user (email, display_name, password_hash, role, verification_token) 
-           VALUES (?, ?, ?, ?, ?)""",
-        (email, display_name, password_hash, role, verification_token)
-    )
-    db.commit()
+    ts = now_ms()
+    cur = _pools().writer.run(lambda db: db.execute(
+        """INSERT INTO user (email, display_name, password_hash, role, verification_token, created_ms, updated_ms) 
+           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+        (email, display_name, password_hash, role, verification_token, ts, ts)
+    ))
     return cur.lastrowid
 
 
 def get_user_by_email(email: str) -> Optional[Dict[str, Any]]:
     """Get user by email"""
-    db = get_db()
-    cur = db.execute(
-        """SELECT id, email, display_name, password_hash, role, is_verified, created_at 
+    rows = _pools().reader.execute(
+        """SELECT id, email, display_name, password_hash, role, is_verified, created_ms 
            FROM user WHERE email = ?""",
         (email,)
     )
-    row = cur.fetchone()
-    if not row:
+    if not rows:
         return None
+    row = rows[0]
     return {
         "id": row[0],
         "email": row[1],
@@ -324,103 +362,494 @@ def get_user_by_email(email: str) -> Optional[Dict[str, Any]]:
         "password_hash": row[3],
         "role": row[4],
         "is_verified": bool(row[5]),
-        "created_at": row[6],
+        "created_at": ms_to_text(row[6]),
     }
 
 
 def get_user_by_id(user_id: int) -> Optional[Dict[str, Any]]:
     """Get user by ID"""
-    db = get_db()
-    cur = db.execute(
-        """SELECT id, email, display_name, role, is_verified, created_at 
+    rows = _pools().reader.execute(
+        """SELECT id, email, display_name, role, is_verified, created_ms 
            FROM user WHERE id = ?""",
         (user_id,)
     )
-    row = cur.fetchone()
-    if not row:
+    if not rows:
         return None
+    row = rows[0]
     return {
         "id": row[0],
         "email": row[1],
         "display_name": row[2],
         "role": row[3],
         "is_verified": bool(row[4]),
-        "created_at": row[5],
+        "created_at": ms_to_text(row[5]),
     }
 
 
 def update_user_verification(email: str, is_verified: bool = True):
     """Mark user email as verified"""
-    db = get_db()
-    db.execute(
-        "UPDATE user SET is_verified = ?, verification_token = NULL, updated_at = CURRENT_TIMESTAMP WHERE email = ?",
-        (1 if is_verified else 0, email)
+    def _update(db: sqlite3.Connection):
+        ts = now_ms()
+        db.execute(
+            "UPDATE user SET is_verified = ?, verification_token = NULL, updated_ms = ? WHERE email = ?",
+            (1 if is_verified else 0, ts, email)
+        )
+        row = db.execute("SELECT id FROM user WHERE email = ?", (email,)).fetchone()
+        if row is not None:
+            _bump_user_generation(db, row[0], ts)
+        return row
+    row = _pools().writer.run(_update)
+    if row is not None:
+        _invalidate_principal(row[0])
+
+
+def update_user_role(user_id: int, role: str):
+    """Change a user's role (student, admin, ...)"""
+    def _update(db: sqlite3.Connection):
+        ts = now_ms()
+        db.execute("UPDATE user SET role = ?, updated_ms = ? WHERE id = ?", (role, ts, user_id))
+        _bump_user_generation(db, user_id, ts)
+    _pools().writer.run(_update)
+    _invalidate_principal(user_id)
+
+
+def _bump_user_generation(db: sqlite3.Connection, user_id: int, ts: int):
+    """Record a change other workers must drop from their principal cache.
+
+    API tokens issued to the user before now are revoked as well, until the
+    longest-lived of them (a refresh token) has expired.
+    """
+    db.execute("INSERT INTO user_invalidation (user_id, created_ms) VALUES (?, ?)", (user_id, ts))
+    ttl_ms = int(float(current_app.config.get("JWT_REFRESH_TTL_S", 30 * 86400)) * 1000)
+    # REPLACE gives the row a new id, so workers polling by id see the new cutoff
+    db.execute("INSERT OR REPLACE INTO revoked_token (jti, user_id, revoked_ms, expires_ms) VALUES (?, ?, ?, ?)",
+               (f"user:{user_id}", str(user_id), ts, ts + ttl_ms))
+
+
+def _invalidate_principal(user_id: int):
+    cache = current_app.extensions.get("principals")
+    if cache is not None:
+        cache.invalidate(user_id)
+
+
+def get_user_generation() -> int:
+    rows = _pools().reader.execute("SELECT COALESCE(MAX(generation), 0) FROM user_invalidation")
+    return rows[0][0]
+
+
+def get_user_invalidations(after_generation: int) -> List[Any]:
+    """(generation, user_id) rows newer than after_generation, oldest first."""
+    return _pools().reader.execute(
+        "SELECT generation, user_id FROM user_invalidation WHERE generation > ? ORDER BY generation",
+        (after_generation,)
     )
-    db.commit()
+
+
+def purge_user_invalidations(before_ms: int) -> int:
+    return _pools().writer.run(lambda db: db.execute(
+        "DELETE FROM user_invalidation WHERE created_ms < ?",
+        (before_ms,)
+    ).rowcount)
 
 
 # ---- Password reset operations ----
 
 def create_password_reset(user_id: int, token: str, expires_at: str) -> int:
-    """Create password reset token"""
-    db = get_db()
-    cur = db.execute(
-        "INSERT INTO password_reset (user_id, token, expires_at) VALUES (?, ?, ?)",
-        (user_id, token, expires_at)
-    )
-    db.commit()
+    """Create password reset token (expires_at: UTC "YYYY-MM-DD HH:MM:SS" or ISO 8601)"""
+    cur = _pools().writer.run(lambda db: db.execute(
+        "INSERT INTO password_reset (user_id, token, expires_ms, created_ms) VALUES (?, ?, ?, ?)",
+        (user_id, token, text_to_ms(expires_at), now_ms())
+    ))
     return cur.lastrowid
 
 
 def get_password_reset(token: str) -> Optional[Dict[str, Any]]:
     """Get password reset by token"""
-    db = get_db()
-    cur = db.execute(
-        """SELECT id, user_id, token, expires_at, used, created_at 
+    rows = _pools().reader.execute(
+        """SELECT id, user_id, token, expires_ms, used, created_ms 
            FROM password_reset WHERE token = ?""",
         (token,)
     )
-    row = cur.fetchone()
-    if not row:
+    if not rows:
         return None
+    row = rows[0]
     return {
         "id": row[0],
         "user_id": row[1],
         "token": row[2],
-        "expires_at": row[3],
+        "expires_at": ms_to_text(row[3]),
         "used": bool(row[4]),
-        "created_at": row[5],
+        "created_at": ms_to_text(row[5]),
     }
 
 
 def mark_reset_used(token: str):
     """Mark password reset token as used"""
-    db = get_db()
-    db.execute(
+    _pools().writer.run(lambda db: db.execute(
         "UPDATE password_reset SET used = 1 WHERE token = ?",
         (token,)
-    )
-    db.commit()
+    ))
 
 
 def update_user_password(user_id: int, password_hash: str):
     """Update user password"""
-    db = get_db()
-    db.execute(
-        "UPDATE user SET password_hash = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-        (password_hash, user_id)
-    )
-    db.commit()
+    def _update(db: sqlite3.Connection):
+        ts = now_ms()
+        db.execute(
+            "UPDATE user SET password_hash = ?, updated_ms = ? WHERE id = ?",
+            (password_hash, ts, user_id)
+        )
+        _bump_user_generation(db, user_id, ts)
+    _pools().writer.run(_update)
+    _invalidate_principal(user_id)
 
 
 # ---- Login attempt operations ----
 
 def log_login_attempt(email: str, ip_address: Optional[str], success: bool):
     """Log login attempt for security monitoring"""
-    db = get_db()
-    db.execute(
-        "INSERT INTO login_attempt (email, ip_address, success) VALUES (?, ?, ?)",
-        (email, ip_address, 1 if success else 0)
+    _pools().writer.run(lambda db: db.execute(
+        "INSERT INTO login_attempt (email, ip_address, success, attempted_ms) VALUES (?, ?, ?, ?)",
+        (email, ip_address, 1 if success else 0, now_ms())
+    ))
+
+
+def count_recent_login_failures(email: str, since_ms: int) -> int:
+    """Failed attempts for an email since since_ms (covering index range scan)."""
+    rows = _pools().reader.execute(
+        "SELECT COUNT(*) FROM login_attempt WHERE email = ? AND attempted_ms >= ? AND success = 0",
+        (email, since_ms)
+    )
+    return rows[0][0]
+
+
+
+# ---- Idempotency keys ----
+
+def claim_idempotency_key(key: str, fingerprint: str, now_ms: int, ttl_ms: int,
+                          stale_ms: int) -> Optional[Dict[str, Any]]:
+    """Atomically claim an idempotency key.
+
+    Returns None when the caller now owns the key (new, expired, released
+    after a server error, or pending for longer than stale_ms, i.e. abandoned
+    by a crashed worker); otherwise the existing record. Taking over a key
+    for the same request keeps the question an earlier attempt stored.
+    """
+    def _claim(db: sqlite3.Connection):
+        row = db.execute(
+            "SELECT fingerprint, status, status_code, response, created_ms, expires_ms "
+            "FROM idempotency_key WHERE key = ?",
+            (key,)
+        ).fetchone()
+        if row is not None:
+            expired = row[5] <= now_ms
+            abandoned = row[1] == 'pending' and row[4] + stale_ms <= now_ms
+            if not (expired or abandoned or row[1] == 'released'):
+                return {
+                    "fingerprint": row[0],
+                    "status": row[1],
+                    "status_code": row[2],
+                    "response": row[3],
+                }
+            if not expired and row[0] == fingerprint:
+                db.execute(
+                    "UPDATE idempotency_key SET status = 'pending', created_ms = ? WHERE key = ?",
+                    (now_ms, key)
+                )
+                return None
+        db.execute(
+            "INSERT OR REPLACE INTO idempotency_key (key, fingerprint, status, created_ms, expires_ms) "
+            "VALUES (?, ?, 'pending', ?, ?)",
+            (key, fingerprint, now_ms, now_ms + ttl_ms)
+        )
+        return None
+    return _pools().writer.run(_claim)
+
+
+def get_idempotency_key(key: str) -> Optional[Dict[str, Any]]:
+    rows = _pools().reader.execute(
+        "SELECT fingerprint, status, status_code, response FROM idempotency_key WHERE key = ?",
+        (key,)
     )
-    db.commit()
+    if not rows:
+        return None
+    row = rows[0]
+    return {"fingerprint": row[0], "status": row[1], "status_code": row[2], "response": row[3]}
+
+
+def complete_idempotency_key(key: str, status_code: int, response: str):
+    """Store the reply to replay for later retries with the same key."""
+    _pools().writer.run(lambda db: db.execute(
+        "UPDATE idempotency_key SET status = 'done', status_code = ?, response = ? WHERE key = ?",
+        (status_code, response, key)
+    ))
+
+
+def release_idempotency_key(key: str):
+    """Release a key whose request failed so that a retry runs again."""
+    _pools().writer.run(lambda db: db.execute(
+        "UPDATE idempotency_key SET status = 'released' WHERE key = ? AND status = 'pending'",
+        (key,)
+    ))
+
+
+def set_idempotency_message(key: str, session_uuid: str, message_id: int):
+    """Record the user message stored by the request holding the key."""
+    _pools().writer.run(lambda db: db.execute(
+        "UPDATE idempotency_key SET message_session = ?, message_id = ? WHERE key = ?",
+        (session_uuid, message_id, key)
+    ))
+
+
+def get_idempotency_message(key: str) -> Optional[Dict[str, Any]]:
+    """User message an earlier attempt with this key stored, if any."""
+    rows = _pools().reader.execute(
+        "SELECT message_session, message_id FROM idempotency_key WHERE key = ? AND message_id IS NOT NULL",
+        (key,)
+    )
+    if not rows:
+        return None
+    return {"session_id": rows[0][0], "message_id": rows[0][1]}
+
+
+def purge_idempotency_keys(now_ms: int) -> int:
+    """Delete expired keys, return how many were removed."""
+    return _pools().writer.run(lambda db: db.execute(
+        "DELETE FROM idempotency_key WHERE expires_ms <= ?",
+        (now_ms,)
+    ).rowcount)
+
+
+# ---- Server-side web sessions ----
+
+def get_web_session(key: bytes) -> Optional[Dict[str, Any]]:
+    """Stored Flask session for a hashed cookie id, expired rows included."""
+    rows = _pools().reader.execute(
+        "SELECT data, user_id, expires_ms, updated_ms FROM web_session WHERE id = ?",
+        (key,)
+    )
+    if not rows:
+        return None
+    row = rows[0]
+    return {"data": row[0], "user_id": row[1], "expires_ms": row[2], "updated_ms": row[3]}
+
+
+def save_web_session(key: bytes, data: str, user_id: Optional[str], expires_ms: int,
+                     updated_ms: int, replaces: Optional[bytes] = None):
+    """Insert or overwrite a session; `replaces` is deleted in the same transaction."""
+    def _save(db: sqlite3.Connection):
+        if replaces is not None:
+            db.execute("DELETE FROM web_session WHERE id = ?", (replaces,))
+        db.execute(
+            "INSERT OR REPLACE INTO web_session (id, data, user_id, expires_ms, updated_ms) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, data, user_id, expires_ms, updated_ms)
+        )
+    _pools().writer.run(_save)
+
+
+def touch_web_session(key: bytes, expires_ms: int, updated_ms: int):
+    """Slide the expiry of an unmodified session."""
+    _pools().writer.run(lambda db: db.execute(
+        "UPDATE web_session SET expires_ms = ?, updated_ms = ? WHERE id = ?",
+        (expires_ms, updated_ms, key)
+    ))
+
+
+def delete_web_session(key: bytes) -> int:
+    return _pools().writer.run(lambda db: db.execute(
+        "DELETE FROM web_session WHERE id = ?", (key,)
+    ).rowcount)
+
+
+def delete_user_web_sessions(user_id: str) -> int:
+    """Revoke every session of a user (partial index on user_id)."""
+    return _pools().writer.run(lambda db: db.execute(
+        "DELETE FROM web_session WHERE user_id = ?", (user_id,)
+    ).rowcount)
+
+
+def purge_web_sessions(now_ms: int, batch_size: int = 500) -> int:
+    """Delete up to batch_size expired sessions, return how many were removed.
+
+    Callers loop until fewer than batch_size rows go, so the write lock is
+    released between short transactions.
+    """
+    return _pools().writer.run(lambda db: db.execute(
+        "DELETE FROM web_session WHERE id IN "
+        "(SELECT id FROM web_session WHERE expires_ms <= ? LIMIT ?)",
+        (now_ms, batch_size)
+    ).rowcount)
+
+
+def count_web_sessions(now_ms: int) -> Dict[str, int]:
+    rows = _pools().reader.execute(
+        "SELECT COUNT(*), COUNT(user_id), COALESCE(SUM(expires_ms <= ?), 0) FROM web_session",
+        (now_ms,)
+    )
+    total, authenticated, expired = rows[0]
+    return {"total": total, "authenticated": authenticated, "expired": expired}
+
+
+# ---- Token usage ----
+
+def add_token_usage(rows: List[Tuple[str, str, str, int, int, int]]) -> Dict[Tuple[str, str, str], int]:
+    """Add (day, scope, subject, prompt_tokens, output_tokens, calls) deltas in one transaction.
+
+    Returns the new total tokens of every row written, which include the
+    usage flushed by other workers.
+    """
+    def _add(db: sqlite3.Connection):
+        db.executemany(
+            "INSERT INTO token_usage (day, scope, subject, prompt_tokens, output_tokens, calls) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (day, scope, subject) DO UPDATE SET "
+            "prompt_tokens = prompt_tokens + excluded.prompt_tokens, "
+            "output_tokens = output_tokens + excluded.output_tokens, "
+            "calls = calls + excluded.calls",
+            rows
+        )
+        totals = {}
+        for day, scope, subject, *_ in rows:
+            totals[(day, scope, subject)] = db.execute(
+                "SELECT prompt_tokens + output_tokens FROM token_usage WHERE day = ? AND scope = ? AND subject = ?",
+                (day, scope, subject)
+            ).fetchone()[0]
+        return totals
+    return _pools().writer.run(_add)
+
+
+def get_token_usage(day: str, scope: str, subject: str) -> int:
+    """Total tokens of one subject on one day (0 when unknown)."""
+    rows = _pools().reader.execute(
+        "SELECT prompt_tokens + output_tokens FROM token_usage WHERE day = ? AND scope = ? AND subject = ?",
+        (day, scope, subject)
+    )
+    return rows[0][0] if rows else 0
+
+
+def get_token_usage_report(since_day: str, top: int = 20) -> Dict[str, Any]:
+    """Daily totals since since_day and the heaviest users and sessions."""
+    reader = _pools().reader
+    days = reader.execute(
+        "SELECT day, prompt_tokens, output_tokens, calls FROM token_usage "
+        "WHERE scope = 'day' AND day >= ? ORDER BY day",
+        (since_day,)
+    )
+    report: Dict[str, Any] = {
+        "days": [{"day": r[0], "prompt_tokens": r[1], "output_tokens": r[2], "calls": r[3]} for r in days],
+    }
+    for scope, key in (("user", "top_users"), ("session", "top_sessions")):
+        rows = reader.execute(
+            "SELECT subject, SUM(prompt_tokens), SUM(output_tokens), SUM(calls) FROM token_usage "
+            "WHERE day >= ? AND scope = ? GROUP BY subject "
+            "ORDER BY SUM(prompt_tokens + output_tokens) DESC LIMIT ?",
+            (since_day, scope, top)
+        )
+        report[key] = [{"subject": r[0], "prompt_tokens": r[1], "output_tokens": r[2], "calls": r[3]}
+                       for r in rows]
+    return report
+
+
+# ---- Revoked API tokens ----
+
+def revoke_token(jti: str, user_id: Optional[str], expires_ms: int) -> bool:
+    """Deny a token until it expires; False if it was already revoked."""
+    cur = _pools().writer.run(lambda db: db.execute(
+        "INSERT OR IGNORE INTO revoked_token (jti, user_id, revoked_ms, expires_ms) VALUES (?, ?, ?, ?)",
+        (jti, user_id, now_ms(), expires_ms)
+    ))
+    return cur.rowcount == 1
+
+
+def is_token_revoked(jti: str) -> bool:
+    rows = _pools().reader.execute("SELECT 1 FROM revoked_token WHERE jti = ?", (jti,))
+    return bool(rows)
+
+
+def get_revoked_tokens(after_id: int, now: int) -> List[Any]:
+    """(id, jti, revoked_ms) rows newer than after_id and not yet expired, oldest first."""
+    return _pools().reader.execute(
+        "SELECT id, jti, revoked_ms FROM revoked_token WHERE id > ? AND expires_ms > ? ORDER BY id",
+        (after_id, now)
+    )
+
+
+def purge_revoked_tokens(now: int) -> int:
+    """Delete rows whose tokens have all expired."""
+    return _pools().writer.run(lambda db: db.execute(
+        "DELETE FROM revoked_token WHERE expires_ms <= ?",
+        (now,)
+    ).rowcount)
+
+
+# ---- Evaluation jobs ----
+
+def start_eval_job(job_id: str, total: int, timeout_ms: int, now: int, stale_ms: int, keep: int) -> bool:
+    """Record a running evaluation job; False if another one is still running.
+
+    Running jobs not updated for max(stale_ms, 2 * their timeout_ms) are
+    marked failed first (their worker is gone). Only the `keep` most recent
+    finished jobs are kept.
+    """
+    def _start(db: sqlite3.Connection):
+        db.execute(
+            "UPDATE eval_job SET status = 'failed', error = 'worker lost', updated_ms = ? "
+            "WHERE status = 'running' AND updated_ms + MAX(?, 2 * timeout_ms) <= ?",
+            (now, stale_ms, now)
+        )
+        if db.execute("SELECT 1 FROM eval_job WHERE status = 'running'").fetchone():
+            return False
+        db.execute(
+            "INSERT INTO eval_job (id, total, timeout_ms, started_ms, updated_ms) VALUES (?, ?, ?, ?, ?)",
+            (job_id, total, timeout_ms, now, now)
+        )
+        db.execute(
+            "DELETE FROM eval_job WHERE status != 'running' AND id NOT IN "
+            "(SELECT id FROM eval_job WHERE status != 'running' ORDER BY started_ms DESC LIMIT ?)",
+            (keep,)
+        )
+        return True
+    return _pools().writer.run(_start)
+
+
+def update_eval_job(job_id: str, done: Optional[int] = None, status: Optional[str] = None,
+                    report: Optional[str] = None, error: Optional[str] = None):
+    """Store progress (done) or the outcome (status with report or error) of a job."""
+    _pools().writer.run(lambda db: db.execute(
+        "UPDATE eval_job SET done = COALESCE(?, done), status = COALESCE(?, status), "
+        "report = COALESCE(?, report), error = COALESCE(?, error), updated_ms = ? WHERE id = ?",
+        (done, status, report, error, now_ms(), job_id)
+    ))
+
+
+def get_eval_job(job_id: str) -> Optional[Dict[str, Any]]:
+    rows = _pools().reader.execute(
+        "SELECT id, status, done, total, report, error FROM eval_job WHERE id = ?",
+        (job_id,)
+    )
+    if not rows:
+        return None
+    row = rows[0]
+    return {"id": row[0], "status": row[1], "done": row[2], "total": row[3], "report": row[4], "error": row[5]}
+
+
+# ---- Analytics rollups ----
+
+def refresh_stats(settle_seconds: Optional[int] = None) -> int:
+    """Fold messages added since the last refresh into the rollup tables."""
+    if settle_seconds is None:
+        settle_seconds = int(current_app.config.get("STATS_SETTLE_SECONDS", 5))
+    writers = [get_pools(path).writer for path in chat_db_paths()]
+    return RollupRefresher(writers, settle_seconds=settle_seconds).refresh()
+
+
+def get_dashboard_stats(days: int = 14, hours: int = 24, top: int = 10) -> Dict[str, Any]:
+    """Admin dashboard figures read from the rollups (no scan of message), summed over shards."""
+    size = int(current_app.config.get("DB_READ_POOL_SIZE", 4))
 
+    def _read(reader):
+        with reader.connection() as conn:
+            return read_dashboard(conn, days=days, hours=hours, top=top)
+    return merge_dashboards([retry_busy(lambda: _read(get_pools(path, size).reader)) for path in chat_db_paths()],
+                            top=top)
@@ -0,0 +1,239 @@
+"""Streaming NDJSON export / import of conversations.
+
+Export walks `session JOIN message` with a single cursor ordered by
+(session id, message time, message id). SQLite serves that order from the
+session rowid (or idx_session_user_id) and idx_message_session_created
+without a temp B-tree
+sort, and lines are yielded one at a time, so memory stays constant no
+matter how many messages are exported. With --since/--until only the
+window is read, through idx_message_created. SQLite then sorts it with its
+external sorter, which spills to temp files instead of growing in memory.
+
+Line format (one JSON object per line):
+  {"type": "session", "uuid": ..., "user_id": ..., "status": ...,
+   "started_at": ..., "last_activity_at": ...}
+  {"type": "message", "session": <uuid>, "role": ..., "content": ...,
+   "created_at": ..., "error": ...}
+
+A session line always precedes the messages of that session. Timestamps
+are "YYYY-MM-DD HH:MM:SS" UTC text in the file; the database stores epoch
+milliseconds (database/timestamps.py).
+"""
+
+from __future__ import annotations
+
+import gzip
+import io
+import json
+import sqlite3
+import zlib
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from database.content_codec import codec_for
+from database.shards import shard_index
+from database.timestamps import ms_to_text, now_ms, text_to_ms
+
+EXPORT_SQL = """
+SELECT s.id, s.uuid, s.user_id, s.status, s.started_ms, s.last_activity_ms,
+       m.role, m.content, m.created_ms, m.error, m.codec
+FROM session s
+JOIN message m ON m.session_id = s.id
+{where}
+ORDER BY s.id, m.created_ms, m.id
+"""
+
+
+def _export_query(since: Optional[str], until: Optional[str],
+                  user_id: Optional[int]) -> Tuple[str, List[Any]]:
+    clauses, params = [], []
+    if since:
+        clauses.append("m.created_ms >= ?")
+        params.append(text_to_ms(since))
+    if until:
+        clauses.append("m.created_ms < ?")
+        params.append(text_to_ms(until))
+    if user_id is not None:
+        clauses.append("s.user_id = ?")
+        params.append(user_id)
+    where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+    return EXPORT_SQL.format(where=where), params
+
+
+def iter_export(conn: sqlite3.Connection, since: Optional[str] = None,
+                until: Optional[str] = None, user_id: Optional[int] = None) -> Iterator[str]:
+    """Yield NDJSON lines (with trailing newline) for matching messages.
+
+    `since` / `until` are compared with message.created_ms
+    ("YYYY-MM-DD" or "YYYY-MM-DD HH:MM:SS", UTC), `until` is exclusive.
+    """
+    sql, params = _export_query(since, until, user_id)
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    decode = codec_for(conn).decode
+    current_session = None
+    for row in conn.execute(sql, params):
+        if row[0] != current_session:
+            current_session = row[0]
+            yield dumps({
+                "type": "session",
+                "uuid": row[1],
+                "user_id": row[2],
+                "status": row[3],
+                "started_at": ms_to_text(row[4]),
+                "last_activity_at": ms_to_text(row[5]),
+            }) + "\n"
+        yield dumps({
+            "type": "message",
+            "session": row[1],
+            "role": row[6],
+            "content": decode(row[10], row[7], conn),
+            "created_at": ms_to_text(row[8]),
+            "error": row[9],
+        }) + "\n"
+
+
+def iter_chunks(lines: Iterable[str], compress: bool = False, chunk_lines: int = 500) -> Iterator[bytes]:
+    """Group lines into byte chunks for HTTP streaming, optionally gzipped."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buf: List[str] = []
+    for line in lines:
+        buf.append(line)
+        if len(buf) >= chunk_lines:
+            data = "".join(buf).encode("utf-8")
+            buf.clear()
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+    data = "".join(buf).encode("utf-8")
+    if compressor:
+        yield compressor.compress(data) + compressor.flush()
+    elif data:
+        yield data
+
+
+def iter_export_all(conns: List[sqlite3.Connection], **filters) -> Iterator[str]:
+    """Export of several shard files, one after the other (sessions never span files)."""
+    for conn in conns:
+        yield from iter_export(conn, **filters)
+
+
+def export_to_file(conn: Union[sqlite3.Connection, List[sqlite3.Connection]], out: IO[bytes],
+                   compress: bool = False, **filters) -> int:
+    """Write an export (of one file or a list of shard files) to a binary file object.
+
+    Returns the number of lines.
+    """
+    count = 0
+    conns = conn if isinstance(conn, list) else [conn]
+    target = gzip.GzipFile(fileobj=out, mode="wb", compresslevel=6) if compress else out
+    try:
+        for chunk in iter_chunks(iter_export_all(conns, **filters), chunk_lines=1000):
+            target.write(chunk)
+            count += chunk.count(b"\n")
+    finally:
+        if compress:
+            target.close()
+    return count
+
+
+def open_ndjson(stream: IO[bytes]) -> Iterator[str]:
+    """Iterate text lines from a (possibly gzip-compressed) binary stream."""
+    if not hasattr(stream, "peek"):
+        stream = io.BufferedReader(stream)  # type: ignore[arg-type]
+    if stream.peek(2)[:2] == b"\x1f\x8b":
+        stream = gzip.GzipFile(fileobj=stream, mode="rb")
+    return io.TextIOWrapper(stream, encoding="utf-8")
+
+
+def import_ndjson(conn: Union[sqlite3.Connection, List[sqlite3.Connection]], lines: Iterable[str],
+                  batch_size: int = 5000, transaction_rows: int = 100000) -> Dict[str, int]:
+    """Load an NDJSON export with batched executemany in large transactions.
+
+    `conn` must be in autocommit mode (isolation_level=None); transactions
+    are managed here. With a list of shard files (chat_db_paths() order)
+    each session is written straight into the file its uuid maps to, so no
+    rebalance is needed afterwards. Sessions whose uuid already exists are
+    skipped along with their messages, so re-importing the same file is
+    harmless. Commits happen only between sessions (once transaction_rows
+    is reached), so a session is never stored without part of its messages
+    and re-running an interrupted import completes it.
+    """
+    stats = {"sessions": 0, "messages": 0, "skipped_sessions": 0, "skipped_messages": 0}
+    conns = conn if isinstance(conn, list) else [conn]
+    encoders = [codec_for(c).encode for c in conns]
+    batches: List[List[tuple]] = [[] for _ in conns]
+    # Records without a timestamp get the import time
+    default_ms = now_ms()
+    in_txn_rows = 0
+    current_uuid = None
+    current_id: Optional[int] = None
+    shard = 0
+
+    for c in conns:
+        c.execute("BEGIN IMMEDIATE")
+    try:
+        for raw in lines:
+            if not raw.strip():
+                continue
+            record = json.loads(raw)
+            kind = record.get("type")
+            if kind == "session":
+                if in_txn_rows >= transaction_rows:
+                    # Session boundary: everything before it is complete
+                    for c, batch in zip(conns, batches):
+                        if batch:
+                            _flush_messages(c, batch)
+                            stats["messages"] += len(batch)
+                            batch.clear()
+                        c.execute("COMMIT")
+                        c.execute("BEGIN IMMEDIATE")
+                    in_txn_rows = 0
+                current_uuid = record["uuid"]
+                shard = shard_index(current_uuid, len(conns))
+                target = conns[shard]
+                if target.execute("SELECT 1 FROM session WHERE uuid = ?", (current_uuid,)).fetchone():
+                    current_id = None
+                    stats["skipped_sessions"] += 1
+                    continue
+                cur = target.execute(
+                    "INSERT INTO session (uuid, user_id, status, started_ms, last_activity_ms) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (current_uuid, record.get("user_id"), record.get("status") or "active",
+                     text_to_ms(record.get("started_at")) or default_ms,
+                     text_to_ms(record.get("last_activity_at")) or default_ms),
+                )
+                current_id = cur.lastrowid
+                stats["sessions"] += 1
+            elif kind == "message":
+                if record.get("session") != current_uuid:
+                    raise ValueError(f"Message for session {record.get('session')} before its session line")
+                if current_id is None:
+                    stats["skipped_messages"] += 1
+                    continue
+                codec, stored = encoders[shard](record["content"])
+                batch = batches[shard]
+                batch.append((current_id, record["role"], stored,
+                              text_to_ms(record.get("created_at")) or default_ms, record.get("error"), codec))
+                in_txn_rows += 1
+                if len(batch) >= batch_size:
+                    _flush_messages(conns[shard], batch)
+                    stats["messages"] += len(batch)
+                    batch.clear()
+        for c, batch in zip(conns, batches):
+            if batch:
+                _flush_messages(c, batch)
+                stats["messages"] += len(batch)
+        for c in conns:
+            c.execute("COMMIT")
+    except BaseException:
+        for c in conns:
+            if c.in_transaction:
+                c.execute("ROLLBACK")
+        raise
+    return stats
+
+
+def _flush_messages(conn: sqlite3.Connection, batch: List[tuple]):
+    conn.executemany(
+        "INSERT INTO message (session_id, role, content, created_ms, error, codec) VALUES (?, ?, ?, ?, ?, ?)",
+        batch,
+    )
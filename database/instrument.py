@@ -0,0 +1,297 @@
+"""Per-statement timing, slow-query log and plan capture for SQLite.
+
+Connections opened by `database.pool.connect` use InstrumentedConnection,
+whose cursors time every statement. The time of a SELECT includes its
+fetchone/fetchmany/fetchall calls, because SQLite steps lazily. Rows read
+by iterating a cursor are not counted; the bulk export is the only code
+that does that.
+
+Timings are aggregated per normalized statement: whitespace collapsed,
+literals replaced by `?`, `IN (?, ?, ...)` folded to `IN (?...)`. A
+statement slower than DB_SLOW_QUERY_MS goes into the slow log. Each entry
+keeps the shape of the bound parameters (types and string lengths, never
+the values) and the statement's EXPLAIN QUERY PLAN. A plan that scans a
+whole table or builds a temporary B-tree is flagged. The plan of every
+statement, slow or not, is captured when it first runs and refreshed at
+most once per PLAN_TTL_S, so a dropped index shows up as a flag
+right away.
+
+Stats are per process and served by GET /api/admin/queries.
+"""
+
+from __future__ import annotations
+
+import itertools
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Any, Deque, Dict, List, Optional
+
+SAMPLE_WINDOW = 256
+MAX_STATEMENTS = 500
+OTHER_STATEMENTS = "(other statements)"
+SLOW_LOG_SIZE = 100
+PLAN_TTL_S = 60.0
+
+_WS = re.compile(r"\s+")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w?])-?\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql: str) -> str:
+    """Statement text used as the aggregation key."""
+    text = _WS.sub(" ", sql).strip().rstrip(";")
+    text = _STRING.sub("?", text)
+    text = _NUMBER.sub("?", text)
+    return _IN_LIST.sub("IN (?...)", text)
+
+
+def param_shape(params: Any) -> Any:
+    """Types (and string lengths) of bound parameters, without their values."""
+    def shape(value):
+        if value is None:
+            return "null"
+        if isinstance(value, (str, bytes)):
+            return f"{type(value).__name__}({len(value)})"
+        return type(value).__name__
+    if isinstance(params, dict):
+        return {key: shape(value) for key, value in params.items()}
+    if isinstance(params, (list, tuple)):
+        return [shape(value) for value in params]
+    return []
+
+
+def plan_flags(plan: List[str]) -> List[str]:
+    """Plan steps worth flagging: full scans and temporary B-trees."""
+    flags = []
+    for detail in plan:
+        if detail.startswith("SCAN ") and "CONSTANT ROW" not in detail:
+            flags.append("full_scan")
+        elif "TEMP B-TREE" in detail:
+            flags.append("temp_btree")
+    return sorted(set(flags))
+
+
+class _StatementStats:
+    __slots__ = ("count", "total_ms", "max_ms", "rows", "slow", "samples", "plan", "flags", "plan_at")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.slow = 0
+        self.samples: Deque[float] = deque(maxlen=SAMPLE_WINDOW)
+        self.plan: Optional[List[str]] = None
+        self.flags: List[str] = []
+        self.plan_at = 0.0
+
+
+class QueryStats:
+    """Process-wide statement registry (see module docstring)."""
+
+    def __init__(self, enabled: bool = True, slow_ms: float = 100.0):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self._stats: Dict[str, _StatementStats] = {}
+        self._slow_log: Deque[Dict[str, Any]] = deque(maxlen=SLOW_LOG_SIZE)
+        self._lock = threading.Lock()
+
+    def configure(self, enabled: Optional[bool] = None, slow_ms: Optional[float] = None):
+        if enabled is not None:
+            self.enabled = enabled
+        if slow_ms is not None:
+            self.slow_ms = slow_ms
+
+    def record(self, conn: sqlite3.Connection, sql: str, params: Any, elapsed_ms: float, rows: int):
+        key = normalize_sql(sql)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                if len(self._stats) >= MAX_STATEMENTS:
+                    key = OTHER_STATEMENTS
+                    stats = self._stats.get(key)
+                if stats is None:
+                    stats = self._stats[key] = _StatementStats()
+            stats.count += 1
+            stats.total_ms += elapsed_ms
+            stats.max_ms = max(stats.max_ms, elapsed_ms)
+            stats.rows += rows
+            stats.samples.append(elapsed_ms)
+            now = time.monotonic()
+            need_plan = stats.plan is None or now - stats.plan_at >= PLAN_TTL_S
+            if need_plan:
+                stats.plan_at = now
+            slow = elapsed_ms >= self.slow_ms
+            if slow:
+                stats.slow += 1
+        if need_plan and key != OTHER_STATEMENTS:
+            plan = explain(conn, sql, params)
+            with self._lock:
+                stats.plan = plan
+                stats.flags = plan_flags(plan)
+        if not slow:
+            return
+        entry = {
+            "sql": key,
+            "ms": round(elapsed_ms, 2),
+            "rows": rows,
+            "params": param_shape(params),
+            "plan": stats.plan,
+            "flags": stats.flags,
+            "at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+        with self._lock:
+            self._slow_log.append(entry)
+        flags = f" [{', '.join(stats.flags)}]" if stats.flags else ""
+        print(f"[SLOW SQL] {elapsed_ms:.1f} ms{flags} {key} params={entry['params']}")
+
+    def snapshot(self, top: int = 50) -> Dict[str, Any]:
+        """Statements by total time, plus the most recent slow queries."""
+        with self._lock:
+            items = [(key, s, sorted(s.samples)) for key, s in self._stats.items()]
+            slow_log = list(self._slow_log)[::-1]
+        items.sort(key=lambda item: item[1].total_ms, reverse=True)
+        pct = lambda samples, p: round(samples[min(len(samples) - 1, int(p * len(samples)))], 3)
+        statements = [
+            {
+                "sql": key,
+                "count": s.count,
+                "total_ms": round(s.total_ms, 2),
+                "mean_ms": round(s.total_ms / s.count, 3),
+                "p50_ms": pct(samples, 0.5),
+                "p95_ms": pct(samples, 0.95),
+                "max_ms": round(s.max_ms, 2),
+                "rows": s.rows,
+                "slow": s.slow,
+                "plan": s.plan,
+                "flags": s.flags,
+            }
+            for key, s, samples in items[:top]
+        ]
+        return {"enabled": self.enabled, "slow_ms": self.slow_ms,
+                "statements": statements, "slow_log": slow_log}
+
+    def plan_for(self, conn: sqlite3.Connection, sql: str, params: Any = ()) -> List[str]:
+        """Capture (and remember) the plan of one statement on demand."""
+        plan = explain(conn, sql, params)
+        with self._lock:
+            stats = self._stats.setdefault(normalize_sql(sql), _StatementStats())
+            stats.plan, stats.flags, stats.plan_at = plan, plan_flags(plan), time.monotonic()
+        return plan
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._slow_log.clear()
+
+
+QUERY_STATS = QueryStats()
+
+
+_explain_seq = itertools.count()
+
+
+def explain(conn: sqlite3.Connection, sql: str, params: Any = ()) -> List[str]:
+    """EXPLAIN QUERY PLAN details, run on a plain (uninstrumented) cursor.
+
+    An EXPLAIN never checks the schema cookie, and sqlite3 caches prepared
+    statements by text. So the schema is re-read first, and each EXPLAIN
+    gets a unique comment to force a fresh prepare. Otherwise a dropped
+    index would still appear in the plan.
+    """
+    stripped = sql.lstrip().upper()
+    if not stripped.startswith(("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")):
+        return []
+    try:
+        cur = sqlite3.Connection.cursor(conn)
+        sqlite3.Cursor.execute(cur, "SELECT 1 FROM sqlite_master LIMIT 0").fetchall()
+        query = f"EXPLAIN QUERY PLAN /* {next(_explain_seq)} */ {sql}"
+        return [row[-1] for row in sqlite3.Cursor.execute(cur, query, params)]
+    except sqlite3.Error as e:
+        return [f"unavailable: {e}"]
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor timing execute() and the fetch calls that finish a SELECT."""
+
+    _sql: Optional[str] = None
+    _params: Any = ()
+    _elapsed = 0.0
+
+    def execute(self, sql, parameters=()):
+        if not QUERY_STATS.enabled:
+            return super().execute(sql, parameters)
+        start = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        finally:
+            self._elapsed = (time.perf_counter() - start) * 1000.0
+        if self.description is None:
+            # No result set: the statement is done
+            QUERY_STATS.record(self.connection, sql, parameters, self._elapsed, max(self.rowcount, 0))
+            self._sql = None
+        else:
+            self._sql, self._params = sql, parameters
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        if not QUERY_STATS.enabled:
+            return super().executemany(sql, seq_of_parameters)
+        start = time.perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000.0
+        first = seq_of_parameters[0] if isinstance(seq_of_parameters, (list, tuple)) and seq_of_parameters else ()
+        QUERY_STATS.record(self.connection, sql, first, elapsed, max(self.rowcount, 0))
+        return self
+
+    def _finish(self, start: float, rows: int):
+        elapsed = self._elapsed + (time.perf_counter() - start) * 1000.0
+        sql, self._sql = self._sql, None
+        QUERY_STATS.record(self.connection, sql, self._params, elapsed, rows)
+
+    def fetchall(self):
+        if self._sql is None:
+            return super().fetchall()
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._finish(start, len(rows))
+        return rows
+
+    def fetchone(self):
+        if self._sql is None:
+            return super().fetchone()
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._finish(start, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        if self._sql is None:
+            return super().fetchmany(self.arraysize if size is None else size)
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._finish(start, len(rows))
+        return rows
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection whose cursors (and conn.execute) are instrumented."""
+
+    def cursor(self, factory=InstrumentedCursor):  # type: ignore[override]
+        return super().cursor(factory)
+
+    # Connection.execute() does not go through cursor(): route it explicitly
+    def execute(self, sql, parameters=()):  # type: ignore[override]
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):  # type: ignore[override]
+        return self.cursor().executemany(sql, seq_of_parameters)
+
@@ -0,0 +1,653 @@
+"""Versioned schema migrations keyed on `PRAGMA user_version`.
+
+Each migration is a function taking an open connection; `migrate()` runs the
+pending ones in order, each inside its own BEGIN IMMEDIATE transaction that
+also bumps user_version. A process starting against an up-to-date database
+only reads the version PRAGMA and returns, so startup no longer re-executes
+the whole schema script or probes table_info on every boot.
+
+To change the schema, append a new function to MIGRATIONS; never edit one
+that has already shipped.
+
+A migration that must copy a large table registers a step in PREPARE. That
+step runs before the migration's own transaction, in short batches with a
+commit after each one. It must be resumable and safe to run from several
+processes at once. The final transaction then only copies the tail.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from typing import Callable, Dict, List, Tuple
+
+from database.timestamps import SQL_NOW_MS, sql_text_to_ms
+
+SCHEMA_SQL = """
+-- User table with authentication fields
+CREATE TABLE IF NOT EXISTS user (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email TEXT UNIQUE NOT NULL,
+    display_name TEXT NOT NULL,
+    password_hash TEXT NOT NULL,
+    role TEXT DEFAULT 'student' CHECK(role IN ('student', 'admin', 'guest')),
+    is_verified INTEGER DEFAULT 0,
+    verification_token TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_user_email ON user(email);
+CREATE INDEX IF NOT EXISTS idx_user_verification_token ON user(verification_token);
+
+-- Session table linked to users
+CREATE TABLE IF NOT EXISTS session (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    uuid TEXT UNIQUE NOT NULL,
+    user_id INTEGER,
+    status TEXT DEFAULT 'active',
+    started_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    last_activity_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY(user_id) REFERENCES user(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_session_uuid ON session(uuid);
+CREATE INDEX IF NOT EXISTS idx_session_user_id ON session(user_id);
+
+-- Message table
+CREATE TABLE IF NOT EXISTS message (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    error TEXT,
+    FOREIGN KEY(session_id) REFERENCES session(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_message_session_id ON message(session_id);
+
+-- Password reset table
+CREATE TABLE IF NOT EXISTS password_reset (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    token TEXT UNIQUE NOT NULL,
+    expires_at TEXT NOT NULL,
+    used INTEGER DEFAULT 0,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY(user_id) REFERENCES user(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_password_reset_token ON password_reset(token);
+CREATE INDEX IF NOT EXISTS idx_password_reset_user_id ON password_reset(user_id);
+
+-- Login attempt table for security
+CREATE TABLE IF NOT EXISTS login_attempt (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email TEXT NOT NULL,
+    ip_address TEXT,
+    success INTEGER DEFAULT 0,
+    attempted_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_login_attempt_email ON login_attempt(email);
+CREATE INDEX IF NOT EXISTS idx_login_attempt_attempted_at ON login_attempt(attempted_at);
+"""
+
+ROLLUP_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS stats_hourly (
+    bucket TEXT NOT NULL,              -- 'YYYY-MM-DD HH' (UTC)
+    role TEXT NOT NULL,
+    messages INTEGER NOT NULL DEFAULT 0,
+    errors INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, role)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS stats_daily (
+    bucket TEXT NOT NULL,              -- 'YYYY-MM-DD' (UTC)
+    role TEXT NOT NULL,
+    messages INTEGER NOT NULL DEFAULT 0,
+    errors INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, role)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS stats_session_day (
+    day TEXT NOT NULL,
+    session_id INTEGER NOT NULL,
+    PRIMARY KEY (day, session_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS stats_daily_sessions (
+    day TEXT PRIMARY KEY,
+    active_sessions INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS stats_question (
+    question TEXT PRIMARY KEY,
+    asked INTEGER NOT NULL DEFAULT 0,
+    last_asked_at TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_stats_question_asked ON stats_question(asked DESC);
+
+CREATE TABLE IF NOT EXISTS stats_watermark (
+    name TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL DEFAULT 0,
+    refreshed_at TEXT
+)
+"""
+
+IDEMPOTENCY_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS idempotency_key (
+    key TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending' CHECK(status IN ('pending', 'done')),
+    status_code INTEGER,
+    response TEXT,
+    created_ms INTEGER NOT NULL,
+    expires_ms INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_key_expires ON idempotency_key(expires_ms)
+"""
+
+# Migration 4: the same tables with INTEGER epoch-ms timestamps. They are
+# built as <table>_v4 shadows, then swapped in. Indexes are created after
+# the copy, and the UNIQUE autoindexes replace the duplicate single-column
+# indexes on user.email, session.uuid and password_reset.token.
+TIMESTAMP_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS user_v4 (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email TEXT UNIQUE NOT NULL,
+    display_name TEXT NOT NULL,
+    password_hash TEXT NOT NULL,
+    role TEXT DEFAULT 'student' CHECK(role IN ('student', 'admin', 'guest')),
+    is_verified INTEGER DEFAULT 0,
+    verification_token TEXT,
+    created_ms INTEGER DEFAULT ({now}),
+    updated_ms INTEGER DEFAULT ({now})
+);
+
+CREATE TABLE IF NOT EXISTS session_v4 (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    uuid TEXT UNIQUE NOT NULL,
+    user_id INTEGER,
+    status TEXT DEFAULT 'active',
+    started_ms INTEGER DEFAULT ({now}),
+    last_activity_ms INTEGER DEFAULT ({now}),
+    FOREIGN KEY(user_id) REFERENCES user(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS message_v4 (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_ms INTEGER DEFAULT ({now}),
+    error TEXT,
+    FOREIGN KEY(session_id) REFERENCES session(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS password_reset_v4 (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    token TEXT UNIQUE NOT NULL,
+    expires_ms INTEGER NOT NULL,
+    used INTEGER DEFAULT 0,
+    created_ms INTEGER DEFAULT ({now}),
+    FOREIGN KEY(user_id) REFERENCES user(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS login_attempt_v4 (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email TEXT NOT NULL,
+    ip_address TEXT,
+    success INTEGER DEFAULT 0,
+    attempted_ms INTEGER DEFAULT ({now})
+)
+""".format(now=SQL_NOW_MS)
+
+TIMESTAMP_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS idx_user_verification_token ON user(verification_token);
+CREATE INDEX IF NOT EXISTS idx_session_user_id ON session(user_id);
+-- Idle sessions: status = ? AND last_activity_ms < ? (covering, returns uuid)
+CREATE INDEX IF NOT EXISTS idx_session_status_activity ON session(status, last_activity_ms, uuid);
+CREATE INDEX IF NOT EXISTS idx_message_session_id ON message(session_id);
+-- Time-range filters on messages (export --since/--until, daily volumes). Not
+-- covering: a time window is a run of consecutive ids, so row lookups stay local
+CREATE INDEX IF NOT EXISTS idx_message_created ON message(created_ms);
+CREATE INDEX IF NOT EXISTS idx_password_reset_user_id ON password_reset(user_id);
+-- Recent attempts of one email: email = ? AND attempted_ms >= ? (covering)
+CREATE INDEX IF NOT EXISTS idx_login_attempt_email_time ON login_attempt(email, attempted_ms, success);
+CREATE INDEX IF NOT EXISTS idx_login_attempt_attempted ON login_attempt(attempted_ms)
+"""
+
+CONTENT_CODEC_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS content_codec (
+    id INTEGER PRIMARY KEY,
+    algorithm TEXT NOT NULL CHECK(algorithm IN ('zlib', 'zstd')),
+    dictionary BLOB,
+    created_ms INTEGER DEFAULT ({now})
+);
+
+INSERT OR IGNORE INTO content_codec (id, algorithm) VALUES (1, 'zlib'), (2, 'zstd')
+""".format(now=SQL_NOW_MS)
+
+# Server-side Flask sessions (service/session_store.py). The cookie carries
+# an opaque random id; only its SHA-256 is stored, so a leaked database does
+# not hand out live cookies.
+WEB_SESSION_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS web_session (
+    id BLOB PRIMARY KEY,
+    data TEXT NOT NULL,
+    user_id TEXT,
+    expires_ms INTEGER NOT NULL,
+    updated_ms INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_web_session_expires ON web_session(expires_ms);
+CREATE INDEX IF NOT EXISTS idx_web_session_user ON web_session(user_id) WHERE user_id IS NOT NULL
+"""
+
+# One row per change to a user's verification, password or role. The rowid is
+# the generation counter workers poll to drop stale cached principals
+# (service/principal_cache.py); old rows are purged once no cache can hold them.
+USER_INVALIDATION_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS user_invalidation (
+    generation INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    created_ms INTEGER NOT NULL
+)
+"""
+
+# Gemini token usage per UTC day, aggregated in memory by service/usage.py
+# and flushed as batched upserts. scope 'day' has one row per day (subject
+# ''), 'user' is keyed by user id and 'session' by session uuid.
+TOKEN_USAGE_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS token_usage (
+    day TEXT NOT NULL,
+    scope TEXT NOT NULL CHECK(scope IN ('day', 'user', 'session')),
+    subject TEXT NOT NULL,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    calls INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, scope, subject)
+) WITHOUT ROWID
+"""
+
+# Admin evaluation jobs (service/evaluation.py), in SQLite so that polling
+# GET /api/admin/eval/<id> works on any worker. updated_ms is bumped on each
+# answered question; a running job silent for longer than its staleness
+# window died with its worker.
+EVAL_JOB_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS eval_job (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT 'running' CHECK(status IN ('running', 'done', 'failed')),
+    done INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL,
+    report TEXT,
+    error TEXT,
+    timeout_ms INTEGER NOT NULL,
+    started_ms INTEGER NOT NULL,
+    updated_ms INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_eval_job_status ON eval_job(status)
+"""
+
+# History is read in created_ms order: with DB_WRITE_DURABILITY=async each
+# worker hands out ids from its own reserved block, so ids do not follow the
+# conversation. (session_id, created_ms) replaces the (session_id) index.
+MESSAGE_HISTORY_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS idx_message_session_created ON message(session_id, created_ms);
+DROP INDEX IF EXISTS idx_message_session_id
+"""
+
+# Messages not folded into the rollups yet (database/rollups.py). A trigger
+# queues each row in the transaction that inserts it, so a row is queued
+# exactly when it commits whatever its id: async write-behind ids commit out
+# of id order, which the old id watermark could not follow.
+STATS_PENDING_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS stats_pending (
+    message_id INTEGER PRIMARY KEY
+)
+"""
+
+# Trigger bodies contain ';', so they are not run through _statements()
+STATS_PENDING_TRIGGERS = (
+    "CREATE TRIGGER IF NOT EXISTS trg_message_stats_queue AFTER INSERT ON message "
+    "BEGIN INSERT OR IGNORE INTO stats_pending (message_id) VALUES (new.id); END",
+    "CREATE TRIGGER IF NOT EXISTS trg_message_stats_unqueue AFTER DELETE ON message "
+    "BEGIN DELETE FROM stats_pending WHERE message_id = old.id; END",
+)
+
+# idempotency_key with status 'released' and the question the claim stored:
+# a 5xx releases the key but keeps the stored question, so the retry
+# neither loses it nor stores it twice (message_session is the chat session
+# uuid, message_id the row id in that session's file)
+IDEMPOTENCY_MESSAGE_SCHEMA_SQL = """
+CREATE TABLE idempotency_key_v14 (
+    key TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending' CHECK(status IN ('pending', 'done', 'released')),
+    status_code INTEGER,
+    response TEXT,
+    created_ms INTEGER NOT NULL,
+    expires_ms INTEGER NOT NULL,
+    message_session TEXT,
+    message_id INTEGER
+)
+"""
+
+# token_usage with scope 'client': anonymous callers are also metered by
+# remote address, so dropping the cookie does not reset a guest's quota
+TOKEN_USAGE_CLIENT_SCHEMA_SQL = """
+CREATE TABLE token_usage_v10 (
+    day TEXT NOT NULL,
+    scope TEXT NOT NULL CHECK(scope IN ('day', 'user', 'session', 'client')),
+    subject TEXT NOT NULL,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    calls INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, scope, subject)
+) WITHOUT ROWID
+"""
+
+# Revoked API tokens (service/token_denylist.py). jti is the token id, or
+# 'user:<id>' for "every token of this user issued before revoked_ms" (password,
+# role or verification change). The AUTOINCREMENT id lets workers load only
+# new rows; rows are purged once the tokens they cover have expired.
+REVOKED_TOKEN_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS revoked_token (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    jti TEXT NOT NULL UNIQUE,
+    user_id TEXT,
+    revoked_ms INTEGER NOT NULL,
+    expires_ms INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_revoked_token_expires ON revoked_token(expires_ms)
+"""
+
+# (table, columns of the v4 table, matching expressions over the old table)
+_V4_COPIES: List[Tuple[str, str, str]] = [
+    ("user",
+     "id, email, display_name, password_hash, role, is_verified, verification_token, created_ms, updated_ms",
+     "id, email, display_name, password_hash, role, is_verified, verification_token, "
+     f"{sql_text_to_ms('created_at')}, {sql_text_to_ms('updated_at')}"),
+    ("session",
+     "id, uuid, user_id, status, started_ms, last_activity_ms",
+     f"id, uuid, user_id, status, {sql_text_to_ms('started_at')}, {sql_text_to_ms('last_activity_at')}"),
+    ("message",
+     "id, session_id, role, content, created_ms, error",
+     f"id, session_id, role, content, {sql_text_to_ms('created_at')}, error"),
+    ("password_reset",
+     "id, user_id, token, expires_ms, used, created_ms",
+     f"id, user_id, token, COALESCE({sql_text_to_ms('expires_at')}, 0), used, {sql_text_to_ms('created_at')}"),
+    ("login_attempt",
+     "id, email, ip_address, success, attempted_ms",
+     f"id, email, ip_address, success, {sql_text_to_ms('attempted_at')}"),
+]
+
+# Append-only tables: copied ahead of the swap, in batches of rowids
+_V4_BATCHED = ("message", "login_attempt")
+BACKFILL_BATCH_ROWS = 20000
+
+
+def _statements(script: str) -> List[str]:
+    """Split a DDL script into statements (the schema has no ';' in literals)."""
+    return [stmt.strip() for stmt in script.split(";") if stmt.strip()]
+
+
+def _migrate_existing_user_table(conn: sqlite3.Connection) -> None:
+    """Upgrade pre-auth 'user' table to include new authentication columns if missing.
+
+    Earlier versions of the schema created a minimal `user` table without
+    password_hash / role / is_verified / verification_token / updated_at.
+    Because we now create indexes referencing `verification_token`, startup
+    would fail with `sqlite3.OperationalError: no such column: verification_token`.
+
+    This function inspects the existing table (if any) and issues ALTER TABLE
+    statements to add the missing columns with safe defaults so constraints
+    won't break. Columns added:
+      - password_hash TEXT NOT NULL DEFAULT ''
+      - role TEXT DEFAULT 'student'
+      - is_verified INTEGER DEFAULT 0
+      - verification_token TEXT (nullable)
+      - updated_at TEXT (backfilled with CURRENT_TIMESTAMP)
+
+    NOTE: Existing users will have an empty password_hash and must be updated
+    on next login/registration flow. If you prefer a clean slate you can delete
+    the database file instead of relying on this migration logic.
+    """
+    cur = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='user'")
+    if not cur.fetchone():
+        return  # Table does not exist yet; fresh create will handle it.
+
+    cur = conn.execute("PRAGMA table_info(user)")
+    existing_cols = {row[1] for row in cur.fetchall()}
+    required_defs = {
+        "password_hash": "ALTER TABLE user ADD COLUMN password_hash TEXT DEFAULT '' NOT NULL",
+        "role": "ALTER TABLE user ADD COLUMN role TEXT DEFAULT 'student'",
+        "is_verified": "ALTER TABLE user ADD COLUMN is_verified INTEGER DEFAULT 0",
+        "verification_token": "ALTER TABLE user ADD COLUMN verification_token TEXT",
+        # ADD COLUMN rejects non-constant defaults such as CURRENT_TIMESTAMP
+        "updated_at": "ALTER TABLE user ADD COLUMN updated_at TEXT",
+    }
+    for col, ddl in required_defs.items():
+        if col not in existing_cols:
+            conn.execute(ddl)
+    if "updated_at" not in existing_cols:
+        conn.execute("UPDATE user SET updated_at = CURRENT_TIMESTAMP")
+
+
+# ---- Migrations ----
+
+def _v1_baseline(conn: sqlite3.Connection) -> None:
+    """Schema as it existed before versioning (also upgrades pre-auth DBs)."""
+    _migrate_existing_user_table(conn)
+    for stmt in _statements(SCHEMA_SQL):
+        conn.execute(stmt)
+
+
+def _v2_rollups(conn: sqlite3.Connection) -> None:
+    """Analytics rollup tables (filled incrementally by database/rollups.py)."""
+    for stmt in _statements(ROLLUP_SCHEMA_SQL):
+        conn.execute(stmt)
+
+
+def _v3_idempotency(conn: sqlite3.Connection) -> None:
+    """Stored replies for Idempotency-Key retries of /api/chat."""
+    for stmt in _statements(IDEMPOTENCY_SCHEMA_SQL):
+        conn.execute(stmt)
+
+
+def _v4_copy(conn: sqlite3.Connection, table: str, limit: int = -1) -> int:
+    """Copy rows of `table` past the shadow's highest id; return rows copied."""
+    _, columns, select = next(c for c in _V4_COPIES if c[0] == table)
+    start = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}_v4").fetchone()[0]
+    return conn.execute(
+        f"INSERT INTO {table}_v4 ({columns}) SELECT {select} FROM {table} "
+        "WHERE id > ? ORDER BY id LIMIT ?",
+        (start, limit),
+    ).rowcount
+
+
+def _v4_backfill(conn: sqlite3.Connection, batch_rows: int = BACKFILL_BATCH_ROWS) -> None:
+    """Copy message / login_attempt into their shadows, one batch per commit.
+
+    Progress is the shadow's MAX(id), so a restart resumes where it stopped,
+    and concurrent workers just take turns on the write lock. Writers never
+    wait longer than one batch.
+    """
+    for table in _V4_BATCHED:
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if current_version(conn) >= 4:
+                    conn.execute("ROLLBACK")
+                    return
+                for stmt in _statements(TIMESTAMP_SCHEMA_SQL):
+                    conn.execute(stmt)
+                copied = _v4_copy(conn, table, batch_rows)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            if copied < batch_rows:
+                break
+
+
+def _v4_integer_timestamps(conn: sqlite3.Connection) -> None:
+    """INTEGER epoch-ms timestamps (*_ms) instead of CURRENT_TIMESTAMP text."""
+    for stmt in _statements(TIMESTAMP_SCHEMA_SQL):
+        conn.execute(stmt)
+    for table, _, _ in _V4_COPIES:
+        # Tail of the batched tables, or everything for the small mutable ones
+        _v4_copy(conn, table)
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+        seq = max(row[0] if row else 0,
+                  conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}_v4").fetchone()[0])
+        # Foreign keys are off (see migrate), so dropping a parent cascades nothing
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {table}_v4 RENAME TO {table}")
+        # Keep AUTOINCREMENT from reusing ids (e.g. blocks reserved by write-behind)
+        conn.execute("DELETE FROM sqlite_sequence WHERE name = ?", (table,))
+        if seq:
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, seq))
+    for stmt in _statements(TIMESTAMP_INDEX_SQL):
+        conn.execute(stmt)
+
+
+def _v5_message_codec(conn: sqlite3.Connection) -> None:
+    """message.codec + content_codec rows (see database/content_codec.py).
+
+    Existing rows stay plain (codec 0); `flask db recompress` rewrites them.
+    """
+    conn.execute("ALTER TABLE message ADD COLUMN codec INTEGER NOT NULL DEFAULT 0")
+    for stmt in _statements(CONTENT_CODEC_SCHEMA_SQL):
+        conn.execute(stmt)
+
+
+def _v6_web_sessions(conn: sqlite3.Connection) -> None:
+    for stmt in _statements(WEB_SESSION_SCHEMA_SQL):
+        conn.execute(stmt)
+
+
+def _v7_user_invalidation(conn: sqlite3.Connection) -> None:
+    for stmt in _statements(USER_INVALIDATION_SCHEMA_SQL):
+        conn.execute(stmt)
+
+
+def _v8_token_usage(conn: sqlite3.Connection) -> None:
+    for stmt in _statements(TOKEN_USAGE_SCHEMA_SQL):
+        conn.execute(stmt)
+
+
+def _v9_revoked_tokens(conn: sqlite3.Connection) -> None:
+    for stmt in _statements(REVOKED_TOKEN_SCHEMA_SQL):
+        conn.execute(stmt)
+
+
+def _v10_client_usage(conn: sqlite3.Connection) -> None:
+    """Rebuild token_usage to widen its scope CHECK (a few rows per day)."""
+    conn.execute(TOKEN_USAGE_CLIENT_SCHEMA_SQL)
+    conn.execute("INSERT INTO token_usage_v10 (day, scope, subject, prompt_tokens, output_tokens, calls) "
+                 "SELECT day, scope, subject, prompt_tokens, output_tokens, calls FROM token_usage")
+    conn.execute("DROP TABLE token_usage")
+    conn.execute("ALTER TABLE token_usage_v10 RENAME TO token_usage")
+
+
+def _v11_eval_jobs(conn: sqlite3.Connection) -> None:
+    for stmt in _statements(EVAL_JOB_SCHEMA_SQL):
+        conn.execute(stmt)
+
+
+def _v12_message_history_index(conn: sqlite3.Connection) -> None:
+    for stmt in _statements(MESSAGE_HISTORY_INDEX_SQL):
+        conn.execute(stmt)
+
+
+def _v13_stats_pending(conn: sqlite3.Connection) -> None:
+    for stmt in _statements(STATS_PENDING_SCHEMA_SQL):
+        conn.execute(stmt)
+    for stmt in STATS_PENDING_TRIGGERS:
+        conn.execute(stmt)
+    # Rows past the old id watermark have not been folded yet
+    conn.execute(
+        "INSERT OR IGNORE INTO stats_pending (message_id) SELECT id FROM message WHERE id > "
+        "COALESCE((SELECT last_id FROM stats_watermark WHERE name = 'message'), 0)"
+    )
+
+
+def _v14_idempotency_message(conn: sqlite3.Connection) -> None:
+    """Rebuild idempotency_key to widen its status CHECK (short-lived rows)."""
+    conn.execute(IDEMPOTENCY_MESSAGE_SCHEMA_SQL)
+    conn.execute("INSERT INTO idempotency_key_v14 (key, fingerprint, status, status_code, response, "
+                 "created_ms, expires_ms) SELECT key, fingerprint, status, status_code, response, "
+                 "created_ms, expires_ms FROM idempotency_key")
+    conn.execute("DROP TABLE idempotency_key")
+    conn.execute("ALTER TABLE idempotency_key_v14 RENAME TO idempotency_key")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_key_expires ON idempotency_key(expires_ms)")
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "baseline schema", _v1_baseline),
+    (2, "analytics rollups", _v2_rollups),
+    (3, "idempotency keys", _v3_idempotency),
+    (4, "integer timestamps", _v4_integer_timestamps),
+    (5, "message content compression", _v5_message_codec),
+    (6, "server-side web sessions", _v6_web_sessions),
+    (7, "principal cache generations", _v7_user_invalidation),
+    (8, "token usage metering", _v8_token_usage),
+    (9, "revoked API tokens", _v9_revoked_tokens),
+    (10, "token usage per client address", _v10_client_usage),
+    (11, "evaluation jobs", _v11_eval_jobs),
+    (12, "message history index", _v12_message_history_index),
+    (13, "rollup pending queue", _v13_stats_pending),
+    (14, "idempotency stored question", _v14_idempotency_message),
+]
+
+PREPARE: Dict[int, Callable[[sqlite3.Connection], None]] = {
+    4: _v4_backfill,
+}
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection, target: int = LATEST_VERSION) -> int:
+    """Bring the database up to `target` and return the resulting version.
+
+    `conn` should be in autocommit mode (isolation_level=None) so that the
+    explicit transactions below are the only ones.
+    """
+    version = current_version(conn)
+    if version >= target:
+        return version
+    # journal_mode is persistent in the file but cannot change inside a transaction
+    conn.execute("PRAGMA journal_mode=WAL")
+    # Table rebuilds drop parent tables; with foreign keys on that would cascade
+    conn.execute("PRAGMA foreign_keys=OFF")
+    for number, description, apply in MIGRATIONS:
+        if number <= version or number > target:
+            continue
+        if number in PREPARE:
+            PREPARE[number](conn)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have migrated while we waited for the lock
+            if current_version(conn) >= number:
+                conn.execute("ROLLBACK")
+                continue
+            apply(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        print(f"[DB] Applied migration {number}: {description}")
+        version = number
+    return version
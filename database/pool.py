@@ -0,0 +1,219 @@
+"""Single-writer / multi-reader connection management for SQLite.
+
+SQLite allows any number of concurrent readers in WAL mode but only one
+writer. Letting every request open its own read-write connection means
+writers fight over the lock and surface `database is locked`. This module
+makes the split explicit:
+
+  * ReadPool: a bounded pool of read-only connections (`mode=ro` URI plus
+    `PRAGMA query_only`) shared by the query helpers.
+  * SerializedWriter: one read-write connection per process guarded by a
+    lock; every write runs in a `BEGIN IMMEDIATE` transaction through it.
+
+Both retry on SQLITE_BUSY / SQLITE_LOCKED with exponential backoff on top
+of SQLite's own busy timeout. Pools are keyed by (db path, pid) so a forked
+worker never reuses its parent's connections.
+"""
+
+from __future__ import annotations
+
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Tuple, TypeVar
+
+from database.instrument import InstrumentedConnection
+
+T = TypeVar("T")
+
+BUSY_TIMEOUT_S = 5.0
+BUSY_RETRIES = 5
+BUSY_BACKOFF_MS = 10
+
+
+def is_busy_error(exc: BaseException) -> bool:
+    """True for errors raised when another connection holds the lock."""
+    if not isinstance(exc, sqlite3.OperationalError):
+        return False
+    msg = str(exc).lower()
+    return "database is locked" in msg or "database is busy" in msg or "database table is locked" in msg
+
+
+def retry_busy(fn: Callable[[], T], retries: int = BUSY_RETRIES, backoff_ms: int = BUSY_BACKOFF_MS) -> T:
+    """Call fn(), retrying with jittered exponential backoff on SQLITE_BUSY."""
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except sqlite3.OperationalError as exc:
+            if not is_busy_error(exc) or attempt >= retries:
+                raise
+            delay = backoff_ms * (2 ** attempt) / 1000.0
+            time.sleep(delay * (0.5 + random.random()))
+            attempt += 1
+
+
+def connect(db_path: str, read_only: bool = False) -> sqlite3.Connection:
+    """Open a connection configured like the pooled ones (outside any pool).
+
+    Used for long-running jobs (exports, migrations) that should not hold a
+    pooled connection for minutes. Statements are timed by
+    database.instrument (see QUERY_STATS).
+    """
+    if read_only:
+        uri = "file:" + os.path.abspath(db_path) + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, timeout=BUSY_TIMEOUT_S, check_same_thread=False,
+                               detect_types=sqlite3.PARSE_DECLTYPES, factory=InstrumentedConnection)
+        conn.execute("PRAGMA query_only = 1")
+    else:
+        conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_S, check_same_thread=False,
+                               detect_types=sqlite3.PARSE_DECLTYPES, isolation_level=None,
+                               factory=InstrumentedConnection)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+class ReadPool:
+    """Bounded pool of read-only connections."""
+
+    def __init__(self, db_path: str, size: int = 4):
+        self.db_path = db_path
+        self.size = size
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self._checkout()
+        try:
+            yield conn
+        finally:
+            # Never hand back a connection with an open read transaction:
+            # it would pin an old WAL snapshot.
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def _checkout(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return connect(self.db_path, read_only=True)
+                except Exception:
+                    self._created -= 1
+                    raise
+        return self._idle.get()
+
+    def execute(self, sql: str, params=()) -> list:
+        """Run a read query and return all rows (retried on SQLITE_BUSY)."""
+        def _run():
+            with self.connection() as conn:
+                return conn.execute(sql, params).fetchall()
+        return retry_busy(_run)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class SerializedWriter:
+    """The only read-write connection of the process, used under a lock."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._conn: sqlite3.Connection = None  # type: ignore[assignment]
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = connect(self.db_path, read_only=False)
+        return self._conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Hold the writer lock for one BEGIN IMMEDIATE ... COMMIT block.
+
+        Re-entrant: a nested call joins the outer transaction.
+        """
+        with self._lock:
+            conn = self.conn
+            if conn.in_transaction:
+                yield conn
+                return
+            retry_busy(lambda: conn.execute("BEGIN IMMEDIATE"))
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            else:
+                conn.execute("COMMIT")
+
+    def set_pragma(self, name: str, value: str):
+        """Set a connection-level PRAGMA on the writer (outside any transaction)."""
+        with self._lock:
+            self.conn.execute(f"PRAGMA {name} = {value}")
+
+    def run(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        """Run fn(conn) in a write transaction, retrying the whole unit on SQLITE_BUSY."""
+        def _attempt():
+            with self.transaction() as conn:
+                return fn(conn)
+        return retry_busy(_attempt)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class ConnectionPools:
+    __slots__ = ("reader", "writer")
+
+    def __init__(self, db_path: str, read_pool_size: int):
+        self.reader = ReadPool(db_path, read_pool_size)
+        self.writer = SerializedWriter(db_path)
+
+    def close(self):
+        self.reader.close()
+        self.writer.close()
+
+
+_pools: Dict[Tuple[str, int], ConnectionPools] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pools(db_path: str, read_pool_size: int = 4) -> ConnectionPools:
+    """Return the reader pool / writer pair for db_path in this process."""
+    key = (os.path.abspath(db_path), os.getpid())
+    pools = _pools.get(key)
+    if pools is None:
+        with _pools_lock:
+            pools = _pools.get(key)
+            if pools is None:
+                pools = _pools[key] = ConnectionPools(db_path, read_pool_size)
+    return pools
+
+
+def close_pools():
+    """Close every pool owned by this process (tests, worker shutdown)."""
+    with _pools_lock:
+        for (path, pid), pools in list(_pools.items()):
+            if pid == os.getpid():
+                pools.close()
+                del _pools[(path, pid)]
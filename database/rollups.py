@@ -0,0 +1,318 @@
+"""Incrementally maintained analytics rollups for the admin dashboard.
+
+Instead of GROUP BY scans over `message` on every dashboard load, a refresh
+job folds only the messages added since the last run (queued in
+stats_pending by an insert trigger) into small aggregate tables:
+
+  * stats_hourly / stats_daily: messages and errors per bucket and role
+  * stats_session_day + stats_daily_sessions: distinct active sessions per day
+  * stats_question: normalized user questions with their ask count
+
+Reads (`read_dashboard`) only touch these tables through their primary keys,
+so the cost depends on the requested window, not on the size of `message`.
+
+Ordering: in DB_WRITE_DURABILITY=async mode message ids are reserved in
+per-worker blocks and commit out of id order, so no id watermark is used. A
+row enters stats_pending in the transaction that inserts it and leaves it in
+the transaction that folds it, whatever its id. Rows younger than
+`settle_seconds` are left for the next run. stats_watermark only records
+the highest id folded and the time of the last refresh.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import sqlite3
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from database.content_codec import codec_for
+from database.timestamps import ms_to_text, now_ms
+
+WATERMARK = "message"
+QUESTION_MAX_CHARS = 200
+
+_WS = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    """Group trivially different phrasings of the same question."""
+    text = _WS.sub(" ", text.strip().lower()).rstrip(" ?!.")
+    return text[:QUESTION_MAX_CHARS]
+
+
+def refresh_batch(conn: sqlite3.Connection, batch_size: int = 5000,
+                  settle_seconds: int = 5) -> int:
+    """Fold up to batch_size new messages into the rollups; return rows folded.
+
+    Must run inside a write transaction (rows are read from stats_pending and
+    removed from it in the same transaction, so concurrent refreshers cannot
+    double count).
+    """
+    # With no settle window every queued row is folded
+    cutoff = now_ms() - settle_seconds * 1000 if settle_seconds else 2 ** 62
+    rows = conn.execute(
+        "SELECT m.id, m.session_id, m.role, m.content, m.created_ms, m.error, m.codec "
+        "FROM stats_pending p JOIN message m ON m.id = p.message_id "
+        "WHERE COALESCE(m.created_ms, 0) <= ? ORDER BY p.message_id LIMIT ?",
+        (cutoff, batch_size),
+    ).fetchall()
+
+    hourly: Dict[Tuple[str, str], List[int]] = defaultdict(lambda: [0, 0])
+    daily: Dict[Tuple[str, str], List[int]] = defaultdict(lambda: [0, 0])
+    session_days: Dict[str, set] = defaultdict(set)
+    questions: Dict[str, List[Any]] = {}
+    decode = codec_for(conn).decode
+    for msg_id, session_id, role, content, created_ms, error, codec in rows:
+        created_ms = created_ms or 0
+        created_at = ms_to_text(created_ms)
+        day, hour = created_at[:10], created_at[:13]
+        is_error = 1 if error else 0
+        hourly[(hour, role)][0] += 1
+        hourly[(hour, role)][1] += is_error
+        daily[(day, role)][0] += 1
+        daily[(day, role)][1] += is_error
+        session_days[day].add(session_id)
+        if role == "user" and not error:
+            # Only user questions are decompressed; replies are just counted
+            key = normalize_question(decode(codec, content, conn))
+            if key:
+                entry = questions.setdefault(key, [0, created_at])
+                entry[0] += 1
+                entry[1] = max(entry[1], created_at)
+
+    if not rows:
+        return 0
+
+    for table, counts in (("stats_hourly", hourly), ("stats_daily", daily)):
+        conn.executemany(
+            f"INSERT INTO {table} (bucket, role, messages, errors) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(bucket, role) DO UPDATE SET "
+            "messages = messages + excluded.messages, errors = errors + excluded.errors",
+            [(bucket, role, c[0], c[1]) for (bucket, role), c in counts.items()],
+        )
+    for day, sessions in session_days.items():
+        before = conn.total_changes
+        conn.executemany(
+            "INSERT OR IGNORE INTO stats_session_day (day, session_id) VALUES (?, ?)",
+            [(day, sid) for sid in sessions],
+        )
+        new_sessions = conn.total_changes - before
+        if new_sessions:
+            conn.execute(
+                "INSERT INTO stats_daily_sessions (day, active_sessions) VALUES (?, ?) "
+                "ON CONFLICT(day) DO UPDATE SET active_sessions = active_sessions + excluded.active_sessions",
+                (day, new_sessions),
+            )
+    conn.executemany(
+        "INSERT INTO stats_question (question, asked, last_asked_at) VALUES (?, ?, ?) "
+        "ON CONFLICT(question) DO UPDATE SET asked = asked + excluded.asked, "
+        "last_asked_at = MAX(COALESCE(last_asked_at, ''), excluded.last_asked_at)",
+        [(q, c[0], c[1]) for q, c in questions.items()],
+    )
+    conn.executemany("DELETE FROM stats_pending WHERE message_id = ?", [(r[0],) for r in rows])
+    conn.execute(
+        "INSERT INTO stats_watermark (name, last_id, refreshed_at) VALUES (?, ?, CURRENT_TIMESTAMP) "
+        "ON CONFLICT(name) DO UPDATE SET last_id = MAX(last_id, excluded.last_id), "
+        "refreshed_at = excluded.refreshed_at",
+        (WATERMARK, max(r[0] for r in rows)),
+    )
+    return len(rows)
+
+
+def unfold_messages(conn: sqlite3.Connection, session_ids: List[int]) -> int:
+    """Take already folded messages of these sessions back out of the rollups.
+
+    Used before the sessions are deleted from this file (shard rebalance):
+    the file they move to folds them again. Must run inside a write
+    transaction. Returns the number of messages unfolded.
+    """
+    if not session_ids:
+        return 0
+    marks = ",".join("?" * len(session_ids))
+    rows = conn.execute(
+        f"SELECT session_id, role, content, created_ms, error, codec FROM message "
+        f"WHERE session_id IN ({marks}) "
+        f"AND NOT EXISTS (SELECT 1 FROM stats_pending p WHERE p.message_id = message.id)",
+        list(session_ids),
+    ).fetchall()
+    hourly: Dict[Tuple[str, str], List[int]] = defaultdict(lambda: [0, 0])
+    daily: Dict[Tuple[str, str], List[int]] = defaultdict(lambda: [0, 0])
+    session_days = set()
+    questions: Dict[str, int] = defaultdict(int)
+    decode = codec_for(conn).decode
+    for session_id, role, content, created_ms, error, codec in rows:
+        created_at = ms_to_text(created_ms or 0)
+        is_error = 1 if error else 0
+        for counts, bucket in ((hourly, created_at[:13]), (daily, created_at[:10])):
+            counts[(bucket, role)][0] += 1
+            counts[(bucket, role)][1] += is_error
+        session_days.add((created_at[:10], session_id))
+        if role == "user" and not error:
+            key = normalize_question(decode(codec, content, conn))
+            if key:
+                questions[key] += 1
+
+    for table, counts in (("stats_hourly", hourly), ("stats_daily", daily)):
+        conn.executemany(
+            f"UPDATE {table} SET messages = messages - ?, errors = errors - ? WHERE bucket = ? AND role = ?",
+            [(c[0], c[1], bucket, role) for (bucket, role), c in counts.items()],
+        )
+        conn.execute(f"DELETE FROM {table} WHERE messages <= 0")
+    for day, session_id in session_days:
+        if conn.execute("DELETE FROM stats_session_day WHERE day = ? AND session_id = ?",
+                        (day, session_id)).rowcount:
+            conn.execute("UPDATE stats_daily_sessions SET active_sessions = active_sessions - 1 WHERE day = ?",
+                         (day,))
+    conn.executemany("UPDATE stats_question SET asked = asked - ? WHERE question = ?",
+                     [(n, q) for q, n in questions.items()])
+    conn.execute("DELETE FROM stats_question WHERE asked <= 0")
+    return len(rows)
+
+
+def merge_dashboards(payloads: List[Dict[str, Any]], top: int = 10) -> Dict[str, Any]:
+    """Sum read_dashboard() payloads of several shard files."""
+    if len(payloads) == 1:
+        return payloads[0]
+    per_day: Dict[str, Dict[str, Any]] = {}
+    per_hour: Dict[str, Dict[str, Any]] = {}
+    questions: Dict[str, Dict[str, Any]] = {}
+    for payload in payloads:
+        for rows, merged, key in ((payload["days"], per_day, "day"), (payload["hours"], per_hour, "hour")):
+            for row in rows:
+                entry = merged.setdefault(row[key], {key: row[key], "messages": 0, "errors": 0, "by_role": {}})
+                entry["messages"] += row["messages"]
+                entry["errors"] += row["errors"]
+                for role, messages in row["by_role"].items():
+                    entry["by_role"][role] = entry["by_role"].get(role, 0) + messages
+                if key == "day":
+                    entry["active_sessions"] = entry.get("active_sessions", 0) + row["active_sessions"]
+        for row in payload["top_questions"]:
+            entry = questions.setdefault(row["question"], dict(row, asked=0))
+            entry["asked"] += row["asked"]
+            entry["last_asked_at"] = max(entry["last_asked_at"] or "", row["last_asked_at"] or "") or None
+    for entry in per_day.values():
+        by_role = entry["by_role"]
+        entry["unanswered"] = max(by_role.get("user", 0) - by_role.get("assistant", 0), 0)
+        entry["error_rate"] = round(entry["errors"] / entry["messages"], 4) if entry["messages"] else 0.0
+    return {
+        "days": [per_day[k] for k in sorted(per_day)],
+        "hours": [per_hour[k] for k in sorted(per_hour)],
+        # Each file's top-N only: a question just below the cut in every shard may be missing
+        "top_questions": sorted(questions.values(), key=lambda q: q["asked"], reverse=True)[:top],
+        "watermark": {"shards": [p["watermark"] for p in payloads]},
+    }
+
+
+def read_dashboard(conn: sqlite3.Connection, days: int = 14, hours: int = 24,
+                   top: int = 10) -> Dict[str, Any]:
+    """Dashboard payload answered from the rollup tables only."""
+    now = datetime.now(timezone.utc)
+    first_day = (now - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    first_hour = (now - timedelta(hours=hours - 1)).strftime("%Y-%m-%d %H")
+
+    per_day: Dict[str, Dict[str, Any]] = {}
+    for bucket, role, messages, errors in conn.execute(
+            "SELECT bucket, role, messages, errors FROM stats_daily WHERE bucket >= ? ORDER BY bucket",
+            (first_day,)):
+        entry = per_day.setdefault(bucket, {"day": bucket, "messages": 0, "errors": 0, "by_role": {},
+                                            "active_sessions": 0})
+        entry["messages"] += messages
+        entry["errors"] += errors
+        entry["by_role"][role] = messages
+    for day, active in conn.execute(
+            "SELECT day, active_sessions FROM stats_daily_sessions WHERE day >= ?", (first_day,)):
+        if day in per_day:
+            per_day[day]["active_sessions"] = active
+    for entry in per_day.values():
+        by_role = entry["by_role"]
+        asked = by_role.get("user", 0)
+        entry["unanswered"] = max(asked - by_role.get("assistant", 0), 0)
+        entry["error_rate"] = round(entry["errors"] / entry["messages"], 4) if entry["messages"] else 0.0
+
+    per_hour: Dict[str, Dict[str, Any]] = {}
+    for bucket, role, messages, errors in conn.execute(
+            "SELECT bucket, role, messages, errors FROM stats_hourly WHERE bucket >= ? ORDER BY bucket",
+            (first_hour,)):
+        entry = per_hour.setdefault(bucket, {"hour": bucket, "messages": 0, "errors": 0, "by_role": {}})
+        entry["messages"] += messages
+        entry["errors"] += errors
+        entry["by_role"][role] = messages
+
+    top_questions = [
+        {"question": q, "asked": asked, "last_asked_at": last}
+        for q, asked, last in conn.execute(
+            "SELECT question, asked, last_asked_at FROM stats_question ORDER BY asked DESC LIMIT ?", (top,))
+    ]
+    row = conn.execute("SELECT last_id, refreshed_at FROM stats_watermark WHERE name = ?",
+                       (WATERMARK,)).fetchone()
+    return {
+        "days": list(per_day.values()),
+        "hours": list(per_hour.values()),
+        "top_questions": top_questions,
+        "watermark": {"last_message_id": row[0] if row else 0, "refreshed_at": row[1] if row else None},
+    }
+
+
+class RollupRefresher:
+    """Background thread folding new messages into the rollups periodically.
+
+    Every worker may run one: refresh_batch reads and empties the pending
+    queue inside the writer transaction, so concurrent refreshers serialize
+    on the SQLite write lock and never count a row twice. `writer` may be a list
+    (one writer per shard file, each with its own rollups).
+    """
+
+    def __init__(self, writer, interval_s: float = 60.0, batch_size: int = 5000,
+                 settle_seconds: int = 5):
+        self.writers = list(writer) if isinstance(writer, (list, tuple)) else [writer]
+        self.interval_s = interval_s
+        self.batch_size = batch_size
+        self.settle_seconds = settle_seconds
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = os.getpid()
+        self.runs = 0
+        self.rows = 0
+
+    def start(self) -> "RollupRefresher":
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = None
+            self._stop = threading.Event()
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="db-rollups", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def refresh(self) -> int:
+        """Fold every settled message now (in batch-sized transactions)."""
+        total = 0
+        for writer in self.writers:
+            while True:
+                folded = writer.run(
+                    lambda conn: refresh_batch(conn, self.batch_size, self.settle_seconds))
+                total += folded
+                if folded < self.batch_size:
+                    break
+        self.runs += 1
+        self.rows += total
+        return total
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.refresh()
+            except Exception as exc:
+                # Keep the loop alive: a dead refresher silently freezes the dashboard
+                print(f"[ERROR] Rollup refresh failed: {exc}")
@@ -0,0 +1,189 @@
+"""Optional sharding of chat storage across several SQLite files.
+
+SQLite serializes writers per database file, so one file caps message
+inserts at one writer no matter how many workers run. With DB_SHARDS=N the
+`session` and `message` rows live in N files next to the primary database
+(botinterface.shard0.db, ...). Users, auth, web sessions, idempotency keys
+and token usage stay in the primary file.
+
+A session is placed by a jump consistent hash of its public uuid, so the
+helpers in database/db.py route every call for that uuid to one file and
+nothing else changes for callers. Numeric session / message ids are local
+to a file; only the uuid is global. Growing from N to N+1 shards moves
+about 1/(N+1) of the sessions (plain modulo would move nearly all).
+
+Each file keeps its own analytics rollups (database/rollups.py); the
+dashboard sums them. A session lives in exactly one file, so per-day
+distinct session counts add up exactly.
+
+rebalance() moves every session that is not in the file its uuid maps to
+(primary included, e.g. when enabling sharding on an existing database).
+Run it with the workers stopped, then restart them with the new DB_SHARDS.
+It is idempotent: a session is copied, then deleted from its source, and a
+rerun after a crash finishes the deletions.
+"""
+
+from __future__ import annotations
+
+import glob
+import hashlib
+import os
+import re
+import sqlite3
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+from database.content_codec import codec_for
+from database.migrations import migrate
+from database.pool import connect
+from database.rollups import unfold_messages
+
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """Jump consistent hash (Lamping & Veach) of a 64-bit key."""
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & _MASK64
+        j = int((b + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return b
+
+
+def shard_index(session_uuid: str, shards: int) -> int:
+    """Shard number of a session (0 when sharding is off)."""
+    if shards <= 1:
+        return 0
+    digest = hashlib.blake2b(session_uuid.encode("utf-8"), digest_size=8).digest()
+    return jump_hash(int.from_bytes(digest, "big"), shards)
+
+
+def shard_path(db_path: str, index: int) -> str:
+    root, ext = os.path.splitext(db_path)
+    return f"{root}.shard{index}{ext or '.db'}"
+
+
+def shard_paths(db_path: str, shards: int) -> List[str]:
+    """Files holding chat rows: the shards, or the primary file when shards == 0."""
+    if shards <= 0:
+        return [db_path]
+    return [shard_path(db_path, i) for i in range(shards)]
+
+
+def existing_shard_paths(db_path: str) -> List[str]:
+    """Shard files on disk for db_path, whatever DB_SHARDS is now."""
+    root, ext = os.path.splitext(db_path)
+    pattern = re.compile(re.escape(os.path.basename(root)) + r"\.shard(\d+)" + re.escape(ext or ".db") + "$")
+    found = []
+    for path in glob.glob(f"{glob.escape(root)}.shard*{ext or '.db'}"):
+        match = pattern.search(os.path.basename(path))
+        if match:
+            found.append((int(match.group(1)), path))
+    return [path for _, path in sorted(found)]
+
+
+def _ensure_schema(path: str):
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        migrate(conn)
+    finally:
+        conn.close()
+
+
+def move_sessions(src: sqlite3.Connection, dst: sqlite3.Connection, session_ids: List[int]) -> Dict[str, int]:
+    """Copy sessions with their messages from src to dst, then delete them from src.
+
+    Message bodies are decoded with the source codecs and re-encoded with
+    the destination's (trained dictionaries are per file). Rollup counts
+    already folded in src are taken back out; dst folds the copies on its
+    next refresh.
+    """
+    moved = {"sessions": 0, "messages": 0}
+    if not session_ids:
+        return moved
+    marks = ",".join("?" * len(session_ids))
+    sessions = src.execute(
+        f"SELECT id, uuid, user_id, status, started_ms, last_activity_ms FROM session WHERE id IN ({marks})",
+        session_ids).fetchall()
+    decode, encode = codec_for(src).decode, codec_for(dst).encode
+
+    dst.execute("BEGIN IMMEDIATE")
+    try:
+        for sid, uuid, user_id, status, started_ms, last_ms in sessions:
+            if dst.execute("SELECT 1 FROM session WHERE uuid = ?", (uuid,)).fetchone():
+                continue  # copied by an interrupted run; only the delete is left
+            new_id = dst.execute(
+                "INSERT INTO session (uuid, user_id, status, started_ms, last_activity_ms) VALUES (?, ?, ?, ?, ?)",
+                (uuid, user_id, status, started_ms, last_ms)).lastrowid
+            rows = [(new_id, role, *encode(decode(codec, content, src))[::-1], created_ms, error)
+                    for role, content, created_ms, error, codec in src.execute(
+                        "SELECT role, content, created_ms, error, codec FROM message "
+                        "WHERE session_id = ? ORDER BY created_ms, id", (sid,))]
+            dst.executemany(
+                "INSERT INTO message (session_id, role, content, codec, created_ms, error) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows)
+            moved["sessions"] += 1
+            moved["messages"] += len(rows)
+        dst.execute("COMMIT")
+    except BaseException:
+        dst.execute("ROLLBACK")
+        raise
+
+    src.execute("BEGIN IMMEDIATE")
+    try:
+        unfold_messages(src, session_ids)
+        src.execute(f"DELETE FROM message WHERE session_id IN ({marks})", session_ids)
+        src.execute(f"DELETE FROM session WHERE id IN ({marks})", session_ids)
+        src.execute("COMMIT")
+    except BaseException:
+        src.execute("ROLLBACK")
+        raise
+    return moved
+
+
+def rebalance(db_path: str, shards: int, batch_size: int = 500,
+              progress: Optional[Callable[[str, Dict[str, int]], None]] = None) -> Dict[str, object]:
+    """Move every session to the file its uuid maps to with `shards` shards.
+
+    Scans the primary file and every shard file on disk. Files no longer
+    used (after shrinking) are left empty on disk, not deleted.
+    """
+    targets = shard_paths(db_path, shards)
+    sources = [db_path] + [p for p in existing_shard_paths(db_path) if p not in (db_path,)]
+    for path in targets:
+        _ensure_schema(path)
+    totals = {"scanned": 0, "sessions": 0, "messages": 0}
+    conns: Dict[str, sqlite3.Connection] = {}
+    try:
+        for src_path in sources:
+            _ensure_schema(src_path)
+            src = conns.setdefault(src_path, connect(src_path))
+            last_id = 0
+            while True:
+                rows = src.execute("SELECT id, uuid FROM session WHERE id > ? ORDER BY id LIMIT ?",
+                                   (last_id, batch_size)).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                totals["scanned"] += len(rows)
+                by_target: Dict[str, List[int]] = defaultdict(list)
+                for sid, uuid in rows:
+                    target = targets[shard_index(uuid, shards)]
+                    if os.path.abspath(target) != os.path.abspath(src_path):
+                        by_target[target].append(sid)
+                for target, session_ids in by_target.items():
+                    dst = conns.setdefault(target, connect(target))
+                    moved = move_sessions(src, dst, session_ids)
+                    totals["sessions"] += moved["sessions"]
+                    totals["messages"] += moved["messages"]
+                if progress is not None:
+                    progress(src_path, totals)
+        distribution = {}
+        for path in targets:
+            conn = conns.setdefault(path, connect(path))
+            distribution[os.path.basename(path)] = conn.execute("SELECT COUNT(*) FROM session").fetchone()[0]
+    finally:
+        for conn in conns.values():
+            conn.close()
+    return dict(totals, shards=shards, distribution=distribution)
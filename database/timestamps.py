@@ -0,0 +1,44 @@
+"""Epoch-millisecond timestamps used by the schema since migration 4.
+
+Columns ending in `_ms` hold INTEGER milliseconds since the Unix epoch
+(UTC). The public dicts and the NDJSON export keep the previous text form
+("YYYY-MM-DD HH:MM:SS", like SQLite's CURRENT_TIMESTAMP); the helpers
+below convert at the edges.
+"""
+
+from __future__ import annotations
+
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+TEXT_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# SQL expression for "now" in milliseconds (column defaults, SQLite >= 3.0)
+SQL_NOW_MS = "CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER)"
+
+
+def sql_text_to_ms(column: str) -> str:
+    """SQL expression converting a CURRENT_TIMESTAMP-style text column."""
+    return f"CAST(ROUND((julianday({column}) - 2440587.5) * 86400000) AS INTEGER)"
+
+
+def now_ms() -> int:
+    return time.time_ns() // 1_000_000
+
+
+def ms_to_text(ms: Optional[int]) -> Optional[str]:
+    """Milliseconds -> "YYYY-MM-DD HH:MM:SS" (UTC), None stays None."""
+    if ms is None:
+        return None
+    return time.strftime(TEXT_FORMAT, time.gmtime(ms // 1000))
+
+
+def text_to_ms(text: Optional[str]) -> Optional[int]:
+    """Parse "YYYY-MM-DD[ HH:MM:SS[.fff]]" (or ISO 8601) as UTC milliseconds."""
+    if not text:
+        return None
+    value = datetime.fromisoformat(text.strip().replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return round(value.timestamp() * 1000)
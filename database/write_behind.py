@@ -0,0 +1,294 @@
+"""Group-commit write-behind buffer for message inserts.
+
+Instead of one transaction (and one fsync) per add_message() call, messages
+are queued in-process and a dedicated writer thread commits them in batches
+every DB_FLUSH_INTERVAL_MS milliseconds or DB_FLUSH_MAX_ROWS rows, whichever
+comes first.
+
+Durability modes (DB_WRITE_DURABILITY):
+  * "commit" (default): the caller blocks until the batch holding its row is
+    committed (at most DB_WRITE_TIMEOUT_S, then TimeoutError). Same guarantees
+    as the synchronous path, but concurrent writers share a single commit. The writer does not linger for the flush
+    interval in this mode: whatever queued up during the previous commit
+    forms the next batch.
+  * "async": the caller returns as soon as the row is queued. The message id
+    comes from a block reserved in sqlite_sequence and the timestamp is taken
+    in Python (in both modes), so the returned dict is final. Each worker
+    reserves its own block, so ids do not follow the conversation across
+    workers: history is read in (created_ms, id) order. Rows still in the
+    queue are lost if the process crashes; they are flushed on clean shutdown.
+"""
+
+from __future__ import annotations
+
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Dict, List, Optional
+
+from database.content_codec import PLAIN, content_codec
+from database.pool import SerializedWriter
+from database.timestamps import ms_to_text, now_ms
+
+DURABILITY_COMMIT = "commit"
+DURABILITY_ASYNC = "async"
+
+_FLUSH = object()
+_STOP = object()
+
+
+class _PendingMessage:
+    __slots__ = ("session_id", "role", "content", "error", "created_ms", "id", "future", "codec", "stored")
+
+    def __init__(self, session_id, role, content, error, created_ms, msg_id=None):
+        self.session_id = session_id
+        self.role = role
+        self.content = content
+        # Value written to message.content (compressed by the caller's thread)
+        self.codec = PLAIN
+        self.stored = content
+        self.error = error
+        self.created_ms = created_ms
+        self.id = msg_id
+        self.future: Future = Future()
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "role": self.role,
+            "content": self.content,
+            "timestamp": ms_to_text(self.created_ms),
+            "error": self.error,
+        }
+
+
+class WriteBehindWriter:
+    """Writer thread draining a queue of message inserts.
+
+    Batches are committed through the process' SerializedWriter, so they
+    are serialized with every other write issued by this worker.
+    """
+
+    def __init__(self, writer: SerializedWriter, flush_interval_ms: int = 20, max_batch: int = 256,
+                 durability: str = DURABILITY_COMMIT, synchronous: str = "NORMAL",
+                 id_block: int = 1000, result_timeout_s: float = 30.0):
+        if durability not in (DURABILITY_COMMIT, DURABILITY_ASYNC):
+            raise ValueError(f"Unknown write-behind durability: {durability}")
+        self.writer = writer
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_batch = max_batch
+        self.durability = durability
+        self.synchronous = synchronous
+        self.id_block = id_block
+        self.result_timeout_s = result_timeout_s
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._pending_by_session: Dict[int, int] = {}
+        self._next_id = 0
+        self._id_limit = 0
+        self.batches = 0
+        self.rows = 0
+
+    # ---- lifecycle ----
+
+    def start(self) -> "WriteBehindWriter":
+        if self._pid != os.getpid():
+            # Forked child: the parent's thread does not exist here and its
+            # queue / reserved id block must not be shared.
+            self._pid = os.getpid()
+            self._thread = None
+            self._queue = queue.Queue()
+            self._lock = threading.Lock()
+            self._pending_by_session = {}
+            self._next_id = self._id_limit = 0
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="db-write-behind", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+        return self
+
+    def stop(self, timeout: float = 10.0):
+        """Flush everything still queued and stop the writer thread."""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        self._thread = None
+
+    def flush(self, timeout: float = 10.0):
+        """Block until every message queued before this call is committed."""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put((_FLUSH, done))
+        done.wait(timeout)
+
+    # ---- producer API ----
+
+    def add_message(self, session_id: int, role: str, content: str,
+                    error: Optional[str] = None) -> Dict[str, Any]:
+        item = _PendingMessage(session_id, role, content, error, now_ms())
+        item.codec, item.stored = content_codec(self.writer.db_path).encode(content)
+        if self.durability == DURABILITY_ASYNC:
+            item.id = self._reserve_id()
+        with self._lock:
+            self._pending_by_session[session_id] = self._pending_by_session.get(session_id, 0) + 1
+        self._queue.put(item)
+        if self.durability == DURABILITY_ASYNC:
+            return item.as_dict()
+        try:
+            return item.future.result(timeout=self.result_timeout_s)
+        except FutureTimeout:
+            # The row may still be committed later; the caller must not hang on it
+            raise TimeoutError(f"Write-behind commit not confirmed after {self.result_timeout_s:g} s") from None
+
+    def wait_for_session(self, session_id: int):
+        """Read-your-writes barrier: flush if this session has queued rows."""
+        with self._lock:
+            pending = self._pending_by_session.get(session_id, 0)
+        if pending:
+            self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "durability": self.durability,
+            "queued": self._queue.qsize(),
+            "batches": self.batches,
+            "rows": self.rows,
+            "avg_batch": round(self.rows / self.batches, 2) if self.batches else 0.0,
+        }
+
+    def _reserve_id(self) -> int:
+        with self._lock:
+            if self._next_id >= self._id_limit:
+                self._next_id, self._id_limit = self._reserve_block()
+            msg_id = self._next_id
+            self._next_id += 1
+            return msg_id
+
+    def _reserve_block(self):
+        """Bump sqlite_sequence so no other writer can hand out these ids."""
+        def _reserve(conn: sqlite3.Connection):
+            row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'message'").fetchone()
+            max_row = conn.execute("SELECT COALESCE(MAX(id), 0) FROM message").fetchone()
+            start = max(row[0] if row else 0, max_row[0]) + 1
+            end = start + self.id_block
+            if row:
+                conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'message'", (end - 1,))
+            else:
+                conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('message', ?)", (end - 1,))
+            return start, end
+        return self.writer.run(_reserve)
+
+    # ---- writer thread ----
+
+    def _run(self):
+        # Applies to the shared writer connection, i.e. every write of this process.
+        try:
+            self.writer.set_pragma("synchronous", self.synchronous)
+        except Exception as exc:
+            print(f"[ERROR] Write-behind could not set synchronous={self.synchronous}: {exc}")
+        stopping = False
+        while True:
+            first = self._queue.get()
+            batch: List[_PendingMessage] = []
+            waiters: List[threading.Event] = []
+            deadline = time.monotonic() + self.flush_interval
+            item = first
+            while True:
+                if item is _STOP:
+                    stopping = True
+                elif isinstance(item, tuple) and item[0] is _FLUSH:
+                    waiters.append(item[1])
+                else:
+                    batch.append(item)
+                if len(batch) >= self.max_batch:
+                    break
+                if stopping or waiters or self.durability == DURABILITY_COMMIT:
+                    # Drain whatever is already queued without waiting
+                    try:
+                        item = self._queue.get_nowait()
+                        continue
+                    except queue.Empty:
+                        break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as exc:
+                    # Unexpected (not sqlite3.Error): fail this batch, keep the thread alive
+                    print(f"[ERROR] Write-behind batch of {len(batch)} rows failed: {exc}")
+                    for item in batch:
+                        if not item.future.done():
+                            self._settle(item, exc)
+            for event in waiters:
+                event.set()
+            if stopping and self._queue.empty():
+                break
+
+    def _write_batch(self, batch: List[_PendingMessage]):
+        self.batches += 1
+        self.rows += len(batch)
+        try:
+            def _insert_all(conn: sqlite3.Connection):
+                for item in batch:
+                    self._insert(conn, item)
+            self.writer.run(_insert_all)
+        except sqlite3.Error:
+            pass
+        else:
+            for item in batch:
+                self._settle(item)
+            return
+        # Retry row by row so one bad row does not fail its neighbours.
+        for item in batch:
+            if self.durability == DURABILITY_COMMIT:
+                item.id = None  # rowid from the rolled back transaction
+            try:
+                self.writer.run(lambda conn, item=item: self._insert(conn, item))
+            except sqlite3.Error as exc:
+                self._settle(item, exc)
+            else:
+                self._settle(item)
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, item: _PendingMessage):
+        if item.id is None:
+            cur = conn.execute(
+                "INSERT INTO message (session_id, role, content, created_ms, error, codec) VALUES (?, ?, ?, ?, ?, ?)",
+                (item.session_id, item.role, item.stored, item.created_ms, item.error, item.codec),
+            )
+            item.id = cur.lastrowid
+        else:
+            conn.execute(
+                "INSERT INTO message (id, session_id, role, content, created_ms, error, codec) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (item.id, item.session_id, item.role, item.stored, item.created_ms, item.error, item.codec),
+            )
+
+    def _settle(self, item: _PendingMessage, exc: Optional[BaseException] = None):
+        with self._lock:
+            left = self._pending_by_session.get(item.session_id, 1) - 1
+            if left > 0:
+                self._pending_by_session[item.session_id] = left
+            else:
+                self._pending_by_session.pop(item.session_id, None)
+        if exc is not None:
+            if self.durability == DURABILITY_ASYNC:
+                print(f"[ERROR] Write-behind insert dropped for session {item.session_id}: {exc}")
+            item.future.set_exception(exc)
+        else:
+            item.future.set_result(item.as_dict())
@@ -0,0 +1,255 @@
+"""
+Admin API routes (/api/admin/*)
+"""
+
+import os
+
+from flask import Blueprint, Response, current_app, jsonify, request, send_file, stream_with_context
+
+from database.db import chat_db_paths, get_dashboard_stats
+from database.export import import_ndjson, iter_chunks, iter_export_all, open_ndjson
+from database.instrument import QUERY_STATS
+from database.pool import connect
+from route.auth_routes import admin_required
+from service.evaluation import EvalRunner, load_golden_set, validate_golden_set
+from service.gemini_service import get_gemini_service
+
+admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
+
+
+@admin_bp.route('/export', methods=['GET'])
+@admin_required
+def export_conversations():
+    """
+    Stream conversations as NDJSON
+    Query: since, until (UTC dates), user_id, gzip=1
+    """
+    since = request.args.get('since') or None
+    until = request.args.get('until') or None
+    user_id = request.args.get('user_id', type=int)
+    compress = request.args.get('gzip') == '1'
+    paths = chat_db_paths()
+
+    def generate():
+        conns = [connect(path, read_only=True) for path in paths]
+        try:
+            yield from iter_chunks(iter_export_all(conns, since=since, until=until, user_id=user_id),
+                                   compress=compress)
+        finally:
+            for conn in conns:
+                conn.close()
+
+    filename = 'conversations.ndjson' + ('.gz' if compress else '')
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/gzip' if compress else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename={filename}'},
+    )
+
+
+@admin_bp.route('/import', methods=['POST'])
+@admin_required
+def import_conversations():
+    """Load an NDJSON export (plain or gzip) sent as the request body."""
+    try:
+        # Each session goes straight into its shard file (no rebalance in a live request)
+        conns = [connect(path) for path in chat_db_paths()]
+        try:
+            stats = import_ndjson(conns, open_ndjson(request.stream))
+        finally:
+            for conn in conns:
+                conn.close()
+        return jsonify(stats)
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        # Malformed line (bad JSON, missing field, not an object): sessions committed
+        # before it are complete, re-sending the fixed file skips them
+        return jsonify({'error': 'Fichier d\'import invalide', 'details': repr(e)}), 400
+
+
+@admin_bp.route('/stats', methods=['GET'])
+@admin_required
+def dashboard_stats():
+    """
+    Dashboard figures from the analytics rollups
+    Query: days (14, max 366), hours (24, max 168), top (10, max 100)
+    Returns: { "days": [...], "hours": [...], "top_questions": [...], "watermark": {...} }
+    """
+    try:
+        days = min(max(request.args.get('days', 14, type=int), 1), 366)
+        hours = min(max(request.args.get('hours', 24, type=int), 1), 168)
+        top = min(max(request.args.get('top', 10, type=int), 1), 100)
+        return jsonify(get_dashboard_stats(days=days, hours=hours, top=top))
+    except Exception as e:
+        print(f'[ERROR] Error in /api/admin/stats: {e}')
+        return jsonify({'error': 'Erreur lors du calcul des statistiques'}), 500
+
+
+@admin_bp.route('/queries', methods=['GET'])
+@admin_required
+def query_stats():
+    """
+    SQL statement timings of this worker, slowest total first
+    Query: top (50, max 500), reset=1 to clear after reading
+    Returns: { "statements": [{ "sql", "count", "p95_ms", "plan", "flags", ... }], "slow_log": [...] }
+    """
+    top = min(max(request.args.get('top', 50, type=int), 1), 500)
+    snapshot = QUERY_STATS.snapshot(top=top)
+    if request.args.get('reset') == '1':
+        QUERY_STATS.reset()
+    return jsonify(snapshot)
+
+
+@admin_bp.route('/profiler', methods=['GET'])
+@admin_required
+def profiler_status():
+    """
+    Sampling profiler settings, counters of this worker and captures on disk
+    Returns: { "profiler": {...}, "captures": [{ "name", "path", "duration_ms", ... }] }
+    """
+    profiler = current_app.extensions['profiler']
+    return jsonify({'profiler': profiler.stats(), 'captures': profiler.captures()})
+
+
+@admin_bp.route('/profiler', methods=['POST'])
+@admin_required
+def profiler_configure():
+    """
+    Enable/disable the profiler in every worker
+    POST body: { "enabled": true, "threshold_ms": 2000, "sample_rate": 0.01 } (all optional)
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        settings = current_app.extensions['profiler'].configure(
+            enabled=data.get('enabled'),
+            threshold_ms=data.get('threshold_ms'),
+            sample_rate=data.get('sample_rate'),
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': 'Paramètres du profileur invalides', 'details': str(e)}), 400
+    except OSError as e:
+        print(f'[ERROR] Error in /api/admin/profiler: {e}')
+        return jsonify({'error': "Impossible d'enregistrer les paramètres du profileur"}), 500
+    return jsonify(settings)
+
+
+@admin_bp.route('/profiler/<name>', methods=['GET'])
+@admin_required
+def profiler_capture(name):
+    """Download one capture in collapsed-stack format (flamegraph.pl, speedscope)."""
+    path = current_app.extensions['profiler'].capture_path(name)
+    if path is None:
+        return jsonify({'error': 'Profil introuvable'}), 404
+    return send_file(path, mimetype='text/plain', as_attachment=True,
+                     download_name=f'{name}.collapsed')
+
+
+@admin_bp.route('/sessions', methods=['GET'])
+@admin_required
+def session_store_stats():
+    """
+    Server-side session store: rows in the table, cache counters of this worker
+    Returns: { "backend": "sqlite", "stored": { "total", "authenticated", "expired" }, "hit_ratio", ... }
+    """
+    store = current_app.extensions.get('session_store')
+    if store is None:
+        return jsonify({'backend': 'cookie'})
+    return jsonify(dict(store.stats(), backend='sqlite'))
+
+
+@admin_bp.route('/sessions/revoke', methods=['POST'])
+@admin_required
+def revoke_sessions():
+    """
+    End sessions server-side (effective in every worker within SESSION_CACHE_TTL_S)
+    POST body: { "user_id": "..." } or { "sid": "<cookie value>" }
+    Returns: { "revoked": 1 }
+    """
+    store = current_app.extensions.get('session_store')
+    if store is None:
+        return jsonify({'error': 'Révocation impossible avec des sessions en cookie'}), 409
+    data = request.get_json(silent=True) or {}
+    if data.get('user_id') is not None:
+        revoked = store.revoke_user(data['user_id'])
+    elif isinstance(data.get('sid'), str):
+        revoked = int(store.revoke(data['sid']))
+    else:
+        return jsonify({'error': 'user_id ou sid requis'}), 400
+    return jsonify({'revoked': revoked})
+
+
+@admin_bp.route('/principals', methods=['GET'])
+@admin_required
+def principal_cache_stats():
+    """
+    Principal cache of this worker
+    Returns: { "hit_ratio", "queries_saved_per_request", "generation", "cached", ... }
+    """
+    return jsonify(current_app.extensions['principals'].stats())
+
+
+@admin_bp.route('/tokens', methods=['GET'])
+@admin_required
+def api_token_stats():
+    """
+    Signed API tokens of this worker
+    Returns: { "issued", "verified", "rejected", "signing_kid", "denylist": {...}, ... }
+    """
+    return jsonify(current_app.extensions['tokens'].stats())
+
+
+@admin_bp.route('/usage', methods=['GET'])
+@admin_required
+def token_usage_report():
+    """
+    Gemini token usage (this worker's pending counters are flushed first)
+    Query: days (7, max 366), top (20, max 200)
+    Returns: { "days": [...], "top_users": [...], "top_sessions": [...], "quotas": {...}, "meter": {...} }
+    """
+    try:
+        days = min(max(request.args.get('days', 7, type=int), 1), 366)
+        top = min(max(request.args.get('top', 20, type=int), 1), 200)
+        meter = current_app.extensions['usage']
+        return jsonify(dict(meter.report(days=days, top=top), meter=meter.stats()))
+    except Exception as e:
+        print(f'[ERROR] Error in /api/admin/usage: {e}')
+        return jsonify({'error': "Erreur lors du calcul de la consommation"}), 500
+
+
+@admin_bp.route('/eval', methods=['POST'])
+@admin_required
+def start_evaluation():
+    """
+    Run a golden set against the current prompt and models in the background
+    POST body: { "golden": "golden_preinscription.json" (file in EVAL_DIR) or {inline set},
+                 "concurrency": 4, "rate": 0, "timeout_ms": 30000 }
+    Returns: 202 { "job_id": "..." } - poll GET /api/admin/eval/<job_id>
+    """
+    data = request.get_json(silent=True) or {}
+    golden = data.get('golden', 'golden_preinscription.json')
+    try:
+        if isinstance(golden, str):
+            name = os.path.basename(golden)
+            golden = load_golden_set(os.path.join(current_app.config.get('EVAL_DIR', 'eval'), name))
+        else:
+            validate_golden_set(golden)
+        runner = EvalRunner(get_gemini_service(),
+                            concurrency=min(max(int(data.get('concurrency', 4)), 1), 32),
+                            rate=float(data.get('rate', 0)),
+                            timeout_ms=float(data.get('timeout_ms', 30000)))
+    except (OSError, TypeError, ValueError) as e:
+        return jsonify({'error': "Jeu de questions d'évaluation invalide", 'details': str(e)}), 400
+    try:
+        job_id = current_app.extensions['eval_jobs'].start(runner, golden)
+    except RuntimeError as e:
+        return jsonify({'error': 'Une évaluation est déjà en cours', 'details': str(e)}), 409
+    return jsonify({'job_id': job_id}), 202
+
+
+@admin_bp.route('/eval/<job_id>', methods=['GET'])
+@admin_required
+def evaluation_status(job_id):
+    """Progress of an evaluation job and, once done, its report."""
+    job = current_app.extensions['eval_jobs'].get(job_id)
+    if job is None:
+        return jsonify({'error': 'Évaluation introuvable'}), 404
+    return jsonify(job)
@@ -2,7 +2,7 @@
 AI health routes
 """
 
-from flask import Blueprint, jsonify
+from flask import Blueprint, current_app, jsonify
 from service.gemini_service import get_gemini_service
 
 ai_bp = Blueprint('ai', __name__, url_prefix='/api/ai')
@@ -13,3 +13,12 @@ def ai_health():
     svc = get_gemini_service()
     status = svc.health_check()
     return jsonify(status)
+
+
+@ai_bp.route('/stats', methods=['GET'])
+def ai_stats():
+    svc = get_gemini_service()
+    stats = svc.stats()
+    admission = current_app.extensions.get('admission')
+    stats["admission"] = admission.stats() if admission else None
+    return jsonify(stats)
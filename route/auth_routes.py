@@ -3,18 +3,74 @@ Authentication Routes Blueprint
 Handles user authentication: login, register, logout, password reset
 """
 
-from flask import Blueprint, request, jsonify, session, render_template, redirect, url_for
+from flask import Blueprint, request, jsonify, session, render_template, redirect, url_for, current_app, g
 from functools import wraps
+import hmac
 import re
 
+from database.db import get_user_by_email, log_login_attempt
+from service.auth_service import AuthService, JWTService, TokenError
+
 auth_bp = Blueprint('auth', __name__)
 
 
+def _bearer_token():
+    """The signed API token of an `Authorization: Bearer <jwt>` header, if any."""
+    auth_header = request.headers.get('Authorization', '')
+    if auth_header.startswith('Bearer ') and auth_header.count('.') == 2:
+        return auth_header[7:]
+    return None
+
+
+def principal_from_claims(claims):
+    """Principal dict carried by a verified API token."""
+    sub = claims['sub']
+    return {'id': int(sub) if sub.isdigit() else sub, 'email': claims.get('email'),
+            'display_name': claims.get('name'), 'role': claims.get('role')}
+
+
+def current_principal():
+    """The logged-in user (get_user_by_id dict), resolved once per request.
+
+    A signed API token (Authorization: Bearer) is checked first: an HMAC and
+    the in-memory denylist, no database read. Otherwise database users go
+    through the per-worker principal cache, so role and verification
+    changes apply without a query on every request. Returns None for
+    anonymous sessions, invalid tokens and users that no longer exist.
+    """
+    if 'principal' in g:
+        return g.principal
+    token = _bearer_token()
+    if token is not None:
+        principal = None
+        try:
+            principal = principal_from_claims(current_app.extensions['tokens'].verify_token(token))
+        except TokenError as e:
+            g.token_error = str(e)
+        g.principal = principal
+        return principal
+    user_id = session.get('user_id')
+    principal = None
+    if isinstance(user_id, int):
+        principal = current_app.extensions['principals'].get(user_id)
+    elif user_id is not None:
+        # Placeholder login without a user row (see login() below)
+        principal = {'id': user_id, 'email': session.get('user_email'),
+                     'display_name': session.get('user_name'), 'role': session.get('user_role')}
+    g.principal = principal
+    return principal
+
+
 def login_required(f):
     """Decorator to require login for routes"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
+        if current_principal() is None:
+            if _bearer_token() is not None:
+                return jsonify({'error': 'Authentication required', 'details': g.get('token_error')}), 401
+            if 'user_id' in session:
+                # The user was deleted: end the session
+                session.clear()
             if request.is_json:
                 return jsonify({'error': 'Authentication required'}), 401
             return redirect(url_for('auth.login_page'))
@@ -22,6 +78,41 @@ def login_required(f):
     return decorated_function
 
 
+def admin_required(f):
+    """Decorator restricting a route to administrators.
+
+    Accepts a logged-in session or API token with role 'admin' or, for
+    scripts and cron jobs, `Authorization: Bearer <ADMIN_API_TOKEN>` when
+    that token is configured.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = current_app.config.get('ADMIN_API_TOKEN')
+        auth_header = request.headers.get('Authorization', '')
+        if token and auth_header.startswith('Bearer ') and hmac.compare_digest(auth_header[7:], token):
+            return f(*args, **kwargs)
+        principal = current_principal()
+        if principal is None:
+            return jsonify({'error': 'Authentication required'}), 401
+        if principal.get('role') != 'admin':
+            return jsonify({'error': 'Accès réservé aux administrateurs'}), 403
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def request_identity():
+    """Who the request is made by, as {'user_id', 'user_role'} (API token or session).
+
+    Used for admission classes and token quotas. The role comes from the
+    principal (the users table for database accounts), never from the
+    cookie; an invalid API token counts as anonymous.
+    """
+    principal = current_principal()
+    if principal is None:
+        return {}
+    return {'user_id': principal['id'], 'user_role': principal.get('role')}
+
+
 def validate_email(email):
     """Accept any non-empty email input (no domain restriction)."""
     return bool(email)
@@ -227,16 +318,111 @@ def verify_email(token):
         return redirect(url_for('auth.login_page') + '?verified=false')
 
 
+@auth_bp.route('/api/auth/token', methods=['POST'])
+def issue_api_token():
+    """
+    Issue signed API tokens
+    Body: { "email", "password" } or nothing, for the logged-in session (database accounts only)
+    Returns: { "access_token", "refresh_token", "token_type": "Bearer", "expires_in" }
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        email = AuthService.sanitize_email(data.get('email', ''))
+        password = data.get('password', '')
+        if email or password:
+            if not email or not password:
+                return jsonify({'error': 'Email et mot de passe requis'}), 400
+            user = get_user_by_email(email)
+            success = user is not None and AuthService.verify_password(password, user['password_hash'])
+            log_login_attempt(email, request.remote_addr, success)
+            if not success:
+                return jsonify({'error': 'Email ou mot de passe incorrect'}), 401
+            principal = user
+        elif _bearer_token() is None:
+            principal = current_principal()
+            if principal is not None and not isinstance(principal['id'], int):
+                # Placeholder logins have no user row, hence nothing to revoke tokens against
+                principal = None
+        else:
+            # An access token is renewed with its refresh token, not by itself
+            principal = None
+        if principal is None:
+            return jsonify({'error': 'Authentication required'}), 401
+        return jsonify(current_app.extensions['tokens'].issue_pair(principal)), 200
+    except Exception as e:
+        print(f'[ERROR] Token issue error: {e}')
+        return jsonify({'error': 'Erreur lors de la création du jeton'}), 500
+
+
+@auth_bp.route('/api/auth/token/refresh', methods=['POST'])
+def refresh_api_token():
+    """
+    Exchange a refresh token for a new pair; the old refresh token is revoked
+    Body: { "refresh_token" }
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        if not data.get('refresh_token'):
+            return jsonify({'error': 'refresh_token requis'}), 400
+        tokens = current_app.extensions['tokens']
+        try:
+            claims = tokens.verify_token(data['refresh_token'], JWTService.REFRESH)
+        except TokenError as e:
+            return jsonify({'error': 'Jeton invalide', 'details': str(e)}), 401
+        if not tokens.revoke(claims):
+            # Already used: only one of two concurrent refreshes wins
+            return jsonify({'error': 'Jeton invalide', 'details': 'token revoked'}), 401
+        principal = principal_from_claims(claims)
+        if isinstance(principal['id'], int):
+            # Role and email as they are now (principal cache, not the old claims)
+            principal = current_app.extensions['principals'].get(principal['id'])
+            if principal is None:
+                return jsonify({'error': 'Jeton invalide', 'details': 'unknown user'}), 401
+        return jsonify(tokens.issue_pair(principal)), 200
+    except Exception as e:
+        print(f'[ERROR] Token refresh error: {e}')
+        return jsonify({'error': 'Erreur lors du renouvellement du jeton'}), 500
+
+
+@auth_bp.route('/api/auth/token/revoke', methods=['POST'])
+def revoke_api_token():
+    """
+    Revoke an API token before it expires (logout of an API client)
+    Body: { "token" } (access or refresh), else the Authorization bearer token
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        token = data.get('token') or _bearer_token()
+        if not token:
+            return jsonify({'error': 'Jeton requis'}), 400
+        tokens = current_app.extensions['tokens']
+        for token_type in (JWTService.ACCESS, JWTService.REFRESH):
+            try:
+                claims = tokens.verify_token(token, token_type)
+                break
+            except TokenError as e:
+                error = str(e)
+        else:
+            return jsonify({'error': 'Jeton invalide', 'details': error}), 401
+        tokens.revoke(claims)
+        return jsonify({'message': 'Jeton révoqué'}), 200
+    except Exception as e:
+        print(f'[ERROR] Token revoke error: {e}')
+        return jsonify({'error': 'Erreur lors de la révocation du jeton'}), 500
+
+
 @auth_bp.route('/api/auth/me')
 @login_required
 def get_current_user():
     """Get current authenticated user info"""
     try:
+        principal = current_principal()
         return jsonify({
             'user': {
-                'id': session.get('user_id'),
-                'email': session.get('user_email'),
-                'full_name': session.get('user_name')
+                'id': principal['id'],
+                'email': principal['email'],
+                'full_name': principal['display_name'],
+                'role': principal.get('role'),
             }
         }), 200
     except Exception as e:
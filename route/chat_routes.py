@@ -2,41 +2,179 @@
 Chat API routes (/api/chat, /api/history)
 """
 
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, session, current_app
 import uuid
 
 from database.db import (
     create_session,
     session_exists,
     add_message,
+    get_idempotency_message,
     get_messages,
     get_recent_context,
+    set_idempotency_message,
 )
+from route.auth_routes import request_identity
+from service.admission import AdmissionRejected, request_class
+from service.deadline import Deadline, DeadlineExceeded
 from service.gemini_service import get_gemini_service
+from service.usage import quota_subjects
 
 chat_bp = Blueprint('chat', __name__, url_prefix='/api')
 
 
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+
 @chat_bp.route('/chat', methods=['POST'])
 def chat():
     """
     Handle chat messages from frontend
     POST body: { "message": "user message", "session_id": "optional" }
+    Headers: Idempotency-Key (optional) - retries with the same key replay the
+             first reply instead of generating a new one
+             X-Request-Deadline-Ms (optional) - time budget, capped by CHAT_DEADLINE_MAX_MS
     Returns: { "reply": "bot response", "session_id": "session_id" }
+             429 + Retry-After when the user's daily token quota is used up
+             503 + Retry-After when the request is shed by admission control
+             504 when the deadline passes before a reply is generated
     """
+    deadline = Deadline.from_header(
+        request.headers.get('X-Request-Deadline-Ms'),
+        default_ms=current_app.config.get('CHAT_DEADLINE_MS', 30000),
+        max_ms=current_app.config.get('CHAT_DEADLINE_MAX_MS', 60000),
+    )
     try:
         data = request.get_json()
-        
+    except Exception as e:
+        print(f'[ERROR] Error in /api/chat: {e}')
+        return jsonify({
+            'error': 'Erreur serveur interne',
+            'details': str(e)
+        }), 500
+
+    body, status, replayed = run_chat(data, deadline, request.headers.get('Idempotency-Key'))
+    if replayed and body.get('session_id'):
+        session['session_id'] = body['session_id']
+    response = jsonify(body)
+    response.status_code = status
+    if replayed:
+        response.headers['Idempotent-Replayed'] = 'true'
+    if status == 409:
+        response.headers['Retry-After'] = '1'
+    elif status in (429, 503) and 'retry_after' in body:
+        response.headers['Retry-After'] = str(body['retry_after'])
+    return response
+
+
+def run_chat(data, deadline=None, key=None, progress=None):
+    """chat_reply() behind the optional idempotency key (HTTP and WebSocket).
+
+    Returns (body, status code, replayed).
+    """
+    if key is None:
+        body, status = chat_reply(data, deadline, progress)
+        return body, status, False
+
+    key = key.strip()
+    if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH or not key.isascii() or not key.isprintable():
+        return {'error': "En-tête Idempotency-Key invalide"}, 400, False
+
+    store = current_app.extensions['idempotency']
+    payload = data if isinstance(data, dict) else {}
+    fingerprint = store.fingerprint(payload.get('message'), payload.get('session_id'))
+    scoped_key = f"{_idempotency_scope(payload)}:{key}"
+    return store.run(scoped_key, fingerprint,
+                     lambda: chat_reply(data, deadline, progress, scoped_key),
+                     wait_s=deadline.remaining() if deadline else None)
+
+
+def _idempotency_scope(data):
+    """Owner of an Idempotency-Key: the user, else the chat session, else the client address.
+
+    Another caller reusing the same key gets its own request run, never
+    someone else's stored reply (and session_id). Only the body's session_id
+    is used, not the cookie: a retry resends the same body, but may carry
+    the cookie set by the response it lost.
+    """
+    user_id = request_identity().get('user_id')
+    if user_id is not None:
+        return f"user:{user_id}"
+    session_id = data.get('session_id')
+    if isinstance(session_id, str) and session_exists(session_id):
+        return f"session:{session_id}"
+    return f"client:{request.remote_addr}"
+
+
+def chat_reply(data, deadline=None, progress=None, idempotency_key=None):
+    """Persist the user message, generate the reply and persist it.
+
+    progress, if given, is called with 'generating' once the request is
+    admitted. idempotency_key is the claimed key, if any: the stored user
+    message is recorded on it so that a retry after a 5xx does not store
+    it again. Returns (body, status code).
+    """
+    try:
         if not data or 'message' not in data:
-            return jsonify({'error': 'Message manquant'}), 400
+            return {'error': 'Message manquant'}, 400
         
         user_message = data['message'].strip()
         
         if not user_message:
-            return jsonify({'error': 'Message vide'}), 400
-        
+            return {'error': 'Message vide'}, 400
+    except Exception as e:
+        print(f'[ERROR] Error in /api/chat: {e}')
+        return {
+            'error': 'Erreur serveur interne',
+            'details': str(e)
+        }, 500
+
+    identity = request_identity()
+    priority = request_class(identity)
+    # Daily token quota, checked in memory before any work is done
+    usage = current_app.extensions.get('usage')
+    if usage is not None:
+        subjects = quota_subjects(identity.get('user_id'), _known_session_id(data), request.remote_addr)
+        retry_after = usage.check(priority, *subjects)
+        if retry_after is not None:
+            return {
+                'error': "Quota de jetons atteint pour aujourd'hui",
+                'retry_after': retry_after
+            }, 429
+
+    # Admission control: queue by priority class or shed before any work is done
+    admission = current_app.extensions.get('admission')
+    if admission is None:
+        if progress:
+            progress('generating')
+        return _generate_and_store(data, user_message, deadline, idempotency_key)
+    try:
+        started = admission.acquire(priority, deadline.remaining() if deadline else None)
+    except AdmissionRejected as rejected:
+        print(f'[ERROR] Chat request shed ({priority}): {rejected.reason}')
+        return {
+            'error': 'Service surchargé, réessayez plus tard',
+            'details': rejected.reason,
+            'retry_after': rejected.retry_after
+        }, 503
+    try:
+        if progress:
+            progress('generating')
+        return _generate_and_store(data, user_message, deadline, idempotency_key)
+    finally:
+        admission.release(priority, started)
+
+
+def _generate_and_store(data, user_message, deadline=None, idempotency_key=None):
+    """Generation stage of chat_reply, run once the request is admitted."""
+    try:
+        # A retry after a failed attempt continues where its question was stored
+        stored = get_idempotency_message(idempotency_key) if idempotency_key else None
+        if stored is not None and not session_exists(stored['session_id']):
+            stored = None
+
         # Get or create session ID
-        session_id = data.get('session_id') or session.get('session_id')
+        session_id = (stored and stored['session_id']) or data.get('session_id') or session.get('session_id')
         if not session_id:
             session_id = str(uuid.uuid4())
             session['session_id'] = session_id
@@ -46,35 +184,64 @@ def chat():
             session_id = create_session()
             session['session_id'] = session_id
         
-        # Persist user message
-        add_message(session_id, 'user', user_message)
+        # Persist user message (once per idempotency key)
+        if stored is None:
+            message = add_message(session_id, 'user', user_message)
+            if idempotency_key:
+                set_idempotency_message(idempotency_key, session_id, message['id'])
         
         # Generate bot response via Gemini service (no mock fallback)
         try:
             gemini_service = get_gemini_service()
             context = get_recent_context(session_id, max_messages=10)
-            bot_response = gemini_service.generate_reply(user_message, context)
+            bot_response = gemini_service.generate_reply(user_message, context, deadline=deadline,
+                                                         on_usage=_usage_recorder(session_id))
+        except DeadlineExceeded as timeout_error:
+            print(f'[ERROR] AI generation deadline: {timeout_error}')
+            return {
+                'error': 'Délai de réponse dépassé',
+                'details': str(timeout_error)
+            }, 504
         except Exception as bot_error:
             print(f'[ERROR] AI generation error: {bot_error}')
-            return jsonify({
+            return {
                 'error': 'Erreur lors de la génération de la réponse',
                 'details': str(bot_error)
-            }), 502
+            }, 502
         
         # Save bot response
         add_message(session_id, 'assistant', bot_response)
         
-        return jsonify({
+        return {
             'reply': bot_response,
             'session_id': session_id
-        })
+        }, 200
         
     except Exception as e:
         print(f'[ERROR] Error in /api/chat: {e}')
-        return jsonify({
+        return {
             'error': 'Erreur serveur interne',
             'details': str(e)
-        }), 500
+        }, 500
+
+
+def _known_session_id(data):
+    """The chat session a request continues, if it exists server-side (body first, then cookie)."""
+    session_id = data.get('session_id') or session.get('session_id')
+    if isinstance(session_id, str) and session_exists(session_id):
+        return session_id
+    return None
+
+
+def _usage_recorder(session_id):
+    """on_usage callback charging the reply to the user (or client address) and the chat session."""
+    usage = current_app.extensions.get('usage')
+    if usage is None:
+        return None
+    user_id = request_identity().get('user_id')
+    client = request.remote_addr
+    return lambda model, prompt_tokens, output_tokens: usage.record(
+        user_id, session_id, prompt_tokens, output_tokens, client=client)
 
 
 @chat_bp.route('/history', methods=['GET'])
@@ -0,0 +1,223 @@
+"""
+Chat WebSocket route (/ws/chat)
+One connection per tab instead of one HTTP request per message
+
+Requires the optional flask-sock package and WS_ENABLED=True; otherwise the
+route is not registered and the frontend keeps using POST /api/chat.
+
+Frames are JSON text messages. Client to server:
+  { "type": "chat", "id": "c1", "message": "...", "session_id": "optional",
+    "idempotency_key": "optional", "deadline_ms": optional }
+  { "type": "ping" }
+Server to client:
+  { "type": "ready" }                                   once, after connecting
+  { "type": "progress", "id": "c1", "stage": "queued" } message accepted
+  { "type": "typing", "id": "c1" }                      generation started
+  { "type": "reply", "id": "c1", "reply": "...", "session_id": "..." }
+  { "type": "error", "id": "c1", "status": 503, "error": "...", "retry_after": 2 }
+  { "type": "pong" }
+
+Several chat frames may be in flight on one connection; each is answered
+with its own id. Messages go through run_chat(), so admission control,
+deadlines and idempotency keys behave exactly as on /api/chat.
+
+The upgrade request carries the session cookie, which is read when the
+connection opens, but a WebSocket cannot set cookies. A conversation's
+first message is therefore sent over HTTP by the frontend.
+
+Under serve.py's gthread workers an open socket holds one server thread
+for as long as it is connected. The route is off unless WS_ENABLED is set,
+and a worker accepts at most WS_MAX_CONNECTIONS sockets (keep it well below
+WEB_THREADS): further upgrades get a 503 and the page stays on HTTP.
+
+Browsers send that cookie on a cross-site WebSocket too, with no CORS
+preflight, so the upgrade is refused (403) unless its Origin is the app's
+own host or listed in WS_ALLOWED_ORIGINS.
+"""
+
+import json
+import socket
+import threading
+from urllib.parse import urlparse
+
+from flask import Blueprint, copy_current_request_context, current_app, g, jsonify, request
+
+from route.chat_routes import run_chat
+from service.deadline import Deadline
+
+try:
+    from flask_sock import Sock  # type: ignore
+    from simple_websocket import ConnectionClosed  # type: ignore
+except Exception:
+    Sock = None  # type: ignore
+    ConnectionClosed = Exception  # type: ignore
+
+ws_bp = Blueprint('ws', __name__, url_prefix='/ws')
+
+
+def origin_allowed(origin) -> bool:
+    """True if a browser on `origin` may use this app's WebSocket with the user's cookie."""
+    if not origin:
+        return False
+    if urlparse(origin).netloc == request.host:
+        return True
+    allowed = current_app.config.get('WS_ALLOWED_ORIGINS', '')
+    return origin.rstrip('/') in {o.strip().rstrip('/') for o in allowed.split(',') if o.strip()}
+
+
+@ws_bp.before_request
+def check_origin():
+    """Refuse cross-site upgrades before the handshake (CSWSH)."""
+    if not origin_allowed(request.headers.get('Origin')):
+        return jsonify({'error': 'Origine non autorisée'}), 403
+    if not current_app.extensions['ws_slots'].acquire():
+        # Every socket holds a server thread: leave the rest for HTTP requests
+        return jsonify({'error': 'Trop de connexions WebSocket, utilisez HTTP'}), 503
+    g.ws_slot = True
+    return None
+
+
+@ws_bp.teardown_request
+def release_slot(exc=None):
+    if g.pop('ws_slot', False):
+        current_app.extensions['ws_slots'].release()
+
+
+class ConnectionSlots:
+    """Open sockets of this worker, bounded by WS_MAX_CONNECTIONS."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.open = 0
+        self.refused = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        with self._lock:
+            if self.open >= self.limit:
+                self.refused += 1
+                return False
+            self.open += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.open -= 1
+
+
+class _Connection:
+    """Serializes sends and tracks in-flight chat frames of one socket."""
+
+    def __init__(self, ws, max_pending: int):
+        self.ws = ws
+        self.max_pending = max_pending
+        self.pending = 0
+        self._lock = threading.Lock()
+
+    def send(self, frame: dict) -> bool:
+        try:
+            with self._lock:
+                self.ws.send(json.dumps(frame, ensure_ascii=False))
+            return True
+        except ConnectionClosed:
+            return False
+
+    def try_begin(self) -> bool:
+        with self._lock:
+            if self.pending >= self.max_pending:
+                return False
+            self.pending += 1
+            return True
+
+    def end(self):
+        with self._lock:
+            self.pending -= 1
+
+
+def chat_socket(ws):
+    """Chat over a persistent WebSocket (see module docstring for frames)."""
+    conn = _Connection(ws, int(current_app.config.get('WS_MAX_PENDING', 4)))
+    # Several small frames per message: without this, Nagle + delayed ACK adds ~40 ms
+    try:
+        ws.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except (AttributeError, OSError):
+        pass
+    conn.send({'type': 'ready'})
+    while True:
+        raw = ws.receive()
+        try:
+            frame = json.loads(raw)
+            kind = frame.get('type')
+        except (ValueError, AttributeError):
+            conn.send({'type': 'error', 'id': None, 'status': 400, 'error': 'Trame JSON invalide'})
+            continue
+        if kind == 'ping':
+            conn.send({'type': 'pong'})
+        elif kind == 'chat':
+            _start_chat(conn, frame)
+        else:
+            conn.send({'type': 'error', 'id': frame.get('id'), 'status': 400,
+                       'error': 'Type de trame inconnu'})
+
+
+def _start_chat(conn: _Connection, frame: dict):
+    frame_id = frame.get('id')
+    if not conn.try_begin():
+        conn.send({'type': 'error', 'id': frame_id, 'status': 429,
+                   'error': 'Trop de messages en cours sur cette connexion', 'retry_after': 1})
+        return
+    conn.send({'type': 'progress', 'id': frame_id, 'stage': 'queued'})
+
+    @copy_current_request_context
+    def work():
+        result = {'type': 'error', 'id': frame_id, 'status': 500, 'error': 'Erreur serveur interne'}
+        try:
+            deadline = Deadline.from_header(
+                str(frame.get('deadline_ms') or ''),
+                default_ms=current_app.config.get('CHAT_DEADLINE_MS', 30000),
+                max_ms=current_app.config.get('CHAT_DEADLINE_MAX_MS', 60000),
+            )
+            data = {'message': frame.get('message'), 'session_id': frame.get('session_id')}
+            if not isinstance(data['message'], str):
+                data = None
+            body, status, replayed = run_chat(
+                data, deadline, frame.get('idempotency_key'),
+                progress=lambda stage: conn.send({'type': 'typing', 'id': frame_id}),
+            )
+            if status == 200:
+                result = {'type': 'reply', 'id': frame_id, 'reply': body['reply'],
+                          'session_id': body['session_id'], 'replayed': replayed}
+            else:
+                result = {'type': 'error', 'id': frame_id, 'status': status, 'error': body.get('error')}
+                if 'retry_after' in body:
+                    result['retry_after'] = body['retry_after']
+                elif status == 409:
+                    result['retry_after'] = 1
+        except Exception as e:
+            print(f'[ERROR] Error in /ws/chat: {e}')
+        finally:
+            # Free the slot first: the client may send its next frame as soon as it reads this one
+            conn.end()
+            conn.send(result)
+
+    threading.Thread(target=work, name='ws-chat', daemon=True).start()
+
+
+if Sock is not None:
+    # Socket options are read per app from SOCK_SERVER_OPTIONS when a client connects
+    Sock().route('/chat', bp=ws_bp)(chat_socket)
+
+
+def init_websocket(app):
+    """Register /ws/chat when flask-sock is installed and WS_ENABLED is set."""
+    if Sock is None or not app.config.get('WS_ENABLED', True):
+        app.extensions['websocket'] = None
+        return None
+    app.config.setdefault('SOCK_SERVER_OPTIONS', {
+        'ping_interval': app.config.get('WS_PING_INTERVAL_S', 25) or None,
+        'max_message_size': app.config.get('WS_MAX_MESSAGE_BYTES', 65536),
+    })
+    app.extensions['ws_slots'] = ConnectionSlots(int(app.config.get('WS_MAX_CONNECTIONS', 1)))
+    app.register_blueprint(ws_bp)
+    app.extensions['websocket'] = ws_bp
+    return ws_bp
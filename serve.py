@@ -0,0 +1,99 @@
+"""
+BotInterface - production launcher
+Runs the app factory under a preforking gunicorn server
+
+    python serve.py                # one worker process per core (WEB_CONCURRENCY)
+    kill -HUP <master pid>         # recycle workers (same code: they fork from the master)
+    kill -TERM <master pid>        # graceful shutdown (pending writes flushed)
+
+The master imports and builds the app once (preload) so compiled templates,
+prompt templates and other immutable state are shared copy-on-write by the
+workers. Everything that must not cross a fork (SQLite connections, the
+write-behind thread, the Gemini HTTP client) is created per worker in the
+post_fork hook; the master starts no threads and holds no connections.
+
+Because workers fork from the preloaded master, a HUP restarts them with
+the code the master imported at startup. Deploying new code needs a full
+restart (TERM, then start serve.py again).
+
+Environment:
+  PORT                 listen port (5000)
+  WEB_CONCURRENCY      worker processes (default: number of CPU cores)
+  WEB_THREADS          threads per worker (4); chat requests mostly wait on Gemini,
+                       and each open /ws/chat socket (WS_ENABLED) holds one thread
+                       while connected, up to WS_MAX_CONNECTIONS per worker
+  WEB_TIMEOUT          seconds before a silent worker is restarted (120)
+  WEB_GRACEFUL_TIMEOUT seconds workers get to finish requests on reload (30)
+  WEB_MAX_REQUESTS     recycle a worker after N requests, 0 = never (0)
+  WEB_WARM_WORKERS     open DB pool / Gemini client before the first request (True)
+
+On platforms without gunicorn (Windows) it falls back to the threaded
+Werkzeug server in a single process.
+"""
+
+import multiprocessing
+import os
+
+from app import create_app, init_worker, shutdown_worker
+
+
+def _int_env(name: str, default: int) -> int:
+    return int(os.environ.get(name, str(default)))
+
+
+def gunicorn_options() -> dict:
+    """Gunicorn settings derived from the environment."""
+    return {
+        "bind": f"0.0.0.0:{_int_env('PORT', 5000)}",
+        "workers": _int_env("WEB_CONCURRENCY", multiprocessing.cpu_count()),
+        "threads": _int_env("WEB_THREADS", 4),
+        "worker_class": "gthread",
+        "timeout": _int_env("WEB_TIMEOUT", 120),
+        "graceful_timeout": _int_env("WEB_GRACEFUL_TIMEOUT", 30),
+        "keepalive": 5,
+        "max_requests": _int_env("WEB_MAX_REQUESTS", 0),
+        "max_requests_jitter": max(1, _int_env("WEB_MAX_REQUESTS", 0) // 10),
+        "preload_app": True,
+        "post_fork": _post_fork,
+        "worker_exit": _worker_exit,
+    }
+
+
+def _post_fork(server, worker):
+    warm = os.environ.get("WEB_WARM_WORKERS", "True").lower() == "true"
+    init_worker(server.app.load(), warm=warm)
+
+
+def _worker_exit(server, worker):
+    shutdown_worker(server.app.load())
+
+
+def run():
+    application = create_app()
+    try:
+        from gunicorn.app.base import BaseApplication  # type: ignore
+    except ImportError:
+        print("[WARN] gunicorn not available, falling back to the single-process threaded server")
+        init_worker(application)
+        application.run(host="0.0.0.0", port=_int_env("PORT", 5000), threaded=True)
+        return
+
+    class BotInterfaceServer(BaseApplication):
+        def __init__(self, wsgi_app, options):
+            self.application = wsgi_app
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                if key in self.cfg.settings and value is not None:
+                    self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+    BotInterfaceServer(application, gunicorn_options()).run()
+
+
+if __name__ == "__main__":
+    run()
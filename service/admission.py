@@ -0,0 +1,242 @@
+"""
+Priority admission control for the chat generation stage
+Bounded, class-aware queue with early load shedding
+
+Each worker admits at most ADMISSION_CAPACITY concurrent generations.
+Requests are classed from the user's role (admin > student > guest) and each
+class may only use its share of the capacity, so a flood of guest traffic
+cannot starve logged-in students or admins. When a slot frees up, the
+oldest waiter of the highest class that is under its share goes next.
+
+Requests are rejected early (503 + Retry-After) rather than queued when:
+  * the queue already holds ADMISSION_MAX_QUEUE requests and none of them
+    has a lower priority that could be evicted instead
+  * the estimated wait (position / capacity * mean service time) exceeds
+    the class' queue-time limit or the request deadline
+  * the request waited its full queue-time limit without being admitted
+
+Capacity only queues requests if the server accepts more concurrent requests
+than it (e.g. WEB_THREADS above ADMISSION_CAPACITY); otherwise requests wait
+in the socket backlog in arrival order.
+"""
+
+import math
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from service.model_router import ModelStats
+
+ADMIN = "admin"
+STUDENT = "student"
+GUEST = "guest"
+# Highest priority first
+CLASSES = (ADMIN, STUDENT, GUEST)
+
+DEFAULT_SHARES = {ADMIN: 1.0, STUDENT: 0.8, GUEST: 0.5}
+DEFAULT_MAX_WAIT_MS = {ADMIN: 10000, STUDENT: 5000, GUEST: 2000}
+
+
+class AdmissionRejected(Exception):
+    """The request was shed; retry after `retry_after` seconds."""
+
+    def __init__(self, reason: str, retry_after: int = 1):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def parse_class_map(value: Optional[str], default: Dict[str, float]) -> Dict[str, float]:
+    """Parse "admin:1.0,student:0.8,guest:0.5" over the defaults."""
+    result = dict(default)
+    for part in (value or "").split(","):
+        name, _, number = part.partition(":")
+        name = name.strip()
+        if name in result and number.strip():
+            result[name] = float(number)
+    return result
+
+
+class _Waiter:
+    __slots__ = ("cls", "enqueued", "event", "admitted", "evicted")
+
+    def __init__(self, cls: str):
+        self.cls = cls
+        self.enqueued = time.monotonic()
+        self.event = threading.Event()
+        self.admitted = False
+        self.evicted = False
+
+
+class AdmissionController:
+    """Class-aware concurrency limiter with a bounded priority queue."""
+
+    def __init__(self, capacity: int = 8, shares: Optional[Dict[str, float]] = None,
+                 max_queue: int = 32, max_wait_ms: Optional[Dict[str, float]] = None):
+        self.capacity = capacity
+        shares = shares or DEFAULT_SHARES
+        self.limits = {cls: max(1, math.floor(capacity * shares.get(cls, 1.0))) for cls in CLASSES}
+        self.max_queue = max_queue
+        self.max_wait_s = {cls: (max_wait_ms or DEFAULT_MAX_WAIT_MS).get(cls, 5000) / 1000.0
+                           for cls in CLASSES}
+        self._lock = threading.Lock()
+        self._queues: Dict[str, Deque[_Waiter]] = {cls: deque() for cls in CLASSES}
+        self._inflight: Dict[str, int] = {cls: 0 for cls in CLASSES}
+        self._service_s: Optional[float] = None
+        self._waits = {cls: ModelStats(500) for cls in CLASSES}
+        self._counters = {cls: {"admitted": 0, "queue_full": 0, "shed_early": 0, "timed_out": 0,
+                                "evicted": 0} for cls in CLASSES}
+
+    # ---- public API ----
+
+    def acquire(self, cls: str, deadline_s: Optional[float] = None) -> float:
+        """Block until admitted; return the start time to pass to release().
+
+        Raises AdmissionRejected when the request is shed.
+        """
+        if cls not in self._queues:
+            cls = GUEST
+        max_wait = self.max_wait_s[cls]
+        if deadline_s is not None:
+            max_wait = min(max_wait, deadline_s)
+        with self._lock:
+            if self._can_run(cls) and not self._waiting_at_or_above(cls):
+                return self._admit(cls, 0.0)
+            ahead = self._waiting_at_or_above(cls)
+            estimate = self._estimate_wait(ahead)
+            if estimate is not None and estimate > max_wait:
+                self._counters[cls]["shed_early"] += 1
+                raise AdmissionRejected("estimated wait too long", self._retry_after(estimate))
+            if self._queued() >= self.max_queue and not self._evict_below(cls):
+                self._counters[cls]["queue_full"] += 1
+                raise AdmissionRejected("queue full", self._retry_after(estimate))
+            waiter = _Waiter(cls)
+            self._queues[cls].append(waiter)
+
+        waiter.event.wait(max_wait)
+        with self._lock:
+            if waiter.admitted:
+                return time.monotonic()
+            if not waiter.evicted:
+                self._queues[cls].remove(waiter)
+                self._counters[cls]["timed_out"] += 1
+                reason = "queue wait limit reached"
+            else:
+                reason = "evicted by higher-priority request"
+        raise AdmissionRejected(reason, self._retry_after(self._estimate_wait(0)))
+
+    def release(self, cls: str, started: float):
+        """Free the slot taken by acquire() and hand it to the next waiter."""
+        if cls not in self._queues:
+            cls = GUEST
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._inflight[cls] -= 1
+            # Exponentially weighted mean service time for wait estimates
+            self._service_s = elapsed if self._service_s is None else 0.9 * self._service_s + 0.1 * elapsed
+            self._dispatch()
+
+    def stats(self) -> dict:
+        with self._lock:
+            classes = {
+                cls: {
+                    "limit": self.limits[cls],
+                    "inflight": self._inflight[cls],
+                    "queued": len(self._queues[cls]),
+                    **self._counters[cls],
+                }
+                for cls in CLASSES
+            }
+            service_ms = round(self._service_s * 1000, 1) if self._service_s is not None else None
+            queued = self._queued()
+        for cls in CLASSES:
+            classes[cls]["wait_p50_ms"] = self._waits[cls].percentile(0.5)
+            classes[cls]["wait_p95_ms"] = self._waits[cls].percentile(0.95)
+        return {
+            "capacity": self.capacity,
+            "max_queue": self.max_queue,
+            "queued": queued,
+            "mean_service_ms": service_ms,
+            "classes": classes,
+        }
+
+    # ---- internals (called with the lock held) ----
+
+    def _can_run(self, cls: str) -> bool:
+        return sum(self._inflight.values()) < self.capacity and self._inflight[cls] < self.limits[cls]
+
+    def _queued(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def _waiting_at_or_above(self, cls: str) -> int:
+        rank = CLASSES.index(cls)
+        return sum(len(self._queues[c]) for c in CLASSES[:rank + 1])
+
+    def _admit(self, cls: str, waited_s: float) -> float:
+        self._inflight[cls] += 1
+        self._counters[cls]["admitted"] += 1
+        self._waits[cls].record(waited_s * 1000.0, True)
+        return time.monotonic()
+
+    def _dispatch(self):
+        admitted = True
+        while admitted:
+            admitted = False
+            for cls in CLASSES:
+                queue = self._queues[cls]
+                if queue and self._can_run(cls):
+                    waiter = queue.popleft()
+                    waiter.admitted = True
+                    self._admit(cls, time.monotonic() - waiter.enqueued)
+                    waiter.event.set()
+                    admitted = True
+                    break
+
+    def _evict_below(self, cls: str) -> bool:
+        """Make room by shedding the newest waiter of a lower class."""
+        rank = CLASSES.index(cls)
+        for lower in reversed(CLASSES[rank + 1:]):
+            queue = self._queues[lower]
+            if queue:
+                waiter = queue.pop()
+                waiter.evicted = True
+                self._counters[lower]["evicted"] += 1
+                waiter.event.set()
+                return True
+        return False
+
+    def _estimate_wait(self, ahead: int) -> Optional[float]:
+        if self._service_s is None:
+            return None
+        return (ahead + 1) * self._service_s / self.capacity
+
+    @staticmethod
+    def _retry_after(estimate: Optional[float]) -> int:
+        return max(1, math.ceil(estimate)) if estimate else 1
+
+
+def init_admission(app) -> Optional[AdmissionController]:
+    """Attach the admission controller to the Flask app (ADMISSION_CAPACITY=0 disables it)."""
+    capacity = int(app.config.get("ADMISSION_CAPACITY", 8))
+    if capacity <= 0:
+        app.extensions["admission"] = None
+        return None
+    controller = AdmissionController(
+        capacity=capacity,
+        shares=parse_class_map(app.config.get("ADMISSION_SHARES"), DEFAULT_SHARES),
+        max_queue=int(app.config.get("ADMISSION_MAX_QUEUE", 32)),
+        max_wait_ms=parse_class_map(app.config.get("ADMISSION_MAX_WAIT_MS"), DEFAULT_MAX_WAIT_MS),
+    )
+    app.extensions["admission"] = controller
+    return controller
+
+
+def request_class(identity) -> str:
+    """Priority class of the current user from request_identity()."""
+    role = identity.get('user_role')
+    if role == ADMIN:
+        return ADMIN
+    if identity.get('user_id') is not None:
+        return STUDENT if role in (None, STUDENT) else GUEST
+    return GUEST
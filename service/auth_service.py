@@ -3,10 +3,15 @@ Authentication Service
 Handles password hashing, JWT tokens, email validation
 """
 
+import base64
 import bcrypt
+import hmac
+import json
 import secrets
+import time
 from datetime import datetime, timedelta
 import hashlib
+from typing import Any, Dict
 
 
 class AuthService:
@@ -66,24 +71,165 @@ class AuthService:
         return secrets.token_urlsafe(32)
 
 
-# For future JWT implementation
+class TokenError(Exception):
+    """A signed API token that is malformed, expired, revoked or of the wrong type."""
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def parse_signing_keys(spec: str, secret_key: str) -> Dict[str, bytes]:
+    """Signing keys from "kid:secret,kid2:secret2"; the first one signs.
+
+    Rotate by putting the new key first and keeping the old one until the
+    tokens it signed have expired (JWT_REFRESH_TTL_S). Without keys, one is
+    derived from SECRET_KEY.
+    """
+    keys: Dict[str, bytes] = {}
+    for item in (spec or '').split(','):
+        kid, sep, secret = item.strip().partition(':')
+        if sep and kid and secret:
+            keys[kid] = secret.encode('utf-8')
+    if not keys:
+        keys['k0'] = hmac.new(secret_key.encode('utf-8'), b'api-tokens', hashlib.sha256).digest()
+    return keys
+
+
 class JWTService:
-    """Service for JWT token operations (for future use)"""
-    
-    @staticmethod
-    def create_token(user_id: str, expiration_hours: int = 24) -> str:
-        """Create JWT token"""
-        # TODO: Implement with PyJWT library
-        # payload = {
-        #     'user_id': user_id,
-        #     'exp': datetime.utcnow() + timedelta(hours=expiration_hours)
-        # }
-        # return jwt.encode(payload, secret_key, algorithm='HS256')
-        pass
-    
-    @staticmethod
-    def verify_token(token: str) -> dict:
-        """Verify and decode JWT token"""
-        # TODO: Implement with PyJWT library
-        # return jwt.decode(token, secret_key, algorithms=['HS256'])
-        pass
+    """HS256 signed API tokens (JWT) checked without a database read.
+
+    Access tokens are short-lived (JWT_ACCESS_TTL_S) and carry the user's
+    id, role, email and name, so a bearer request is authenticated with one
+    HMAC. Refresh tokens (JWT_REFRESH_TTL_S) are exchanged for a new pair
+    and revoked on use. Revocation is checked against the in-memory
+    denylist (service/token_denylist.py) when one is attached.
+    """
+
+    ALGORITHM = 'HS256'
+    ACCESS = 'access'
+    REFRESH = 'refresh'
+
+    def __init__(self, keys: Dict[str, bytes], access_ttl_s: float = 900, refresh_ttl_s: float = 30 * 86400,
+                 denylist=None):
+        if not keys:
+            raise ValueError('at least one signing key is required')
+        self.keys = dict(keys)
+        self.signing_kid = next(iter(self.keys))
+        self.access_ttl_s = access_ttl_s
+        self.refresh_ttl_s = refresh_ttl_s
+        self.denylist = denylist
+        self.counters = {'issued': 0, 'verified': 0, 'rejected': 0}
+
+    @classmethod
+    def from_config(cls, config, denylist=None) -> 'JWTService':
+        return cls(parse_signing_keys(config.get('JWT_SIGNING_KEYS', ''), config.get('SECRET_KEY', '')),
+                   access_ttl_s=float(config.get('JWT_ACCESS_TTL_S', 900)),
+                   refresh_ttl_s=float(config.get('JWT_REFRESH_TTL_S', 30 * 86400)),
+                   denylist=denylist)
+
+    def _sign(self, signing_input: bytes, kid: str) -> bytes:
+        return hmac.new(self.keys[kid], signing_input, hashlib.sha256).digest()
+
+    def create_token(self, principal: Dict[str, Any], token_type: str = ACCESS) -> str:
+        """Signed token for a principal ({'id', 'role', 'email', 'display_name'})."""
+        now = time.time()
+        ttl = self.access_ttl_s if token_type == self.ACCESS else self.refresh_ttl_s
+        header = {'alg': self.ALGORITHM, 'typ': 'JWT', 'kid': self.signing_kid}
+        payload = {
+            'sub': str(principal['id']),
+            'role': principal.get('role'),
+            'email': principal.get('email'),
+            'name': principal.get('display_name'),
+            'typ': token_type,
+            # Millisecond precision, compared with revocation cutoffs in ms
+            'iat': round(now, 3),
+            'exp': int(now + ttl),
+            'jti': secrets.token_urlsafe(12),
+        }
+        signing_input = '.'.join(
+            _b64encode(json.dumps(part, separators=(',', ':')).encode('utf-8')) for part in (header, payload)
+        ).encode('ascii')
+        self.counters['issued'] += 1
+        return signing_input.decode('ascii') + '.' + _b64encode(self._sign(signing_input, self.signing_kid))
+
+    def verify_token(self, token: str, token_type: str = ACCESS) -> Dict[str, Any]:
+        """Claims of a valid token; raises TokenError otherwise."""
+        try:
+            claims = self._decode(token, token_type)
+        except TokenError:
+            self.counters['rejected'] += 1
+            raise
+        self.counters['verified'] += 1
+        return claims
+
+    def _decode(self, token: str, token_type: str) -> Dict[str, Any]:
+        # Every malformed input must end as TokenError (401), never a 500
+        try:
+            header_b64, payload_b64, signature_b64 = token.split('.')
+            header = json.loads(_b64decode(header_b64))
+            signature = _b64decode(signature_b64)
+            signing_input = f'{header_b64}.{payload_b64}'.encode('ascii')
+        except (ValueError, TypeError):
+            raise TokenError('malformed token')
+        if not isinstance(header, dict):
+            raise TokenError('malformed token')
+        kid = header.get('kid')
+        if header.get('alg') != self.ALGORITHM or not isinstance(kid, str) or kid not in self.keys:
+            raise TokenError('unknown signing key')
+        if not hmac.compare_digest(signature, self._sign(signing_input, kid)):
+            raise TokenError('bad signature')
+        try:
+            claims = json.loads(_b64decode(payload_b64))
+        except ValueError:
+            raise TokenError('malformed token')
+        if not isinstance(claims, dict) or not isinstance(claims.get('exp', 0), (int, float)):
+            raise TokenError('malformed token')
+        if claims.get('typ') != token_type:
+            raise TokenError('wrong token type')
+        if time.time() >= claims.get('exp', 0):
+            raise TokenError('token expired')
+        if self.denylist is not None and self.denylist.is_revoked(claims):
+            raise TokenError('token revoked')
+        return claims
+
+    def issue_pair(self, principal: Dict[str, Any]) -> Dict[str, Any]:
+        """Access and refresh tokens for a login or a refresh."""
+        return {
+            'access_token': self.create_token(principal, self.ACCESS),
+            'refresh_token': self.create_token(principal, self.REFRESH),
+            'token_type': 'Bearer',
+            'expires_in': int(self.access_ttl_s),
+        }
+
+    def revoke(self, claims: Dict[str, Any]) -> bool:
+        """Deny a verified token until it expires."""
+        if self.denylist is None:
+            return False
+        return self.denylist.revoke(claims['jti'], claims.get('sub'), int(claims['exp']) * 1000)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self.counters, signing_kid=self.signing_kid, kids=list(self.keys),
+                     access_ttl_s=self.access_ttl_s, refresh_ttl_s=self.refresh_ttl_s)
+        if self.denylist is not None:
+            stats['denylist'] = self.denylist.stats()
+        return stats
+
+
+def init_tokens(app) -> JWTService:
+    """Attach the API token service, with its revocation denylist, to the Flask app."""
+    from service.token_denylist import TokenDenylist
+
+    denylist = TokenDenylist(
+        capacity=int(app.config.get('JWT_DENYLIST_CAPACITY', 100000)),
+        error_rate=float(app.config.get('JWT_DENYLIST_ERROR_RATE', 0.001)),
+        sync_interval_ms=int(app.config.get('JWT_DENYLIST_SYNC_MS', 1000)),
+        rebuild_interval_s=float(app.config.get('JWT_DENYLIST_REBUILD_S', 3600)),
+    )
+    tokens = JWTService.from_config(app.config, denylist)
+    app.extensions['tokens'] = tokens
+    return tokens
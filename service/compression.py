@@ -0,0 +1,185 @@
+"""
+Response compression middleware
+Negotiates gzip / brotli from Accept-Encoding for API and page responses
+"""
+
+import zlib
+from typing import Dict, Iterable, Iterator, Optional
+
+try:
+    import brotli  # type: ignore
+except Exception:
+    brotli = None  # type: ignore
+
+
+DEFAULT_MIMETYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "text/html",
+    "text/css",
+    "text/plain",
+    "application/javascript",
+)
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """Parse an Accept-Encoding header into {coding: qvalue}."""
+    codings: Dict[str, float] = {}
+    if not header:
+        return codings
+    for part in header.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, params = part.partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        codings[name.strip().lower()] = q
+    return codings
+
+
+def choose_encoding(header: Optional[str], available: Iterable[str]) -> Optional[str]:
+    """Pick the best encoding the client accepts, or None for identity.
+
+    `available` is ordered by server preference; it breaks ties between
+    codings the client rates equally (e.g. "gzip, br" -> br).
+    """
+    accepted = parse_accept_encoding(header)
+    if not accepted:
+        return None
+    wildcard = accepted.get("*")
+    best: Optional[str] = None
+    best_q = 0.0
+    for coding in available:
+        q = accepted.get(coding, wildcard if wildcard is not None else 0.0)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class ResponseCompressor:
+    """Flask extension compressing responses after the view has run.
+
+    Buffered responses are compressed in one shot once they reach
+    COMPRESS_MIN_SIZE bytes. Streamed responses (generators, NDJSON exports)
+    are wrapped in an incremental compressor that flushes after every chunk,
+    so the client keeps receiving data progressively.
+
+    Config keys (all optional):
+      COMPRESS_ENABLED       bool, default True
+      COMPRESS_MIN_SIZE      int bytes, default 500
+      COMPRESS_GZIP_LEVEL    1-9, default 6
+      COMPRESS_BROTLI_LEVEL  0-11, default 4
+      COMPRESS_STREAMS       bool, compress chunked responses, default True
+      COMPRESS_MIMETYPES     iterable of mimetypes to compress
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("COMPRESS_ENABLED", True)
+        app.config.setdefault("COMPRESS_MIN_SIZE", 500)
+        app.config.setdefault("COMPRESS_GZIP_LEVEL", 6)
+        app.config.setdefault("COMPRESS_BROTLI_LEVEL", 4)
+        app.config.setdefault("COMPRESS_STREAMS", True)
+        app.config.setdefault("COMPRESS_MIMETYPES", DEFAULT_MIMETYPES)
+        self.config = app.config
+        app.extensions["compression"] = self
+        app.after_request(self.after_request)
+
+    @property
+    def available_encodings(self):
+        return ("br", "gzip") if brotli is not None else ("gzip",)
+
+    def after_request(self, response):
+        from flask import request
+
+        config = self.config
+        if not config.get("COMPRESS_ENABLED", True):
+            return response
+        if response.mimetype not in config.get("COMPRESS_MIMETYPES", DEFAULT_MIMETYPES):
+            return response
+
+        # The representation depends on Accept-Encoding even when we end up
+        # sending it uncompressed, so caches must key on it.
+        response.vary.add("Accept-Encoding")
+
+        if (
+            response.direct_passthrough
+            or response.status_code < 200
+            or response.status_code in (204, 304)
+            or "Content-Encoding" in response.headers
+            or "no-transform" in (response.headers.get("Cache-Control") or "")
+            or request.method == "HEAD"
+        ):
+            return response
+
+        encoding = choose_encoding(request.headers.get("Accept-Encoding"), self.available_encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            if not config.get("COMPRESS_STREAMS", True):
+                return response
+            response.response = self._compress_stream(response.response, encoding)
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < int(config.get("COMPRESS_MIN_SIZE", 500)):
+                return response
+            response.set_data(self.compress(data, encoding))
+
+        response.headers["Content-Encoding"] = encoding
+        return response
+
+    def compress(self, data: bytes, encoding: str) -> bytes:
+        """Compress a complete body with the configured level."""
+        if encoding == "br":
+            return brotli.compress(data, quality=int(self.config.get("COMPRESS_BROTLI_LEVEL", 4)))
+        compressor = zlib.compressobj(int(self.config.get("COMPRESS_GZIP_LEVEL", 6)), zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+
+    def _compress_stream(self, chunks: Iterable, encoding: str) -> Iterator[bytes]:
+        """Incrementally compress a chunked body, flushing after each chunk."""
+        if encoding == "br":
+            compressor = brotli.Compressor(quality=int(self.config.get("COMPRESS_BROTLI_LEVEL", 4)))
+
+            def _push(data: bytes) -> bytes:
+                return compressor.process(data) + compressor.flush()
+
+            def _finish() -> bytes:
+                return compressor.finish()
+        else:
+            compressor = zlib.compressobj(int(self.config.get("COMPRESS_GZIP_LEVEL", 6)), zlib.DEFLATED, 31)
+
+            def _push(data: bytes) -> bytes:
+                return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+            def _finish() -> bytes:
+                return compressor.flush(zlib.Z_FINISH)
+
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode("utf-8")
+                if chunk:
+                    out = _push(chunk)
+                    if out:
+                        yield out
+            yield _finish()
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+
+
+def init_compression(app) -> ResponseCompressor:
+    """Attach response compression to the Flask app."""
+    return ResponseCompressor(app)
@@ -0,0 +1,52 @@
+"""
+Per-request deadline budget
+Shared by the chat route and GeminiService so retries never outlive the request
+"""
+
+import time
+from typing import Optional
+
+
+class DeadlineExceeded(Exception):
+    """Raised when the request's time budget is used up."""
+
+
+class Deadline:
+    """Absolute point in time (monotonic clock) a request must finish by."""
+
+    __slots__ = ("budget_ms", "expires_at")
+
+    def __init__(self, budget_ms: float):
+        self.budget_ms = budget_ms
+        self.expires_at = time.monotonic() + budget_ms / 1000.0
+
+    @classmethod
+    def from_header(cls, value: Optional[str], default_ms: float, max_ms: float) -> "Deadline":
+        """Budget from a client header (milliseconds), clamped to max_ms.
+
+        A missing or malformed header falls back to default_ms.
+        """
+        budget = default_ms
+        if value:
+            try:
+                requested = float(value)
+            except ValueError:
+                requested = 0
+            if requested > 0:
+                budget = requested
+        return cls(min(budget, max_ms))
+
+    def remaining(self) -> float:
+        """Seconds left (never negative)."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def remaining_ms(self) -> int:
+        return int(self.remaining() * 1000)
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def check(self, what: str = "request"):
+        """Raise DeadlineExceeded if the budget is used up."""
+        if self.expired():
+            raise DeadlineExceeded(f"Deadline of {self.budget_ms:.0f} ms exceeded before {what}")
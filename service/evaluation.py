@@ -0,0 +1,327 @@
+"""
+Golden-set evaluation of GeminiService
+Runs standard questions at a controlled concurrency and scores the replies
+
+A golden set is a JSON (or YAML, with PyYAML installed) file:
+
+  { "name": "preinscription",
+    "defaults": { "max_latency_ms": 20000 },
+    "questions": [
+      { "id": "how-to", "question": "Comment faire ma préinscription ?",
+        "context": [ { "role": "user", "content": "..." } ],
+        "assert": { "contains": ["{preinscription_url}"], "regex": "(?i)formulaire" } } ] }
+
+Assertions: contains / not_contains (lists, case-insensitive), regex /
+not_regex, min_chars / max_chars and max_latency_ms. "{preinscription_url}"
+is replaced by the configured portal URL.
+
+EvalRunner sends every question through generate_reply on a thread pool of
+`concurrency` workers, starting at most `rate` calls per second, and
+records per question the latency, the model that answered, token usage
+and the failed assertions. The report carries a fingerprint of the prompt
+and the model so two reports can be compared (compare_reports).
+
+    flask --app app eval run eval/golden_preinscription.json --concurrency 4 --out report.json
+    flask --app app eval run eval/golden_preinscription.json --baseline report.json
+    GEMINI_FAKE=True flask --app app eval run eval/golden_preinscription.json   # offline
+
+Admins can start the same run with POST /api/admin/eval. The job's progress
+and report are stored in SQLite (eval_job), so GET /api/admin/eval/<id>
+answers on any worker; one job runs at a time across all of them.
+"""
+
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import click
+from flask.cli import AppGroup
+
+from database.db import get_eval_job, start_eval_job, update_eval_job
+from database.timestamps import ms_to_text, now_ms
+from service.deadline import Deadline
+
+try:
+    import yaml  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    yaml = None  # type: ignore
+
+
+def load_golden_set(path: str) -> Dict[str, Any]:
+    """Read a golden set from a .json, .yaml or .yml file."""
+    with open(path, "r", encoding="utf-8") as fh:
+        if path.endswith((".yaml", ".yml")):
+            if yaml is None:
+                raise ValueError("YAML golden sets need the PyYAML package (or use JSON)")
+            golden = yaml.safe_load(fh)
+        else:
+            golden = json.load(fh)
+    validate_golden_set(golden)
+    return golden
+
+
+def validate_golden_set(golden: Any):
+    if not isinstance(golden, dict) or not isinstance(golden.get("questions"), list) or not golden["questions"]:
+        raise ValueError("A golden set needs a non-empty 'questions' list")
+    seen = set()
+    for i, item in enumerate(golden["questions"]):
+        if not isinstance(item, dict) or not isinstance(item.get("question"), str):
+            raise ValueError(f"Question #{i} needs a 'question' string")
+        qid = str(item.get("id", i))
+        if qid in seen:
+            raise ValueError(f"Duplicate question id {qid!r}")
+        seen.add(qid)
+
+
+def check_reply(reply: str, latency_ms: float, rules: Dict[str, Any], variables: Dict[str, str]) -> List[str]:
+    """Failed assertions of one reply (empty list = pass)."""
+    def expand(value: str) -> str:
+        for name, replacement in variables.items():
+            value = value.replace("{" + name + "}", replacement)
+        return value
+
+    failures = []
+    lowered = reply.lower()
+    for needle in rules.get("contains", []):
+        if expand(needle).lower() not in lowered:
+            failures.append(f"contains {expand(needle)!r}")
+    for needle in rules.get("not_contains", []):
+        if expand(needle).lower() in lowered:
+            failures.append(f"not_contains {expand(needle)!r}")
+    if "regex" in rules and not re.search(expand(rules["regex"]), reply):
+        failures.append(f"regex {rules['regex']!r}")
+    if "not_regex" in rules and re.search(expand(rules["not_regex"]), reply):
+        failures.append(f"not_regex {rules['not_regex']!r}")
+    if "min_chars" in rules and len(reply) < rules["min_chars"]:
+        failures.append(f"min_chars {rules['min_chars']} (got {len(reply)})")
+    if "max_chars" in rules and len(reply) > rules["max_chars"]:
+        failures.append(f"max_chars {rules['max_chars']} (got {len(reply)})")
+    if "max_latency_ms" in rules and latency_ms > rules["max_latency_ms"]:
+        failures.append(f"max_latency_ms {rules['max_latency_ms']} (got {latency_ms:.0f})")
+    return failures
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))], 1)
+
+
+class _RateLimiter:
+    """Spaces call starts at least 1/rate seconds apart (0 = unlimited)."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            start = max(self._next, time.monotonic())
+            self._next = start + self.interval
+        time.sleep(max(0.0, start - time.monotonic()))
+
+
+class EvalRunner:
+    """Run a golden set through a GeminiService."""
+
+    def __init__(self, service, concurrency: int = 4, rate: float = 0.0, timeout_ms: float = 30000):
+        self.service = service
+        self.concurrency = max(1, concurrency)
+        self.rate = rate
+        self.timeout_ms = timeout_ms
+
+    def fingerprint(self) -> Dict[str, str]:
+        """What the results depend on: prompt template and model choice."""
+        return {
+            "model": self.service.model,
+            "models": ",".join(self.service.router.fast_models + self.service.router.strong_models),
+            "prompt_sha": hashlib.sha256(self.service.prompt_prefix.encode("utf-8")).hexdigest()[:12],
+            "client": "fake" if getattr(self.service, "fake", False) else "genai",
+        }
+
+    def run(self, golden: Dict[str, Any], progress=None) -> Dict[str, Any]:
+        validate_golden_set(golden)
+        defaults = golden.get("defaults") or {}
+        variables = {"preinscription_url": self.service.preinscription_url}
+        limiter = _RateLimiter(self.rate)
+        started_ms = now_ms()
+        started = time.perf_counter()
+
+        def one(index: int, item: Dict[str, Any]) -> Dict[str, Any]:
+            limiter.wait()
+            result: Dict[str, Any] = {"id": str(item.get("id", index)), "question": item["question"],
+                                      "model": None, "prompt_tokens": 0, "output_tokens": 0}
+
+            def on_usage(model, prompt_tokens, output_tokens):
+                result.update(model=model, prompt_tokens=prompt_tokens, output_tokens=output_tokens)
+
+            t0 = time.perf_counter()
+            try:
+                reply = self.service.generate_reply(item["question"], item.get("context") or [],
+                                                    deadline=Deadline(self.timeout_ms), on_usage=on_usage)
+                error = None
+            except Exception as e:
+                reply, error = "", str(e)
+            latency_ms = (time.perf_counter() - t0) * 1000.0
+            failures = [] if error else check_reply(
+                reply, latency_ms, dict(defaults, **(item.get("assert") or {})), variables)
+            result.update(latency_ms=round(latency_ms, 1), passed=error is None and not failures,
+                          failures=failures, error=error, reply=reply)
+            if progress:
+                progress(result)
+            return result
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="eval") as pool:
+            results = list(pool.map(lambda pair: one(*pair), enumerate(golden["questions"])))
+
+        latencies = [r["latency_ms"] for r in results if r["error"] is None]
+        passed = sum(r["passed"] for r in results)
+        return {
+            "name": golden.get("name", "golden"),
+            "started_at": ms_to_text(started_ms),
+            "duration_s": round(time.perf_counter() - started, 2),
+            "concurrency": self.concurrency,
+            "rate": self.rate,
+            **self.fingerprint(),
+            "summary": {
+                "total": len(results),
+                "passed": passed,
+                "failed": len(results) - passed,
+                "errors": sum(r["error"] is not None for r in results),
+                "pass_rate": round(passed / len(results), 3),
+                "latency_ms": {"p50": _percentile(latencies, 0.5), "p95": _percentile(latencies, 0.95),
+                               "max": max(latencies) if latencies else None},
+                "prompt_tokens": sum(r["prompt_tokens"] for r in results),
+                "output_tokens": sum(r["output_tokens"] for r in results),
+            },
+            "results": results,
+        }
+
+
+def compare_reports(baseline: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Any]:
+    """Differences between two reports of the same golden set."""
+    before = {r["id"]: r for r in baseline.get("results", [])}
+    regressions, fixes = [], []
+    for r in current.get("results", []):
+        old = before.get(r["id"])
+        if old is None:
+            continue
+        if old["passed"] and not r["passed"]:
+            regressions.append(r["id"])
+        elif not old["passed"] and r["passed"]:
+            fixes.append(r["id"])
+    b, c = baseline["summary"], current["summary"]
+
+    def delta(a, z):
+        return None if a is None or z is None else round(z - a, 3)
+
+    return {
+        "changed": {k: [baseline.get(k), current.get(k)] for k in ("model", "models", "prompt_sha", "client")
+                    if baseline.get(k) != current.get(k)},
+        "pass_rate": delta(b["pass_rate"], c["pass_rate"]),
+        "latency_p50_ms": delta(b["latency_ms"]["p50"], c["latency_ms"]["p50"]),
+        "latency_p95_ms": delta(b["latency_ms"]["p95"], c["latency_ms"]["p95"]),
+        "output_tokens": delta(b["output_tokens"], c["output_tokens"]),
+        "regressions": regressions,
+        "fixes": fixes,
+    }
+
+
+class EvalJobs:
+    """Evaluation runs started from the admin API (state shared through SQLite)."""
+
+    # A running job with no progress for this long (or twice its per-question
+    # timeout) died with its worker and no longer blocks new runs
+    STALE_MS = 10 * 60 * 1000
+
+    def __init__(self, app, max_jobs: int = 20):
+        self.app = app
+        self.max_jobs = max_jobs
+
+    def start(self, runner: EvalRunner, golden: Dict[str, Any]) -> str:
+        job_id = uuid.uuid4().hex[:12]
+        if not start_eval_job(job_id, len(golden["questions"]), int(runner.timeout_ms), now_ms(),
+                              self.STALE_MS, self.max_jobs):
+            raise RuntimeError("An evaluation is already running")
+        done = [0]
+        lock = threading.Lock()
+
+        def progress(_result):
+            # Called from the runner's pool threads, outside any app context.
+            # The write stays under the lock so a late 6 never overwrites 7.
+            with lock, self.app.app_context():
+                done[0] += 1
+                update_eval_job(job_id, done=done[0])
+
+        def work():
+            with self.app.app_context():
+                try:
+                    report = runner.run(golden, progress=progress)
+                    update_eval_job(job_id, status="done", report=json.dumps(report, ensure_ascii=False))
+                except Exception as e:
+                    print(f'[ERROR] Evaluation job {job_id} failed: {e}')
+                    update_eval_job(job_id, status="failed", error=str(e))
+
+        threading.Thread(target=work, name=f"eval-{job_id}", daemon=True).start()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = get_eval_job(job_id)
+        if job is not None and job["report"] is not None:
+            job["report"] = json.loads(job["report"])
+        return job
+
+
+def init_evaluation(app) -> EvalJobs:
+    """Attach the admin evaluation jobs registry to the Flask app."""
+    jobs = EvalJobs(app)
+    app.extensions["eval_jobs"] = jobs
+    return jobs
+
+
+eval_cli = AppGroup("eval", help="Golden-set evaluation of the Gemini prompt and models.")
+
+
+@eval_cli.command("run")
+@click.argument("golden_path")
+@click.option("--concurrency", type=int, default=4, show_default=True, help="Questions in flight.")
+@click.option("--rate", type=float, default=0.0, show_default=True, help="Max calls started per second (0 = no limit).")
+@click.option("--timeout-ms", type=float, default=30000, show_default=True, help="Deadline per question.")
+@click.option("--out", "out_path", default=None, help="Write the JSON report to this file.")
+@click.option("--baseline", default=None, help="Earlier report to compare against.")
+def run_command(golden_path, concurrency, rate, timeout_ms, out_path, baseline):
+    """Run a golden set and print a per-question summary."""
+    from service.gemini_service import get_gemini_service
+
+    golden = load_golden_set(golden_path)
+    runner = EvalRunner(get_gemini_service(), concurrency=concurrency, rate=rate, timeout_ms=timeout_ms)
+
+    def progress(r):
+        mark = "PASS" if r["passed"] else "FAIL"
+        detail = r["error"] or "; ".join(r["failures"])
+        click.echo(f"[{mark}] {r['id']:<20} {r['latency_ms']:8.0f} ms {r['output_tokens']:6d} tok  {detail}")
+
+    report = runner.run(golden, progress=progress)
+    s = report["summary"]
+    click.echo(f"\n{report['name']}: {s['passed']}/{s['total']} passed, p50 {s['latency_ms']['p50']} ms, "
+               f"p95 {s['latency_ms']['p95']} ms, {s['prompt_tokens']}+{s['output_tokens']} tokens "
+               f"(model {report['model']}, prompt {report['prompt_sha']})")
+    if baseline:
+        with open(baseline, "r", encoding="utf-8") as fh:
+            report["comparison"] = compare_reports(json.load(fh), report)
+        click.echo(json.dumps(report["comparison"], ensure_ascii=False, indent=2))
+    if out_path:
+        with open(out_path, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, ensure_ascii=False, indent=2)
+    if s["failed"]:
+        raise SystemExit(1)
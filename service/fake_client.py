@@ -0,0 +1,81 @@
+"""
+Offline stand-in for the google-genai client
+Deterministic replies for development, evaluation runs and benchmarks
+
+Enabled with GEMINI_FAKE=True (no API key or network needed). It exposes
+the small part of genai.Client that GeminiService uses:
+client.models.generate_content(model=..., contents=..., config=...)
+returning an object with .text and .usage_metadata.
+
+Replies are built from the last user turn of the prompt and the
+preinscription URL found in it, so quality assertions behave like they
+would against a helpful model. FAKE_GEMINI_LATENCY_MS adds a simulated
+upstream delay (normally distributed, 20% spread).
+"""
+
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Optional
+
+_URL_RE = re.compile(r"https?://\S+?(?=[\s,;)]|\.(?:\s|$)|$)")
+_QUESTION_RE = re.compile(r"Utilisateur:\s*(.*?)\s*\nBot4Univ:\s*$", re.DOTALL)
+
+_STEPS = (
+    "1. Créez ou ouvrez votre compte sur le portail de préinscription.\n"
+    "2. Remplissez le formulaire et choisissez votre filière.\n"
+    "3. Téléversez les pièces requises (relevé du baccalauréat, pièce d'identité, photo).\n"
+    "4. Vérifiez puis validez votre dossier et payez les frais via les canaux officiels."
+)
+
+
+class _Models:
+    def __init__(self, client: "FakeGeminiClient"):
+        self._client = client
+
+    def generate_content(self, model: str, contents: Any, config: Any = None) -> SimpleNamespace:
+        return self._client.generate(model, str(contents))
+
+
+class FakeGeminiClient:
+    """Deterministic, offline generate_content with token counts."""
+
+    def __init__(self, latency_ms: float = 0.0, seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.models = _Models(self)
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+
+    def generate(self, model: str, prompt: str) -> SimpleNamespace:
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self._rng.gauss(self.latency_ms, self.latency_ms * 0.2)) if self.latency_ms else 0.0
+        if delay:
+            time.sleep(delay / 1000.0)
+        text = self.reply(prompt)
+        usage = SimpleNamespace(prompt_token_count=len(prompt) // 4,
+                                candidates_token_count=len(text) // 4,
+                                thoughts_token_count=None)
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+    @staticmethod
+    def reply(prompt: str) -> str:
+        match = _QUESTION_RE.search(prompt)
+        question = (match.group(1) if match else prompt).strip()
+        urls = _URL_RE.findall(prompt)
+        url = urls[0] if urls else ""
+        lowered = question.lower()
+        if re.search(r"\b(lien|url|portail|site)\b", lowered):
+            return f"Voici le lien officiel de préinscription : {url}"
+        if re.search(r"\b(comment|étapes?|procédure|pièces?|documents?|\w*inscri\w*)\b", lowered):
+            return f"Pour votre préinscription à l'Université de Douala :\n{_STEPS}\nPortail : {url}"
+        if re.search(r"\b(frais|payer|paiement|coût)\b", lowered):
+            return ("Les frais de préinscription se paient uniquement via les canaux officiels "
+                    f"indiqués sur le portail : {url}. Ne communiquez jamais vos codes de carte.")
+        if re.search(r"\b(bonjour|bonsoir|salut|hello)\b", lowered):
+            return "Bonjour ! Je suis Bot4Univ. Comment puis-je vous aider pour votre préinscription ?"
+        return ("Je réponds aux questions sur la préinscription à l'Université de Douala. "
+                f"Consultez le portail officiel pour plus de détails : {url}")
@@ -4,13 +4,50 @@ Handles all Gemini API interactions with retry logic and fallback
 """
 
 import os
+import threading
 import time
-from typing import Optional, Any
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Optional, Tuple
 
-try:
-    from google import genai  # type: ignore
-except Exception:
-    genai = None  # type: ignore
+from service.deadline import Deadline, DeadlineExceeded
+from service.gemini_transport import (DEFAULT_BASE_URL, ConnectionMetrics, TransportConfig, build_http_client,
+                                      warm_up)
+from service.hedging import HedgePolicy
+from service.model_router import ModelRouter
+
+# google.genai pulls in a large dependency tree (httpx, pydantic, auth...).
+# It is imported on first use so processes that never call Gemini, and
+# workers before their first chat request, don't pay for it at startup.
+_genai_module: Any = None
+_genai_loaded = False
+
+
+def _load_genai():
+    """Import google.genai once; return None if it is not installed."""
+    global _genai_module, _genai_loaded
+    if not _genai_loaded:
+        try:
+            from google import genai  # type: ignore
+            _genai_module = genai
+        except Exception:
+            _genai_module = None
+        _genai_loaded = True
+    return _genai_module
+
+
+def token_usage(response: Any, prompt: str, text: str) -> Tuple[int, int]:
+    """(prompt tokens, output tokens) of a response.
+
+    Read from usage_metadata; thinking tokens are billed as output. Clients
+    that report no usage are estimated at 4 characters per token.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", None)
+    if usage is None or prompt_tokens is None:
+        return len(prompt) // 4, len(text) // 4
+    output_tokens = (getattr(usage, "candidates_token_count", None) or 0) + \
+        (getattr(usage, "thoughts_token_count", None) or 0)
+    return prompt_tokens, output_tokens
 
 
 class GeminiService:
@@ -21,21 +58,104 @@ class GeminiService:
         self.model = os.environ.get("GEMINI_MODEL", "gemini-2.5-flash")
         self.max_retries = int(os.environ.get("GEMINI_MAX_RETRIES", "2"))
         self.retry_delay_ms = int(os.environ.get("GEMINI_RETRY_DELAY_MS", "400"))
+        # Upper bound on concurrent upstream calls of this process
+        self.max_inflight = int(os.environ.get("GEMINI_MAX_INFLIGHT", "32"))
+        # Offline deterministic client (service/fake_client.py) instead of the API
+        self.fake = os.environ.get("GEMINI_FAKE", "False").lower() == "true"
         # Preinscription URL (Université de Douala)
         # Avoid session-specific query params like jsessionid
         self.preinscription_url = os.environ.get(
             "PREINSCRIPTION_URL",
             "http://www.systhag-online.cm:8080/SYSTHAG-ONLINE/faces/etudiants/preInscription.xhtml",
         )
-        self.client: Optional[Any] = None
-        
-        if self.api_key and genai:
-            try:
-                self.client = genai.Client(api_key=self.api_key)
-            except Exception as e:
-                print(f"[WARN] Failed to initialize Gemini client: {e}")
-                self.client = None
+        system_instruction = (
+            "Vous êtes Bot4Univ, un assistant universitaire dédié aux préinscriptions à l'Université de Douala. "
+            "Votre objectif principal est d'aider les étudiants à comprendre et à réussir leur préinscription. "
+            "Soyez clair, concis et pratique. Lorsque pertinent, orientez vers le portail officiel de préinscription: "
+            f"{self.preinscription_url}. "
+            "Ne demandez jamais d'informations sensibles (mots de passe, numéros de carte). "
+            "Rappelez que le paiement et la validation se font uniquement via les canaux officiels. "
+            "Si la question dépasse la préinscription, répondez brièvement dans un cadre académique général."
+        )
+
+        guidance = (
+            "Quand on vous demande 'comment faire', proposez des étapes génériques (ex: créer/accéder au compte, "
+            "remplir le formulaire, téléverser les pièces requises, vérifier et valider), et ajoutez le lien. "
+            "Si l'utilisateur demande un lien direct, fournissez: " + self.preinscription_url + "."
+        )
+        # Immutable part of the prompt, built once (and shared by preforked workers)
+        self.prompt_prefix = system_instruction + "\n\n" + guidance + "\n\n"
+        self._client: Optional[Any] = None
+        self._client_initialized = False
+        self._client_lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Keep-alive HTTP pool handed to genai (service/gemini_transport.py)
+        self.transport = TransportConfig.from_env(self.max_inflight)
+        self.connections = ConnectionMetrics()
+        self._http: Optional[Any] = None
+        # Per-request model selection and failover (single model unless
+        # GEMINI_FAST_MODELS / GEMINI_STRONG_MODELS are configured)
+        self.router = ModelRouter.from_env(self.model)
+        # Optional backup requests for slow calls (GEMINI_HEDGE)
+        self.hedging = HedgePolicy.from_env()
+
+    @property
+    def client(self) -> Optional[Any]:
+        """Gemini client, created on first access."""
+        if not self._client_initialized:
+            with self._client_lock:
+                if not self._client_initialized:
+                    genai = _load_genai() if self.api_key and not self.fake else None
+                    if self.fake:
+                        from service.fake_client import FakeGeminiClient
+                        self._client = FakeGeminiClient(
+                            latency_ms=float(os.environ.get("FAKE_GEMINI_LATENCY_MS", "0")))
+                    elif genai:
+                        try:
+                            self._client = self._build_client(genai)
+                        except Exception as e:
+                            print(f"[WARN] Failed to initialize Gemini client: {e}")
+                            self._client = None
+                    self._client_initialized = True
+        return self._client
+
+    @client.setter
+    def client(self, value: Optional[Any]):
+        self._client = value
+        self._client_initialized = True
+
+    def _build_client(self, genai: Any) -> Any:
+        """genai.Client on this process' pooled httpx client."""
+        from google.genai import types  # type: ignore
+        self._http = build_http_client(self.transport, self.connections)
+        options = {"httpx_client": self._http} if self._http is not None else {}
+        if self.transport.base_url != DEFAULT_BASE_URL:
+            options["base_url"] = self.transport.base_url
+        if self.transport.timeout_ms:
+            options["timeout"] = int(self.transport.timeout_ms)
+        return genai.Client(api_key=self.api_key, http_options=types.HttpOptions(**options))
+
+    def reset_client(self):
+        """Drop the client so the next access builds a new one (after fork)."""
+        # The lock itself may have been held by another thread at fork time
+        self._client_lock = threading.Lock()
+        self._client = None
+        self._client_initialized = False
+        # Sockets inherited from the parent must not be shared; the child opens its own
+        self._http = None
+        self.connections = ConnectionMetrics()
+        # Executor threads do not survive fork
+        self._executor = None
     
+    def warm_up(self) -> int:
+        """Create the client and pre-open its connections (no generation call).
+
+        Returns the number of connections opened.
+        """
+        if self.client is None or self._http is None:
+            return 0
+        return warm_up(self._http, self.transport, self.connections)
+
     def is_available(self) -> bool:
         """Check if Gemini service is configured and available."""
         return self.client is not None
@@ -56,18 +176,131 @@ class GeminiService:
         except Exception as e:
             return {"available": False, "model": self.model, "error": str(e)}
     
-    def generate_reply(self, message: str, context: list) -> str:
+    def stats(self) -> dict:
+        """Per-model routing, latency and usage statistics."""
+        return {"default_model": self.model, **self.router.stats(), "hedging": self.hedging.stats(),
+                "transport": dict(self.transport.as_dict(), connections=self.connections.stats())}
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._client_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_inflight, thread_name_prefix="gemini-call")
+        return self._executor
+
+    def _call_model(self, model: str, prompt: str, timeout_ms: Optional[int] = None) -> Any:
+        """One upstream generate_content call."""
+        genai = _load_genai() if timeout_ms and not self.fake else None
+        if genai is not None and isinstance(self.client, genai.Client):
+            # Let the HTTP layer drop the call at the deadline as well
+            from google.genai import types  # type: ignore
+            return self.client.models.generate_content(
+                model=model,
+                contents=prompt,
+                config=types.GenerateContentConfig(http_options=types.HttpOptions(timeout=timeout_ms)),
+            )
+        return self.client.models.generate_content(model=model, contents=prompt)
+
+    def _generate(self, model: str, prompt: str, deadline: Optional[Deadline],
+                  on_usage: Optional[Callable[[str, int, int], None]] = None) -> Any:
+        """Run one attempt, giving up when the deadline passes.
+
+        The attempt runs on the executor so the request thread is released
+        at the deadline even if the upstream call hangs; the abandoned call
+        finishes (or hits its HTTP timeout) in the background. With hedging
+        enabled a second identical call is started when the first is slower
+        than the model's rolling percentile, and the first success wins.
+        Every call that completes is billed, so on_usage runs for the losing
+        hedge and for calls abandoned at the deadline too.
+        """
+        hedging = self.hedging if self.hedging.enabled else None
+        if deadline is None and hedging is None:
+            response = self._call_model(model, prompt)
+            self._meter(on_usage, model, prompt, response)
+            return response
+        if deadline is not None:
+            deadline.check(f"calling {model}")
+
+        started = time.perf_counter()
+        first = self._submit(model, prompt, deadline, on_usage)
+        calls = [first]
+        if hedging is not None:
+            hedging.begin()
+            first.add_done_callback(lambda f: hedging.record_first_call(
+                model, (time.perf_counter() - started) * 1000.0, not f.cancelled() and f.exception() is None))
+            delay_ms = hedging.delay_ms(model)
+            if delay_ms is not None:
+                hedge_after = delay_ms / 1000.0
+                if deadline is not None:
+                    hedge_after = min(hedge_after, deadline.remaining())
+                done, _ = wait(calls, timeout=hedge_after)
+                if not done and not (deadline is not None and deadline.expired()) and hedging.admit():
+                    calls.append(self._submit(model, prompt, deadline, on_usage))
+
+        winner = self._first_success(calls, model, deadline)
+        if hedging is not None:
+            hedging.record_served((time.perf_counter() - started) * 1000.0, hedge_won=winner is not first)
+        return winner.result()
+
+    def _submit(self, model: str, prompt: str, deadline: Optional[Deadline],
+                on_usage: Optional[Callable[[str, int, int], None]] = None) -> Future:
+        timeout_ms = max(1, deadline.remaining_ms()) if deadline is not None else None
+        call = self._pool().submit(self._call_model, model, prompt, timeout_ms)
+        if on_usage is not None:
+            call.add_done_callback(lambda f: f.cancelled() or f.exception() is not None
+                                   or self._meter(on_usage, model, prompt, f.result()))
+        return call
+
+    @staticmethod
+    def _meter(on_usage: Optional[Callable[[str, int, int], None]], model: str, prompt: str,
+               response: Any) -> None:
+        """Report one completed call's tokens; metering never fails the reply."""
+        if on_usage is None:
+            return
+        try:
+            on_usage(model, *token_usage(response, prompt, getattr(response, "text", None) or ""))
+        except Exception as e:
+            print(f"[ERROR] Token usage not recorded: {e}")
+
+    @staticmethod
+    def _first_success(calls: list, model: str, deadline: Optional[Deadline]) -> Future:
+        """First call to succeed; re-raise the first error if all fail."""
+        pending = set(calls)
+        error: Optional[BaseException] = None
+        while pending:
+            timeout = deadline.remaining() if deadline is not None else None
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                for call in pending:
+                    call.cancel()
+                raise DeadlineExceeded(f"Deadline of {deadline.budget_ms:.0f} ms exceeded waiting for {model}")
+            for call in done:
+                if call.exception() is None:
+                    # The loser's result is ignored; cancel() only helps if it has not started
+                    for other in pending:
+                        other.cancel()
+                    return call
+                error = error or call.exception()
+        raise error  # type: ignore[misc]
+
+    def generate_reply(self, message: str, context: list, deadline: Optional[Deadline] = None,
+                       on_usage: Optional[Callable[[str, int, int], None]] = None) -> str:
         """
         Generate AI reply with context awareness.
         
         Args:
             message: User message
             context: List of recent messages [{'role': 'user/assistant', 'content': '...'}]
+            deadline: Optional time budget shared by every attempt and backoff
+            on_usage: Optional callback(model, prompt_tokens, output_tokens), called once per
+                completed upstream call (hedges and abandoned calls included)
         
         Returns:
             Generated reply text
         
         Raises:
+            DeadlineExceeded: If the deadline passes before a reply arrives
             Exception: If generation fails after retries
         """
         if not self.is_available():
@@ -78,41 +311,31 @@ class GeminiService:
         for m in context:
             formatted_context.append(f"{m['role']}: {m['content']}")
         
-        system_instruction = (
-            "Vous êtes Bot4Univ, un assistant universitaire dédié aux préinscriptions à l'Université de Douala. "
-            "Votre objectif principal est d'aider les étudiants à comprendre et à réussir leur préinscription. "
-            "Soyez clair, concis et pratique. Lorsque pertinent, orientez vers le portail officiel de préinscription: "
-            f"{self.preinscription_url}. "
-            "Ne demandez jamais d'informations sensibles (mots de passe, numéros de carte). "
-            "Rappelez que le paiement et la validation se font uniquement via les canaux officiels. "
-            "Si la question dépasse la préinscription, répondez brièvement dans un cadre académique général."
-        )
-
-        guidance = (
-            "Quand on vous demande 'comment faire', proposez des étapes génériques (ex: créer/accéder au compte, "
-            "remplir le formulaire, téléverser les pièces requises, vérifier et valider), et ajoutez le lien. "
-            "Si l'utilisateur demande un lien direct, fournissez: " + self.preinscription_url + "."
-        )
-
         prompt = (
-            system_instruction + "\n\n" + guidance + "\n\n" +
+            self.prompt_prefix +
             "Contexte de conversation:\n" + "\n".join(formatted_context[-10:]) +
             f"\n\nUtilisateur: {message}\nBot4Univ:"
         )
         
         last_error: Optional[Exception] = None
+        candidates = self.router.plan(message, context)
+        model_index = 0
         
         for attempt in range(1, self.max_retries + 2):
+            model = candidates[model_index % len(candidates)]
+            self.router.stats_for(model).start()
+            started = time.perf_counter()
             try:
-                response = self.client.models.generate_content(
-                    model=self.model,
-                    contents=prompt,
-                )
+                response = self._generate(model, prompt, deadline, on_usage)
+                self.router.record(model, (time.perf_counter() - started) * 1000.0, ok=True)
                 text = getattr(response, "text", None)
                 if not text:
                     return "Désolé, je n'ai pas de réponse pour le moment."
                 return text.strip()
                 
+            except DeadlineExceeded:
+                self.router.record(model, (time.perf_counter() - started) * 1000.0, ok=False)
+                raise
             except Exception as e:
                 last_error = e
                 msg = str(e)
@@ -124,10 +347,21 @@ class GeminiService:
                     "overloaded" in msg.lower() or
                     "quota" in msg.lower()
                 )
+                self.router.record(
+                    model, (time.perf_counter() - started) * 1000.0, ok=False, overloaded=transient
+                )
                 
                 if transient and attempt <= self.max_retries:
-                    print(f"[GeminiService] Transient error attempt {attempt}/{self.max_retries}: {msg}")
-                    time.sleep(self.retry_delay_ms / 1000.0)
+                    print(f"[GeminiService] Transient error on {model} attempt {attempt}/{self.max_retries}: {msg}")
+                    model_index += 1
+                    # Fail over to the next model right away; only back off
+                    # once every candidate has been tried.
+                    if model_index % len(candidates) == 0:
+                        delay = self.retry_delay_ms / 1000.0
+                        if deadline is not None and deadline.remaining() <= delay:
+                            raise DeadlineExceeded(
+                                f"Deadline of {deadline.budget_ms:.0f} ms exceeded before retrying: {msg}")
+                        time.sleep(delay)
                     continue
                 
                 if transient:
@@ -0,0 +1,227 @@
+"""
+HTTP transport of the Gemini client
+Shared keep-alive connection pool, warm-up and connection reuse metrics
+
+genai.Client normally builds its own httpx client with default limits and
+no timeout. GeminiService hands it one built here instead, per process:
+
+- a bounded pool of keep-alive connections (GEMINI_HTTP_MAX_CONNECTIONS,
+  GEMINI_HTTP_KEEPALIVE, GEMINI_HTTP_KEEPALIVE_EXPIRY_S); the expiry closes
+  idle connections before the upstream load balancer drops them, so a
+  request never lands on a dead socket
+- HTTP/2 when the optional h2 package is installed (GEMINI_HTTP2=auto):
+  every concurrent call is multiplexed on one connection
+- a connect timeout (GEMINI_CONNECT_TIMEOUT_MS) kept separate from the
+  request timeout (GEMINI_TIMEOUT_MS), which genai passes on each request
+
+warm_up() opens connections at worker start with a bare HEAD on the API
+host (DNS, TCP and TLS, no generation call and no tokens). Each request is
+traced through httpcore, so ConnectionMetrics can tell reused connections
+from new handshakes.
+"""
+
+import importlib.util
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# httpx is imported with genai, on first use (see gemini_service); only
+# look up whether the optional HTTP/2 support is installed here
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+_client_class: Any = None
+
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com/"
+
+
+class TransportConfig:
+    """Pool, protocol and timeout settings of the Gemini HTTP client.
+
+    Environment:
+      GEMINI_BASE_URL                 API endpoint (genai default)
+      GEMINI_HTTP_MAX_CONNECTIONS     max open connections (GEMINI_MAX_INFLIGHT)
+      GEMINI_HTTP_KEEPALIVE           idle connections kept open (8)
+      GEMINI_HTTP_KEEPALIVE_EXPIRY_S  close connections idle for longer (60)
+      GEMINI_HTTP2                    auto (if h2 is installed), True or False
+      GEMINI_CONNECT_TIMEOUT_MS       TCP + TLS setup timeout (5000)
+      GEMINI_TIMEOUT_MS               default request timeout, 0 = none (60000)
+      GEMINI_WARM_CONNECTIONS         connections opened by warm_up() (2)
+    """
+
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, max_connections: int = 32,
+                 keepalive: int = 8, keepalive_expiry_s: float = 60.0, http2: Optional[bool] = None,
+                 connect_timeout_ms: float = 5000.0, timeout_ms: float = 60000.0, warm_connections: int = 2):
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.keepalive = min(keepalive, max_connections)
+        self.keepalive_expiry_s = keepalive_expiry_s
+        self.http2 = HTTP2_AVAILABLE if http2 is None else (http2 and HTTP2_AVAILABLE)
+        self.connect_timeout_ms = connect_timeout_ms
+        self.timeout_ms = timeout_ms
+        # One HTTP/2 connection carries every concurrent call
+        self.warm_connections = 1 if self.http2 and warm_connections else warm_connections
+
+    @classmethod
+    def from_env(cls, max_inflight: int = 32) -> "TransportConfig":
+        http2 = os.environ.get("GEMINI_HTTP2", "auto").lower()
+        return cls(
+            base_url=os.environ.get("GEMINI_BASE_URL") or DEFAULT_BASE_URL,
+            max_connections=int(os.environ.get("GEMINI_HTTP_MAX_CONNECTIONS", max_inflight)),
+            keepalive=int(os.environ.get("GEMINI_HTTP_KEEPALIVE", "8")),
+            keepalive_expiry_s=float(os.environ.get("GEMINI_HTTP_KEEPALIVE_EXPIRY_S", "60")),
+            http2=None if http2 == "auto" else http2 == "true",
+            connect_timeout_ms=float(os.environ.get("GEMINI_CONNECT_TIMEOUT_MS", "5000")),
+            timeout_ms=float(os.environ.get("GEMINI_TIMEOUT_MS", "60000")),
+            warm_connections=int(os.environ.get("GEMINI_WARM_CONNECTIONS", "2")),
+        )
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "max_connections": self.max_connections,
+            "keepalive": self.keepalive,
+            "keepalive_expiry_s": self.keepalive_expiry_s,
+            "http2": self.http2,
+            "connect_timeout_ms": self.connect_timeout_ms,
+            "timeout_ms": self.timeout_ms,
+        }
+
+
+class ConnectionMetrics:
+    """Counts requests against new connections and TLS handshakes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connects = 0
+        self.tls_handshakes = 0
+        self.connect_ms = 0.0
+        self.closed = 0
+        self.warm_ups = 0
+        self.warmed = 0
+
+    def attach(self, request: Any):
+        """httpx request hook: trace this request's connection events."""
+        state: Dict[str, float] = {}
+
+        def trace(event: str, info: dict):
+            if event == "connection.connect_tcp.started":
+                state["started"] = time.perf_counter()
+            elif event in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+                elapsed = (time.perf_counter() - state.get("started", time.perf_counter())) * 1000.0
+                with self._lock:
+                    if event.endswith("connect_tcp.complete"):
+                        self.connects += 1
+                    else:
+                        self.tls_handshakes += 1
+                    self.connect_ms += elapsed
+                state["started"] = time.perf_counter()
+            elif event == "connection.close.complete":
+                with self._lock:
+                    self.closed += 1
+
+        request.extensions["trace"] = trace
+        with self._lock:
+            self.requests += 1
+
+    def record_warm_up(self, requests: int, opened: int):
+        with self._lock:
+            self.warm_ups += requests
+            self.warmed += opened
+
+    def stats(self) -> Dict[str, Any]:
+        """Reuse of API calls; warm-up requests and their connections are excluded."""
+        with self._lock:
+            requests = self.requests - self.warm_ups
+            connects = max(0, self.connects - self.warmed)
+            return {
+                "requests": requests,
+                "connects": connects,
+                "tls_handshakes": self.tls_handshakes,
+                "reused": max(0, requests - connects),
+                "reuse_rate": round(1 - connects / requests, 4) if requests else 0.0,
+                "avg_connect_ms": round(self.connect_ms / self.connects, 2) if self.connects else 0.0,
+                "closed": self.closed,
+                "warm_up_requests": self.warm_ups,
+                "warmed_connections": self.warmed,
+            }
+
+
+def _http_client_class() -> Optional[Any]:
+    """GeminiHttpClient, defined on first use (None without httpx)."""
+    global _client_class
+    if _client_class is None:
+        try:
+            import httpx
+        except ImportError:  # pragma: no cover - google-genai depends on httpx
+            return None
+
+        class GeminiHttpClient(httpx.Client):
+            """httpx client that keeps its connect timeout when a request sets a total one.
+
+            genai passes HttpOptions.timeout as a single number, which httpx
+            would apply to every phase, connection setup included.
+            """
+
+            def __init__(self, connect_timeout_s: float, **kwargs):
+                self.connect_timeout_s = connect_timeout_s
+                super().__init__(**kwargs)
+
+            def build_request(self, *args, **kwargs) -> httpx.Request:
+                timeout = kwargs.get("timeout")
+                if isinstance(timeout, (int, float)):
+                    kwargs["timeout"] = httpx.Timeout(timeout, connect=min(timeout, self.connect_timeout_s))
+                return super().build_request(*args, **kwargs)
+
+        _client_class = GeminiHttpClient
+    return _client_class
+
+
+def build_http_client(config: TransportConfig, metrics: ConnectionMetrics) -> Optional[Any]:
+    """Process-wide pooled httpx client for genai (None without httpx)."""
+    client_class = _http_client_class()
+    if client_class is None:
+        return None
+    import httpx
+    connect_s = config.connect_timeout_ms / 1000.0
+    return client_class(
+        connect_s,
+        limits=httpx.Limits(max_connections=config.max_connections,
+                            max_keepalive_connections=config.keepalive,
+                            keepalive_expiry=config.keepalive_expiry_s),
+        http2=config.http2,
+        timeout=httpx.Timeout(config.timeout_ms / 1000.0 if config.timeout_ms else None, connect=connect_s),
+        event_hooks={"request": [metrics.attach]},
+    )
+
+
+def warm_up(http_client: Any, config: TransportConfig, metrics: ConnectionMetrics) -> int:
+    """Open up to config.warm_connections connections to the API host.
+
+    The HEADs run concurrently so HTTP/1.1 opens one connection each; the
+    status code does not matter. Returns the number of new connections.
+    """
+    count = config.warm_connections
+    if http_client is None or count <= 0:
+        return 0
+    before = metrics.connects
+    barrier = threading.Barrier(count)
+
+    def head():
+        try:
+            barrier.wait(timeout=config.connect_timeout_ms / 1000.0)
+        except threading.BrokenBarrierError:
+            pass
+        try:
+            http_client.head(config.base_url)
+        except Exception as e:
+            print(f"[WARN] Gemini connection warm-up failed: {e}")
+
+    threads = [threading.Thread(target=head, name="gemini-warm-up", daemon=True) for _ in range(count - 1)]
+    for thread in threads:
+        thread.start()
+    head()
+    for thread in threads:
+        thread.join()
+    opened = metrics.connects - before
+    metrics.record_warm_up(count, opened)
+    return opened
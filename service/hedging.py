@@ -0,0 +1,151 @@
+"""
+Hedged Gemini requests
+Issues a backup call when the first one is slower than usual
+
+When GEMINI_HEDGE is enabled and a call has not answered within the rolling
+GEMINI_HEDGE_PERCENTILE of that model's latency, GeminiService sends a
+second identical request and uses whichever answers first. The slower call
+is abandoned: its result is ignored and, for real clients, its HTTP timeout
+bounds how long it keeps running.
+
+A token bucket caps hedges at GEMINI_HEDGE_MAX_RATE of requests, so in the
+worst case (upstream uniformly slow) cost grows by that fraction only.
+
+Metrics compare the latency actually served with the latency of the first
+call alone (recorded when it completes, even if it lost): the latter is
+what every request would have waited without hedging.
+"""
+
+import os
+import threading
+from typing import Dict, Optional
+
+from service.model_router import ModelStats
+
+
+class HedgeBudget:
+    """Token bucket allowing `max_rate` hedges per request on average."""
+
+    def __init__(self, max_rate: float = 0.1, burst: float = 5.0):
+        self.max_rate = max_rate
+        self.burst = burst
+        self._tokens = burst
+        self._lock = threading.Lock()
+
+    def earn(self):
+        """Called once per request."""
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.max_rate)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            return False
+
+
+class HedgePolicy:
+    """Decides when to hedge and keeps the hedging metrics.
+
+    Environment:
+      GEMINI_HEDGE                enable hedging (False)
+      GEMINI_HEDGE_PERCENTILE     hedge after this percentile of first-call latency (90)
+      GEMINI_HEDGE_MAX_RATE       max fraction of requests that may hedge (0.1)
+      GEMINI_HEDGE_MIN_SAMPLES    latency samples needed before hedging a model (20)
+      GEMINI_HEDGE_MIN_DELAY_MS   never hedge sooner than this (50)
+    """
+
+    def __init__(self, enabled: bool = False, percentile: float = 0.9, max_rate: float = 0.1,
+                 min_samples: int = 20, min_delay_ms: float = 50.0, window: int = 500):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay_ms = min_delay_ms
+        self.window = window
+        self.budget = HedgeBudget(max_rate)
+        self._primary: Dict[str, ModelStats] = {}
+        self._lock = threading.Lock()
+        self.served = ModelStats(window)
+        self.unhedged = ModelStats(window)
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.denied = 0
+
+    @classmethod
+    def from_env(cls) -> "HedgePolicy":
+        return cls(
+            enabled=os.environ.get("GEMINI_HEDGE", "False").lower() == "true",
+            percentile=float(os.environ.get("GEMINI_HEDGE_PERCENTILE", "90")) / 100.0,
+            max_rate=float(os.environ.get("GEMINI_HEDGE_MAX_RATE", "0.1")),
+            min_samples=int(os.environ.get("GEMINI_HEDGE_MIN_SAMPLES", "20")),
+            min_delay_ms=float(os.environ.get("GEMINI_HEDGE_MIN_DELAY_MS", "50")),
+        )
+
+    def _stats_for(self, model: str) -> ModelStats:
+        stats = self._primary.get(model)
+        if stats is None:
+            with self._lock:
+                stats = self._primary.setdefault(model, ModelStats(self.window))
+        return stats
+
+    def begin(self):
+        """Account for one request (earns hedge budget)."""
+        with self._lock:
+            self.requests += 1
+        self.budget.earn()
+
+    def delay_ms(self, model: str) -> Optional[float]:
+        """How long to wait for the first call before hedging (None = never)."""
+        stats = self._stats_for(model)
+        if stats.sample_count() < self.min_samples:
+            return None
+        threshold = stats.percentile(self.percentile)
+        if threshold is None:
+            return None
+        return max(threshold, self.min_delay_ms)
+
+    def admit(self) -> bool:
+        """Spend budget for one hedge; False when over the rate cap."""
+        if self.budget.try_spend():
+            with self._lock:
+                self.hedges += 1
+            return True
+        with self._lock:
+            self.denied += 1
+        return False
+
+    def record_first_call(self, model: str, latency_ms: float, ok: bool):
+        """Latency of the first call alone, whether it won or not."""
+        self._stats_for(model).record(latency_ms, ok)
+        self.unhedged.record(latency_ms, ok)
+
+    def record_served(self, latency_ms: float, hedge_won: bool):
+        self.served.record(latency_ms, True)
+        if hedge_won:
+            with self._lock:
+                self.hedge_wins += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests, hedges, wins, denied = self.requests, self.hedges, self.hedge_wins, self.denied
+        served_p99 = self.served.percentile(0.99)
+        unhedged_p99 = self.unhedged.percentile(0.99)
+        return {
+            "enabled": self.enabled,
+            "requests": requests,
+            "hedges": hedges,
+            "hedge_rate": round(hedges / requests, 4) if requests else 0.0,
+            "hedge_wins": wins,
+            "denied_by_budget": denied,
+            "max_rate": self.budget.max_rate,
+            "served_p50_ms": self.served.percentile(0.5),
+            "served_p90_ms": self.served.percentile(0.9),
+            "served_p99_ms": served_p99,
+            "unhedged_p50_ms": self.unhedged.percentile(0.5),
+            "unhedged_p90_ms": self.unhedged.percentile(0.9),
+            "unhedged_p99_ms": unhedged_p99,
+            "p99_saved_ms": (round(unhedged_p99 - served_p99, 1)
+                             if served_p99 is not None and unhedged_p99 is not None else None),
+        }
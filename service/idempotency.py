@@ -0,0 +1,179 @@
+"""
+Idempotency-Key support for /api/chat
+Replays stored replies and attaches retries to in-flight generations
+
+A client that lost the response to POST /api/chat (flaky mobile link) can
+resend the same request with the same Idempotency-Key header:
+
+  * the first request claims the key in the idempotency_key table and runs;
+    its reply is stored for IDEMPOTENCY_TTL_S seconds
+  * a retry arriving while it still runs waits for it: on an in-process
+    Event when it landed on the same worker, by polling the table otherwise
+  * a retry arriving later gets the stored reply replayed
+
+Either way the message is persisted and Gemini is called only once. Server
+errors (5xx) are not stored: the key is released so a retry runs again.
+The question the failed attempt stored stays recorded on the key, and the
+chat route reuses it instead of storing it twice. The chat route scopes keys
+to the caller (user, chat session or client address), so a key reused by
+someone else never replays their reply.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from database.db import (
+    claim_idempotency_key,
+    complete_idempotency_key,
+    get_idempotency_key,
+    purge_idempotency_keys,
+    release_idempotency_key,
+)
+
+# (body, status code, replayed)
+Outcome = Tuple[Dict[str, Any], int, bool]
+
+PURGE_INTERVAL_S = 60.0
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class _InFlight:
+    __slots__ = ("fingerprint", "event", "result")
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.event = threading.Event()
+        self.result: Optional[Tuple[Dict[str, Any], int]] = None
+
+
+class IdempotencyStore:
+    """Run a handler at most once per idempotency key."""
+
+    def __init__(self, ttl_s: float = 86400, wait_s: float = 90, poll_ms: int = 50):
+        self.ttl_ms = int(ttl_s * 1000)
+        self.wait_s = wait_s
+        self.poll_s = poll_ms / 1000.0
+        self._inflight: Dict[str, _InFlight] = {}
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        self.counters = {"executed": 0, "replayed": 0, "attached": 0, "conflicts": 0, "timeouts": 0}
+
+    @staticmethod
+    def fingerprint(*parts: Any) -> str:
+        """Hash of the request fields that must match between retries."""
+        raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def run(self, key: str, fingerprint: str,
+            handler: Callable[[], Tuple[Dict[str, Any], int]],
+            wait_s: Optional[float] = None) -> Outcome:
+        """Return the handler's (body, status), running it only if no earlier
+        request with this key has completed or is still running.
+
+        wait_s caps how long a retry waits for the original (default
+        IDEMPOTENCY_WAIT_S).
+        """
+        wait_s = self.wait_s if wait_s is None else min(wait_s, self.wait_s)
+        self._maybe_purge()
+        with self._lock:
+            flight = self._inflight.get(key)
+            owner = flight is None
+            if owner:
+                flight = self._inflight[key] = _InFlight(fingerprint)
+        if not owner:
+            return self._attach(flight, fingerprint, wait_s)
+        try:
+            outcome = self._run_owned(key, fingerprint, handler, wait_s)
+            flight.result = (outcome[0], outcome[1])
+            return outcome
+        finally:
+            if flight.result is None:
+                flight.result = ({'error': 'Erreur serveur interne'}, 500)
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+
+    def _attach(self, flight: _InFlight, fingerprint: str, wait_s: float) -> Outcome:
+        """Same worker: wait for the running request and share its reply."""
+        if flight.fingerprint != fingerprint:
+            return self._conflict()
+        if not flight.event.wait(wait_s):
+            return self._timeout()
+        self.counters["attached"] += 1
+        body, status = flight.result  # type: ignore[misc]
+        return body, status, True
+
+    def _run_owned(self, key: str, fingerprint: str,
+                   handler: Callable[[], Tuple[Dict[str, Any], int]], wait_s: float) -> Outcome:
+        deadline = time.monotonic() + wait_s
+        delay = self.poll_s
+        while True:
+            record = claim_idempotency_key(key, fingerprint, _now_ms(), self.ttl_ms,
+                                           stale_ms=int(self.wait_s * 1000) * 2)
+            if record is None:
+                return self._execute(key, handler)
+            if record["fingerprint"] != fingerprint:
+                return self._conflict()
+            # Claimed by another worker: poll until it completes or is released
+            while record is not None and record["status"] == "pending":
+                if time.monotonic() >= deadline:
+                    return self._timeout()
+                time.sleep(delay)
+                delay = min(delay * 2, 0.5)
+                record = get_idempotency_key(key)
+            if record is not None and record["status"] == "done":
+                self.counters["replayed"] += 1
+                return json.loads(record["response"]), record["status_code"], True
+            # Released after a server error: try to claim it ourselves
+
+    def _execute(self, key: str, handler: Callable[[], Tuple[Dict[str, Any], int]]) -> Outcome:
+        self.counters["executed"] += 1
+        try:
+            body, status = handler()
+        except BaseException:
+            release_idempotency_key(key)
+            raise
+        if status >= 500:
+            release_idempotency_key(key)
+        else:
+            complete_idempotency_key(key, status, json.dumps(body, ensure_ascii=False))
+        return body, status, False
+
+    def _conflict(self) -> Outcome:
+        self.counters["conflicts"] += 1
+        return {'error': "Clé d'idempotence déjà utilisée pour une autre requête"}, 422, False
+
+    def _timeout(self) -> Outcome:
+        self.counters["timeouts"] += 1
+        return {'error': 'Requête déjà en cours de traitement, réessayez plus tard'}, 409, False
+
+    def _maybe_purge(self):
+        now = time.monotonic()
+        if now - self._last_purge < PURGE_INTERVAL_S:
+            return
+        self._last_purge = now
+        try:
+            purge_idempotency_keys(_now_ms())
+        except Exception as e:
+            print(f'[ERROR] Idempotency key purge failed: {e}')
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            inflight = len(self._inflight)
+        return dict(self.counters, inflight=inflight)
+
+
+def init_idempotency(app) -> IdempotencyStore:
+    """Attach the idempotency store to the Flask app."""
+    store = IdempotencyStore(
+        ttl_s=float(app.config.get("IDEMPOTENCY_TTL_S", 86400)),
+        wait_s=float(app.config.get("IDEMPOTENCY_WAIT_S", 90)),
+    )
+    app.extensions["idempotency"] = store
+    return store
@@ -0,0 +1,210 @@
+"""
+Gemini model router
+Picks a model per request from local heuristics and observed per-model health
+"""
+
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+
+FAST = "fast"
+STRONG = "strong"
+
+# Messages that are pure small talk or ask for the portal link do not need
+# the stronger (slower, more expensive) model.
+_FAQ_PATTERN = re.compile(
+    r"^\s*(bonjour|bonsoir|salut|hello|coucou|merci|ok|d'accord|au revoir)\b"
+    r"|\b(lien|url|portail|site)\b",
+    re.IGNORECASE,
+)
+_COMPLEX_PATTERN = re.compile(
+    r"\b(comment|pourquoi|expliqu\w*|étapes?|procédure|différence|comparer|"
+    r"rédige\w*|résume\w*|analyse\w*)\b",
+    re.IGNORECASE,
+)
+
+
+def _env_list(name: str) -> List[str]:
+    return [m.strip() for m in os.environ.get(name, "").split(",") if m.strip()]
+
+
+class ModelStats:
+    """Rolling latency / error window for a single model (thread-safe)."""
+
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window)  # (latency_ms, ok)
+        self.calls = 0
+        self.errors = 0
+        self.inflight = 0
+        self.cooldown_until = 0.0
+
+    def start(self):
+        with self._lock:
+            self.inflight += 1
+
+    def record(self, latency_ms: float, ok: bool):
+        with self._lock:
+            self.inflight = max(0, self.inflight - 1)
+            self.calls += 1
+            if not ok:
+                self.errors += 1
+            self._samples.append((latency_ms, ok))
+
+    def sample_count(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self._samples:
+                return 0.0
+            return sum(1 for _, ok in self._samples if not ok) / len(self._samples)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            latencies = sorted(lat for lat, ok in self._samples if ok)
+        if not latencies:
+            return None
+        idx = min(len(latencies) - 1, int(round(pct * (len(latencies) - 1))))
+        return latencies[idx]
+
+    def snapshot(self) -> dict:
+        p50, p90, p99 = self.percentile(0.5), self.percentile(0.9), self.percentile(0.99)
+        error_rate = self.error_rate()
+        with self._lock:
+            samples = len(self._samples)
+            calls, errors, inflight = self.calls, self.errors, self.inflight
+            cooling = self.cooldown_until > time.monotonic()
+        return {
+            "calls": calls,
+            "errors": errors,
+            "inflight": inflight,
+            "window": samples,
+            "error_rate": round(error_rate, 4),
+            "p50_ms": p50,
+            "p90_ms": p90,
+            "p99_ms": p99,
+            "cooling_down": cooling,
+        }
+
+
+class ModelRouter:
+    """Route each generation to a fast or strong model tier.
+
+    The tier comes from cheap local signals (message length, FAQ-like
+    intent, conversation size). Inside the chosen tier models are ordered
+    by health; models that recently reported overload, or whose rolling
+    error rate is too high, are pushed to the end so the caller fails over
+    to the next candidate automatically.
+
+    Environment:
+      GEMINI_FAST_MODELS          comma list, e.g. "gemini-2.5-flash-lite"
+      GEMINI_STRONG_MODELS        comma list, defaults to GEMINI_MODEL
+      GEMINI_ROUTER_SHORT_CHARS   messages up to this length may go fast (160)
+      GEMINI_ROUTER_CONTEXT_CHARS conversations above this go strong (4000)
+      GEMINI_ROUTER_MAX_ERROR_RATE rolling error rate marking a model degraded (0.5)
+      GEMINI_ROUTER_COOLDOWN_MS   how long an overloaded model is avoided (15000)
+    """
+
+    def __init__(self, default_model: str,
+                 fast_models: Optional[List[str]] = None,
+                 strong_models: Optional[List[str]] = None,
+                 short_chars: int = 160,
+                 context_chars: int = 4000,
+                 max_error_rate: float = 0.5,
+                 cooldown_ms: int = 15000,
+                 min_samples: int = 5):
+        self.default_model = default_model
+        self.fast_models = list(fast_models or [])
+        self.strong_models = list(strong_models or [default_model])
+        self.short_chars = short_chars
+        self.context_chars = context_chars
+        self.max_error_rate = max_error_rate
+        self.cooldown_ms = cooldown_ms
+        self.min_samples = min_samples
+        self._stats: Dict[str, ModelStats] = {}
+        self._routes = {FAST: 0, STRONG: 0}
+        self._lock = threading.Lock()
+        for model in self.fast_models + self.strong_models:
+            self._stats.setdefault(model, ModelStats())
+
+    @classmethod
+    def from_env(cls, default_model: str) -> "ModelRouter":
+        return cls(
+            default_model,
+            fast_models=_env_list("GEMINI_FAST_MODELS"),
+            strong_models=_env_list("GEMINI_STRONG_MODELS") or [default_model],
+            short_chars=int(os.environ.get("GEMINI_ROUTER_SHORT_CHARS", "160")),
+            context_chars=int(os.environ.get("GEMINI_ROUTER_CONTEXT_CHARS", "4000")),
+            max_error_rate=float(os.environ.get("GEMINI_ROUTER_MAX_ERROR_RATE", "0.5")),
+            cooldown_ms=int(os.environ.get("GEMINI_ROUTER_COOLDOWN_MS", "15000")),
+        )
+
+    def stats_for(self, model: str) -> ModelStats:
+        with self._lock:
+            stats = self._stats.get(model)
+            if stats is None:
+                stats = self._stats[model] = ModelStats()
+            return stats
+
+    def classify(self, message: str, context: list) -> str:
+        """Return FAST or STRONG for a message using local heuristics only."""
+        if not self.fast_models:
+            return STRONG
+        context_size = sum(len(m.get("content") or "") for m in context)
+        if context_size > self.context_chars:
+            return STRONG
+        if len(message) > self.short_chars or message.count("?") > 1 or "\n" in message:
+            return STRONG
+        if _FAQ_PATTERN.search(message):
+            return FAST
+        if _COMPLEX_PATTERN.search(message):
+            return STRONG
+        return FAST
+
+    def _is_degraded(self, model: str) -> bool:
+        stats = self.stats_for(model)
+        if stats.cooldown_until > time.monotonic():
+            return True
+        return stats.sample_count() >= self.min_samples and stats.error_rate() > self.max_error_rate
+
+    def _order(self, models: List[str]) -> List[str]:
+        def key(model):
+            p90 = self.stats_for(model).percentile(0.9)
+            return (self._is_degraded(model), p90 if p90 is not None else 0.0)
+        return sorted(models, key=key)
+
+    def plan(self, message: str, context: list) -> List[str]:
+        """Ordered list of models to try for this request (preferred first)."""
+        tier = self.classify(message, context)
+        with self._lock:
+            self._routes[tier] += 1
+        preferred = self.fast_models if tier == FAST else self.strong_models
+        fallback = self.strong_models if tier == FAST else self.fast_models
+        ordered = self._order(preferred) + self._order([m for m in fallback if m not in preferred])
+        # Healthy fallbacks go before degraded preferred models.
+        healthy = [m for m in ordered if not self._is_degraded(m)]
+        degraded = [m for m in ordered if self._is_degraded(m)]
+        return healthy + degraded or [self.default_model]
+
+    def record(self, model: str, latency_ms: float, ok: bool, overloaded: bool = False):
+        stats = self.stats_for(model)
+        stats.record(latency_ms, ok)
+        if overloaded:
+            stats.cooldown_until = time.monotonic() + self.cooldown_ms / 1000.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            models = dict(self._stats)
+            routes = dict(self._routes)
+        return {
+            "routes": routes,
+            "fast_models": self.fast_models,
+            "strong_models": self.strong_models,
+            "models": {name: s.snapshot() for name, s in models.items()},
+        }
@@ -0,0 +1,142 @@
+"""
+Principal cache for authenticated routes
+Resolves the logged-in user without a SQLite query on every request
+
+login_required, admin_required and /api/auth/me need the current user's
+row (role, verification). PrincipalCache keeps those rows per worker in a
+bounded LRU with a TTL (PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL_S):
+
+  * update_user_verification, update_user_password and update_user_role
+    drop the user from this worker's cache immediately, and append a row
+    to user_invalidation in the same transaction
+  * other workers read the rows newer than the last generation they saw,
+    at most every PRINCIPAL_SYNC_INTERVAL_MS, and drop those users; a
+    worker that fell behind the purge horizon clears its whole cache
+
+A role change is therefore seen by every worker within the sync interval.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from database.db import get_user_by_id, get_user_generation, get_user_invalidations, purge_user_invalidations
+from database.timestamps import now_ms
+
+PURGE_INTERVAL_S = 300.0
+
+
+class _Entry:
+    __slots__ = ("principal", "loaded_at")
+
+    def __init__(self, principal: Optional[Dict[str, Any]]):
+        self.principal = principal
+        self.loaded_at = time.monotonic()
+
+
+class PrincipalCache:
+    """Bounded, TTL-limited cache of get_user_by_id results."""
+
+    def __init__(self, size: int = 10000, ttl_s: float = 60.0, sync_interval_ms: int = 1000):
+        self.size = size
+        self.ttl_s = ttl_s
+        self.sync_interval_s = sync_interval_ms / 1000.0
+        # Invalidation rows are kept long enough for any live entry to be covered
+        self.retention_ms = int((ttl_s + self.sync_interval_s) * 1000) + 60000
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation: Optional[int] = None
+        # Bumped by every invalidation: a row read before it is not cached after it
+        self._epoch = 0
+        self._last_sync = 0.0
+        self._last_purge = time.monotonic()
+        self.counters = {"lookups": 0, "hits": 0, "misses": 0, "syncs": 0,
+                         "invalidations": 0, "remote_invalidations": 0, "flushes": 0}
+
+    def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """The user's principal (get_user_by_id dict), or None if it does not exist."""
+        self._maybe_sync()
+        self.counters["lookups"] += 1
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and time.monotonic() - entry.loaded_at <= self.ttl_s:
+                self._entries.move_to_end(user_id)
+                self.counters["hits"] += 1
+                return entry.principal
+            epoch = self._epoch
+        self.counters["misses"] += 1
+        principal = get_user_by_id(user_id)
+        if self.size > 0:
+            with self._lock:
+                if epoch != self._epoch:
+                    return principal
+                self._entries[user_id] = _Entry(principal)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+        return principal
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._epoch += 1
+        self.counters["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._epoch += 1
+        self.counters["flushes"] += 1
+
+    def _maybe_sync(self):
+        now = time.monotonic()
+        if now - self._last_sync < self.sync_interval_s:
+            return
+        behind = now - self._last_sync > self.retention_ms / 1000.0
+        self._last_sync = now
+        self.counters["syncs"] += 1
+        try:
+            if self.generation is None or behind:
+                # First sync, or rows we never saw may have been purged
+                self.generation = get_user_generation()
+                self.clear()
+            else:
+                rows = get_user_invalidations(self.generation)
+                if rows:
+                    with self._lock:
+                        for _, user_id in rows:
+                            self._entries.pop(user_id, None)
+                        self._epoch += 1
+                    self.generation = rows[-1][0]
+                    self.counters["remote_invalidations"] += len(rows)
+            self._maybe_purge(now)
+        except Exception as e:
+            print(f'[ERROR] Principal cache sync failed: {e}')
+
+    def _maybe_purge(self, now: float):
+        if now - self._last_purge < PURGE_INTERVAL_S:
+            return
+        self._last_purge = now
+        purge_user_invalidations(now_ms() - self.retention_ms)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            cached = len(self._entries)
+        lookups = self.counters["lookups"]
+        # A hit saves one get_user_by_id; a generation sync costs one query
+        saved = self.counters["hits"] - self.counters["syncs"]
+        return dict(self.counters, cached=cached, generation=self.generation,
+                    hit_ratio=round(self.counters["hits"] / lookups, 3) if lookups else None,
+                    queries_saved_per_request=round(saved / lookups, 3) if lookups else None)
+
+
+def init_principals(app) -> PrincipalCache:
+    """Attach the principal cache to the Flask app."""
+    cache = PrincipalCache(
+        size=int(app.config.get("PRINCIPAL_CACHE_SIZE", 10000)),
+        ttl_s=float(app.config.get("PRINCIPAL_CACHE_TTL_S", 60)),
+        sync_interval_ms=int(app.config.get("PRINCIPAL_SYNC_INTERVAL_MS", 1000)),
+    )
+    app.extensions["principals"] = cache
+    return cache
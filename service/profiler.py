@@ -0,0 +1,323 @@
+"""
+Sampling profiler for slow API requests
+Captures collapsed stacks of requests over a latency threshold
+
+While enabled, a background thread wakes every PROFILE_INTERVAL_MS and reads
+the current frame of each thread serving an /api/ request
+(sys._current_frames). Stacks are counted per request. When the request
+ends, its profile is kept if it took at least PROFILE_THRESHOLD_MS, or
+if it was drawn by PROFILE_SAMPLE_RATE; otherwise it is dropped.
+
+A kept profile is written in collapsed-stack format, which flamegraph.pl,
+speedscope and inferno read directly. Each line is
+"outer;...;inner count". A .json sidecar holds the request metadata.
+The directory is a ring buffer of PROFILE_MAX_FILES captures shared by
+all workers: the oldest files are removed on write.
+
+Production safety:
+  * nothing is sampled while disabled, and the sampler thread sleeps
+    whenever no request is in flight
+  * the cost is one frame walk per in-flight request per tick, far from
+    the per-call hooks of cProfile
+  * at most PROFILE_MAX_PER_MIN captures are written per worker
+  * stacks are truncated to MAX_DEPTH frames
+
+The enabled flag, threshold and sample rate can be changed at runtime
+(POST /api/admin/profiler). They are stored in state.json in the
+directory, so every worker picks them up within a second.
+"""
+
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+MAX_DEPTH = 128
+STATE_FILE = "state.json"
+STATE_REFRESH_S = 1.0
+
+
+@lru_cache(maxsize=4096)
+def _frame_label(filename: str, firstlineno: int, name: str) -> str:
+    """Collapsed-stack label of a function (bounded, keyed by value so no code object is kept alive)."""
+    return f"{name} ({os.path.basename(filename)}:{firstlineno})"
+
+
+class _Capture:
+    __slots__ = ("ident", "started", "stacks", "samples")
+
+    def __init__(self, ident: int):
+        self.ident = ident
+        self.started = time.perf_counter()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+
+
+class SamplingProfiler:
+    """Per-process sampler; captures are shared on disk between workers."""
+
+    def __init__(self, directory: str, enabled: bool = False, interval_ms: float = 10.0,
+                 threshold_ms: float = 2000.0, sample_rate: float = 0.0,
+                 max_files: int = 50, max_per_min: int = 30):
+        self.directory = directory
+        self.enabled = enabled
+        self.interval_s = max(interval_ms, 1.0) / 1000.0
+        self.threshold_ms = threshold_ms
+        self.sample_rate = sample_rate
+        self.max_files = max_files
+        self.max_per_min = max_per_min
+        self._active: Dict[int, _Capture] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._idle = True
+        self._pid = os.getpid()
+        self._state_checked = 0.0
+        self._state_mtime = 0.0
+        self._written: List[float] = []
+        self._seq = 0
+        self.counters = {"profiled": 0, "captured": 0, "rate_limited": 0, "samples": 0}
+
+    # ---- request hooks ----
+
+    def begin(self) -> Optional[_Capture]:
+        """Start profiling the calling thread's request (None when disabled)."""
+        self._refresh_state()
+        if not self.enabled:
+            return None
+        capture = _Capture(threading.get_ident())
+        with self._lock:
+            self._active[capture.ident] = capture
+            wake = self._idle
+        if wake:
+            self._ensure_thread()
+            self._wake.set()
+        return capture
+
+    def end(self, capture: Optional[_Capture], method: str, path: str,
+            status: Optional[int]) -> Optional[str]:
+        """Stop profiling; write the capture if it qualifies. Returns its name."""
+        if capture is None:
+            return None
+        with self._lock:
+            if self._active.pop(capture.ident, None) is None:
+                return None
+            self.counters["profiled"] += 1
+        duration_ms = (time.perf_counter() - capture.started) * 1000.0
+        if duration_ms >= self.threshold_ms:
+            reason = "slow"
+        elif self.sample_rate > 0 and random.random() < self.sample_rate:
+            reason = "sampled"
+        else:
+            return None
+        if not capture.stacks or not self._allow_write():
+            return None
+        return self._write(capture, {
+            "method": method,
+            "path": path,
+            "status": status,
+            "duration_ms": round(duration_ms, 1),
+            "reason": reason,
+        })
+
+    # ---- sampler thread ----
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._idle = True
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                self._idle = not self._active
+                if self._idle:
+                    self._wake.clear()
+            if self._idle:
+                self._wake.wait()
+                continue
+            time.sleep(self.interval_s)
+            with self._lock:
+                active = list(self._active.items())
+            frames = sys._current_frames()
+            # Walk stacks without the lock so request threads never wait on it
+            keys = [(ident, capture, self._stack_key(frames[ident]))
+                    for ident, capture in active if ident in frames]
+            del frames
+            with self._lock:
+                for ident, capture, key in keys:
+                    if self._active.get(ident) is capture:
+                        capture.stacks[key] += 1
+                        capture.samples += 1
+                self.counters["samples"] += len(keys)
+
+    @staticmethod
+    def _stack_key(frame) -> tuple:
+        """Code objects from leaf to root: cheap to build and hash per sample."""
+        codes = []
+        while frame is not None and len(codes) < MAX_DEPTH:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        return tuple(codes)
+
+    def _collapse(self, key: tuple) -> str:
+        """Collapsed-stack line prefix (root first) for a stack key."""
+        return ";".join(_frame_label(code.co_filename, code.co_firstlineno, code.co_name)
+                        for code in reversed(key))
+
+    # ---- ring buffer on disk ----
+
+    def _allow_write(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            self._written = [t for t in self._written if now - t < 60.0]
+            if len(self._written) >= self.max_per_min:
+                self.counters["rate_limited"] += 1
+                return False
+            self._written.append(now)
+            self._seq += 1
+            return True
+
+    def _write(self, capture: _Capture, meta: Dict[str, Any]) -> Optional[str]:
+        name = f"{int(time.time() * 1000):013d}-{os.getpid()}-{self._seq:06d}"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            lines = [f"{self._collapse(key)} {count}" for key, count in capture.stacks.most_common()]
+            with open(os.path.join(self.directory, name + ".collapsed"), "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            meta = dict(meta, name=name, samples=capture.samples, pid=os.getpid(),
+                        interval_ms=self.interval_s * 1000.0,
+                        captured_at=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+            with open(os.path.join(self.directory, name + ".json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            self._trim()
+        except OSError as e:
+            print(f'[ERROR] Profile capture failed: {e}')
+            return None
+        with self._lock:
+            self.counters["captured"] += 1
+        return name
+
+    def _trim(self):
+        names = sorted({f.rsplit(".", 1)[0] for f in os.listdir(self.directory)
+                        if f.endswith(".collapsed")})
+        for old in names[:max(0, len(names) - self.max_files)]:
+            for ext in (".collapsed", ".json"):
+                try:
+                    os.remove(os.path.join(self.directory, old + ext))
+                except FileNotFoundError:
+                    pass
+
+    def captures(self) -> List[Dict[str, Any]]:
+        """Metadata of the captures on disk, newest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        result = []
+        for entry in sorted(os.listdir(self.directory), reverse=True):
+            if not entry.endswith(".json") or entry == STATE_FILE:
+                continue
+            try:
+                with open(os.path.join(self.directory, entry), encoding="utf-8") as f:
+                    result.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return result
+
+    def capture_path(self, name: str) -> Optional[str]:
+        """Path of a capture's collapsed stacks (None if unknown or invalid name)."""
+        if not name or not all(c.isdigit() or c == "-" for c in name):
+            return None
+        path = os.path.join(self.directory, name + ".collapsed")
+        return path if os.path.isfile(path) else None
+
+    # ---- runtime settings shared by workers ----
+
+    def configure(self, enabled: Optional[bool] = None, threshold_ms: Optional[float] = None,
+                  sample_rate: Optional[float] = None) -> Dict[str, Any]:
+        """Change the settings here and, through state.json, in every worker."""
+        if enabled is not None:
+            self.enabled = bool(enabled)
+        if threshold_ms is not None:
+            self.threshold_ms = max(0.0, float(threshold_ms))
+        if sample_rate is not None:
+            self.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+        settings = self.settings()
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = os.path.join(self.directory, f".{STATE_FILE}.{os.getpid()}")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(settings, f)
+        os.replace(tmp, os.path.join(self.directory, STATE_FILE))
+        return settings
+
+    def settings(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "threshold_ms": self.threshold_ms,
+                "sample_rate": self.sample_rate}
+
+    def _refresh_state(self):
+        now = time.monotonic()
+        if now - self._state_checked < STATE_REFRESH_S:
+            return
+        self._state_checked = now
+        path = os.path.join(self.directory, STATE_FILE)
+        try:
+            mtime = os.stat(path).st_mtime
+            if mtime == self._state_mtime:
+                return
+            with open(path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._state_mtime = mtime
+        self.enabled = bool(state.get("enabled", self.enabled))
+        self.threshold_ms = float(state.get("threshold_ms", self.threshold_ms))
+        self.sample_rate = float(state.get("sample_rate", self.sample_rate))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters, in_flight=len(self._active))
+        return dict(self.settings(), interval_ms=self.interval_s * 1000.0,
+                    max_files=self.max_files, max_per_min=self.max_per_min, **counters)
+
+
+def init_profiler(app) -> SamplingProfiler:
+    """Attach the sampling profiler to the Flask app and hook /api/ requests."""
+    from flask import g, request
+
+    profiler = SamplingProfiler(
+        directory=app.config.get("PROFILE_DIR") or os.path.join(os.getcwd(), "profiles"),
+        enabled=bool(app.config.get("PROFILE_ENABLED", False)),
+        interval_ms=float(app.config.get("PROFILE_INTERVAL_MS", 10)),
+        threshold_ms=float(app.config.get("PROFILE_THRESHOLD_MS", 2000)),
+        sample_rate=float(app.config.get("PROFILE_SAMPLE_RATE", 0.0)),
+        max_files=int(app.config.get("PROFILE_MAX_FILES", 50)),
+        max_per_min=int(app.config.get("PROFILE_MAX_PER_MIN", 30)),
+    )
+    app.extensions["profiler"] = profiler
+
+    @app.before_request
+    def _profile_begin():
+        if request.path.startswith("/api/") and not request.path.startswith("/api/admin/profiler"):
+            g._profile = profiler.begin()
+
+    @app.after_request
+    def _profile_end(response):
+        profiler.end(g.pop("_profile", None), request.method, request.path, response.status_code)
+        return response
+
+    @app.teardown_request
+    def _profile_abort(error=None):
+        # Unhandled exception: after_request did not run
+        profiler.end(g.pop("_profile", None), request.method, request.path, 500)
+
+    return profiler
@@ -0,0 +1,316 @@
+"""
+Server-side Flask sessions stored in SQLite
+Only an opaque random id travels in the cookie
+
+Flask's default session serializes and signs the whole dict into the
+cookie on every response that touches it. With SESSION_BACKEND=sqlite the
+cookie holds a 43-character random id instead, and the data lives in the
+web_session table (keyed by the SHA-256 of the id):
+
+  * reads go through a per-worker LRU cache; an entry is trusted for
+    SESSION_CACHE_TTL_S seconds, which bounds how long another worker may
+    keep serving a session revoked elsewhere
+  * a row is written only when the session was modified; an unmodified
+    session just has its expiry pushed forward, at most once every
+    SESSION_TOUCH_INTERVAL_S seconds
+  * a new id is issued when the logged-in user changes (login, logout),
+    so an id planted before login is useless afterwards
+  * expired rows are deleted in short batches by a background sweeper
+
+Sessions can be revoked server-side one by one or for a whole user
+(POST /api/admin/sessions/revoke).
+"""
+
+import hashlib
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+
+from database.db import (
+    count_web_sessions,
+    delete_user_web_sessions,
+    delete_web_session,
+    get_web_session,
+    purge_web_sessions,
+    save_web_session,
+    touch_web_session,
+)
+from database.timestamps import now_ms
+
+# secrets.token_urlsafe(32); anything else (e.g. an old signed cookie) is ignored
+_SID_RE = re.compile(r'^[A-Za-z0-9_-]{43}$')
+
+
+def _key(sid: str) -> bytes:
+    return hashlib.sha256(sid.encode('ascii')).digest()
+
+
+class ServerSession(SecureCookieSession):
+    """Session dict tracking its cookie id and the user it was loaded for."""
+
+    def __init__(self, initial=None, sid: Optional[str] = None, updated_ms: int = 0):
+        super().__init__(initial)
+        self.sid = sid
+        self.loaded_user = (initial or {}).get('user_id')
+        self.updated_ms = updated_ms
+
+
+class _Entry:
+    __slots__ = ("data", "user_id", "expires_ms", "updated_ms", "loaded_at")
+
+    def __init__(self, data: Dict[str, Any], user_id: Optional[str], expires_ms: int, updated_ms: int):
+        self.data = data
+        self.user_id = user_id
+        self.expires_ms = expires_ms
+        self.updated_ms = updated_ms
+        self.loaded_at = time.monotonic()
+
+
+class SQLiteSessionInterface(SessionInterface):
+    """Flask SessionInterface backed by the web_session table."""
+
+    serializer = TaggedJSONSerializer()
+    session_class = ServerSession
+
+    def __init__(self, cache_size: int = 10000, cache_ttl_s: float = 5.0,
+                 touch_interval_s: float = 300.0, sweep_batch: int = 500):
+        self.cache_size = cache_size
+        self.cache_ttl_s = cache_ttl_s
+        self.touch_interval_ms = int(touch_interval_s * 1000)
+        self.sweep_batch = sweep_batch
+        self._cache: "OrderedDict[bytes, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"cache_hits": 0, "cache_misses": 0, "writes": 0, "touches": 0,
+                         "deletes": 0, "revoked": 0, "swept": 0}
+
+    # ---- cache ----
+
+    def _cache_get(self, key: bytes) -> Optional[_Entry]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry.loaded_at > self.cache_ttl_s:
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return entry
+
+    def _cache_put(self, key: bytes, entry: _Entry):
+        if self.cache_size <= 0:
+            return
+        with self._lock:
+            self._cache[key] = entry
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _cache_drop(self, key: bytes):
+        with self._lock:
+            self._cache.pop(key, None)
+
+    # ---- SessionInterface ----
+
+    def open_session(self, app, request) -> ServerSession:
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid or not _SID_RE.match(sid):
+            return self.session_class()
+        key = _key(sid)
+        entry = self._cache_get(key)
+        if entry is not None:
+            self.counters["cache_hits"] += 1
+        else:
+            self.counters["cache_misses"] += 1
+            row = get_web_session(key)
+            if row is None:
+                return self.session_class()
+            try:
+                data = self.serializer.loads(row["data"])
+            except ValueError:
+                return self.session_class()
+            entry = _Entry(data, row["user_id"], row["expires_ms"], row["updated_ms"])
+            self._cache_put(key, entry)
+        if entry.expires_ms <= now_ms():
+            self._cache_drop(key)
+            return self.session_class()
+        # Shallow copy: the request mutates its own dict, never the cached one
+        return self.session_class(dict(entry.data), sid=sid, updated_ms=entry.updated_ms)
+
+    def save_session(self, app, session: ServerSession, response) -> None:
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if not session:
+            if session.modified and session.sid:
+                self._delete(_key(session.sid))
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       httponly=self.get_cookie_httponly(app),
+                                       samesite=self.get_cookie_samesite(app))
+            return
+
+        now = now_ms()
+        expires_ms = now + int(app.permanent_session_lifetime.total_seconds() * 1000)
+        if session.modified or session.sid is None:
+            user_id = session.get('user_id')
+            old_key = None
+            if session.sid is None or user_id != session.loaded_user:
+                if session.sid is not None:
+                    old_key = _key(session.sid)
+                    self._cache_drop(old_key)
+                session.sid = secrets.token_urlsafe(32)
+            key = _key(session.sid)
+            data = dict(session)
+            user = str(user_id) if user_id is not None else None
+            save_web_session(key, self.serializer.dumps(data), user, expires_ms, now, replaces=old_key)
+            self._cache_put(key, _Entry(data, user, expires_ms, now))
+            self.counters["writes"] += 1
+        elif now - session.updated_ms >= self.touch_interval_ms:
+            key = _key(session.sid)
+            touch_web_session(key, expires_ms, now)
+            entry = self._cache_get(key)
+            if entry is not None:
+                entry.expires_ms, entry.updated_ms = expires_ms, now
+            self.counters["touches"] += 1
+            if not session.permanent:
+                # Browser-session cookie: nothing to send back
+                return
+        else:
+            return
+
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+        response.vary.add("Cookie")
+
+    # ---- administration ----
+
+    def _delete(self, key: bytes) -> int:
+        self._cache_drop(key)
+        self.counters["deletes"] += 1
+        return delete_web_session(key)
+
+    def revoke(self, sid: str) -> bool:
+        """End one session given its cookie value."""
+        if not _SID_RE.match(sid or ''):
+            return False
+        removed = self._delete(_key(sid))
+        self.counters["revoked"] += removed
+        return bool(removed)
+
+    def revoke_user(self, user_id) -> int:
+        """End every session of a user, return how many rows were deleted."""
+        user = str(user_id)
+        with self._lock:
+            for key in [k for k, e in self._cache.items() if e.user_id == user]:
+                del self._cache[key]
+        removed = delete_user_web_sessions(user)
+        self.counters["revoked"] += removed
+        return removed
+
+    def sweep(self) -> int:
+        """Delete expired sessions in batches of sweep_batch rows."""
+        total = 0
+        now = now_ms()
+        while True:
+            removed = purge_web_sessions(now, self.sweep_batch)
+            total += removed
+            if removed < self.sweep_batch:
+                break
+        self.counters["swept"] += total
+        return total
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            cached = len(self._cache)
+        lookups = self.counters["cache_hits"] + self.counters["cache_misses"]
+        return dict(self.counters, cached=cached,
+                    hit_ratio=round(self.counters["cache_hits"] / lookups, 3) if lookups else None,
+                    stored=count_web_sessions(now_ms()))
+
+
+class SessionSweeper:
+    """Background thread deleting expired sessions every interval_s seconds."""
+
+    def __init__(self, app, store: SQLiteSessionInterface, interval_s: float = 600.0):
+        self.app = app
+        self.store = store
+        self.interval_s = interval_s
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = os.getpid()
+
+    def start(self) -> "SessionSweeper":
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = None
+            self._stop = threading.Event()
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="session-sweeper", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            try:
+                with self.app.app_context():
+                    self.store.sweep()
+            except Exception as e:
+                print(f'[ERROR] Session sweep failed: {e}')
+
+
+def init_sessions(app) -> Optional[SQLiteSessionInterface]:
+    """Install the SQLite session interface unless SESSION_BACKEND=cookie."""
+    if app.config.get("SESSION_BACKEND", "sqlite") != "sqlite":
+        return None
+    store = SQLiteSessionInterface(
+        cache_size=int(app.config.get("SESSION_CACHE_SIZE", 10000)),
+        cache_ttl_s=float(app.config.get("SESSION_CACHE_TTL_S", 5)),
+        touch_interval_s=float(app.config.get("SESSION_TOUCH_INTERVAL_S", 300)),
+        sweep_batch=int(app.config.get("SESSION_SWEEP_BATCH", 500)),
+    )
+    app.session_interface = store
+    app.extensions["session_store"] = store
+    return store
+
+
+def start_session_sweeper(app):
+    """Start (or restart after fork) the expired-session sweeper."""
+    store = app.extensions.get("session_store")
+    interval = float(app.config.get("SESSION_SWEEP_INTERVAL_S", 0) or 0)
+    if store is None or interval <= 0:
+        return
+    sweeper = app.extensions.get("session_sweeper")
+    if sweeper is None:
+        sweeper = app.extensions["session_sweeper"] = SessionSweeper(app, store, interval_s=interval)
+    sweeper.start()
+
+
+def stop_session_sweeper(app):
+    sweeper = app.extensions.get("session_sweeper")
+    if sweeper is not None:
+        sweeper.stop()
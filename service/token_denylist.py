@@ -0,0 +1,215 @@
+"""
+Revocation list for signed API tokens
+In-memory bloom filter kept in sync with the revoked_token table
+
+Verifying a token (service/auth_service.py) is a CPU-only check; this
+module keeps revocation on that path without a query per request:
+
+  * revoked token ids (logout, refresh rotation) go into a bloom filter.
+    A miss means "not revoked" for certain; a hit is confirmed with one
+    primary-key read, so false positives (JWT_DENYLIST_ERROR_RATE) only
+    cost a query, never a wrong answer
+  * 'user:<id>' rows (password, role or verification change) are kept in
+    an exact dict of per-user cutoffs: tokens issued before are refused
+
+A background thread per worker (started by init_worker) loads the rows
+added since the last id it saw every JWT_DENYLIST_SYNC_MS, so verifying a
+token never waits on SQLite. Rows are purged once the tokens they cover
+have expired; the filter is rebuilt from the remaining rows every
+JWT_DENYLIST_REBUILD_S (or when it grows past its capacity) so it does not
+fill up with dead entries.
+"""
+
+import hashlib
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from database.db import get_revoked_tokens, is_token_revoked, purge_revoked_tokens, revoke_token
+from database.timestamps import now_ms
+
+USER_PREFIX = "user:"
+
+
+class BloomFilter:
+    """Fixed-size bloom filter over strings (double hashing on blake2b)."""
+
+    def __init__(self, capacity: int = 100000, error_rate: float = 0.001):
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.bits = max(8, int(math.ceil(-self.capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.hashes = max(1, int(round(self.bits / self.capacity * math.log(2))))
+        self._array = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self._array[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        array = self._array
+        return all(array[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self._array)
+
+
+class TokenDenylist:
+    """Revoked token ids and per-user cutoffs, synced from SQLite."""
+
+    def __init__(self, capacity: int = 100000, error_rate: float = 0.001,
+                 sync_interval_ms: int = 1000, rebuild_interval_s: float = 3600.0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval_s = sync_interval_ms / 1000.0
+        self.rebuild_interval_s = rebuild_interval_s
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._users: Dict[str, int] = {}
+        self._last_id = 0
+        self._lock = threading.Lock()
+        self._last_rebuild = 0.0
+        self.counters = {"checks": 0, "bloom_hits": 0, "false_positives": 0, "revoked": 0,
+                         "syncs": 0, "rebuilds": 0, "rows_loaded": 0}
+
+    def revoke(self, jti: str, user_id: Any, expires_ms: int) -> bool:
+        """Deny one token until it expires (visible to this worker at once)."""
+        added = revoke_token(jti, None if user_id is None else str(user_id), expires_ms)
+        with self._lock:
+            if jti not in self._bloom:
+                self._bloom.add(jti)
+        return added
+
+    def is_revoked(self, claims: Dict[str, Any]) -> bool:
+        """True if the token was revoked, by id or by a newer user cutoff."""
+        self.counters["checks"] += 1
+        cutoff = self._users.get(str(claims.get("sub")))
+        if cutoff is not None and float(claims.get("iat", 0)) * 1000 < cutoff:
+            self.counters["revoked"] += 1
+            return True
+        jti = claims.get("jti")
+        if not jti or jti not in self._bloom:
+            return False
+        self.counters["bloom_hits"] += 1
+        if is_token_revoked(jti):
+            self.counters["revoked"] += 1
+            return True
+        self.counters["false_positives"] += 1
+        return False
+
+    def _load(self, rows, bloom: BloomFilter, users: Dict[str, int]):
+        for _, jti, revoked_ms in rows:
+            if jti.startswith(USER_PREFIX):
+                user_id = jti[len(USER_PREFIX):]
+                users[user_id] = max(users.get(user_id, 0), revoked_ms)
+            elif jti not in bloom:
+                bloom.add(jti)
+        self.counters["rows_loaded"] += len(rows)
+
+    def sync(self):
+        """Load rows revoked since the last sync, or purge and rebuild when due.
+
+        Needs an app context (DenylistSync runs it every sync interval).
+        """
+        now = time.monotonic()
+        if now - self._last_rebuild >= self.rebuild_interval_s or self._bloom.count > self.capacity:
+            self._rebuild(now)
+        else:
+            rows = get_revoked_tokens(self._last_id, now_ms())
+            if rows:
+                with self._lock:
+                    self._load(rows, self._bloom, self._users)
+                    self._last_id = rows[-1][0]
+        self.counters["syncs"] += 1
+
+    def _rebuild(self, now: float):
+        """Drop expired rows and rebuild the filter from the live ones."""
+        self._last_rebuild = now
+        purge_revoked_tokens(now_ms())
+        rows = get_revoked_tokens(0, now_ms())
+        live = sum(1 for row in rows if not row[1].startswith(USER_PREFIX))
+        # Leave room to grow before the next rebuild
+        self.capacity = max(self.capacity, 2 * live)
+        bloom, users = BloomFilter(self.capacity, self.error_rate), {}
+        self._load(rows, bloom, users)
+        with self._lock:
+            # Revocations made by this worker meanwhile are in the table too
+            self._bloom, self._users = bloom, users
+            self._last_id = rows[-1][0] if rows else self._last_id
+        self.counters["rebuilds"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        bloom = self._bloom
+        return dict(self.counters, denied_tokens=bloom.count, user_cutoffs=len(self._users),
+                    bloom_bytes=bloom.size_bytes, bloom_hashes=bloom.hashes, capacity=self.capacity)
+
+
+class DenylistSync:
+    """Background thread syncing the denylist every interval_s seconds."""
+
+    def __init__(self, app, denylist: TokenDenylist, interval_s: float = 1.0):
+        self.app = app
+        self.denylist = denylist
+        self.interval_s = interval_s
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = os.getpid()
+
+    def start(self) -> "DenylistSync":
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = None
+            self._stop = threading.Event()
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="token-denylist", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _sync(self):
+        try:
+            with self.app.app_context():
+                self.denylist.sync()
+        except Exception as e:
+            print(f'[ERROR] Token denylist sync failed: {e}')
+
+    def _run(self):
+        # Load the table at once: a fresh worker must not accept revoked tokens
+        self._sync()
+        while not self._stop.wait(self.interval_s):
+            self._sync()
+
+
+def start_denylist_sync(app):
+    """Start (or restart after fork) the periodic denylist sync."""
+    tokens = app.extensions.get("tokens")
+    denylist = tokens.denylist if tokens is not None else None
+    if denylist is None or denylist.sync_interval_s <= 0:
+        return
+    syncer = app.extensions.get("token_denylist_sync")
+    if syncer is None:
+        syncer = app.extensions["token_denylist_sync"] = DenylistSync(
+            app, denylist, interval_s=denylist.sync_interval_s)
+    syncer.start()
+
+
+def stop_denylist_sync(app):
+    syncer = app.extensions.get("token_denylist_sync")
+    if syncer is not None:
+        syncer.stop()
+
@@ -0,0 +1,227 @@
+"""
+Gemini token metering and daily quotas
+Aggregates usage in memory, flushes it to SQLite in batched upserts
+
+Every reply served by GeminiService reports its prompt and output token
+counts (usage_metadata). UsageMeter adds them to in-memory counters per
+UTC day, for the day as a whole, the user (logged-in users) and the chat
+session. A background thread flushes the deltas every
+USAGE_FLUSH_INTERVAL_S seconds as one executemany upsert into token_usage.
+
+Quotas (USAGE_DAILY_QUOTAS, tokens per day by role class, 0 = unlimited)
+are checked before the call against the in-memory total of each subject:
+a dict lookup, plus one primary-key read the first time a worker sees the
+subject that day. A logged-in user is limited as a user. An anonymous
+caller is limited both by remote address ('client') and by its chat
+session, so dropping the cookie or inventing a session id does not reset
+the quota (guests behind one NAT share the client quota). Flushes refresh those totals from the table, so usage
+from other workers is counted within a flush interval.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from database.db import add_token_usage, get_token_usage, get_token_usage_report
+from service.admission import parse_class_map
+
+DEFAULT_QUOTAS = {"admin": 0.0, "student": 200000.0, "guest": 20000.0}
+
+# (day, scope, subject)
+Key = Tuple[str, str, str]
+
+
+def utc_day(ts: Optional[float] = None) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(ts))
+
+
+def seconds_until_tomorrow(ts: Optional[float] = None) -> int:
+    now = time.time() if ts is None else ts
+    return int(86400 - now % 86400) + 1
+
+
+def quota_subjects(user_id, session_id, client=None) -> List[Tuple[str, str]]:
+    """Whose quotas a chat request counts against: the user, else the client address and session.
+
+    session_id must be a server-side session (validated by the caller).
+    """
+    if user_id is not None:
+        return [("user", str(user_id))]
+    subjects = []
+    if client:
+        subjects.append(("client", str(client)))
+    if session_id:
+        subjects.append(("session", str(session_id)))
+    return subjects
+
+
+class UsageMeter:
+    """In-memory token counters with batched persistence and quota checks."""
+
+    def __init__(self, quotas: Optional[Dict[str, float]] = None):
+        self.quotas = dict(DEFAULT_QUOTAS if quotas is None else quotas)
+        # Deltas not yet written: key -> [prompt, output, calls]
+        self._pending: Dict[Key, List[int]] = {}
+        # Known totals of quota subjects (table + pending), today only
+        self._totals: Dict[Key, int] = {}
+        self._lock = threading.Lock()
+        self.counters = {"calls": 0, "prompt_tokens": 0, "output_tokens": 0,
+                         "flushes": 0, "rows_flushed": 0, "rejected": 0}
+
+    def check(self, role: str, *subjects: Tuple[str, str]) -> Optional[int]:
+        """None if the call may go ahead, else seconds until the quota resets.
+
+        The call is refused as soon as one of the subjects used up its quota.
+        """
+        quota = self.quotas.get(role, 0)
+        if quota <= 0:
+            return None
+        day = utc_day()
+        for subject in subjects:
+            if subject is not None and self._used((day,) + tuple(subject)) >= quota:
+                self.counters["rejected"] += 1
+                return seconds_until_tomorrow()
+        return None
+
+    def _used(self, key: Key) -> int:
+        with self._lock:
+            used = self._totals.get(key)
+        if used is None:
+            stored = get_token_usage(*key)
+            with self._lock:
+                pending = self._pending.get(key)
+                used = self._totals.setdefault(key, stored + (pending[0] + pending[1] if pending else 0))
+        return used
+
+    def record(self, user_id, session_id, prompt_tokens: int, output_tokens: int, client=None):
+        """Count one generation for the day, its user (else its client address) and its session."""
+        day = utc_day()
+        keys = [(day, "day", "")]
+        if user_id is not None:
+            keys.append((day, "user", str(user_id)))
+        elif client:
+            keys.append((day, "client", str(client)))
+        if session_id:
+            keys.append((day, "session", str(session_id)))
+        with self._lock:
+            for key in keys:
+                delta = self._pending.get(key)
+                if delta is None:
+                    delta = self._pending[key] = [0, 0, 0]
+                delta[0] += prompt_tokens
+                delta[1] += output_tokens
+                delta[2] += 1
+                if key in self._totals:
+                    self._totals[key] += prompt_tokens + output_tokens
+            self.counters["calls"] += 1
+            self.counters["prompt_tokens"] += prompt_tokens
+            self.counters["output_tokens"] += output_tokens
+
+    def flush(self) -> int:
+        """Write pending deltas in one transaction, return the number of rows."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        rows = [key + tuple(delta) for key, delta in pending.items()]
+        try:
+            totals = add_token_usage(rows)
+        except Exception:
+            # Keep the deltas for the next flush
+            with self._lock:
+                for key, delta in pending.items():
+                    current = self._pending.setdefault(key, [0, 0, 0])
+                    for i in range(3):
+                        current[i] += delta[i]
+            raise
+        today = utc_day()
+        with self._lock:
+            for key in [k for k in self._totals if k[0] != today]:
+                del self._totals[key]
+            for key, total in totals.items():
+                if key in self._totals:
+                    # Table total (all workers) plus what was recorded since the swap
+                    newer = self._pending.get(key)
+                    self._totals[key] = total + (newer[0] + newer[1] if newer else 0)
+            self.counters["flushes"] += 1
+            self.counters["rows_flushed"] += len(rows)
+        return len(rows)
+
+    def report(self, days: int = 7, top: int = 20) -> Dict[str, Any]:
+        self.flush()
+        since = utc_day(time.time() - (days - 1) * 86400)
+        return dict(get_token_usage_report(since, top=top), quotas=self.quotas)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = len(self._pending)
+            tracked = len(self._totals)
+        return dict(self.counters, pending_rows=pending, tracked_subjects=tracked)
+
+
+class UsageFlusher:
+    """Background thread flushing the meter every interval_s seconds."""
+
+    def __init__(self, app, meter: UsageMeter, interval_s: float = 5.0):
+        self.app = app
+        self.meter = meter
+        self.interval_s = interval_s
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = os.getpid()
+
+    def start(self) -> "UsageFlusher":
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = None
+            self._stop = threading.Event()
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="usage-flush", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._flush()
+
+    def _flush(self):
+        try:
+            with self.app.app_context():
+                self.meter.flush()
+        except Exception as e:
+            print(f'[ERROR] Token usage flush failed: {e}')
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            self._flush()
+
+
+def init_usage(app) -> UsageMeter:
+    """Attach the token meter to the Flask app."""
+    meter = UsageMeter(parse_class_map(app.config.get("USAGE_DAILY_QUOTAS"), DEFAULT_QUOTAS))
+    app.extensions["usage"] = meter
+    return meter
+
+
+def start_usage_flusher(app):
+    """Start (or restart after fork) the periodic usage flush."""
+    meter = app.extensions.get("usage")
+    interval = float(app.config.get("USAGE_FLUSH_INTERVAL_S", 0) or 0)
+    if meter is None or interval <= 0:
+        return
+    flusher = app.extensions.get("usage_flusher")
+    if flusher is None:
+        flusher = app.extensions["usage_flusher"] = UsageFlusher(app, meter, interval_s=interval)
+    flusher.start()
+
+
+def stop_usage_flusher(app):
+    """Stop the flush thread and write what is still pending."""
+    flusher = app.extensions.get("usage_flusher")
+    if flusher is not None:
+        flusher.stop()
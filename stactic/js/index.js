@@ -26,11 +26,18 @@ const elements = {
     retryBtn: null
 };
 
+// Windowed message list (created in initializeElements)
+let messageList = null;
+
+// Persistent chat WebSocket (null when unsupported or not served; HTTP is used instead)
+let chatSocket = null;
+
 // Initialize app when DOM is loaded
 document.addEventListener('DOMContentLoaded', () => {
     initializeElements();
     attachEventListeners();
     loadChatHistory();
+    chatSocket = ChatSocket.create();
     
     // Focus on input
     elements.messageInput.focus();
@@ -52,6 +59,12 @@ function initializeElements() {
     elements.errorMessage = document.getElementById('errorMessage');
     elements.errorDetails = document.getElementById('errorDetails');
     elements.retryBtn = document.getElementById('retryBtn');
+
+    const scroller = document.querySelector('.main-content');
+    if (elements.messagesWrapper && scroller) {
+        messageList = new MessageList(elements.messagesWrapper, scroller);
+        state.messages = messageList.items;
+    }
 }
 
 /**
@@ -140,15 +153,9 @@ async function sendMessageToBot(message) {
     hideError();
     
     try {
-        const response = await fetch('/api/chat', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                message: message,
-                session_id: state.sessionId
-            })
+        const response = await sendChat({
+            message: message,
+            session_id: state.sessionId
         });
         
         if (!response.ok) {
@@ -180,6 +187,257 @@ async function sendMessageToBot(message) {
     }
 }
 
+// Retry policy for /api/chat: the Idempotency-Key makes resending safe
+const CHAT_MAX_ATTEMPTS = 4;
+const CHAT_RETRY_BASE_MS = 500;
+const CHAT_RETRY_STATUSES = [408, 409, 425, 429, 503, 504];
+// Total time the UI waits for a reply, retries included
+const CHAT_BUDGET_MS = 45000;
+// Extra wait after the server-side deadline before aborting locally
+const CHAT_ABORT_GRACE_MS = 1000;
+
+/**
+ * Generate a unique Idempotency-Key for one logical chat request
+ */
+function newIdempotencyKey() {
+    if (typeof crypto !== 'undefined' && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    const random = () => Math.random().toString(36).slice(2, 10);
+    return `${Date.now().toString(36)}-${random()}-${random()}`;
+}
+
+/**
+ * Delay before retry number `attempt` (1-based): exponential with jitter,
+ * never shorter than the server's Retry-After
+ */
+function retryDelay(attempt, retryAfterHeader) {
+    const base = CHAT_RETRY_BASE_MS * 2 ** (attempt - 1);
+    const delay = base / 2 + Math.random() * base;
+    const retryAfter = Number(retryAfterHeader) * 1000;
+    return Number.isFinite(retryAfter) && retryAfter > delay ? retryAfter : delay;
+}
+
+/**
+ * POST to /api/chat, retrying network failures and transient statuses.
+ * Every attempt carries the same Idempotency-Key, so a retry after a lost
+ * response replays the server's reply instead of generating a new one.
+ */
+async function postChat(payload, key = newIdempotencyKey()) {
+    const body = JSON.stringify(payload);
+    const expiresAt = Date.now() + CHAT_BUDGET_MS;
+    let lastError = new Error('Délai de réponse dépassé');
+    let lastResponse = null;
+    let retryAfter = null;
+    
+    for (let attempt = 0; attempt < CHAT_MAX_ATTEMPTS; attempt++) {
+        if (attempt > 0) {
+            const delay = retryDelay(attempt, retryAfter);
+            if (Date.now() + delay >= expiresAt) {
+                break;
+            }
+            await new Promise(resolve => setTimeout(resolve, delay));
+        }
+        // The server stops working on the request once this budget is spent
+        const remaining = expiresAt - Date.now();
+        const controller = typeof AbortController !== 'undefined' ? new AbortController() : null;
+        const abortTimer = controller
+            ? setTimeout(() => controller.abort(), remaining + CHAT_ABORT_GRACE_MS)
+            : null;
+        try {
+            const response = await fetch('/api/chat', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'Idempotency-Key': key,
+                    'X-Request-Deadline-Ms': String(remaining)
+                },
+                body: body,
+                signal: controller ? controller.signal : undefined
+            });
+            const lastAttempt = attempt === CHAT_MAX_ATTEMPTS - 1 || Date.now() >= expiresAt;
+            if (response.ok || lastAttempt || !CHAT_RETRY_STATUSES.includes(response.status)) {
+                return response;
+            }
+            lastResponse = response;
+            retryAfter = response.headers.get('Retry-After');
+        } catch (error) {
+            // Network failure or local abort: the server may already have the reply
+            lastError = error;
+            retryAfter = null;
+        } finally {
+            clearTimeout(abortTimer);
+        }
+    }
+    if (lastResponse) {
+        return lastResponse;
+    }
+    throw lastError;
+}
+
+/**
+ * Send one chat message over the WebSocket when it is open, else over HTTP.
+ * Resolves to a Response-like object ({ ok, status, statusText, json() }).
+ * The first message of a conversation always goes over HTTP so the server
+ * can set the session cookie, which a WebSocket cannot do.
+ */
+async function sendChat(payload) {
+    const key = newIdempotencyKey();
+    if (chatSocket && chatSocket.isOpen() && payload.session_id) {
+        try {
+            const result = await chatSocket.chat(payload, key);
+            if (result.ok || !CHAT_RETRY_STATUSES.includes(result.status)) {
+                return result;
+            }
+        } catch (error) {
+            // Connection lost: retry over HTTP with the same key (no double reply)
+            console.warn('WebSocket indisponible, repli sur HTTP:', error.message);
+        }
+    }
+    return postChat(payload, key);
+}
+
+// WebSocket reconnection backoff (ms)
+const SOCKET_RETRY_BASE_MS = 1000;
+const SOCKET_RETRY_MAX_MS = 30000;
+// Give up (HTTP only) if the server never accepted the socket after this many attempts;
+// a worker at its WS_MAX_CONNECTIONS cap refuses the upgrade (503)
+const SOCKET_MAX_FAILURES = 2;
+
+/**
+ * One WebSocket per tab to /ws/chat. Several messages may be in flight; each
+ * frame carries an id and is answered with a reply or error frame of the same
+ * id. Typing events from the server drive the loading indicator.
+ */
+class ChatSocket {
+    static create() {
+        if (typeof WebSocket === 'undefined' || typeof location === 'undefined') {
+            return null;
+        }
+        // Opt-in per deployment (WS_ENABLED): each socket holds a server thread
+        if (typeof document === 'undefined' || document.body.dataset.wsChat !== 'true') {
+            return null;
+        }
+        const scheme = location.protocol === 'https:' ? 'wss' : 'ws';
+        const socket = new ChatSocket(`${scheme}://${location.host}/ws/chat`);
+        socket.connect();
+        return socket;
+    }
+
+    constructor(url) {
+        this.url = url;
+        this.ws = null;
+        this.ready = false;
+        this.nextId = 1;
+        this.pending = new Map();
+        this.failures = 0;
+        this.everReady = false;
+    }
+
+    isOpen() {
+        return this.ready && this.ws && this.ws.readyState === WebSocket.OPEN;
+    }
+
+    connect() {
+        let ws;
+        try {
+            ws = new WebSocket(this.url);
+        } catch (error) {
+            this.scheduleReconnect();
+            return;
+        }
+        this.ws = ws;
+        ws.addEventListener('message', (event) => this.onFrame(event.data));
+        ws.addEventListener('close', () => this.onClose());
+    }
+
+    scheduleReconnect() {
+        this.failures++;
+        if (!this.everReady && this.failures >= SOCKET_MAX_FAILURES) {
+            return;
+        }
+        const delay = Math.min(SOCKET_RETRY_MAX_MS, SOCKET_RETRY_BASE_MS * 2 ** (this.failures - 1));
+        setTimeout(() => this.connect(), delay / 2 + Math.random() * delay / 2);
+    }
+
+    onClose() {
+        const wasReady = this.ready;
+        this.ready = false;
+        this.ws = null;
+        this.pending.forEach(({ reject, timer }) => {
+            clearTimeout(timer);
+            reject(new Error('Connexion WebSocket fermée'));
+        });
+        this.pending.clear();
+        if (wasReady) {
+            this.failures = 0;
+        }
+        this.scheduleReconnect();
+    }
+
+    onFrame(raw) {
+        let frame;
+        try {
+            frame = JSON.parse(raw);
+        } catch (error) {
+            return;
+        }
+        if (frame.type === 'ready') {
+            this.ready = true;
+            this.everReady = true;
+            this.failures = 0;
+            return;
+        }
+        const request = this.pending.get(frame.id);
+        if (!request) {
+            return;
+        }
+        if (frame.type === 'typing') {
+            showLoading();
+        } else if (frame.type === 'reply' || frame.type === 'error') {
+            this.pending.delete(frame.id);
+            clearTimeout(request.timer);
+            request.resolve(ChatSocket.toResponse(frame));
+        }
+    }
+
+    /**
+     * Send one chat frame; rejects if the connection drops or the budget
+     * runs out, so the caller can fall back to HTTP.
+     */
+    chat(payload, key) {
+        return new Promise((resolve, reject) => {
+            const id = `m${this.nextId++}`;
+            const timer = setTimeout(() => {
+                this.pending.delete(id);
+                reject(new Error('Délai de réponse dépassé'));
+            }, CHAT_BUDGET_MS + CHAT_ABORT_GRACE_MS);
+            this.pending.set(id, { resolve, reject, timer });
+            this.ws.send(JSON.stringify({
+                type: 'chat',
+                id: id,
+                message: payload.message,
+                session_id: payload.session_id,
+                idempotency_key: key,
+                deadline_ms: CHAT_BUDGET_MS
+            }));
+        });
+    }
+
+    static toResponse(frame) {
+        const ok = frame.type === 'reply';
+        const body = ok
+            ? { reply: frame.reply, session_id: frame.session_id }
+            : { error: frame.error, retry_after: frame.retry_after };
+        return {
+            ok: ok,
+            status: ok ? 200 : frame.status,
+            statusText: ok ? 'OK' : (frame.error || ''),
+            json: async () => body
+        };
+    }
+}
+
 /**
  * Add message to chat UI
  */
@@ -190,16 +448,11 @@ function addMessage(role, content) {
         timestamp: new Date()
     };
     
-    state.messages.push(message);
-    
-    const messageElement = createMessageElement(message);
-    
-    // Ensure messages wrapper exists and is ready
-    if (elements.messagesWrapper) {
-        elements.messagesWrapper.appendChild(messageElement);
-        
-        // Scroll to bottom
-        scrollToBottom();
+    if (messageList) {
+        // The list owns state.messages and renders it on the next frame
+        messageList.append(message);
+    } else {
+        state.messages.push(message);
     }
 }
 
@@ -223,19 +476,229 @@ function createMessageElement(message) {
     
     const textDiv = document.createElement('div');
     textDiv.className = 'message-text';
-    textDiv.textContent = message.content;
     contentDiv.appendChild(textDiv);
     
     const timestamp = document.createElement('div');
     timestamp.className = 'message-timestamp';
-    timestamp.textContent = formatTimestamp(message.timestamp, message.role);
     contentDiv.appendChild(timestamp);
     
     messageDiv.appendChild(contentDiv);
     
+    // Keep references so recycled nodes can be rebound without queries
+    messageDiv.textNode = textDiv;
+    messageDiv.timestampNode = timestamp;
+    bindMessageElement(messageDiv, message);
+    
     return messageDiv;
 }
 
+/**
+ * Fill a (new or recycled) message element with a message
+ */
+function bindMessageElement(messageDiv, message) {
+    messageDiv.textNode.textContent = message.content;
+    messageDiv.timestampNode.textContent = formatTimestamp(message.timestamp, message.role);
+}
+
+/**
+ * Windowed message list.
+ *
+ * Only the messages around the visible part of the scroller are kept in the
+ * DOM; two spacers stand in for the rest so the scrollbar still reflects the
+ * whole conversation. Heights are measured once a message has been rendered
+ * and estimated before that. Nodes leaving the window go to a per-role pool
+ * and are rebound to other messages instead of being rebuilt.
+ *
+ * All DOM work happens in one requestAnimationFrame callback: appending a
+ * whole history costs one render and one layout, not one per message.
+ */
+class MessageList {
+    constructor(wrapper, scroller, options = {}) {
+        this.wrapper = wrapper;
+        this.scroller = scroller;
+        this.items = [];
+        this.heights = [];
+        this.estimate = options.estimate || 96;
+        this.overscan = options.overscan || 6;
+        this.rendered = new Map();
+        this.pool = {};
+        this.animateFrom = 0;
+        this.stickToBottom = true;
+        this.frame = null;
+
+        this.topSpacer = document.createElement('div');
+        this.topSpacer.className = 'message-spacer';
+        this.bottomSpacer = document.createElement('div');
+        this.bottomSpacer.className = 'message-spacer';
+        wrapper.appendChild(this.topSpacer);
+        wrapper.appendChild(this.bottomSpacer);
+
+        scroller.addEventListener('scroll', () => {
+            const distance = scroller.scrollHeight - scroller.scrollTop - scroller.clientHeight;
+            this.stickToBottom = distance < this.estimate;
+            this.schedule();
+        }, { passive: true });
+        if (typeof window !== 'undefined') {
+            // Text reflows on width changes: measured heights are stale
+            window.addEventListener('resize', debounce(() => {
+                this.heights.fill(0);
+                this.schedule();
+            }, 100));
+        }
+    }
+
+    /** Append one live message (animated) and stay at the bottom. */
+    append(message) {
+        this.items.push(message);
+        this.heights.push(0);
+        this.stickToBottom = true;
+        this.schedule();
+    }
+
+    /** Append many messages (history) without entrance animation. */
+    appendMany(messages) {
+        for (const message of messages) {
+            this.items.push(message);
+            this.heights.push(0);
+        }
+        this.animateFrom = this.items.length;
+        this.stickToBottom = true;
+        this.schedule();
+    }
+
+    /** Drop every message and recycle their nodes. */
+    reset() {
+        for (const [index, node] of this.rendered) {
+            this.release(index, node);
+        }
+        this.rendered.clear();
+        this.items.length = 0;
+        this.heights.length = 0;
+        this.animateFrom = 0;
+        this.stickToBottom = true;
+        this.topSpacer.style.height = '0px';
+        this.bottomSpacer.style.height = '0px';
+    }
+
+    schedule() {
+        if (this.frame === null) {
+            this.frame = requestAnimationFrame(() => this.render());
+        }
+    }
+
+    /** Render synchronously (tests / benchmarks). */
+    flush() {
+        if (this.frame !== null) {
+            cancelAnimationFrame(this.frame);
+        }
+        this.render();
+    }
+
+    heightOf(index) {
+        return this.heights[index] || this.estimate;
+    }
+
+    render() {
+        this.frame = null;
+        const count = this.items.length;
+
+        // Reads first: scroll position and viewport size
+        const viewportHeight = this.scroller.clientHeight || 800;
+        let total = 0;
+        for (let i = 0; i < count; i++) {
+            total += this.heightOf(i);
+        }
+        let viewTop;
+        if (this.stickToBottom) {
+            viewTop = Math.max(0, total - viewportHeight);
+        } else {
+            viewTop = Math.max(0, this.scroller.scrollTop - this.wrapper.offsetTop);
+        }
+
+        let start = 0;
+        let offset = 0;
+        while (start < count && offset + this.heightOf(start) <= viewTop) {
+            offset += this.heightOf(start);
+            start++;
+        }
+        let end = start;
+        let bottom = offset;
+        while (end < count && bottom < viewTop + viewportHeight) {
+            bottom += this.heightOf(end);
+            end++;
+        }
+        const first = Math.max(0, start - this.overscan);
+        const last = Math.min(count, end + this.overscan);
+        for (let i = first; i < start; i++) {
+            offset -= this.heightOf(i);
+        }
+        for (let i = end; i < last; i++) {
+            bottom += this.heightOf(i);
+        }
+
+        // Writes: recycle nodes that left the window, then fill it in order
+        for (const [index, node] of this.rendered) {
+            if (index < first || index >= last) {
+                this.release(index, node);
+                this.rendered.delete(index);
+            }
+        }
+        let cursor = this.topSpacer.nextSibling;
+        for (let i = first; i < last; i++) {
+            let node = this.rendered.get(i);
+            if (!node) {
+                node = this.acquire(this.items[i]);
+                node.classList.toggle('message-static', i < this.animateFrom);
+                this.rendered.set(i, node);
+            }
+            if (node === cursor) {
+                cursor = cursor.nextSibling;
+            } else {
+                this.wrapper.insertBefore(node, cursor);
+            }
+        }
+        this.topSpacer.style.height = `${offset}px`;
+        this.bottomSpacer.style.height = `${total - bottom}px`;
+        this.animateFrom = Math.max(this.animateFrom, count);
+
+        // One layout: measure what was rendered
+        let changed = false;
+        for (const [index, node] of this.rendered) {
+            const height = node.offsetHeight + MessageList.GAP;
+            if (height !== this.heights[index]) {
+                this.heights[index] = height;
+                changed = true;
+            }
+        }
+        if (this.stickToBottom) {
+            this.scroller.scrollTop = this.scroller.scrollHeight;
+        }
+        if (changed) {
+            // Estimates were replaced by real heights: settle spacers next frame
+            this.schedule();
+        }
+    }
+
+    acquire(message) {
+        const pool = this.pool[message.role];
+        if (pool && pool.length) {
+            const node = pool.pop();
+            bindMessageElement(node, message);
+            return node;
+        }
+        return createMessageElement(message);
+    }
+
+    release(index, node) {
+        this.wrapper.removeChild(node);
+        const role = this.items[index].role;
+        (this.pool[role] = this.pool[role] || []).push(node);
+    }
+}
+
+// .message margin-bottom in styles.css
+MessageList.GAP = 24;
+
 /**
  * Format timestamp for display
  */
@@ -251,11 +714,9 @@ function formatTimestamp(date, role) {
  * Scroll chat to bottom
  */
 function scrollToBottom() {
-    const mainContent = document.querySelector('.main-content');
-    if (mainContent) {
-        setTimeout(() => {
-            mainContent.scrollTop = mainContent.scrollHeight;
-        }, 100);
+    if (messageList) {
+        messageList.stickToBottom = true;
+        messageList.schedule();
     }
 }
 
@@ -319,18 +780,15 @@ function startNewChat() {
     
     if (confirm('Voulez-vous vraiment démarrer une nouvelle conversation ? Les messages actuels seront effacés.')) {
         // Clear state completely
-        state.messages = [];
+        if (messageList) {
+            messageList.reset();
+            state.messages = messageList.items;
+        } else {
+            state.messages = [];
+        }
         state.sessionId = null;
         state.isLoading = false;
         
-        // Clear UI - force remove all message elements
-        if (elements.messagesWrapper) {
-            // Remove all child nodes
-            while (elements.messagesWrapper.firstChild) {
-                elements.messagesWrapper.removeChild(elements.messagesWrapper.firstChild);
-            }
-        }
-        
         // Reset chat container visibility
         if (elements.chatContainer) {
             elements.chatContainer.classList.remove('active');
@@ -394,10 +852,17 @@ async function loadChatHistory() {
             elements.emptyState.classList.add('hidden');
             elements.chatContainer.classList.add('active');
             
-            // Load messages
-            data.messages.forEach(msg => {
-                addMessage(msg.role, msg.content);
-            });
+            // Load messages: one batch, rendered in a single frame
+            const messages = data.messages.map(msg => ({
+                role: msg.role,
+                content: msg.content,
+                timestamp: new Date()
+            }));
+            if (messageList) {
+                messageList.appendMany(messages);
+            } else {
+                state.messages.push(...messages);
+            }
             
             if (data.session_id) {
                 state.sessionId = data.session_id;
@@ -429,6 +894,9 @@ if (typeof module !== 'undefined' && module.exports) {
     module.exports = {
         handleSendMessage,
         addMessage,
+        createMessageElement,
+        MessageList,
+        ChatSocket,
         formatTimestamp,
         startNewChat
     };
@@ -0,0 +1,207 @@
+"""Test priority admission control for /api/chat.
+Run: python test/test_admission.py
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from flask import session
+
+from app import create_app
+from database.db import create_user, update_user_role
+from route.auth_routes import request_identity
+from service import gemini_service as svc_module
+from service.admission import AdmissionController, AdmissionRejected, parse_class_map, request_class
+from service.gemini_service import GeminiService
+
+
+def _queue(controller, cls, order, max_wait=None):
+    """Start a thread that waits for a slot, records its class and releases."""
+    def run():
+        started = controller.acquire(cls, max_wait)
+        order.append(cls)
+        controller.release(cls, started)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def _wait_queued(controller, count):
+    for _ in range(200):
+        if controller.stats()["queued"] == count:
+            return
+        time.sleep(0.005)
+    raise AssertionError(f"expected {count} queued requests")
+
+
+def test_priority_order():
+    controller = AdmissionController(capacity=1, shares={"admin": 1, "student": 1, "guest": 1})
+    started = controller.acquire("student")
+    order = []
+    threads = []
+    for cls in ("guest", "student", "admin"):
+        threads.append(_queue(controller, cls, order))
+        _wait_queued(controller, len(threads))
+    controller.release("student", started)
+    for thread in threads:
+        thread.join(2)
+    assert order == ["admin", "student", "guest"], order
+    print('[PASS] Higher classes admitted first OK')
+
+
+def test_class_share_limits_guests():
+    controller = AdmissionController(capacity=4, shares={"admin": 1.0, "student": 0.8, "guest": 0.5})
+    guests = [controller.acquire("guest") for _ in range(2)]
+    order = []
+    waiting = _queue(controller, "guest", order)
+    _wait_queued(controller, 1)
+    # Two slots are still free, but only for the other classes
+    student = controller.acquire("student")
+    assert controller.stats()["classes"]["guest"]["queued"] == 1
+    controller.release("guest", guests[0])
+    waiting.join(2)
+    assert order == ["guest"]
+    controller.release("guest", guests[1])
+    controller.release("student", student)
+    print('[PASS] Guest share of capacity enforced OK')
+
+
+def test_queue_full_evicts_lower_class():
+    controller = AdmissionController(capacity=1, max_queue=1)
+    started = controller.acquire("admin")
+    errors = []
+
+    def guest():
+        try:
+            controller.acquire("guest")
+        except AdmissionRejected as e:
+            errors.append(e.reason)
+
+    thread = threading.Thread(target=guest)
+    thread.start()
+    _wait_queued(controller, 1)
+    try:
+        controller.acquire("guest", 0.1)
+        raise AssertionError("queue is full")
+    except AdmissionRejected as e:
+        assert e.reason == "queue full"
+    order = []
+    student = _queue(controller, "student", order)
+    thread.join(2)
+    assert errors == ["evicted by higher-priority request"], errors
+    controller.release("admin", started)
+    student.join(2)
+    assert order == ["student"]
+    stats = controller.stats()["classes"]
+    assert stats["guest"]["queue_full"] == 1 and stats["guest"]["evicted"] == 1
+    print('[PASS] Full queue sheds the lowest class OK')
+
+
+def test_early_shedding_and_timeout():
+    controller = AdmissionController(capacity=1, max_wait_ms={"admin": 1000, "student": 1000, "guest": 100})
+    # Teach the controller that one generation takes about 2 s
+    controller.release("student", controller.acquire("student") - 2.0)
+    started = controller.acquire("student")
+    start = time.monotonic()
+    try:
+        controller.acquire("guest")
+        raise AssertionError("guest should be shed")
+    except AdmissionRejected as e:
+        assert e.reason == "estimated wait too long" and e.retry_after >= 2
+    assert time.monotonic() - start < 0.05
+
+    controller._service_s = 0.01
+    try:
+        controller.acquire("guest")
+        raise AssertionError("guest should time out")
+    except AdmissionRejected as e:
+        assert e.reason == "queue wait limit reached"
+    controller.release("student", started)
+    stats = controller.stats()
+    assert stats["queued"] == 0
+    assert stats["classes"]["guest"]["shed_early"] == 1
+    assert stats["classes"]["guest"]["timed_out"] == 1
+    print('[PASS] Early shedding and queue-time limit OK')
+
+
+def test_request_class_and_config():
+    assert request_class({}) == "guest"
+    assert request_class({"user_id": "u1"}) == "student"
+    assert request_class({"user_id": "u1", "user_role": "admin"}) == "admin"
+    shares = parse_class_map("guest:0.25, bogus:3", {"admin": 1.0, "guest": 0.5})
+    assert shares == {"admin": 1.0, "guest": 0.25}
+
+    # Cookie logins take their role from the users table, not from the session
+    app = create_app({"DB_PATH": os.path.join(tempfile.mkdtemp(), "class.db"), "TESTING": True})
+    with app.app_context():
+        admin_id = create_user("admin@example.com", "Admin", "hash")
+        update_user_role(admin_id, "admin")
+    with app.test_request_context():
+        session["user_id"] = admin_id
+        assert request_identity() == {"user_id": admin_id, "user_role": "admin"}
+        assert request_class(request_identity()) == "admin"
+    print('[PASS] Priority class and config parsing OK')
+
+
+def test_chat_returns_503_with_retry_after():
+    release = threading.Event()
+
+    class models:
+        @staticmethod
+        def generate_content(model, contents):
+            release.wait(5)
+            return SimpleNamespace(text="réponse")
+
+    svc = GeminiService()
+    svc.client = SimpleNamespace(models=models)
+    svc_module._gemini_service = svc
+    app = create_app({
+        "DB_PATH": os.path.join(tempfile.mkdtemp(), "admission.db"),
+        "TESTING": True,
+        "ADMISSION_CAPACITY": 1,
+        "ADMISSION_MAX_WAIT_MS": "guest:100",
+    })
+    statuses = []
+
+    def first():
+        with app.test_client() as http:
+            statuses.append(http.post('/api/chat', json={'message': 'Bonjour'}).status_code)
+
+    thread = threading.Thread(target=first)
+    thread.start()
+    controller = app.extensions["admission"]
+    for _ in range(200):
+        if controller.stats()["classes"]["guest"]["inflight"]:
+            break
+        time.sleep(0.005)
+    with app.test_client() as http:
+        resp = http.post('/api/chat', json={'message': 'Bonjour aussi'})
+        assert resp.status_code == 503, resp.status_code
+        assert int(resp.headers['Retry-After']) >= 1
+        release.set()
+        thread.join(5)
+        assert statuses == [200], statuses
+        stats = http.get('/api/ai/stats').get_json()["admission"]
+        assert stats["classes"]["guest"]["admitted"] == 1
+        assert stats["classes"]["guest"]["timed_out"] == 1
+    svc_module._gemini_service = None
+    print('[PASS] /api/chat 503 + Retry-After when shed OK')
+
+
+if __name__ == "__main__":
+    test_priority_order()
+    test_class_share_limits_guests()
+    test_queue_full_evicts_lower_class()
+    test_early_shedding_and_timeout()
+    test_request_class_and_config()
+    test_chat_returns_503_with_retry_after()
@@ -0,0 +1,50 @@
+"""Test the application factory and per-worker initialisation.
+Run: python test/test_app_factory.py
+"""
+
+import os
+import sys
+import tempfile
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from app import create_app, init_worker, shutdown_worker
+from database.db import create_session, session_exists
+
+
+def test_isolated_apps():
+    app_a = create_app({"DB_PATH": os.path.join(tempfile.mkdtemp(), "a.db"), "TESTING": True})
+    app_b = create_app({"DB_PATH": os.path.join(tempfile.mkdtemp(), "b.db"), "TESTING": True})
+    with app_a.app_context():
+        sid = create_session()
+        assert session_exists(sid)
+    with app_b.app_context():
+        assert not session_exists(sid)
+    with app_a.test_client() as client:
+        assert client.get('/app').status_code == 200
+    print('[PASS] Isolated app instances OK')
+
+
+def test_worker_init_is_idempotent():
+    app = create_app({
+        "DB_PATH": os.path.join(tempfile.mkdtemp(), "w.db"),
+        "DB_WRITE_BEHIND": True,
+    })
+    # Nothing runs in the (pre-fork) factory
+    assert "db_write_behind" not in app.extensions and "worker_pid" not in app.extensions
+    init_worker(app)
+    writer = app.extensions["db_write_behind"]
+    thread = writer._thread
+    init_worker(app, warm=True)
+    assert writer._thread is thread and thread.is_alive()
+    shutdown_worker(app)
+    assert writer._thread is None
+    print('[PASS] Worker init hooks OK')
+
+
+if __name__ == "__main__":
+    test_isolated_apps()
+    test_worker_init_is_idempotent()
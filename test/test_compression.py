@@ -0,0 +1,94 @@
+"""Test negotiated response compression (gzip / brotli).
+Run: python test/test_compression.py
+"""
+
+import gzip
+import os
+import sys
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from flask import Flask, Response, jsonify
+
+from service.compression import ResponseCompressor, brotli, choose_encoding
+
+
+def _make_app(**config):
+    app = Flask(__name__)
+    app.config.update(config)
+    ResponseCompressor(app)
+    payload = [{"role": "assistant", "content": "Bonjour, voici les étapes de la préinscription. " * 5}] * 20
+
+    @app.route("/big")
+    def big():
+        return jsonify({"messages": payload})
+
+    @app.route("/small")
+    def small():
+        return jsonify({"ok": True})
+
+    @app.route("/stream")
+    def stream():
+        def gen():
+            for i in range(50):
+                yield f'{{"n": {i}, "text": "ligne de conversation"}}\n'
+        return Response(gen(), mimetype="application/x-ndjson")
+
+    return app
+
+
+def test_choose_encoding():
+    assert choose_encoding("gzip, br", ("br", "gzip")) == "br"
+    assert choose_encoding("br;q=0.5, gzip", ("br", "gzip")) == "gzip"
+    assert choose_encoding("identity", ("br", "gzip")) is None
+    assert choose_encoding("*;q=0", ("br", "gzip")) is None
+    assert choose_encoding(None, ("gzip",)) is None
+    print('[PASS] Accept-Encoding negotiation OK')
+
+
+def test_gzip_buffered_and_threshold():
+    app = _make_app(COMPRESS_MIN_SIZE=200)
+    with app.test_client() as client:
+        resp = client.get("/big", headers={"Accept-Encoding": "gzip"})
+        assert resp.headers.get("Content-Encoding") == "gzip"
+        assert "Accept-Encoding" in resp.headers.get("Vary", "")
+        assert b"pr\\u00e9inscription" in gzip.decompress(resp.data)
+
+        small = client.get("/small", headers={"Accept-Encoding": "gzip"})
+        assert "Content-Encoding" not in small.headers
+
+        plain = client.get("/big")
+        assert "Content-Encoding" not in plain.headers
+    print('[PASS] gzip buffered compression OK')
+
+
+def test_streamed_response():
+    app = _make_app()
+    with app.test_client() as client:
+        resp = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+        assert resp.headers.get("Content-Encoding") == "gzip"
+        lines = gzip.decompress(resp.data).decode().splitlines()
+        assert len(lines) == 50
+    print('[PASS] Streamed compression OK')
+
+
+def test_brotli_when_available():
+    if brotli is None:
+        print('[SKIP] brotli not installed')
+        return
+    app = _make_app(COMPRESS_BROTLI_LEVEL=5)
+    with app.test_client() as client:
+        resp = client.get("/big", headers={"Accept-Encoding": "gzip, br"})
+        assert resp.headers.get("Content-Encoding") == "br"
+        assert b"messages" in brotli.decompress(resp.data)
+    print('[PASS] brotli compression OK')
+
+
+if __name__ == "__main__":
+    test_choose_encoding()
+    test_gzip_buffered_and_threshold()
+    test_streamed_response()
+    test_brotli_when_available()
@@ -0,0 +1,90 @@
+"""Test the single-writer / multi-reader SQLite connection architecture.
+Run: python test/test_db_pool.py
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from flask import Flask
+
+from database.db import init_db, create_session, add_message, get_messages, session_exists
+from database.pool import get_pools, retry_busy
+
+
+def _make_app():
+    app = Flask(__name__)
+    app.config["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "pool.db")
+    init_db(app)
+    return app
+
+
+def test_readers_are_read_only():
+    app = _make_app()
+    pools = get_pools(app.config["DB_PATH"])
+    with pools.reader.connection() as conn:
+        try:
+            conn.execute("INSERT INTO session (uuid) VALUES ('x')")
+        except sqlite3.OperationalError as e:
+            assert "readonly" in str(e).lower() or "read-only" in str(e).lower(), e
+        else:
+            raise AssertionError("read-only connection accepted a write")
+    print('[PASS] Read pool is read-only OK')
+
+
+def test_concurrent_writers_do_not_lock():
+    app = _make_app()
+    with app.app_context():
+        sid = create_session()
+    errors = []
+
+    def writer(n):
+        try:
+            with app.app_context():
+                for i in range(30):
+                    add_message(sid, 'user', f'{n}-{i}')
+                    assert session_exists(sid)
+        except Exception as e:  # pragma: no cover - reported below
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors, errors
+    with app.app_context():
+        assert len(get_messages(sid)) == 240
+    print('[PASS] Serialized writer under contention OK')
+
+
+def test_retry_busy():
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise sqlite3.OperationalError("database is locked")
+        return "ok"
+
+    assert retry_busy(flaky, backoff_ms=1) == "ok" and len(calls) == 3
+    try:
+        retry_busy(lambda: (_ for _ in ()).throw(sqlite3.OperationalError("no such table: x")))
+    except sqlite3.OperationalError:
+        pass
+    else:
+        raise AssertionError("non-busy errors must not be retried")
+    print('[PASS] SQLITE_BUSY retry OK')
+
+
+if __name__ == "__main__":
+    test_readers_are_read_only()
+    test_concurrent_writers_do_not_lock()
+    test_retry_busy()
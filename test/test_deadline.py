@@ -0,0 +1,113 @@
+"""Test per-request deadlines for /api/chat and GeminiService.
+Run: python test/test_deadline.py
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from app import create_app
+from service import gemini_service as svc_module
+from service.deadline import Deadline, DeadlineExceeded
+from service.gemini_service import GeminiService
+
+
+class SlowClient:
+    """Fake client that hangs for `delay` seconds, or fails with 503."""
+
+    def __init__(self, delay=0.0, overloaded=False):
+        self.calls = 0
+        self.release = threading.Event()
+        outer = self
+
+        class models:
+            @staticmethod
+            def generate_content(model, contents):
+                outer.calls += 1
+                if overloaded:
+                    raise Exception("503 UNAVAILABLE: The model is overloaded.")
+                outer.release.wait(delay)
+                return SimpleNamespace(text="réponse tardive")
+
+        self.models = models
+
+
+def _service(client, **attrs):
+    svc = GeminiService()
+    svc.client = client
+    for name, value in attrs.items():
+        setattr(svc, name, value)
+    return svc
+
+
+def test_deadline_budget():
+    assert Deadline.from_header(None, 30000, 60000).budget_ms == 30000
+    assert Deadline.from_header("500", 30000, 60000).budget_ms == 500
+    assert Deadline.from_header("999999", 30000, 60000).budget_ms == 60000
+    assert Deadline.from_header("abc", 30000, 60000).budget_ms == 30000
+    expired = Deadline(0)
+    assert expired.expired() and expired.remaining() == 0
+    try:
+        expired.check()
+        raise AssertionError("check() should raise")
+    except DeadlineExceeded:
+        pass
+    print('[PASS] Deadline budget OK')
+
+
+def test_hung_call_released_at_deadline():
+    client = SlowClient(delay=5)
+    svc = _service(client)
+    start = time.monotonic()
+    try:
+        svc.generate_reply("Bonjour", [], deadline=Deadline(200))
+        raise AssertionError("should have timed out")
+    except DeadlineExceeded:
+        pass
+    elapsed = time.monotonic() - start
+    client.release.set()
+    assert elapsed < 1.0, elapsed
+    print('[PASS] Hung upstream call abandoned at the deadline OK')
+
+
+def test_retries_stop_when_budget_is_spent():
+    client = SlowClient(overloaded=True)
+    svc = _service(client, max_retries=10, retry_delay_ms=300)
+    start = time.monotonic()
+    try:
+        svc.generate_reply("Bonjour", [], deadline=Deadline(500))
+        raise AssertionError("should have timed out")
+    except DeadlineExceeded:
+        pass
+    assert time.monotonic() - start < 0.6
+    assert client.calls < 11
+    print('[PASS] Retries bounded by the deadline OK')
+
+
+def test_chat_returns_504():
+    client = SlowClient(delay=5)
+    svc_module._gemini_service = _service(client)
+    app = create_app({"DB_PATH": os.path.join(tempfile.mkdtemp(), "deadline.db"), "TESTING": True})
+    with app.test_client() as http:
+        start = time.monotonic()
+        resp = http.post('/api/chat', json={'message': 'Bonjour'}, headers={'X-Request-Deadline-Ms': '300'})
+        assert resp.status_code == 504, resp.status_code
+        assert time.monotonic() - start < 1.5
+    client.release.set()
+    svc_module._gemini_service = None
+    print('[PASS] /api/chat 504 on deadline OK')
+
+
+if __name__ == "__main__":
+    test_deadline_budget()
+    test_hung_call_released_at_deadline()
+    test_retries_stop_when_budget_is_spent()
+    test_chat_returns_504()
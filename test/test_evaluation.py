@@ -0,0 +1,126 @@
+"""Test the golden-set evaluation runner, its CLI and admin job against the offline fake client.
+Run: python test/test_evaluation.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from app import create_app
+from database.db import start_eval_job
+from service import gemini_service as svc_module
+from service.evaluation import EvalRunner, check_reply, compare_reports, load_golden_set
+from service.fake_client import FakeGeminiClient
+from service.gemini_service import GeminiService
+
+GOLDEN = os.path.join(PROJECT_ROOT, "eval", "golden_preinscription.json")
+TOKEN = "test-admin-token"
+
+
+def _service(latency_ms=0.0):
+    svc = GeminiService()
+    svc.client = FakeGeminiClient(latency_ms=latency_ms, seed=1)
+    svc.max_retries = 0
+    svc_module._gemini_service = svc
+    return svc
+
+
+def test_golden_set_passes_on_fake_client_concurrently():
+    svc = _service(latency_ms=60)
+    golden = load_golden_set(GOLDEN)
+    EvalRunner(svc).run({"questions": [{"question": "Bonjour"}]})  # warm-up (executor, imports)
+    report = EvalRunner(svc, concurrency=len(golden["questions"])).run(golden)
+    summary = report["summary"]
+    assert summary["passed"] == summary["total"] == len(golden["questions"]), \
+        [(r["id"], r["failures"], r["error"]) for r in report["results"]]
+    assert summary["output_tokens"] > 0 and summary["prompt_tokens"] > summary["output_tokens"]
+    assert all(r["model"] == svc.model for r in report["results"])
+    # All questions in flight at once: far below the sequential 7 x 60 ms
+    assert report["duration_s"] < 0.3, report["duration_s"]
+    assert len(report["prompt_sha"]) == 12 and report["client"] == "genai"
+    print('[PASS] Golden set run concurrently against the fake client OK')
+
+
+def test_rate_limit_spaces_calls():
+    svc = _service()
+    golden = {"questions": [{"question": "Bonjour"} for _ in range(5)]}
+    report = EvalRunner(svc, concurrency=5, rate=20).run(golden)
+    # 5 starts at 20/s: the last one begins 200 ms after the first
+    assert report["duration_s"] >= 0.19, report["duration_s"]
+    print('[PASS] Rate limiter spaces call starts OK')
+
+
+def test_assertions_and_comparison():
+    variables = {"preinscription_url": "http://portail"}
+    rules = {"contains": ["{preinscription_url}"], "regex": "(?i)dossier", "max_chars": 10}
+    failures = check_reply("Votre dossier est prêt", 5.0, rules, variables)
+    assert failures == ["contains 'http://portail'", "max_chars 10 (got 22)"]
+    assert check_reply("Voir http://portail", 5.0, {"contains": ["{preinscription_url}"]}, variables) == []
+
+    svc = _service()
+    golden = load_golden_set(GOLDEN)
+    baseline = EvalRunner(svc).run(golden)
+    # A prompt change that drops the portal URL breaks the link questions
+    svc.prompt_prefix = "Vous êtes Bot4Univ.\n\n"
+    current = EvalRunner(svc).run(golden)
+    diff = compare_reports(baseline, current)
+    assert "prompt_sha" in diff["changed"] and diff["pass_rate"] < 0
+    assert {"how-to", "link"} <= set(diff["regressions"]) and diff["fixes"] == []
+    print('[PASS] Assertions and report comparison OK')
+
+
+def test_cli_and_admin_job():
+    _service()
+    app = create_app({"DB_PATH": os.path.join(tempfile.mkdtemp(), "eval.db"), "TESTING": True,
+                      "ADMIN_API_TOKEN": TOKEN, "EVAL_DIR": os.path.dirname(GOLDEN)})
+    out = os.path.join(tempfile.mkdtemp(), "report.json")
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=["eval", "run", GOLDEN, "--concurrency", "3", "--out", out])
+    assert result.exit_code == 0, result.output
+    assert "[PASS] how-to" in result.output and "7/7 passed" in result.output
+    result = runner.invoke(args=["eval", "run", GOLDEN, "--baseline", out])
+    assert result.exit_code == 0 and '"regressions": []' in result.output, result.output
+
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {TOKEN}'}
+    resp = client.post('/api/admin/eval', json={"concurrency": 2}, headers=headers)
+    assert resp.status_code == 202, resp.get_json()
+    job_id = resp.get_json()['job_id']
+    for _ in range(100):
+        job = client.get(f'/api/admin/eval/{job_id}', headers=headers).get_json()
+        if job['status'] != 'running':
+            break
+        time.sleep(0.05)
+    assert job['status'] == 'done' and job['done'] == 7
+    assert job['report']['summary']['pass_rate'] == 1.0
+    # Another worker on the same database answers the poll too
+    other = create_app(dict(app.config))
+    assert other.test_client().get(f'/api/admin/eval/{job_id}', headers=headers).get_json() == job
+
+    # A job left running by a dead worker does not block new runs once stale
+    with app.app_context():
+        assert start_eval_job('orphan', 7, 30000, 0, 1000, 20)
+    resp = client.post('/api/admin/eval', json={}, headers=headers)
+    assert resp.status_code == 202
+    assert client.get('/api/admin/eval/orphan', headers=headers).get_json()['error'] == 'worker lost'
+    for _ in range(100):
+        if client.get(f"/api/admin/eval/{resp.get_json()['job_id']}", headers=headers).get_json()['status'] != 'running':
+            break
+        time.sleep(0.05)
+    assert client.post('/api/admin/eval', json={"golden": {"questions": []}}, headers=headers).status_code == 400
+    assert client.post('/api/admin/eval', json={"golden": "../app.py"}, headers=headers).status_code == 400
+    assert client.get('/api/admin/eval/unknown', headers=headers).status_code == 404
+    print('[PASS] eval CLI with baseline and admin evaluation job OK')
+
+
+if __name__ == "__main__":
+    test_golden_set_passes_on_fake_client_concurrently()
+    test_rate_limit_spaces_calls()
+    test_assertions_and_comparison()
+    test_cli_and_admin_job()
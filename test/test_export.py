@@ -0,0 +1,130 @@
+"""Test the streaming NDJSON export / import and the admin export endpoint.
+Run: python test/test_export.py
+"""
+
+import gzip
+import io
+import json
+import os
+import sys
+import tempfile
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from app import create_app
+from database.db import create_session, add_message, get_messages
+from database.export import export_to_file, import_ndjson, iter_export, open_ndjson
+from database.pool import connect
+
+TOKEN = "test-admin-token"
+
+
+def _make_app():
+    path = os.path.join(tempfile.mkdtemp(), "export.db")
+    return create_app({"DB_PATH": path, "TESTING": True, "ADMIN_API_TOKEN": TOKEN})
+
+
+def _seed(app, sessions=3, per_session=4):
+    uuids = []
+    with app.app_context():
+        for s in range(sessions):
+            sid = create_session()
+            for i in range(per_session):
+                add_message(sid, 'user' if i % 2 == 0 else 'assistant', f'é message {s}-{i}')
+            uuids.append(sid)
+    return uuids
+
+
+def test_export_import_roundtrip():
+    src = _make_app()
+    uuids = _seed(src)
+    buf = io.BytesIO()
+    conn = connect(src.config["DB_PATH"], read_only=True)
+    lines = export_to_file(conn, buf, compress=True)
+    conn.close()
+    assert lines == 3 + 12, lines
+    assert buf.getvalue()[:2] == b"\x1f\x8b"
+
+    dst = _make_app()
+    conn = connect(dst.config["DB_PATH"])
+    stats = import_ndjson(conn, open_ndjson(io.BytesIO(buf.getvalue())), batch_size=5)
+    again = import_ndjson(conn, open_ndjson(io.BytesIO(buf.getvalue())))
+    conn.close()
+    assert stats["sessions"] == 3 and stats["messages"] == 12, stats
+    assert again["skipped_sessions"] == 3 and again["messages"] == 0, again
+    with src.app_context():
+        expected = [get_messages(u) for u in uuids]
+    with dst.app_context():
+        assert [get_messages(u) for u in uuids] == expected
+    print('[PASS] NDJSON export/import round-trip OK')
+
+
+def test_interrupted_import_keeps_whole_sessions():
+    src = _make_app()
+    uuids = _seed(src, sessions=2, per_session=4)
+    conn = connect(src.config["DB_PATH"], read_only=True)
+    lines = list(iter_export(conn))
+    conn.close()
+
+    dst = _make_app()
+    conn = connect(dst.config["DB_PATH"])
+    # Broken in the middle of the second session, after a commit at the session boundary
+    broken = lines[:7] + ['{"type": "message", "session": "%s", "role": "user"}' % uuids[1]]
+    try:
+        import_ndjson(conn, broken, batch_size=2, transaction_rows=3)
+        assert False, "missing content accepted"
+    except KeyError:
+        pass
+    assert conn.execute("SELECT COUNT(*) FROM session").fetchone()[0] == 1
+    assert conn.execute("SELECT COUNT(*) FROM message").fetchone()[0] == 4
+    stats = import_ndjson(conn, lines, batch_size=2, transaction_rows=3)
+    conn.close()
+    assert stats["skipped_sessions"] == 1 and stats["messages"] == 4, stats
+    with dst.app_context():
+        assert [len(get_messages(u)) for u in uuids] == [4, 4]
+
+    client = dst.test_client()
+    for body in (b'{"type": "session"}\n', b'[1, 2]\n', b'"texte"\n'):
+        resp = client.post('/api/admin/import', data=body, headers={'Authorization': f'Bearer {TOKEN}'})
+        assert resp.status_code == 400, (body, resp.status_code)
+    print('[PASS] Interrupted import keeps whole sessions, malformed lines give 400 OK')
+
+
+def test_export_filters():
+    app = _make_app()
+    _seed(app, sessions=2, per_session=2)
+    conn = connect(app.config["DB_PATH"], read_only=True)
+    everything = [json.loads(l) for l in iter_export(conn)]
+    future = list(iter_export(conn, since="2999-01-01"))
+    by_user = list(iter_export(conn, user_id=42))
+    conn.close()
+    assert [r["type"] for r in everything] == ["session", "message", "message"] * 2
+    assert future == [] and by_user == []
+    print('[PASS] Export filters OK')
+
+
+def test_admin_export_endpoint():
+    app = _make_app()
+    _seed(app, sessions=1, per_session=3)
+    client = app.test_client()
+    assert client.get('/api/admin/export').status_code == 401
+
+    resp = client.get('/api/admin/export', headers={'Authorization': f'Bearer {TOKEN}'})
+    assert resp.status_code == 200
+    assert resp.mimetype == 'application/x-ndjson'
+    assert len(resp.get_data().splitlines()) == 4
+
+    resp = client.get('/api/admin/export?gzip=1', headers={'Authorization': f'Bearer {TOKEN}'})
+    assert resp.mimetype == 'application/gzip'
+    assert len(gzip.decompress(resp.get_data()).splitlines()) == 4
+    print('[PASS] Admin export endpoint OK')
+
+
+if __name__ == "__main__":
+    test_export_import_roundtrip()
+    test_interrupted_import_keeps_whole_sessions()
+    test_export_filters()
+    test_admin_export_endpoint()
@@ -0,0 +1,126 @@
+"""Test the pooled Gemini HTTP transport: warm-up, connection reuse metrics and timeouts.
+Run: python test/test_gemini_transport.py
+"""
+
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from service.gemini_service import GeminiService
+from service.gemini_transport import ConnectionMetrics, TransportConfig, build_http_client
+
+
+class FakeGeminiAPI(BaseHTTPRequestHandler):
+    """Keep-alive HTTP/1.1 server answering generateContent like the Gemini API."""
+
+    protocol_version = "HTTP/1.1"
+    peers = set()
+    generations = 0
+
+    def _send(self, status, body=b""):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        FakeGeminiAPI.peers.add(self.client_address)
+        self._send(404)
+
+    def do_POST(self):
+        FakeGeminiAPI.peers.add(self.client_address)
+        FakeGeminiAPI.generations += 1
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = {"candidates": [{"content": {"role": "model", "parts": [{"text": "Voici la procédure."}]}}],
+                "usageMetadata": {"promptTokenCount": 12, "candidatesTokenCount": 4}}
+        self._send(200, json.dumps(body).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+def _server():
+    FakeGeminiAPI.peers = set()
+    FakeGeminiAPI.generations = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGeminiAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _service(server, **env):
+    saved = dict(os.environ)
+    os.environ.update({"GEMINI_API_KEY": "test-key", "GEMINI_FAKE": "False", "GEMINI_HTTP2": "False",
+                       "GEMINI_BASE_URL": f"http://127.0.0.1:{server.server_address[1]}/", **env})
+    try:
+        return GeminiService()
+    finally:
+        os.environ.clear()
+        os.environ.update(saved)
+
+
+def test_warm_up_then_calls_reuse_connections():
+    server = _server()
+    try:
+        svc = _service(server, GEMINI_WARM_CONNECTIONS="2")
+        assert svc.warm_up() == 2
+        assert FakeGeminiAPI.generations == 0  # warm-up costs no generation call
+        for _ in range(5):
+            assert svc.generate_reply("Comment faire ?", []) == "Voici la procédure."
+        stats = svc.stats()["transport"]
+        assert stats["http2"] is False and stats["max_connections"] == svc.max_inflight
+        conns = stats["connections"]
+        assert conns["requests"] == 5 and conns["connects"] == 0 and conns["reuse_rate"] == 1.0, conns
+        assert conns["warmed_connections"] == 2 and conns["warm_up_requests"] == 2
+        # Every request arrived on one of the two warmed sockets
+        assert len(FakeGeminiAPI.peers) == 2
+    finally:
+        server.shutdown()
+    print('[PASS] Warm-up opens connections and calls reuse them OK')
+
+
+def test_reset_client_opens_new_pool():
+    server = _server()
+    try:
+        svc = _service(server, GEMINI_WARM_CONNECTIONS="0")
+        svc.generate_reply("Bonjour", [])
+        first = svc._http
+        assert svc.connections.stats()["connects"] == 1
+        svc.reset_client()  # as after fork
+        svc.generate_reply("Bonjour", [])
+        assert svc._http is not first and svc.connections.stats()["requests"] == 1
+        assert svc.connections.stats()["connects"] == 1
+    finally:
+        server.shutdown()
+    print('[PASS] reset_client drops the inherited pool OK')
+
+
+def test_connect_timeout_kept_under_request_timeout():
+    config = TransportConfig(connect_timeout_ms=2000, timeout_ms=30000, keepalive=64, max_connections=4)
+    assert config.keepalive == 4
+    client = build_http_client(config, ConnectionMetrics())
+    try:
+        default = client.build_request("GET", "http://127.0.0.1/")
+        assert default.extensions["timeout"] == {"connect": 2.0, "read": 30.0, "write": 30.0, "pool": 30.0}
+        # genai passes HttpOptions.timeout (or the deadline) as one number
+        timeout = client.build_request("GET", "http://127.0.0.1/", timeout=0.5).extensions["timeout"]
+        assert timeout["connect"] == 0.5 and timeout["read"] == 0.5
+        timeout = client.build_request("GET", "http://127.0.0.1/", timeout=10.0).extensions["timeout"]
+        assert timeout["connect"] == 2.0 and timeout["read"] == 10.0
+    finally:
+        client.close()
+    print('[PASS] Connect timeout kept separate from the request timeout OK')
+
+
+if __name__ == "__main__":
+    test_warm_up_then_calls_reuse_connections()
+    test_reset_client_opens_new_pool()
+    test_connect_timeout_kept_under_request_timeout()
@@ -0,0 +1,112 @@
+"""Test hedged Gemini requests (backup call after the rolling percentile, budget cap).
+Run: python test/test_hedging.py
+"""
+
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from service.gemini_service import GeminiService
+from service.hedging import HedgeBudget, HedgePolicy
+
+
+class ScriptedClient:
+    """Fake client whose n-th call sleeps latencies[n] seconds (default: fast)."""
+
+    def __init__(self, latencies=None):
+        self.latencies = dict(latencies or {})
+        self.calls = 0
+        self._lock = threading.Lock()
+        outer = self
+
+        class models:
+            @staticmethod
+            def generate_content(model, contents):
+                with outer._lock:
+                    n = outer.calls
+                    outer.calls += 1
+                time.sleep(outer.latencies.get(n, 0.01))
+                return SimpleNamespace(text=f"réponse {n}")
+
+        self.models = models
+
+
+def _service(client, **policy):
+    svc = GeminiService()
+    svc.client = client
+    svc.hedging = HedgePolicy(enabled=True, **dict({"min_samples": 5, "min_delay_ms": 1}, **policy))
+    return svc
+
+
+def test_budget_caps_hedge_rate():
+    budget = HedgeBudget(max_rate=0.1, burst=1)
+    budget.try_spend()
+    spent = 0
+    for _ in range(100):
+        budget.earn()
+        spent += budget.try_spend()
+    assert 9 <= spent <= 10, spent
+    print('[PASS] Hedge budget OK')
+
+
+def test_slow_first_call_is_hedged():
+    # Calls 0-4 warm up the latency window; call 5 hangs, its hedge (6) is fast
+    client = ScriptedClient({5: 1.0})
+    svc = _service(client)
+    for _ in range(5):
+        svc.generate_reply("Bonjour", [])
+    start = time.monotonic()
+    reply = svc.generate_reply("Bonjour", [])
+    elapsed = time.monotonic() - start
+    assert reply == "réponse 6", reply
+    assert elapsed < 0.5, elapsed
+    stats = svc.stats()["hedging"]
+    assert stats["hedges"] == 1 and stats["hedge_wins"] == 1
+    assert stats["requests"] == 6
+    print('[PASS] Slow call hedged OK')
+
+
+def test_losing_hedge_is_metered():
+    client = ScriptedClient({5: 0.3})
+    svc = _service(client)
+    for _ in range(5):
+        svc.generate_reply("Bonjour", [])
+    metered = []
+    reply = svc.generate_reply("Bonjour", [], on_usage=lambda model, p, o: metered.append((model, p, o)))
+    assert reply == "réponse 6", reply
+    # The slow first call still completes upstream and is billed once it does
+    for _ in range(100):
+        if len(metered) == 2:
+            break
+        time.sleep(0.01)
+    assert len(metered) == 2 and metered[0][0] == metered[1][0] == svc.model, metered
+    print('[PASS] Winner and losing hedge both metered OK')
+
+
+def test_no_hedge_without_budget_or_samples():
+    client = ScriptedClient({0: 0.05})
+    svc = _service(client, max_rate=0.0)
+    svc.hedging.budget = HedgeBudget(max_rate=0.0, burst=0)
+    for _ in range(8):
+        svc.generate_reply("Bonjour", [])
+    assert client.calls == 8
+    assert svc.stats()["hedging"]["hedges"] == 0
+
+    cold = _service(ScriptedClient(), min_samples=100)
+    cold.generate_reply("Bonjour", [])
+    assert cold.hedging.delay_ms(cold.model) is None
+    print('[PASS] Hedging bounded by budget and warm-up OK')
+
+
+if __name__ == "__main__":
+    test_budget_caps_hedge_rate()
+    test_slow_first_call_is_hedged()
+    test_losing_hedge_is_metered()
+    test_no_hedge_without_budget_or_samples()
@@ -0,0 +1,170 @@
+"""Test Idempotency-Key handling of /api/chat (replay, attach, conflict, release).
+Run: python test/test_idempotency.py
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from app import create_app
+from database.db import claim_idempotency_key, complete_idempotency_key, get_messages
+from service import gemini_service as svc_module
+from service.gemini_service import GeminiService
+
+
+class CountingClient:
+    """Fake Gemini client counting generations, optionally slow or failing."""
+
+    def __init__(self, delay=0.0, fail=False):
+        self.calls = 0
+        outer = self
+
+        class models:
+            @staticmethod
+            def generate_content(model, contents):
+                outer.calls += 1
+                time.sleep(delay)
+                if fail:
+                    raise Exception("400 INVALID_ARGUMENT: simulated failure")
+                return SimpleNamespace(text=f"réponse {outer.calls}")
+
+        self.models = models
+
+
+def _install(client):
+    svc = GeminiService()
+    svc.client = client
+    svc.max_retries = 0
+    svc.retry_delay_ms = 1
+    svc_module._gemini_service = svc
+
+
+def _make_app(**config):
+    path = os.path.join(tempfile.mkdtemp(), "idem.db")
+    return create_app(dict({"DB_PATH": path, "TESTING": True}, **config))
+
+
+def _post(client, key, message='Comment faire ma préinscription ?'):
+    return client.post('/api/chat', json={'message': message}, headers={'Idempotency-Key': key})
+
+
+def test_retry_replays_stored_reply():
+    gemini = CountingClient()
+    _install(gemini)
+    app = _make_app()
+    with app.test_client() as client:
+        first = _post(client, 'key-1')
+        second = _post(client, 'key-1')
+        assert first.status_code == second.status_code == 200
+        assert first.get_json() == second.get_json()
+        assert second.headers.get('Idempotent-Replayed') == 'true'
+        assert gemini.calls == 1
+        with app.app_context():
+            assert len(get_messages(first.get_json()['session_id'])) == 2
+        # Same key, different request
+        assert _post(client, 'key-1', message='Autre question').status_code == 422
+    svc_module._gemini_service = None
+    print('[PASS] Idempotent replay OK')
+
+
+def test_concurrent_retry_attaches_to_inflight():
+    gemini = CountingClient(delay=0.3)
+    _install(gemini)
+    app = _make_app()
+    results = []
+
+    def send():
+        with app.test_client() as client:
+            results.append(_post(client, 'key-2'))
+
+    threads = [threading.Thread(target=send) for _ in range(3)]
+    for t in threads:
+        t.start()
+        time.sleep(0.05)
+    for t in threads:
+        t.join()
+    assert gemini.calls == 1
+    assert [r.status_code for r in results] == [200, 200, 200]
+    assert len({r.get_json()['reply'] for r in results}) == 1
+    assert sum(r.headers.get('Idempotent-Replayed') == 'true' for r in results) == 2
+    svc_module._gemini_service = None
+    print('[PASS] Attach to in-flight generation OK')
+
+
+def test_failed_request_is_not_stored():
+    _install(CountingClient(fail=True))
+    app = _make_app()
+    with app.test_client() as client:
+        assert _post(client, 'key-3').status_code == 502
+        gemini = CountingClient()
+        _install(gemini)
+        resp = _post(client, 'key-3')
+        assert resp.status_code == 200 and 'Idempotent-Replayed' not in resp.headers
+        assert gemini.calls == 1
+        # The failed attempt stored the question; the retry did not store it again
+        with app.app_context():
+            assert [m['role'] for m in get_messages(resp.get_json()['session_id'])] == ['user', 'assistant']
+        assert client.post('/api/chat', json={'message': 'x'},
+                           headers={'Idempotency-Key': ' '}).status_code == 400
+    svc_module._gemini_service = None
+    print('[PASS] Failed requests release their key OK')
+
+
+def test_waits_for_other_worker():
+    gemini = CountingClient()
+    _install(gemini)
+    app = _make_app(IDEMPOTENCY_WAIT_S=5)
+    store = app.extensions['idempotency']
+    fingerprint = store.fingerprint('Bonjour', None)
+    with app.app_context():
+        # Another process claimed the key and is still generating
+        assert claim_idempotency_key('client:127.0.0.1:key-4', fingerprint, int(time.time() * 1000), 60000, 60000) is None
+
+    def finish():
+        time.sleep(0.2)
+        with app.app_context():
+            complete_idempotency_key('client:127.0.0.1:key-4', 200, '{"reply": "du worker B", "session_id": null}')
+
+    threading.Thread(target=finish).start()
+    with app.test_client() as client:
+        resp = _post(client, 'key-4', message='Bonjour')
+    assert resp.status_code == 200 and resp.get_json()['reply'] == "du worker B"
+    assert gemini.calls == 0
+    svc_module._gemini_service = None
+    print('[PASS] Cross-worker wait OK')
+
+
+def test_keys_scoped_per_caller():
+    gemini = CountingClient()
+    _install(gemini)
+    app = _make_app()
+    alice, bob = app.test_client(), app.test_client()
+    with alice.session_transaction() as sess:
+        sess['user_id'] = 'alice'
+    with bob.session_transaction() as sess:
+        sess['user_id'] = 'bob'
+    first = _post(alice, 'key-5')
+    other = _post(bob, 'key-5')
+    # Bob's request runs on its own: no replay of Alice's reply or session
+    assert other.status_code == 200 and 'Idempotent-Replayed' not in other.headers
+    assert other.get_json()['session_id'] != first.get_json()['session_id']
+    assert _post(alice, 'key-5').headers.get('Idempotent-Replayed') == 'true'
+    assert gemini.calls == 2
+    svc_module._gemini_service = None
+    print('[PASS] Idempotency keys scoped per caller OK')
+
+
+if __name__ == "__main__":
+    test_retry_replays_stored_reply()
+    test_concurrent_retry_attaches_to_inflight()
+    test_failed_request_is_not_stored()
+    test_waits_for_other_worker()
+    test_keys_scoped_per_caller()
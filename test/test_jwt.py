@@ -0,0 +1,197 @@
+"""Test signed API tokens: issue, refresh rotation, key rotation and the revocation denylist.
+Run: python test/test_jwt.py
+"""
+
+import base64
+import os
+import sys
+import tempfile
+import time
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from app import create_app
+from database.db import create_user, update_user_password, update_user_role
+from service.auth_service import AuthService, JWTService, TokenError, parse_signing_keys
+from service.token_denylist import BloomFilter, start_denylist_sync, stop_denylist_sync
+
+PASSWORD = "Secret123"
+
+
+def _make_app(**config):
+    path = os.path.join(tempfile.mkdtemp(), "jwt.db")
+    app = create_app(dict({"DB_PATH": path, "TESTING": True, "JWT_DENYLIST_SYNC_MS": 0}, **config))
+    with app.app_context():
+        user_id = create_user("etudiant@example.com", "Étudiant", AuthService.hash_password(PASSWORD))
+    return app, user_id
+
+
+def _login(client):
+    resp = client.post('/api/auth/token', json={"email": "etudiant@example.com", "password": PASSWORD})
+    assert resp.status_code == 200, resp.get_json()
+    return resp.get_json()
+
+
+def _bearer(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_access_token_authenticates_without_session():
+    app, user_id = _make_app()
+    client = app.test_client()
+    assert client.post('/api/auth/token', json={"email": "etudiant@example.com",
+                                                "password": "Wrong123"}).status_code == 401
+    pair = _login(client)
+    assert pair["token_type"] == "Bearer" and pair["expires_in"] == 900
+
+    fresh = app.test_client()  # no cookie at all
+    me = fresh.get('/api/auth/me', headers=_bearer(pair["access_token"]))
+    assert me.status_code == 200
+    assert me.get_json()["user"] == {"id": user_id, "email": "etudiant@example.com",
+                                     "full_name": "Étudiant", "role": "student"}
+    # A refresh token is not an access token, and a tampered token is refused
+    assert fresh.get('/api/auth/me', headers=_bearer(pair["refresh_token"])).status_code == 401
+    header, payload, signature = pair["access_token"].split(".")
+    forged = f"{header}.{payload}.{signature[:-2]}AA"
+    resp = fresh.get('/api/auth/me', headers=_bearer(forged))
+    assert resp.status_code == 401 and resp.get_json()["details"] == "bad signature"
+    assert app.extensions['principals'].stats()["lookups"] == 0
+
+    # Session-based issue needs a database account, not the placeholder login
+    placeholder = app.test_client()
+    with placeholder.session_transaction() as session:
+        session['user_id'] = 'temp_user_id'
+    assert placeholder.post('/api/auth/token').status_code == 401
+    assert app.test_client().post('/api/auth/token').status_code == 401
+    logged_in = app.test_client()
+    with logged_in.session_transaction() as session:
+        session['user_id'] = user_id
+    assert logged_in.post('/api/auth/token').status_code == 200
+    print('[PASS] Access token authenticates API routes without a session OK')
+
+
+def test_refresh_rotation_and_revocation():
+    app, user_id = _make_app()
+    client = app.test_client()
+    pair = _login(client)
+    resp = client.post('/api/auth/token/refresh', json={"refresh_token": pair["refresh_token"]})
+    assert resp.status_code == 200
+    rotated = resp.get_json()
+    # The used refresh token is revoked
+    resp = client.post('/api/auth/token/refresh', json={"refresh_token": pair["refresh_token"]})
+    assert resp.status_code == 401 and resp.get_json()["details"] == "token revoked"
+
+    # Revoking an access token denies it right away in this worker
+    assert client.get('/api/auth/me', headers=_bearer(rotated["access_token"])).status_code == 200
+    assert client.post('/api/auth/token/revoke', headers=_bearer(rotated["access_token"])).status_code == 200
+    assert client.get('/api/auth/me', headers=_bearer(rotated["access_token"])).status_code == 401
+
+    # Another worker learns the revocation from SQLite on its next background sync
+    other = create_app(dict(app.config, JWT_DENYLIST_SYNC_MS=20))
+    start_denylist_sync(other)
+    try:
+        deadline = time.time() + 5
+        while other.extensions['tokens'].stats()["denylist"]["syncs"] < 1 and time.time() < deadline:
+            time.sleep(0.01)
+        assert other.test_client().get('/api/auth/me', headers=_bearer(rotated["access_token"])).status_code == 401
+    finally:
+        stop_denylist_sync(other)
+    stats = other.extensions['tokens'].stats()["denylist"]
+    assert stats["bloom_hits"] == 1 and stats["revoked"] == 1
+    print('[PASS] Refresh rotation and revocation across workers OK')
+
+
+def test_user_change_revokes_older_tokens():
+    app, user_id = _make_app()
+    client = app.test_client()
+    pair = _login(client)
+    time.sleep(0.01)
+    with app.app_context():
+        update_user_role(user_id, "admin")
+        app.extensions['tokens'].denylist.sync()
+    resp = client.get('/api/auth/me', headers=_bearer(pair["access_token"]))
+    assert resp.status_code == 401 and resp.get_json()["details"] == "token revoked"
+    assert client.post('/api/auth/token/refresh', json={"refresh_token": pair["refresh_token"]}).status_code == 401
+
+    # Tokens issued after the change carry the new role
+    time.sleep(0.01)
+    pair = _login(client)
+    assert client.get('/api/auth/me', headers=_bearer(pair["access_token"])).get_json()["user"]["role"] == "admin"
+    assert client.get('/api/admin/tokens', headers=_bearer(pair["access_token"])).status_code == 200
+    time.sleep(0.01)
+    with app.app_context():
+        update_user_password(user_id, AuthService.hash_password("Other1234"))
+        app.extensions['tokens'].denylist.sync()
+    assert client.get('/api/admin/tokens', headers=_bearer(pair["access_token"])).status_code == 401
+    print('[PASS] Password and role changes revoke older tokens OK')
+
+
+def test_key_rotation_and_expiry():
+    old = JWTService(parse_signing_keys("k1:first-secret", ""))
+    rotated = JWTService(parse_signing_keys("k2:second-secret,k1:first-secret", ""), access_ttl_s=0)
+    principal = {"id": 7, "role": "student", "email": "a@example.com", "display_name": "A"}
+    token = old.create_token(principal)
+    # Signed with the retired key: still valid while k1 is listed
+    assert rotated.verify_token(token)["sub"] == "7"
+    new_token = rotated.create_token(principal, JWTService.REFRESH)
+    assert rotated.verify_token(new_token, JWTService.REFRESH)["sub"] == "7"
+    try:
+        old.verify_token(new_token, JWTService.REFRESH)
+        assert False, "unknown kid accepted"
+    except TokenError as e:
+        assert str(e) == "unknown signing key"
+    try:
+        rotated.verify_token(rotated.create_token(principal))
+        assert False, "expired token accepted"
+    except TokenError as e:
+        assert str(e) == "token expired"
+    # Without JWT_SIGNING_KEYS the key is derived from SECRET_KEY
+    assert parse_signing_keys("", "a") == parse_signing_keys("", "a") != parse_signing_keys("", "b")
+    print('[PASS] Key rotation and token expiry OK')
+
+
+def test_malformed_tokens_rejected():
+    jwt = JWTService(parse_signing_keys("k1:first-secret", ""))
+    for token in ("W10.W10.W10", "bnVsbA.bnVsbA.AA", "eyJhbGciOiJIUzI1NiJ9.é.AA", "é.é.é", "a.b", ""):
+        try:
+            jwt.verify_token(token)
+            assert False, f"{token!r} accepted"
+        except TokenError as e:
+            assert str(e) == "malformed token", (token, e)
+    # Signed, but the payload is not a JSON object
+    header, _, _ = jwt.create_token({"id": 7, "role": "student"}).split(".")
+    signing_input = f"{header}.W10"
+    signature = base64.urlsafe_b64encode(jwt._sign(signing_input.encode("ascii"), "k1")).rstrip(b"=").decode()
+    try:
+        jwt.verify_token(f"{signing_input}.{signature}")
+        assert False, "list payload accepted"
+    except TokenError as e:
+        assert str(e) == "malformed token"
+
+    app, _ = _make_app()
+    client = app.test_client()
+    for token in ("W10.W10.W10", "é.é.é"):
+        assert client.get('/api/auth/me', headers=_bearer(token)).status_code == 401
+    print('[PASS] Malformed tokens rejected with 401 OK')
+
+
+def test_bloom_filter_error_rate():
+    bloom = BloomFilter(capacity=5000, error_rate=0.01)
+    for i in range(5000):
+        bloom.add(f"revoked-{i}")
+    assert all(f"revoked-{i}" in bloom for i in range(5000))
+    false_positives = sum(1 for i in range(20000) if f"live-{i}" in bloom)
+    assert false_positives / 20000 < 0.02, false_positives
+    print('[PASS] Bloom filter has no false negatives and a bounded error rate OK')
+
+
+if __name__ == "__main__":
+    test_access_token_authenticates_without_session()
+    test_refresh_rotation_and_revocation()
+    test_user_change_revokes_older_tokens()
+    test_key_rotation_and_expiry()
+    test_malformed_tokens_rejected()
+    test_bloom_filter_error_rate()
@@ -0,0 +1,106 @@
+"""Test transparent compression of stored message bodies.
+Run: python test/test_message_codec.py
+"""
+
+import json
+import os
+import random
+import sys
+import tempfile
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from app import create_app
+from database import db as db_module
+from database.content_codec import PLAIN, ZLIB, MessageCodec, configure_content, train_zlib_dictionary
+from database.export import iter_export
+from database.pool import connect
+
+REPLY = ("Pour votre préinscription à l'Université de Douala, connectez-vous au portail SYSTHAG. "
+         "Munissez-vous de votre relevé de notes du baccalauréat et d'une pièce d'identité. "
+         "Les frais de dossier sont payables en ligne ou auprès de la banque partenaire. ")
+
+
+def _app(**config):
+    return create_app(dict({"DB_PATH": os.path.join(tempfile.mkdtemp(), "codec.db"), "TESTING": True},
+                           **config))
+
+
+def _stored(app):
+    conn = connect(app.config["DB_PATH"], read_only=True)
+    try:
+        return conn.execute("SELECT codec, content FROM message ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+
+def test_long_bodies_compressed_transparently():
+    app = _app()
+    noise = "".join(random.Random(3).choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(2000))
+    with app.app_context():
+        sid = db_module.create_session()
+        added = db_module.add_message(sid, "assistant", REPLY * 10)
+        db_module.add_message(sid, "user", "Bonjour")
+        db_module.add_message(sid, "user", noise)
+        assert added["content"] == REPLY * 10
+        assert [m["content"] for m in db_module.get_messages(sid)] == [REPLY * 10, "Bonjour", noise]
+    (long_codec, long_value), (short_codec, short_value), _ = _stored(app)
+    assert long_codec == ZLIB and isinstance(long_value, bytes)
+    assert len(long_value) < len((REPLY * 10).encode("utf-8")) / 5
+    assert (short_codec, short_value) == (PLAIN, "Bonjour")
+
+    conn = connect(app.config["DB_PATH"], read_only=True)
+    exported = [json.loads(line) for line in iter_export(conn)]
+    conn.close()
+    assert exported[1]["content"] == REPLY * 10
+    print('[PASS] Long bodies stored compressed, read back as text OK')
+
+
+def test_dictionary_and_recompress():
+    app = _app(MESSAGE_COMPRESSION="off")
+    replies = [f"Bonjour étudiant {i}. " + REPLY for i in range(30)]
+    with app.app_context():
+        sid = db_module.create_session()
+        for reply in replies:
+            db_module.add_message(sid, "assistant", reply)
+    assert {codec for codec, _ in _stored(app)} == {PLAIN}
+    plain_bytes = sum(len(value.encode("utf-8")) for _, value in _stored(app))
+
+    configure_content("zlib", min_bytes=64)
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=["db", "recompress", "--train", "--batch-size", "7"])
+    assert result.exit_code == 0, result.output
+    rows = _stored(app)
+    dict_codec = rows[0][0]
+    assert dict_codec > 2 and {codec for codec, _ in rows} == {dict_codec}
+    assert sum(len(value) for _, value in rows) < plain_bytes / 4
+
+    # Another worker (fresh codec cache) reads the rows with the new dictionary
+    other = MessageCodec(app.config["DB_PATH"])
+    assert [other.decode(codec, value) for codec, value in rows] == replies
+    with app.app_context():
+        assert [m["content"] for m in db_module.get_messages(sid)] == replies
+        # New rows use the trained dictionary as well
+        db_module.add_message(sid, "assistant", "Bonjour étudiant 99. " + REPLY)
+    assert _stored(app)[-1][0] == dict_codec
+
+    # Nothing left to do on a second run
+    result = runner.invoke(args=["db", "recompress"])
+    assert "'rewritten': 0" in result.output, result.output
+    print('[PASS] Dictionary training and batched recompression OK')
+
+
+def test_zlib_dictionary_keeps_repeated_sentences():
+    dictionary = train_zlib_dictionary([REPLY + "Question A ?", REPLY + "Question B ?", "Sans rapport."])
+    assert b"portail SYSTHAG." in dictionary and b"Sans rapport" not in dictionary
+    assert train_zlib_dictionary(["Un seul texte."]) == b""
+    print('[PASS] zlib dictionary from repeated sentences OK')
+
+
+if __name__ == "__main__":
+    test_long_bodies_compressed_transparently()
+    test_dictionary_and_recompress()
+    test_zlib_dictionary_keeps_repeated_sentences()
@@ -0,0 +1,131 @@
+"""Test versioned schema migrations and lazy Gemini client creation.
+Run: python test/test_migrations.py
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from database.migrations import LATEST_VERSION, TIMESTAMP_SCHEMA_SQL, _statements, _v4_copy, current_version, migrate
+
+
+def _connect(path):
+    return sqlite3.connect(path, isolation_level=None)
+
+
+def test_fresh_database_reaches_latest_version():
+    path = os.path.join(tempfile.mkdtemp(), "fresh.db")
+    conn = _connect(path)
+    assert migrate(conn) == LATEST_VERSION
+    assert current_version(conn) == LATEST_VERSION
+    tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    assert {"user", "session", "message", "password_reset", "login_attempt"} <= tables
+    # Second run is a no-op
+    assert migrate(conn) == LATEST_VERSION
+    conn.close()
+    print('[PASS] Fresh database migration OK')
+
+
+def test_legacy_user_table_is_upgraded():
+    path = os.path.join(tempfile.mkdtemp(), "legacy.db")
+    conn = _connect(path)
+    conn.execute("CREATE TABLE user (id INTEGER PRIMARY KEY, email TEXT, display_name TEXT, created_at TEXT)")
+    conn.execute("INSERT INTO user (email, display_name) VALUES ('a@b.cm', 'A')")
+    migrate(conn)
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(user)")}
+    assert {"password_hash", "role", "is_verified", "verification_token", "updated_ms"} <= cols
+    assert conn.execute("SELECT role FROM user").fetchone()[0] == "student"
+    conn.close()
+    print('[PASS] Legacy schema upgrade OK')
+
+
+def test_integer_timestamps_backfill_resumes():
+    path = os.path.join(tempfile.mkdtemp(), "v3.db")
+    conn = _connect(path)
+    migrate(conn, target=3)
+    conn.execute("INSERT INTO session (uuid, started_at, last_activity_at) "
+                 "VALUES ('s1', '2025-09-01 10:00:00', '2025-09-01 10:05:00')")
+    conn.executemany("INSERT INTO message (session_id, role, content, created_at) VALUES (1, 'user', ?, ?)",
+                     [(f"m{i}", f"2025-09-01 10:00:{i:02d}") for i in range(5)])
+    conn.execute("INSERT INTO login_attempt (email, attempted_at) VALUES ('a@b.cm', '2025-09-02 08:00:00')")
+    conn.execute("UPDATE sqlite_sequence SET seq = 1000 WHERE name = 'message'")
+
+    # A previous start copied one batch, then the process died
+    conn.execute("BEGIN IMMEDIATE")
+    for stmt in _statements(TIMESTAMP_SCHEMA_SQL):
+        conn.execute(stmt)
+    assert _v4_copy(conn, "message", 2) == 2
+    conn.execute("COMMIT")
+    # ... and old code kept writing meanwhile
+    conn.execute("INSERT INTO message (session_id, role, content, created_at) "
+                 "VALUES (1, 'assistant', 'tail', '2025-09-01 10:01:00')")
+
+    assert migrate(conn) == LATEST_VERSION
+    rows = conn.execute("SELECT id, content, created_ms FROM message ORDER BY id").fetchall()
+    assert [r[1] for r in rows] == ["m0", "m1", "m2", "m3", "m4", "tail"]
+    assert rows[0][2] == 1756720800000 and rows[4][2] == 1756720804000
+    assert rows[5][0] == 1001, "AUTOINCREMENT sequence must be preserved"
+    assert conn.execute("SELECT started_ms, last_activity_ms FROM session").fetchone() == (1756720800000, 1756721100000)
+    assert conn.execute("SELECT attempted_ms FROM login_attempt").fetchone()[0] == 1756800000000
+    names = {r[0] for r in conn.execute("SELECT name FROM sqlite_master")}
+    assert not any(n.endswith("_v4") for n in names)
+    assert {"idx_message_created", "idx_login_attempt_email_time", "idx_session_status_activity"} <= names
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(message)")}
+    assert "created_ms" in cols and "created_at" not in cols
+    conn.close()
+    print('[PASS] Integer timestamp backfill resumes and keeps ids OK')
+
+
+def test_timestamp_dicts_and_range_queries():
+    import re
+    from app import create_app
+    from database import db as db_module
+    from database.instrument import QUERY_STATS
+    from database.timestamps import now_ms
+
+    app = create_app({"DB_PATH": os.path.join(tempfile.mkdtemp(), "ts.db"), "TESTING": True})
+    with app.app_context():
+        sid = db_module.create_session()
+        added = db_module.add_message(sid, "user", "Bonjour")
+        assert set(added) == {"id", "role", "content", "timestamp", "error"}
+        assert re.fullmatch(r"\d{4}-\d\d-\d\d \d\d:\d\d:\d\d", added["timestamp"])
+        assert db_module.get_messages(sid) == [
+            {"role": "user", "content": "Bonjour", "timestamp": added["timestamp"], "error": None}]
+
+        db_module.log_login_attempt("a@b.cm", "127.0.0.1", False)
+        db_module.log_login_attempt("a@b.cm", "127.0.0.1", True)
+        assert db_module.count_recent_login_failures("a@b.cm", now_ms() - 60000) == 1
+        assert db_module.count_recent_login_failures("a@b.cm", now_ms() + 60000) == 0
+        assert db_module.get_idle_sessions(now_ms() + 1000) == [sid]
+        assert db_module.get_idle_sessions(now_ms() - 60000) == []
+
+        with db_module._pools().reader.connection() as conn:
+            for sql in ("SELECT COUNT(*) FROM login_attempt WHERE email = ? AND attempted_ms >= ? AND success = 0",
+                        "SELECT uuid FROM session WHERE status = ? AND last_activity_ms < ? "
+                        "ORDER BY last_activity_ms LIMIT ?"):
+                plan = QUERY_STATS.plan_for(conn, sql, ("x", 0) + ((1,) if "LIMIT" in sql else ()))
+                assert any("COVERING INDEX" in step for step in plan), plan
+    print('[PASS] Timestamp dicts and covering range queries OK')
+
+
+def test_gemini_client_is_created_lazily():
+    from service import gemini_service as svc_module
+    svc = svc_module.GeminiService()
+    assert svc._client_initialized is False
+    svc.client = object()
+    assert svc.is_available()
+    print('[PASS] Lazy Gemini client OK')
+
+
+if __name__ == "__main__":
+    test_fresh_database_reaches_latest_version()
+    test_legacy_user_table_is_upgraded()
+    test_integer_timestamps_backfill_resumes()
+    test_timestamp_dicts_and_range_queries()
+    test_gemini_client_is_created_lazily()
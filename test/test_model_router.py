@@ -0,0 +1,85 @@
+"""Test latency-aware model routing and failover in GeminiService.
+Run: python test/test_model_router.py
+"""
+
+import os
+import sys
+from types import SimpleNamespace
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from service.gemini_service import GeminiService
+from service.model_router import FAST, STRONG, ModelRouter
+
+
+class RecordingClient:
+    """Fake client failing with 503 for the models listed in `overloaded`."""
+
+    def __init__(self, overloaded=()):
+        self.calls = []
+        outer = self
+
+        class models:
+            @staticmethod
+            def generate_content(model, contents):
+                outer.calls.append(model)
+                if model in overloaded:
+                    raise Exception("503 UNAVAILABLE: The model is overloaded.")
+                return SimpleNamespace(text=f"réponse de {model}")
+
+        self.models = models
+
+
+def _service(client):
+    svc = GeminiService()
+    svc.client = client
+    svc.retry_delay_ms = 1
+    svc.router = ModelRouter("strong-a", fast_models=["fast-a"], strong_models=["strong-a", "strong-b"])
+    return svc
+
+
+def test_classify():
+    router = ModelRouter("strong-a", fast_models=["fast-a"], strong_models=["strong-a"])
+    assert router.classify("Bonjour", []) == FAST
+    assert router.classify("Donne-moi le lien du portail", []) == FAST
+    assert router.classify("Comment faire ma préinscription en master ?", []) == STRONG
+    assert router.classify("x" * 500, []) == STRONG
+    long_context = [{"role": "user", "content": "y" * 5000}]
+    assert router.classify("merci", long_context) == STRONG
+    # Without fast models everything stays on the default model
+    assert ModelRouter("m").plan("Bonjour", []) == ["m"]
+    print('[PASS] Router heuristics OK')
+
+
+def test_failover_on_overload():
+    client = RecordingClient(overloaded={"strong-a"})
+    svc = _service(client)
+    reply = svc.generate_reply("Pourquoi mon dossier est-il rejeté ?", [])
+    assert reply == "réponse de strong-b", reply
+    assert client.calls == ["strong-a", "strong-b"]
+    # strong-a is now cooling down, the next complex request skips it
+    client.calls.clear()
+    svc.generate_reply("Comment payer les frais ?", [])
+    assert client.calls == ["strong-b"], client.calls
+    stats = svc.stats()["models"]
+    assert stats["strong-a"]["errors"] == 1 and stats["strong-a"]["cooling_down"]
+    assert stats["strong-b"]["calls"] == 2
+    print('[PASS] Router failover OK')
+
+
+def test_fast_route():
+    client = RecordingClient()
+    svc = _service(client)
+    svc.generate_reply("Bonjour", [])
+    assert client.calls == ["fast-a"]
+    assert svc.stats()["routes"][FAST] == 1
+    print('[PASS] Fast route OK')
+
+
+if __name__ == "__main__":
+    test_classify()
+    test_failover_on_overload()
+    test_fast_route()
@@ -0,0 +1,110 @@
+"""Test the principal cache behind login_required/admin_required (hits, invalidation, generations).
+Run: python test/test_principal_cache.py
+"""
+
+import os
+import sys
+import tempfile
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from app import create_app
+from database import db as db_module
+from database.pool import connect
+
+
+def _make_app(path=None, **config):
+    path = path or os.path.join(tempfile.mkdtemp(), "principals.db")
+    return create_app(dict({"DB_PATH": path, "TESTING": True}, **config))
+
+
+def _logged_in(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+    return client
+
+
+def test_me_served_from_cache():
+    app = _make_app()
+    with app.app_context():
+        user_id = db_module.create_user("etudiant@univ.cm", "Étudiant", "hash")
+    client = _logged_in(app, user_id)
+    for _ in range(10):
+        resp = client.get('/api/auth/me')
+        assert resp.status_code == 200
+        assert resp.get_json()['user']['email'] == "etudiant@univ.cm"
+    stats = app.extensions['principals'].stats()
+    assert stats['misses'] == 1 and stats['hits'] == 9
+    assert stats['hit_ratio'] == 0.9 and stats['queries_saved_per_request'] > 0.5
+    print('[PASS] /api/auth/me resolved from the principal cache OK')
+
+
+def test_local_invalidation_on_updates():
+    app = _make_app()
+    with app.app_context():
+        user_id = db_module.create_user("admin@univ.cm", "Admin", "hash")
+    client = _logged_in(app, user_id)
+    assert client.get('/api/admin/principals').status_code == 403
+
+    with app.app_context():
+        db_module.update_user_role(user_id, 'admin')
+    stats = client.get('/api/admin/principals').get_json()
+    assert stats['invalidations'] == 1
+
+    with app.app_context():
+        db_module.update_user_verification("admin@univ.cm")
+    assert client.get('/api/auth/me').status_code == 200
+    with app.app_context():
+        db_module.update_user_password(user_id, "new-hash")
+    assert app.extensions['principals'].counters['invalidations'] == 3
+
+    conn = connect(app.config["DB_PATH"], read_only=True)
+    assert conn.execute("SELECT COUNT(*) FROM user_invalidation WHERE user_id = ?", (user_id,)).fetchone()[0] == 3
+    conn.close()
+    print('[PASS] Role, verification and password changes invalidate OK')
+
+
+def test_other_worker_follows_generation():
+    writer_app = _make_app()
+    path = writer_app.config["DB_PATH"]
+    reader_app = _make_app(path, PRINCIPAL_SYNC_INTERVAL_MS=60000)
+    with writer_app.app_context():
+        user_id = db_module.create_user("prof@univ.cm", "Prof", "hash")
+    client = _logged_in(reader_app, user_id)
+    assert client.get('/api/auth/me').get_json()['user']['role'] == 'student'
+
+    with writer_app.app_context():
+        db_module.update_user_role(user_id, 'admin')
+    # Within the sync interval the other worker may still serve the cached row
+    assert client.get('/api/auth/me').get_json()['user']['role'] == 'student'
+    cache = reader_app.extensions['principals']
+    cache._last_sync -= 60
+    assert client.get('/api/auth/me').get_json()['user']['role'] == 'admin'
+    assert cache.counters['remote_invalidations'] == 1 and cache.generation == 1
+    print('[PASS] Other worker drops stale principal on next generation sync OK')
+
+
+def test_deleted_user_logged_out():
+    app = _make_app()
+    with app.app_context():
+        user_id = db_module.create_user("parti@univ.cm", "Parti", "hash")
+    conn = connect(app.config["DB_PATH"])
+    conn.execute("DELETE FROM user WHERE id = ?", (user_id,))
+    conn.close()
+    client = _logged_in(app, user_id)
+    resp = client.get('/api/auth/me', headers={'Content-Type': 'application/json'})
+    assert resp.status_code == 401
+    with client.session_transaction() as sess:
+        assert 'user_id' not in sess
+    print('[PASS] Session of a deleted user is ended OK')
+
+
+if __name__ == "__main__":
+    test_me_served_from_cache()
+    test_local_invalidation_on_updates()
+    test_other_worker_follows_generation()
+    test_deleted_user_logged_out()
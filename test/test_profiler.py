@@ -0,0 +1,112 @@
+"""Test the sampling profiler and its admin endpoints.
+Run: python test/test_profiler.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from app import create_app
+from service.profiler import SamplingProfiler
+
+
+def _slow_function(seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        time.sleep(0.001)
+
+
+def test_slow_request_captured():
+    profiler = SamplingProfiler(tempfile.mkdtemp(), enabled=True, interval_ms=2, threshold_ms=50)
+    capture = profiler.begin()
+    _slow_function(0.1)
+    name = profiler.end(capture, "POST", "/api/chat", 200)
+    assert name is not None
+    with open(profiler.capture_path(name), encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert any("_slow_function (test_profiler.py" in line for line in lines), lines[:3]
+    stack, count = lines[0].rsplit(" ", 1)
+    assert int(count) > 0 and ";" in stack
+
+    # Fast requests are profiled but not kept
+    capture = profiler.begin()
+    assert profiler.end(capture, "GET", "/api/history", 200) is None
+    captures = profiler.captures()
+    assert len(captures) == 1 and captures[0]["reason"] == "slow" and captures[0]["path"] == "/api/chat"
+    print('[PASS] Slow request captured as collapsed stacks OK')
+
+
+def test_ring_buffer_and_rate_limit():
+    profiler = SamplingProfiler(tempfile.mkdtemp(), enabled=True, interval_ms=1, threshold_ms=0,
+                                max_files=3, max_per_min=5)
+    names = []
+    for _ in range(7):
+        capture = profiler.begin()
+        _slow_function(0.01)
+        names.append(profiler.end(capture, "GET", "/api/history", 200))
+    written = [n for n in names if n]
+    assert len(written) == 5, names
+    assert profiler.counters["rate_limited"] == 2
+    assert [c["name"] for c in profiler.captures()] == written[:-4:-1]
+    assert profiler.capture_path(written[0]) is None
+    assert profiler.capture_path("../state") is None
+    print('[PASS] Ring buffer and capture rate limit OK')
+
+
+def test_disabled_and_shared_settings():
+    directory = tempfile.mkdtemp()
+    first = SamplingProfiler(directory)
+    second = SamplingProfiler(directory)
+    assert first.begin() is None
+    first.configure(enabled=True, threshold_ms=10, sample_rate=5)
+    assert first.settings() == {"enabled": True, "threshold_ms": 10.0, "sample_rate": 1.0}
+    capture = second.begin()
+    assert capture is not None and second.threshold_ms == 10.0
+    second.end(capture, "GET", "/api/history", 200)
+    print('[PASS] Disabled by default, settings shared through state.json OK')
+
+
+def test_admin_endpoints():
+    directory = tempfile.mkdtemp()
+    app = create_app({
+        "DB_PATH": os.path.join(tempfile.mkdtemp(), "profiler.db"),
+        "TESTING": True,
+        "ADMIN_API_TOKEN": "secret",
+        "PROFILE_DIR": directory,
+        "PROFILE_INTERVAL_MS": 1,
+    })
+    auth = {"Authorization": "Bearer secret"}
+
+    @app.route('/api/slow')
+    def slow():
+        _slow_function(0.05)
+        return {"ok": True}
+
+    with app.test_client() as http:
+        assert http.get('/api/admin/profiler').status_code in (401, 403)
+        resp = http.post('/api/admin/profiler', json={"enabled": True, "threshold_ms": 20}, headers=auth)
+        assert resp.status_code == 200 and resp.get_json()["enabled"] is True
+        assert http.get('/api/slow').status_code == 200
+        assert http.get('/api/history').status_code == 200
+        listing = http.get('/api/admin/profiler', headers=auth).get_json()
+        assert [c["path"] for c in listing["captures"]] == ["/api/slow"]
+        assert listing["profiler"]["profiled"] == 2
+        name = listing["captures"][0]["name"]
+        resp = http.get(f'/api/admin/profiler/{name}', headers=auth)
+        assert resp.status_code == 200 and b"slow (test_profiler.py" in resp.data
+        assert http.get('/api/admin/profiler/0-0-0', headers=auth).status_code == 404
+        assert http.post('/api/admin/profiler', json={"threshold_ms": "x"}, headers=auth).status_code == 400
+    print('[PASS] Admin profiler endpoints OK')
+
+
+if __name__ == "__main__":
+    test_slow_request_captured()
+    test_ring_buffer_and_rate_limit()
+    test_disabled_and_shared_settings()
+    test_admin_endpoints()
@@ -0,0 +1,97 @@
+"""Test SQL statement instrumentation and the slow-query log.
+Run: python test/test_query_stats.py
+"""
+
+import os
+import sys
+import tempfile
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from app import create_app
+from database import db as db_module
+from database.instrument import QUERY_STATS, normalize_sql, param_shape, plan_flags
+
+MESSAGES_SQL = ("SELECT role, content, created_ms, error, codec FROM message WHERE session_id = ? "
+                "ORDER BY created_ms ASC, id ASC")
+
+
+def _app(**config):
+    return create_app(dict({
+        "DB_PATH": os.path.join(tempfile.mkdtemp(), "queries.db"),
+        "TESTING": True,
+        "ADMIN_API_TOKEN": "secret",
+    }, **config))
+
+
+def _statement(sql):
+    for stmt in QUERY_STATS.snapshot(top=500)["statements"]:
+        if stmt["sql"] == sql:
+            return stmt
+    raise AssertionError(f"{sql!r} not recorded")
+
+
+def test_normalization():
+    assert normalize_sql("SELECT *\n  FROM t WHERE a = 'x''y' AND b = 42 AND c IN (?, ?, ?);") == \
+        "SELECT * FROM t WHERE a = ? AND b = ? AND c IN (?...)"
+    assert normalize_sql("SELECT col2 FROM t2 WHERE id = ?") == "SELECT col2 FROM t2 WHERE id = ?"
+    assert param_shape(("bonjour", 3, None, b"\x00\x01")) == ["str(7)", "int", "null", "bytes(2)"]
+    assert plan_flags(["SEARCH message USING INDEX idx (session_id=?)"]) == []
+    assert plan_flags(["SCAN message", "USE TEMP B-TREE FOR ORDER BY"]) == ["full_scan", "temp_btree"]
+    print('[PASS] SQL normalization and plan flags OK')
+
+
+def test_missing_index_flagged():
+    app = _app()
+    with app.app_context():
+        sid = db_module.create_session()
+        db_module.add_message(sid, "user", "Bonjour")
+        QUERY_STATS.reset()
+        db_module.get_messages(sid)
+        stmt = _statement(MESSAGES_SQL)
+        assert stmt["count"] == 1 and stmt["rows"] == 1
+        assert stmt["flags"] == [], stmt["plan"]
+
+        # Simulate the regression: the (session_id) index disappears
+        db_module._pools().writer.run(lambda db: db.execute("DROP INDEX idx_message_session_created"))
+        QUERY_STATS.reset()
+        db_module.get_messages(sid)
+        assert "full_scan" in _statement(MESSAGES_SQL)["flags"]
+    print('[PASS] Missing (session_id) index flagged as a full scan OK')
+
+
+def test_slow_log_hides_values():
+    app = _app(DB_SLOW_QUERY_MS=0)
+    with app.app_context():
+        QUERY_STATS.reset()
+        sid = db_module.create_session()
+        db_module.add_message(sid, "user", "mon mot de passe secret")
+        slow_log = QUERY_STATS.snapshot()["slow_log"]
+        inserts = [e for e in slow_log if e["sql"].startswith("INSERT INTO message")]
+        assert inserts and "str(23)" in inserts[0]["params"]
+        assert "secret" not in repr(slow_log)
+        assert all(e["plan"] is not None for e in inserts)
+    print('[PASS] Slow-query log keeps parameter shapes only OK')
+
+
+def test_admin_endpoint():
+    app = _app()
+    with app.test_client() as http:
+        assert http.get('/api/admin/queries').status_code in (401, 403)
+        http.get('/api/history')
+        data = http.get('/api/admin/queries?top=5', headers={"Authorization": "Bearer secret"}).get_json()
+        assert data["enabled"] is True and len(data["statements"]) <= 5
+        assert {"sql", "count", "p95_ms", "plan", "flags"} <= set(data["statements"][0])
+        http.get('/api/admin/queries?reset=1', headers={"Authorization": "Bearer secret"})
+        assert QUERY_STATS.snapshot()["statements"] == []
+    print('[PASS] /api/admin/queries OK')
+
+
+if __name__ == "__main__":
+    test_normalization()
+    test_missing_index_flagged()
+    test_slow_log_hides_values()
+    test_admin_endpoint()
@@ -0,0 +1,153 @@
+"""Test the incrementally maintained analytics rollups and /api/admin/stats.
+Run: python test/test_rollups.py
+"""
+
+import os
+import sys
+import tempfile
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from app import create_app
+from database.db import add_message, create_session, get_dashboard_stats, refresh_stats
+from database.rollups import normalize_question
+
+TOKEN = "test-admin-token"
+
+
+def _make_app():
+    path = os.path.join(tempfile.mkdtemp(), "rollups.db")
+    return create_app({"DB_PATH": path, "TESTING": True, "ADMIN_API_TOKEN": TOKEN,
+                       "STATS_REFRESH_INTERVAL_S": 0})
+
+
+def _ground_truth(app):
+    from database.pool import connect
+    conn = connect(app.config["DB_PATH"], read_only=True)
+    try:
+        by_day = {}
+        for day, messages, errors, sessions in conn.execute(
+                "SELECT strftime('%Y-%m-%d', created_ms / 1000, 'unixepoch'), COUNT(*), COUNT(error), COUNT(DISTINCT session_id) "
+                "FROM message GROUP BY 1"):
+            by_day[day] = (messages, errors, sessions)
+        return by_day
+    finally:
+        conn.close()
+
+
+def test_incremental_refresh_matches_group_by():
+    app = _make_app()
+    with app.app_context():
+        a, b = create_session(), create_session()
+        add_message(a, 'user', 'Comment faire ma préinscription ?')
+        add_message(a, 'assistant', 'Rendez-vous sur SYSTHAG.')
+        add_message(b, 'user', '  comment faire ma   PRÉINSCRIPTION')
+        assert refresh_stats(settle_seconds=0) == 3
+        assert refresh_stats(settle_seconds=0) == 0
+
+        add_message(b, 'assistant', 'Voir le portail.', error='timeout')
+        add_message(b, 'user', 'Quels sont les frais ?')
+        assert refresh_stats(settle_seconds=0) == 2
+
+        stats = get_dashboard_stats(days=2)
+    truth = _ground_truth(app)
+    assert len(stats["days"]) == len(truth) == 1
+    day = stats["days"][0]
+    assert (day["messages"], day["errors"], day["active_sessions"]) == truth[day["day"]]
+    assert day["by_role"] == {"user": 3, "assistant": 2}
+    assert day["unanswered"] == 1
+    assert stats["top_questions"][0] == {
+        "question": "comment faire ma préinscription", "asked": 2,
+        "last_asked_at": stats["top_questions"][0]["last_asked_at"],
+    }
+    assert sum(h["messages"] for h in stats["hours"]) == 5
+    assert stats["watermark"]["last_message_id"] == 5
+    print('[PASS] Incremental rollups match GROUP BY OK')
+
+
+def test_settle_window_holds_back_recent_rows():
+    app = _make_app()
+    with app.app_context():
+        sid = create_session()
+        add_message(sid, 'user', 'Bonjour')
+        assert refresh_stats(settle_seconds=3600) == 0
+        assert refresh_stats(settle_seconds=0) == 1
+    assert normalize_question("  Bonjour   Bot ?! ") == "bonjour bot"
+    print('[PASS] Settle window OK')
+
+
+def test_late_commit_of_lower_id_is_folded():
+    # Async write-behind reserves id blocks per worker: id 5 may commit after
+    # id 1001 from another worker was already folded
+    from database.db import _pools
+    from database.timestamps import now_ms
+
+    def insert(msg_id, content):
+        _pools().writer.run(lambda db: db.execute(
+            "INSERT INTO message (id, session_id, role, content, created_ms) "
+            "SELECT ?, id, 'user', ?, ? FROM session WHERE uuid = ?",
+            (msg_id, content, now_ms(), sid)))
+
+    app = _make_app()
+    with app.app_context():
+        sid = create_session()
+        insert(1001, 'Bonjour')
+        assert refresh_stats(settle_seconds=0) == 1
+        insert(5, 'Quels sont les frais ?')
+        assert refresh_stats(settle_seconds=0) == 1
+        assert refresh_stats(settle_seconds=0) == 0
+        stats = get_dashboard_stats(days=2)
+    assert stats["days"][0]["messages"] == 2
+    assert stats["watermark"]["last_message_id"] == 1001
+    print('[PASS] Late commit of a lower id folded OK')
+
+
+def test_refresher_survives_unexpected_errors():
+    import time
+    from database.rollups import RollupRefresher
+
+    class FlakyWriter:
+        calls = 0
+
+        def run(self, fn):
+            self.calls += 1
+            if self.calls == 1:
+                raise KeyError("boom")
+            return 0
+
+    refresher = RollupRefresher(FlakyWriter(), interval_s=0.01).start()
+    try:
+        deadline = time.time() + 5
+        while refresher.runs < 1 and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        refresher.stop()
+    assert refresher.runs >= 1
+    print('[PASS] Refresher keeps looping after an unexpected error OK')
+
+
+def test_admin_stats_endpoint():
+    app = _make_app()
+    with app.app_context():
+        sid = create_session()
+        add_message(sid, 'user', 'Bonjour')
+        refresh_stats(settle_seconds=0)
+    client = app.test_client()
+    assert client.get('/api/admin/stats').status_code == 401
+    resp = client.get('/api/admin/stats?days=7&top=5', headers={'Authorization': f'Bearer {TOKEN}'})
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert data["days"][0]["messages"] == 1
+    assert data["top_questions"][0]["question"] == "bonjour"
+    print('[PASS] Admin stats endpoint OK')
+
+
+if __name__ == "__main__":
+    test_incremental_refresh_matches_group_by()
+    test_settle_window_holds_back_recent_rows()
+    test_late_commit_of_lower_id_is_folded()
+    test_refresher_survives_unexpected_errors()
+    test_admin_stats_endpoint()
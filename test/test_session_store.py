@@ -0,0 +1,167 @@
+"""Test the server-side SQLite session store (opaque cookie, cache, rotation, revocation, sweep).
+Run: python test/test_session_store.py
+"""
+
+import os
+import sys
+import tempfile
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from flask import jsonify, session
+from flask.sessions import SecureCookieSessionInterface
+
+from app import create_app
+from database.pool import connect
+from database.timestamps import now_ms
+from service.session_store import SQLiteSessionInterface, _key
+
+TOKEN = "test-admin-token"
+
+
+def _make_app(**config):
+    path = os.path.join(tempfile.mkdtemp(), "sessions.db")
+    app = create_app(dict({"DB_PATH": path, "TESTING": True, "ADMIN_API_TOKEN": TOKEN}, **config))
+
+    @app.route('/_whoami')
+    def whoami():
+        return jsonify({'email': session.get('user_email'), 'session_id': session.get('session_id')})
+
+    @app.route('/_remember/<value>')
+    def remember(value):
+        session['session_id'] = value
+        return jsonify({})
+
+    return app
+
+
+def _rows(app):
+    conn = connect(app.config["DB_PATH"], read_only=True)
+    try:
+        return conn.execute("SELECT id, data, user_id, expires_ms FROM web_session").fetchall()
+    finally:
+        conn.close()
+
+
+def _login(client, email='etudiant@univ.cm'):
+    resp = client.post('/api/auth/login', json={'email': email, 'password': 'Secret123'})
+    assert resp.status_code == 200, resp.get_json()
+    return client.get_cookie('session').value
+
+
+def test_cookie_holds_only_an_opaque_id():
+    app = _make_app()
+    store = app.extensions["session_store"]
+    assert isinstance(app.session_interface, SQLiteSessionInterface)
+    client = app.test_client()
+    sid = _login(client)
+    assert len(sid) == 43 and '.' not in sid
+
+    (key, data, user_id, _), = _rows(app)
+    assert key == _key(sid) and sid.encode() not in key
+    assert 'etudiant@univ.cm' in data and user_id == 'temp_user_id'
+
+    # Unmodified sessions are read from the cache and never rewritten
+    writes = store.counters["writes"]
+    for _ in range(5):
+        resp = client.get('/_whoami')
+        assert resp.get_json()['email'] == 'etudiant@univ.cm'
+        assert 'Set-Cookie' not in resp.headers
+    assert store.counters["writes"] == writes
+    assert store.counters["cache_hits"] >= 5
+
+    # Another worker (empty cache) loads the same data from the table
+    other = app.test_client()
+    other.set_cookie('session', sid)
+    store._cache.clear()
+    assert other.get('/_whoami').get_json()['email'] == 'etudiant@univ.cm'
+    print('[PASS] Opaque cookie id, data server-side, no write on read OK')
+
+
+def test_login_rotates_id_and_logout_deletes():
+    app = _make_app()
+    client = app.test_client()
+    client.get('/_remember/conv-1')
+    anonymous = client.get_cookie('session').value
+    sid = _login(client)
+    assert sid != anonymous
+    assert [r[0] for r in _rows(app)] == [_key(sid)]
+    assert client.get('/_whoami').get_json()['session_id'] == 'conv-1'
+
+    # The pre-login id no longer opens anything
+    planted = app.test_client()
+    planted.set_cookie('session', anonymous)
+    assert planted.get('/_whoami').get_json() == {'email': None, 'session_id': None}
+
+    resp = client.post('/api/auth/logout')
+    assert resp.status_code == 200
+    assert _rows(app) == []
+    assert client.get_cookie('session') is None
+    print('[PASS] Session id rotated on login, row deleted on logout OK')
+
+
+def test_revoke_user_and_stats_endpoints():
+    app = _make_app()
+    first, second, other = app.test_client(), app.test_client(), app.test_client()
+    _login(first)
+    _login(second)
+    _login(other, email='autre@univ.cm')
+
+    admin = app.test_client()
+    headers = {'Authorization': f'Bearer {TOKEN}'}
+    stats = admin.get('/api/admin/sessions', headers=headers).get_json()
+    assert stats['backend'] == 'sqlite' and stats['stored']['total'] == 3
+
+    # All three share the placeholder user id set by the login route
+    resp = admin.post('/api/admin/sessions/revoke', json={'user_id': 'temp_user_id'}, headers=headers)
+    assert resp.get_json() == {'revoked': 3}
+    assert first.get('/_whoami').get_json()['email'] is None
+    assert admin.post('/api/admin/sessions/revoke', json={}, headers=headers).status_code == 400
+
+    sid = _login(first)
+    resp = admin.post('/api/admin/sessions/revoke', json={'sid': sid}, headers=headers)
+    assert resp.get_json() == {'revoked': 1}
+    assert first.get('/_whoami').get_json()['email'] is None
+    print('[PASS] Server-side revocation by user and by id OK')
+
+
+def test_sweep_deletes_expired_in_batches():
+    app = _make_app(SESSION_SWEEP_BATCH=3)
+    store = app.extensions["session_store"]
+    conn = connect(app.config["DB_PATH"])
+    past, future = now_ms() - 1000, now_ms() + 3600 * 1000
+    conn.executemany("INSERT INTO web_session (id, data, user_id, expires_ms, updated_ms) VALUES (?, '{}', NULL, ?, 0)",
+                     [(bytes([i]) * 32, past if i < 10 else future) for i in range(12)])
+    conn.close()
+    with app.app_context():
+        assert store.sweep() == 10
+    assert len(_rows(app)) == 2
+    print('[PASS] Expired sessions swept in batches OK')
+
+
+def test_foreign_cookie_ignored_and_cookie_backend():
+    app = _make_app()
+    client = app.test_client()
+    client.set_cookie('session', 'eyJ1c2VyX2lkIjoiYWRtaW4ifQ.Zx.signature')
+    assert client.get('/_whoami').get_json()['email'] is None
+    assert app.extensions["session_store"].counters["cache_misses"] == 0
+
+    cookie_app = _make_app(SESSION_BACKEND="cookie")
+    assert type(cookie_app.session_interface) is SecureCookieSessionInterface
+    assert "session_store" not in cookie_app.extensions
+    client = cookie_app.test_client()
+    _login(client)
+    assert client.get('/_whoami').get_json()['email'] == 'etudiant@univ.cm'
+    assert _rows(cookie_app) == []
+    print('[PASS] Malformed cookie ignored, cookie backend still available OK')
+
+
+if __name__ == "__main__":
+    test_cookie_holds_only_an_opaque_id()
+    test_login_rotates_id_and_logout_deletes()
+    test_revoke_user_and_stats_endpoints()
+    test_sweep_deletes_expired_in_batches()
+    test_foreign_cookie_ignored_and_cookie_backend()
@@ -0,0 +1,174 @@
+"""Test sharded chat storage: uuid routing, merged reads, rebalance and per-shard rollups.
+Run: python test/test_shards.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+import uuid
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from app import create_app, init_worker
+from database.db import (
+    add_message, chat_db_paths, create_session, create_user, get_dashboard_stats, get_idle_sessions,
+    get_messages, get_user_by_id, refresh_stats, session_exists,
+)
+from database.pool import close_pools, connect
+from database.shards import rebalance, shard_index, shard_path
+
+QUESTIONS = ["Comment faire ma préinscription ?", "Quels sont les frais ?", "Où trouver le lien ?"]
+
+
+def _make_app(path, **config):
+    return create_app(dict({"DB_PATH": path, "TESTING": True, "STATS_REFRESH_INTERVAL_S": 0}, **config))
+
+
+def _count(path, table):
+    conn = connect(path, read_only=True)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _fill(app, sessions=30):
+    uuids = []
+    with app.app_context():
+        for i in range(sessions):
+            sid = create_session()
+            add_message(sid, 'user', QUESTIONS[i % 3])
+            add_message(sid, 'assistant', 'Voici la réponse. ' * (i % 40), error='timeout' if i % 7 == 0 else None)
+            uuids.append(sid)
+    return uuids
+
+
+def test_sessions_routed_by_uuid():
+    path = os.path.join(tempfile.mkdtemp(), "chat.db")
+    app = _make_app(path, DB_SHARDS=4)
+    uuids = _fill(app, 40)
+    with app.app_context():
+        assert chat_db_paths() == [shard_path(path, i) for i in range(4)]
+        for sid in uuids:
+            assert session_exists(sid)
+            messages = get_messages(sid)
+            assert [m['role'] for m in messages] == ['user', 'assistant']
+        assert not session_exists(str(uuid.uuid4()))
+        user_id = create_user("etudiant@example.com", "Étudiant", "hash")
+        assert get_user_by_id(user_id)['email'] == "etudiant@example.com"
+        idle = get_idle_sessions(2 ** 62, limit=10)
+        everyone = get_idle_sessions(2 ** 62, limit=100)
+    # Users stay in the primary file, chat rows only in the shards
+    assert _count(path, "session") == 0 and _count(path, "user") == 1
+    counts = [_count(shard_path(path, i), "session") for i in range(4)]
+    assert sum(counts) == 40 and all(counts), counts
+    for sid in uuids:
+        conn = connect(shard_path(path, shard_index(sid, 4)), read_only=True)
+        assert conn.execute("SELECT 1 FROM session WHERE uuid = ?", (sid,)).fetchone()
+        conn.close()
+    # Merged across every shard, oldest activity first
+    assert sorted(everyone) == sorted(uuids) and idle == everyone[:10]
+    print('[PASS] Sessions and messages routed to their shard by uuid OK')
+
+
+def test_jump_hash_moves_few_sessions():
+    keys = [str(uuid.uuid4()) for _ in range(4000)]
+    before = [shard_index(k, 4) for k in keys]
+    after = [shard_index(k, 5) for k in keys]
+    moved = [(b, a) for b, a in zip(before, after) if b != a]
+    # Only sessions moving to the new shard, about 1/5 of them
+    assert all(a == 4 for _, a in moved)
+    assert 0.15 < len(moved) / len(keys) < 0.25, len(moved)
+    print('[PASS] Growing the shard count moves ~1/N of the sessions OK')
+
+
+def test_rebalance_keeps_messages_and_rollups():
+    path = os.path.join(tempfile.mkdtemp(), "chat.db")
+    app = _make_app(path)
+    uuids = _fill(app)
+    with app.app_context():
+        refresh_stats(settle_seconds=0)
+        before = get_dashboard_stats(days=2)
+        history = {sid: get_messages(sid) for sid in uuids}
+    close_pools()
+
+    result = rebalance(path, 3)
+    assert result["sessions"] == 30 and result["messages"] == 60 and sum(result["distribution"].values()) == 30
+    assert _count(path, "message") == 0
+    assert rebalance(path, 3)["sessions"] == 0  # idempotent
+
+    sharded = _make_app(path, DB_SHARDS=3)
+    with sharded.app_context():
+        assert {sid: get_messages(sid) for sid in uuids} == history
+        # Rollups were taken out of the source and are folded again by the shards
+        refresh_stats(settle_seconds=0)
+        after = get_dashboard_stats(days=2)
+        assert after["days"] == before["days"], (after["days"], before["days"])
+        assert after["hours"] == before["hours"]
+        by_question = lambda d: sorted(d["top_questions"], key=lambda q: q["question"])
+        assert by_question(after) == by_question(before)
+        assert len(after["watermark"]["shards"]) == 3
+        sid = create_session()
+        add_message(sid, 'user', 'Bonjour')
+    close_pools()
+
+    # Shrinking back to the single file
+    assert rebalance(path, 0)["sessions"] == 31
+    app = _make_app(path)
+    with app.app_context():
+        assert get_messages(sid)[0]['content'] == 'Bonjour'
+        refresh_stats(settle_seconds=0)
+        assert get_dashboard_stats(days=2)["days"][0]["messages"] == before["days"][0]["messages"] + 1
+    print('[PASS] Rebalance moves sessions, keeps history and rollup totals OK')
+
+
+def test_write_behind_and_export_per_shard():
+    path = os.path.join(tempfile.mkdtemp(), "chat.db")
+    app = _make_app(path, DB_SHARDS=2, DB_WRITE_BEHIND=True)
+    init_worker(app)
+    assert "db_write_behind" not in app.extensions
+    assert sorted(app.extensions["db_write_behind_shards"]) == [shard_path(path, 0), shard_path(path, 1)]
+    uuids = _fill(app, 10)
+    with app.app_context():
+        assert all(len(get_messages(sid)) == 2 for sid in uuids)
+    out = os.path.join(tempfile.mkdtemp(), "export.ndjson")
+    result = app.test_cli_runner().invoke(args=["db", "export", "--out", out])
+    assert result.exit_code == 0, result.output
+    with open(out, encoding="utf-8") as fh:
+        lines = [json.loads(line) for line in fh]
+    assert sorted(l["uuid"] for l in lines if l["type"] == "session") == sorted(uuids)
+    assert sum(1 for l in lines if l["type"] == "message") == 20
+
+    # Importing into a sharded database lands every session in its shard
+    other = os.path.join(tempfile.mkdtemp(), "imported.db")
+    imported = _make_app(other, DB_SHARDS=3)
+    result = imported.test_cli_runner().invoke(args=["db", "import", out])
+    assert result.exit_code == 0, result.output
+    assert _count(other, "session") == 0
+    assert sum(_count(shard_path(other, i), "session") for i in range(3)) == 10
+    with imported.app_context():
+        assert all(len(get_messages(sid)) == 2 for sid in uuids)
+
+    # Same through the admin endpoint, without a rebalance in the request
+    served = _make_app(os.path.join(tempfile.mkdtemp(), "served.db"), DB_SHARDS=3, ADMIN_API_TOKEN="t")
+    with open(out, "rb") as fh:
+        resp = served.test_client().post('/api/admin/import', data=fh.read(),
+                                         headers={'Authorization': 'Bearer t'})
+    assert resp.status_code == 200 and resp.get_json()["sessions"] == 10, resp.get_json()
+    assert _count(served.config["DB_PATH"], "session") == 0
+    with served.app_context():
+        for sid in uuids:
+            assert _count(shard_path(served.config["DB_PATH"], shard_index(sid, 3)), "session") >= 1
+            assert len(get_messages(sid)) == 2
+    print('[PASS] Write-behind per shard, export and import across shards OK')
+
+
+if __name__ == "__main__":
+    test_sessions_routed_by_uuid()
+    test_jump_hash_moves_few_sessions()
+    test_rebalance_keeps_messages_and_rollups()
+    test_write_behind_and_export_per_shard()
@@ -0,0 +1,143 @@
+"""Test Gemini token metering, batched flushes, daily quotas and the usage report.
+Run: python test/test_usage.py
+"""
+
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from app import create_app
+from database.pool import connect
+from service import gemini_service as svc_module
+from service.gemini_service import GeminiService, token_usage
+from service.usage import UsageMeter, utc_day
+
+TOKEN = "test-admin-token"
+
+
+class MeteredClient:
+    """Fake Gemini client reporting usage_metadata like google-genai."""
+
+    def __init__(self, prompt_tokens=100, output_tokens=40):
+        class models:
+            @staticmethod
+            def generate_content(model, contents):
+                usage = SimpleNamespace(prompt_token_count=prompt_tokens,
+                                        candidates_token_count=output_tokens, thoughts_token_count=None)
+                return SimpleNamespace(text="Voici la procédure.", usage_metadata=usage)
+
+        self.models = models
+
+
+def _make_app(**config):
+    svc = GeminiService()
+    svc.client = MeteredClient()
+    svc_module._gemini_service = svc
+    path = os.path.join(tempfile.mkdtemp(), "usage.db")
+    return create_app(dict({"DB_PATH": path, "TESTING": True, "ADMIN_API_TOKEN": TOKEN,
+                            "USAGE_FLUSH_INTERVAL_S": 0}, **config))
+
+
+def _rows(app):
+    conn = connect(app.config["DB_PATH"], read_only=True)
+    try:
+        return {(scope, subject): (p, o, c) for scope, subject, p, o, c in conn.execute(
+            "SELECT scope, subject, prompt_tokens, output_tokens, calls FROM token_usage")}
+    finally:
+        conn.close()
+
+
+def test_usage_aggregated_and_flushed_in_batches():
+    app = _make_app()
+    meter = app.extensions['usage']
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 'etudiant-1'
+    session_ids = set()
+    for _ in range(3):
+        resp = client.post('/api/chat', json={'message': 'Comment faire ma préinscription ?'})
+        assert resp.status_code == 200, resp.get_json()
+        session_ids.add(resp.get_json()['session_id'])
+    (session_id,) = session_ids
+    assert _rows(app) == {}  # nothing written before the flush
+    assert meter.stats()['pending_rows'] == 3
+
+    with app.app_context():
+        assert meter.flush() == 3
+    rows = _rows(app)
+    assert rows[('day', '')] == (300, 120, 3)
+    assert rows[('user', 'etudiant-1')] == (300, 120, 3)
+    assert rows[('session', session_id)] == (300, 120, 3)
+    print('[PASS] Token usage aggregated per day, user and session, flushed in one batch OK')
+
+
+def test_quota_rejects_before_calling_gemini():
+    app = _make_app(USAGE_DAILY_QUOTAS="student:300")
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 'etudiant-2'
+    statuses = [client.post('/api/chat', json={'message': 'Bonjour'}).status_code for _ in range(4)]
+    # 140 tokens per reply: allowed at 0 and 140, refused from 280 + 140 = 420 >= 300 on
+    assert statuses == [200, 200, 200, 429], statuses
+    resp = client.post('/api/chat', json={'message': 'Bonjour'})
+    assert resp.status_code == 429 and int(resp.headers['Retry-After']) > 0
+    assert app.extensions['usage'].counters['calls'] == 3
+
+    # Another worker starts from the table once this one has flushed
+    with app.app_context():
+        app.extensions['usage'].flush()
+        other = UsageMeter({"student": 300})
+        assert other.check("student", ("user", "etudiant-2")) is not None
+        assert other.check("student", ("user", "etudiant-3")) is None
+        assert other.check("admin", ("user", "etudiant-2")) is None
+    print('[PASS] Daily quota enforced in memory with 429 + Retry-After OK')
+
+
+def test_guest_quota_not_reset_by_new_session_ids():
+    app = _make_app(USAGE_DAILY_QUOTAS="guest:200")
+    statuses = []
+    for i in range(3):
+        # A fresh cookie jar and an invented session_id each time: still the same client address
+        resp = app.test_client().post('/api/chat', json={'message': 'Bonjour', 'session_id': f'inventee-{i}'})
+        statuses.append(resp.status_code)
+    assert statuses == [200, 200, 429], statuses
+    with app.app_context():
+        app.extensions['usage'].flush()
+    rows = _rows(app)
+    assert rows[('client', '127.0.0.1')] == (200, 80, 2)
+    assert not any(subject.startswith('inventee-') for _, subject in rows)
+    print('[PASS] Guest quota keyed on the client address and server-side sessions OK')
+
+
+def test_admin_usage_report():
+    app = _make_app()
+    client = app.test_client()
+    client.post('/api/chat', json={'message': 'Bonjour'})
+    resp = app.test_client().get('/api/admin/usage?days=3', headers={'Authorization': f'Bearer {TOKEN}'})
+    assert resp.status_code == 200
+    report = resp.get_json()
+    assert report['days'] == [{'day': utc_day(), 'prompt_tokens': 100, 'output_tokens': 40, 'calls': 1}]
+    assert report['top_users'] == [] and len(report['top_sessions']) == 1
+    assert report['quotas']['guest'] == 20000 and report['meter']['rows_flushed'] == 3
+    print('[PASS] /api/admin/usage report OK')
+
+
+def test_token_usage_estimate_without_metadata():
+    assert token_usage(SimpleNamespace(text="x" * 40), "p" * 400, "x" * 40) == (100, 10)
+    usage = SimpleNamespace(prompt_token_count=7, candidates_token_count=3, thoughts_token_count=5)
+    assert token_usage(SimpleNamespace(usage_metadata=usage), "", "") == (7, 8)
+    print('[PASS] Token counts read from usage_metadata or estimated OK')
+
+
+if __name__ == "__main__":
+    test_usage_aggregated_and_flushed_in_batches()
+    test_quota_rejects_before_calling_gemini()
+    test_guest_quota_not_reset_by_new_session_ids()
+    test_admin_usage_report()
+    test_token_usage_estimate_without_metadata()
@@ -0,0 +1,188 @@
+"""Test the /ws/chat WebSocket channel against a live local server.
+Run: python test/test_websocket.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from werkzeug.serving import make_server
+
+from app import create_app
+from database.db import get_messages
+from service import gemini_service as svc_module
+from service.gemini_service import GeminiService
+
+try:
+    import simple_websocket
+except ImportError:
+    simple_websocket = None
+
+
+class EchoClient:
+    def __init__(self, release=None):
+        self.release = release
+
+        class models:
+            @staticmethod
+            def generate_content(model, contents):
+                if self.release is not None:
+                    self.release.wait(5)
+                question = contents.rsplit("Utilisateur:", 1)[-1].strip().splitlines()[0]
+                return SimpleNamespace(text=f"écho {question}")
+
+        self.models = models
+
+
+def _serve(app):
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def _receive(ws):
+    return json.loads(ws.receive(timeout=5))
+
+
+def _frames_until(ws, kind, frame_id):
+    frames = []
+    while True:
+        frame = _receive(ws)
+        frames.append(frame)
+        if frame.get("type") == kind and frame.get("id") == frame_id:
+            return frames
+
+
+def test_websocket_chat():
+    if simple_websocket is None:
+        print('[SKIP] flask-sock not installed')
+        return
+    release = threading.Event()
+    svc = GeminiService()
+    svc.client = EchoClient(release)
+    svc_module._gemini_service = svc
+    app = create_app({"DB_PATH": os.path.join(tempfile.mkdtemp(), "ws.db"), "TESTING": True,
+                      "WS_ENABLED": True, "WS_MAX_CONNECTIONS": 2})
+    server = _serve(app)
+    # simple_websocket sends "Host: 127.0.0.1" without the port, so the same-host Origin is too
+    ws = simple_websocket.Client.connect(f"ws://127.0.0.1:{server.server_port}/ws/chat",
+                                         headers={"Origin": "http://127.0.0.1"})
+    try:
+        assert _receive(ws) == {"type": "ready"}
+        ws.send(json.dumps({"type": "ping"}))
+        assert _receive(ws) == {"type": "pong"}
+
+        # Two messages in flight on the same connection, answered by id
+        ws.send(json.dumps({"type": "chat", "id": "a", "message": "Bonjour"}))
+        ws.send(json.dumps({"type": "chat", "id": "b", "message": "Merci"}))
+        release.set()
+        frames = _frames_until(ws, "reply", "a")
+        replies = {f["id"]: f for f in frames if f["type"] == "reply"}
+        while "b" not in replies:
+            frame = _receive(ws)
+            frames.append(frame)
+            if frame["type"] == "reply":
+                replies[frame["id"]] = frame
+        stages = [(f["type"], f["id"]) for f in frames if f["type"] in ("progress", "typing")]
+        assert ("progress", "a") in stages and ("typing", "a") in stages, stages
+        assert replies["a"]["reply"].startswith("écho")
+        session_id = replies["a"]["session_id"]
+
+        ws.send(json.dumps({"type": "chat", "id": "c", "message": "Encore", "session_id": session_id,
+                            "idempotency_key": "ws-key-1"}))
+        first = _frames_until(ws, "reply", "c")[-1]
+        ws.send(json.dumps({"type": "chat", "id": "d", "message": "Encore", "session_id": session_id,
+                            "idempotency_key": "ws-key-1"}))
+        replay = _frames_until(ws, "reply", "d")[-1]
+        assert replay["reply"] == first["reply"] and replay["replayed"] is True
+        with app.app_context():
+            assert [m["content"] for m in get_messages(session_id)].count("Encore") == 1
+
+        ws.send(json.dumps({"type": "chat", "id": "e", "message": "   "}))
+        error = _frames_until(ws, "error", "e")[-1]
+        assert error["status"] == 400
+        ws.send("pas du json")
+        assert _receive(ws)["status"] == 400
+    finally:
+        ws.close()
+        server.shutdown()
+        svc_module._gemini_service = None
+    print('[PASS] WebSocket chat, multiplexing and replay OK')
+
+
+def test_websocket_cross_site_refused():
+    app = create_app({"DB_PATH": os.path.join(tempfile.mkdtemp(), "ws_origin.db"), "TESTING": True,
+                      "WS_ENABLED": True, "WS_ALLOWED_ORIGINS": "https://portail.example"})
+    if app.extensions["websocket"] is None:
+        print('[SKIP] flask-sock not installed')
+        return
+    client = app.test_client()
+    upgrade = {"Upgrade": "websocket", "Connection": "Upgrade", "Sec-WebSocket-Version": "13",
+               "Sec-WebSocket-Key": "dGhlIHNhbXBsZSBub25jZQ=="}
+    for origin in ("https://evil.example", None):
+        headers = dict(upgrade, **({"Origin": origin} if origin else {}))
+        assert client.get("/ws/chat", headers=headers).status_code == 403
+    with app.test_request_context("/ws/chat", headers={"Origin": "https://portail.example/"}):
+        from route.ws_routes import origin_allowed
+        assert origin_allowed("https://portail.example/") and origin_allowed("http://localhost")
+        assert not origin_allowed("https://portail.example.evil.example")
+    print('[PASS] Cross-site WebSocket upgrades refused OK')
+
+
+def test_websocket_connection_cap():
+    if simple_websocket is None:
+        print('[SKIP] flask-sock not installed')
+        return
+    app = create_app({"DB_PATH": os.path.join(tempfile.mkdtemp(), "ws_cap.db"), "TESTING": True,
+                      "WS_ENABLED": True, "WS_MAX_CONNECTIONS": 1})
+    server = _serve(app)
+    url = f"ws://127.0.0.1:{server.server_port}/ws/chat"
+    connect = lambda: simple_websocket.Client.connect(url, headers={"Origin": "http://127.0.0.1"})
+    try:
+        first = connect()
+        assert _receive(first) == {"type": "ready"}
+        try:
+            connect()
+            assert False, "second socket accepted"
+        except simple_websocket.ConnectionError as e:
+            assert e.status_code == 503
+        # HTTP still has threads to run on
+        assert app.test_client().get('/api/ai/health').status_code in (200, 503)
+        first.close()
+        for _ in range(50):
+            if app.extensions["ws_slots"].open == 0:
+                break
+            time.sleep(0.05)
+        second = connect()
+        assert _receive(second) == {"type": "ready"}
+        second.close()
+        assert app.extensions["ws_slots"].refused == 1
+    finally:
+        server.shutdown()
+    print('[PASS] WebSocket connections capped per worker OK')
+
+
+def test_websocket_disabled():
+    app = create_app({"DB_PATH": os.path.join(tempfile.mkdtemp(), "ws_off.db"), "TESTING": True})
+    # Off by default: the chat page does not open a socket per tab
+    assert app.extensions["websocket"] is None
+    assert not any(rule.rule == "/ws/chat" for rule in app.url_map.iter_rules())
+    assert 'data-ws-chat="false"' in app.test_client().get('/app').get_data(as_text=True)
+    print('[PASS] WebSocket route disabled by WS_ENABLED OK')
+
+
+if __name__ == "__main__":
+    test_websocket_chat()
+    test_websocket_cross_site_refused()
+    test_websocket_connection_cap()
+    test_websocket_disabled()
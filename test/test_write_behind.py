@@ -0,0 +1,151 @@
+"""Test the group-commit write-behind buffer for message persistence.
+Run: python test/test_write_behind.py
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from flask import Flask
+
+from database.db import init_db, close_db, create_session, add_message, get_messages, start_write_behind
+from database.pool import SerializedWriter, connect
+from database.write_behind import WriteBehindWriter
+
+
+def _make_app(durability):
+    app = Flask(__name__)
+    app.config["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "wb.db")
+    app.config["DB_WRITE_BEHIND"] = True
+    app.config["DB_WRITE_DURABILITY"] = durability
+    app.config["DB_FLUSH_INTERVAL_MS"] = 5
+    init_db(app)
+    start_write_behind(app)
+    app.teardown_appcontext(close_db)
+    return app
+
+
+def _concurrent_inserts(app, sid, threads=8, per_thread=25):
+    results = []
+    lock = threading.Lock()
+
+    def worker(n):
+        with app.app_context():
+            for i in range(per_thread):
+                msg = add_message(sid, 'user', f'message {n}-{i}')
+                with lock:
+                    results.append(msg)
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return results
+
+
+def test_commit_durability_groups_writes():
+    app = _make_app("commit")
+    with app.app_context():
+        sid = create_session()
+    results = _concurrent_inserts(app, sid)
+    ids = [m['id'] for m in results]
+    assert len(set(ids)) == 200 and all(ids)
+    assert all(m['timestamp'] for m in results)
+    writer = app.extensions["db_write_behind"]
+    assert writer.stats()["batches"] < 200, writer.stats()
+    with app.app_context():
+        assert len(get_messages(sid)) == 200
+    writer.stop()
+    print('[PASS] Write-behind commit mode OK')
+
+
+def test_async_durability_flushes_on_stop():
+    app = _make_app("async")
+    with app.app_context():
+        sid = create_session()
+        first = add_message(sid, 'user', 'Bonjour')
+        assert first['id'] is not None
+        # Read-your-writes: pending rows are flushed before reading
+        assert [m['content'] for m in get_messages(sid)] == ['Bonjour']
+    results = _concurrent_inserts(app, sid, threads=4, per_thread=10)
+    app.extensions["db_write_behind"].stop()
+    conn = sqlite3.connect(app.config["DB_PATH"])
+    stored = {row[0] for row in conn.execute("SELECT id FROM message")}
+    conn.close()
+    assert stored == {first['id']} | {m['id'] for m in results}
+    print('[PASS] Write-behind async mode OK')
+
+
+def test_async_history_ordered_across_workers():
+    app = _make_app("async")
+    first = app.extensions["db_write_behind"]
+    # A second worker on the same file reserves its own id block
+    second = WriteBehindWriter(SerializedWriter(app.config["DB_PATH"]), flush_interval_ms=5,
+                               durability="async").start()
+    with app.app_context():
+        sid = create_session()
+        conn = connect(app.config["DB_PATH"], read_only=True)
+        session_id = conn.execute("SELECT id FROM session WHERE uuid = ?", (sid,)).fetchone()[0]
+        conn.close()
+        turns = [(first, "q1"), (first, "a1"), (second, "q2"), (second, "a2"), (first, "q3"), (first, "a3")]
+        for writer, content in turns:
+            writer.add_message(session_id, "user" if content[0] == "q" else "assistant", content)
+            time.sleep(0.002)
+        first.flush()
+        second.flush()
+        assert [m["content"] for m in get_messages(sid)] == [c for _, c in turns]
+    first.stop()
+    second.stop()
+    print('[PASS] Async history ordered by time across workers OK')
+
+
+def test_unexpected_error_fails_batch_and_keeps_writer():
+    app = _make_app("commit")
+    writer = app.extensions["db_write_behind"]
+    real_run = writer.writer.run
+    with app.app_context():
+        sid = create_session()
+
+        def broken(fn):
+            raise RuntimeError("simulated bug")
+        writer.writer.run = broken
+        try:
+            add_message(sid, 'user', 'perdu')
+            assert False, "failure not reported"
+        except RuntimeError as e:
+            assert str(e) == "simulated bug"
+
+        # A commit slower than the bound raises instead of blocking the request
+        def slow(fn):
+            time.sleep(0.3)
+            return real_run(fn)
+        writer.writer.run = slow
+        writer.result_timeout_s = 0.05
+        try:
+            add_message(sid, 'user', 'lent')
+            assert False, "timeout not raised"
+        except TimeoutError:
+            pass
+
+        writer.writer.run = real_run
+        writer.result_timeout_s = 30
+        assert add_message(sid, 'user', 'Bonjour')['id']
+        assert [m['content'] for m in get_messages(sid)] == ['lent', 'Bonjour']
+    writer.stop()
+    print('[PASS] Write-behind survives unexpected errors and bounds the wait OK')
+
+
+if __name__ == "__main__":
+    test_commit_durability_groups_writes()
+    test_async_durability_flushes_on_stop()
+    test_async_history_ordered_across_workers()
+    test_unexpected_error_fails_batch_and_keeps_writer()